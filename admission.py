@@ -0,0 +1,144 @@
+"""
+Admission control for the chat endpoints
+
+Each AdmissionPool caps the turns running at once. Requests over the cap
+wait in a bounded FIFO queue for at most a deadline; when the queue is full
+they are rejected straight away (429) and when the deadline passes they are
+rejected as well (503), both with a Retry-After estimated from the pool's
+recent service time. Rejecting early keeps latency flat for admitted
+requests and keeps the process under the LLM provider's rate limits instead
+of letting every request slow down together.
+
+app.py keeps one pool for counselor turns and one for agent turns, so a
+burst of expensive agent requests cannot starve /chat.
+"""
+
+import asyncio
+import math
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Callable, Deque, Dict
+
+from metrics import ADMISSION_REJECTED, ADMISSION_WAIT_SECONDS
+
+
+class Overloaded(Exception):
+    """A request was shed; status_code is 429 (queue full) or 503 (wait deadline passed)"""
+
+    def __init__(self, pool: str, status_code: int, retry_after: int, reason: str):
+        super().__init__(f"{pool} pool overloaded: {reason}")
+        self.pool = pool
+        self.status_code = status_code
+        self.retry_after = retry_after
+        self.reason = reason
+
+
+class AdmissionPool:
+    """Concurrency limit with a bounded, deadline-limited wait queue"""
+
+    def __init__(self, name: str, max_concurrent: int, max_queue: int, queue_timeout: float):
+        self.name = name
+        self.max_concurrent = max_concurrent
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.in_flight = 0
+        self._waiters: Deque[asyncio.Future] = deque()
+        # Moving average of how long an admitted request holds its slot
+        self._service_time = 1.0
+        self.counts: Dict[str, int] = {"admitted": 0, "queued": 0, "rejected_full": 0, "rejected_timeout": 0}
+
+    @property
+    def queue_depth(self) -> int:
+        return len(self._waiters)
+
+    def retry_after(self) -> int:
+        """Seconds until the current backlog should have drained"""
+        backlog = self.in_flight + len(self._waiters)
+        return max(1, math.ceil(self._service_time * backlog / max(1, self.max_concurrent)))
+
+    def _reject(self, status_code: int, reason: str) -> Overloaded:
+        self.counts["rejected_full" if status_code == 429 else "rejected_timeout"] += 1
+        ADMISSION_REJECTED.inc(pool=self.name, reason=reason)
+        return Overloaded(self.name, status_code, self.retry_after(), reason)
+
+    async def acquire(self) -> None:
+        if self.in_flight < self.max_concurrent and not self._waiters:
+            self.in_flight += 1
+            self.counts["admitted"] += 1
+            ADMISSION_WAIT_SECONDS.observe(0.0, pool=self.name)
+            return
+        if len(self._waiters) >= self.max_queue:
+            raise self._reject(429, "queue_full")
+
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters.append(waiter)
+        self.counts["queued"] += 1
+        started = time.perf_counter()
+        try:
+            # release() hands the slot over by resolving the future
+            await asyncio.wait_for(asyncio.shield(waiter), self.queue_timeout)
+        except (asyncio.TimeoutError, asyncio.CancelledError) as e:
+            if waiter.done() and not waiter.cancelled():
+                # The slot arrived just as we gave up: pass it on
+                self.release()
+            else:
+                waiter.cancel()
+                try:
+                    self._waiters.remove(waiter)
+                except ValueError:
+                    pass
+            if isinstance(e, asyncio.CancelledError):
+                raise
+            raise self._reject(503, "queue_timeout") from None
+        self.counts["admitted"] += 1
+        ADMISSION_WAIT_SECONDS.observe(time.perf_counter() - started, pool=self.name)
+
+    def release(self) -> None:
+        # Hand the slot straight to the next live waiter; in_flight is unchanged
+        while self._waiters:
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                waiter.set_result(None)
+                return
+        self.in_flight -= 1
+
+    def record_service_time(self, seconds: float) -> None:
+        self._service_time = 0.9 * self._service_time + 0.1 * seconds
+
+    async def lease(self) -> Callable[[], None]:
+        """Acquire a slot; returns a release callback that is safe to call more than once
+
+        For responses that outlive the handler (streaming), where the slot is
+        released from whichever of several cleanup paths runs first.
+        """
+        await self.acquire()
+        started = time.perf_counter()
+        released = False
+
+        def release() -> None:
+            nonlocal released
+            if not released:
+                released = True
+                self.record_service_time(time.perf_counter() - started)
+                self.release()
+        return release
+
+    @asynccontextmanager
+    async def slot(self) -> AsyncIterator[None]:
+        """Hold a slot for the duration of the block (raises Overloaded when shed)"""
+        release = await self.lease()
+        try:
+            yield
+        finally:
+            release()
+
+    def stats(self) -> Dict[str, float]:
+        return {
+            **self.counts,
+            "in_flight": self.in_flight,
+            "queue_depth": len(self._waiters),
+            "max_concurrent": self.max_concurrent,
+            "max_queue": self.max_queue,
+            "service_time": self._service_time,
+        }
@@ -0,0 +1,176 @@
+"""
+Per-request budgets for agent mode
+
+A vague agent question could loop through many LLM and retrieval rounds and
+hold a worker for tens of seconds. AgentBudget bounds a turn by steps
+(tool-choosing LLM calls), wall-clock seconds and LLM tokens. The agent graph
+(rag.setup_agent) checks the budget after every tool round and stops early,
+asking the model for a final answer from what it has retrieved, when:
+
+- another step would exceed a limit; the time and token checks keep room for
+  the step and the final answer, each estimated as the slowest call so far
+  and the prompt the next call would send
+- the retrieved context is sufficient: context_chunks distinct chunks
+- the last tool round retrieved nothing new
+
+Checks between rounds cannot stop one slow call, so every agent and tool
+step also runs under a timeout, step_seconds(): the seconds left minus room
+for the final answer. A step that times out sends the turn straight to the
+final answer, which gets the remaining_seconds(). A model call that times
+out still counts (record_timeout): its prompt was sent, and the time it took.
+
+The budget travels in the graph state as a plain dict, so it survives the
+checkpointer, and budget_usage() turns it into the response's "budget".
+"""
+
+import hashlib
+import os
+import re
+import time
+from typing import Any, Dict, List, Optional, Sequence
+
+from langchain_core.messages import BaseMessage
+
+from history import count_message_tokens, count_tokens
+
+ANSWERED = "answered"
+MAX_STEPS = "max_steps"
+MAX_SECONDS = "max_seconds"
+MAX_TOKENS = "max_tokens"
+CONTEXT_SUFFICIENT = "context_sufficient"
+CONTEXT_UNCHANGED = "context_unchanged"
+
+# Retrieval tools list their documents as "Source: ..." blocks (rag.format_*_docs)
+_CHUNK_BOUNDARY = re.compile(r"\n\n(?=Source: )")
+
+
+class AgentBudget:
+    """Limits of one agent turn"""
+
+    def __init__(self, max_steps: int = 4, max_seconds: float = 20.0, max_tokens: int = 12000,
+                 context_chunks: int = 12):
+        self.max_steps = max(1, max_steps)
+        self.max_seconds = max_seconds
+        self.max_tokens = max_tokens
+        self.context_chunks = context_chunks
+
+    @classmethod
+    def from_env(cls, **overrides: Any) -> "AgentBudget":
+        """Limits from AGENT_* variables; overrides that are not None win (per-request limits)"""
+        limits = {
+            "max_steps": int(os.getenv("AGENT_MAX_STEPS", "4")),
+            "max_seconds": float(os.getenv("AGENT_MAX_SECONDS", "20")),
+            "max_tokens": int(os.getenv("AGENT_MAX_TOKENS", "12000")),
+            "context_chunks": int(os.getenv("AGENT_CONTEXT_CHUNKS", "12")),
+        }
+        limits.update({key: value for key, value in overrides.items() if value is not None and key in limits})
+        return cls(**limits)
+
+    def start(self) -> Dict[str, Any]:
+        """Budget state for a new turn"""
+        return {
+            "max_steps": self.max_steps,
+            "max_seconds": self.max_seconds,
+            "max_tokens": self.max_tokens,
+            "context_chunks": self.context_chunks,
+            "started": time.time(),
+            "steps": 0,
+            "tokens": 0,
+            "next_call_tokens": 0,
+            "slowest_call": 0.0,
+            "context": [],
+            "new_context": 0,
+            "stopped": None,
+        }
+
+
+def message_tokens(prompt: Sequence[BaseMessage], response: BaseMessage) -> int:
+    """Tokens of one LLM call, from the provider's usage or estimated"""
+    usage = getattr(response, "usage_metadata", None) or {}
+    if usage.get("total_tokens"):
+        return int(usage["total_tokens"])
+    return count_message_tokens(prompt) + count_tokens(str(response.content))
+
+
+def record_call(budget: Dict[str, Any], prompt: Sequence[BaseMessage], response: BaseMessage,
+                seconds: float, step: bool = True) -> Dict[str, Any]:
+    """Budget after an LLM call; step=False for the final answer call"""
+    return {
+        **budget,
+        "steps": budget["steps"] + int(step),
+        "tokens": budget["tokens"] + message_tokens(prompt, response),
+        "slowest_call": max(budget["slowest_call"], seconds),
+    }
+
+
+def record_timeout(budget: Dict[str, Any], prompt: Sequence[BaseMessage], seconds: float,
+                   step: bool = True) -> Dict[str, Any]:
+    """Budget after an LLM call that timed out: its prompt tokens and the time waited"""
+    return {
+        **budget,
+        "steps": budget["steps"] + int(step),
+        "tokens": budget["tokens"] + count_message_tokens(prompt),
+        "slowest_call": max(budget["slowest_call"], seconds),
+    }
+
+
+def context_chunks(text: str) -> List[str]:
+    return [chunk for chunk in _CHUNK_BOUNDARY.split(text) if chunk.strip()]
+
+
+def record_context(budget: Dict[str, Any], tool_messages: Sequence[BaseMessage],
+                   next_prompt: Sequence[BaseMessage] = ()) -> Dict[str, Any]:
+    """Budget after a tool round: distinct chunks seen this turn, how many were new,
+    and the size of the prompt the next call would send"""
+    seen = list(budget["context"])
+    known = set(seen)
+    for message in tool_messages:
+        for chunk in context_chunks(str(message.content)):
+            digest = hashlib.sha1(chunk.encode("utf-8")).hexdigest()[:16]
+            if digest not in known:
+                known.add(digest)
+                seen.append(digest)
+    return {**budget, "context": seen, "new_context": len(seen) - len(budget["context"]),
+            "next_call_tokens": count_message_tokens(next_prompt)}
+
+
+def stop_reason(budget: Dict[str, Any]) -> Optional[str]:
+    """Why the agent should answer now instead of taking another step, if it should"""
+    if budget["steps"] >= budget["max_steps"]:
+        return MAX_STEPS
+    # Another step and then the final answer
+    if time.time() - budget["started"] + 2 * budget["slowest_call"] > budget["max_seconds"]:
+        return MAX_SECONDS
+    if budget["tokens"] + 2 * budget["next_call_tokens"] > budget["max_tokens"]:
+        return MAX_TOKENS
+    if len(budget["context"]) >= budget["context_chunks"]:
+        return CONTEXT_SUFFICIENT
+    if budget["new_context"] == 0:
+        return CONTEXT_UNCHANGED
+    return None
+
+
+def remaining_seconds(budget: Dict[str, Any]) -> float:
+    return budget["max_seconds"] - (time.time() - budget["started"])
+
+
+def step_seconds(budget: Dict[str, Any]) -> float:
+    """Timeout of the next agent or tool step, keeping room for the final answer:
+    the slowest call so far, or a quarter of the limit before the first call"""
+    return remaining_seconds(budget) - (budget["slowest_call"] or budget["max_seconds"] / 4)
+
+
+def budget_usage(budget: Optional[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+    """What the response reports: usage against each limit and why the turn stopped"""
+    if not budget:
+        return None
+    return {
+        "steps": budget["steps"],
+        "max_steps": budget["max_steps"],
+        "seconds": round(budget.get("finished", time.time()) - budget["started"], 3),
+        "max_seconds": budget["max_seconds"],
+        "tokens": budget["tokens"],
+        "max_tokens": budget["max_tokens"],
+        "context_chunks": len(budget["context"]),
+        "stopped": budget["stopped"],
+    }
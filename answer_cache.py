@@ -0,0 +1,135 @@
+"""
+Semantic answer cache for repeated first-turn questions
+
+Many conversations open with the same handful of questions ("what trucker
+caps do you have?", "how much for 48 embroidered caps?"). AnswerCache keeps
+recent answers keyed on:
+
+- the normalized query embedding, matched by cosine similarity above a
+  threshold, so near-duplicate wordings share an entry
+- a fingerprint of the documents retrieval returns for the query, so an
+  answer is only reused when it would have been grounded in the same content
+- the catalog version, so a rebuilt index or reloaded catalog never serves
+  stale prices
+
+Only context-free turns are cached (the caller decides; rag.py uses the first
+turn of a conversation). Entries are evicted LRU and expire after a TTL.
+"""
+
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Any, Dict, Iterable, Optional, Sequence
+
+import numpy as np
+
+from retrieval import content_hash
+
+
+def documents_fingerprint(doc_keys: Iterable[str]) -> str:
+    """Order-insensitive hash of the retrieved documents' identities"""
+    return hashlib.sha1("\n".join(sorted(set(doc_keys))).encode("utf-8")).hexdigest()
+
+
+def document_fingerprint_key(doc) -> str:
+    # Content hash, not just the ID: re-ingested text under the same ID must miss
+    return f"{doc.id or ''}:{content_hash(doc.page_content)}"
+
+
+@dataclass
+class CachedAnswer:
+    query: str
+    vector: np.ndarray
+    fingerprint: str
+    version: str
+    mode: str
+    response: str
+    data_source: str
+    latency: float
+    created: float = field(default_factory=time.monotonic)
+    hits: int = 0
+
+
+class AnswerCache:
+    """LRU cache of answers matched by embedding similarity"""
+
+    def __init__(self, max_entries: int = 1024, min_similarity: float = 0.95, ttl_seconds: Optional[float] = 3600):
+        self.max_entries = max_entries
+        self.min_similarity = min_similarity
+        self.ttl_seconds = ttl_seconds
+        self._entries: "OrderedDict[int, CachedAnswer]" = OrderedDict()
+        self._next_id = 0
+        self._lock = threading.Lock()
+        self.counts: Dict[str, float] = {
+            "lookups": 0, "hits": 0, "misses": 0, "fingerprint_mismatches": 0, "stores": 0,
+            "evictions": 0, "invalidations": 0, "seconds_saved": 0.0,
+        }
+
+    @staticmethod
+    def _normalize(vector: Sequence[float]) -> np.ndarray:
+        array = np.asarray(vector, dtype=np.float32)
+        return array / (np.linalg.norm(array) + 1e-12)
+
+    def _expired(self, entry: CachedAnswer) -> bool:
+        return self.ttl_seconds is not None and time.monotonic() - entry.created > self.ttl_seconds
+
+    def candidate(self, vector: Sequence[float], version: str, mode: str) -> Optional[CachedAnswer]:
+        """Most similar live entry for this catalog version and mode, if above the threshold"""
+        query = self._normalize(vector)
+        with self._lock:
+            self.counts["lookups"] += 1
+            best, best_score = None, self.min_similarity
+            for entry_id, entry in list(self._entries.items()):
+                if entry.version != version or self._expired(entry):
+                    del self._entries[entry_id]
+                    self.counts["evictions"] += 1
+                    continue
+                if entry.mode != mode:
+                    continue
+                score = float(entry.vector @ query)
+                if score >= best_score:
+                    best, best_score = (entry_id, entry), score
+            if best is None:
+                self.counts["misses"] += 1
+                return None
+            self._entries.move_to_end(best[0])
+            return best[1]
+
+    def confirm(self, entry: CachedAnswer, fingerprint: str, elapsed: float) -> bool:
+        """Accept a candidate if retrieval for the new query returns the same documents"""
+        with self._lock:
+            if fingerprint != entry.fingerprint:
+                self.counts["fingerprint_mismatches"] += 1
+                self.counts["misses"] += 1
+                return False
+            entry.hits += 1
+            self.counts["hits"] += 1
+            self.counts["seconds_saved"] += max(0.0, entry.latency - elapsed)
+            return True
+
+    def put(self, query: str, vector: Sequence[float], fingerprint: str, version: str, mode: str,
+            response: str, data_source: str, latency: float) -> None:
+        entry = CachedAnswer(query, self._normalize(vector), fingerprint, version, mode, response, data_source, latency)
+        with self._lock:
+            self._entries[self._next_id] = entry
+            self._next_id += 1
+            self.counts["stores"] += 1
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.counts["evictions"] += 1
+
+    def invalidate(self) -> None:
+        """Drop every entry (index rebuilt or catalog reloaded)"""
+        with self._lock:
+            self._entries.clear()
+            self.counts["invalidations"] += 1
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.counts["lookups"]
+        return {
+            **self.counts,
+            "entries": len(self._entries),
+            "hit_rate": self.counts["hits"] / lookups if lookups else 0.0,
+        }
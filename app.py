@@ -6,20 +6,30 @@ Endpoints:
 - POST /chat - Main chat endpoint with user_id and query
 - GET /health - Health check endpoint
 - POST /chat/agent - Chat with agent mode for complex queries
+- POST /chat/stream - Server-Sent Events stream of tokens, retrieval status and final metadata
+- GET /metrics - Prometheus metrics (stage latencies, token counts, cache hit rates)
 """
 
 from fastapi import FastAPI, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
+from starlette.background import BackgroundTask
 from pydantic import BaseModel, Field
-from typing import Optional
+from typing import Any, Dict, Optional
 from contextlib import asynccontextmanager
 import logging
+import json
 import os
 from datetime import datetime
 import uvicorn
 
 # Import our RAG functions
-from rag import initialize_rag_system, get_response, get_conversation_summary, clear_conversation
+from rag import (
+    initialize_rag_system, aget_response, astream_response, get_conversation_summary, clear_conversation, render_metrics,
+    get_vector_store_health,
+)
+from admission import AdmissionPool, Overloaded
+from metrics import REGISTRY
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
@@ -28,6 +38,48 @@ logger = logging.getLogger(__name__)
 # Global system state
 system_initialized = False
 
+def create_admission_pool(name: str, default_concurrency: int, default_queue: int) -> Optional[AdmissionPool]:
+    """Admission pool sized from ADMISSION_<NAME>_CONCURRENCY / _QUEUE; None when ADMISSION=0"""
+    if os.getenv("ADMISSION", "1") != "1":
+        return None
+    prefix = f"ADMISSION_{name.upper()}"
+    return AdmissionPool(
+        name,
+        max_concurrent=int(os.getenv(f"{prefix}_CONCURRENCY", str(default_concurrency))),
+        max_queue=int(os.getenv(f"{prefix}_QUEUE", str(default_queue))),
+        queue_timeout=float(os.getenv("ADMISSION_QUEUE_TIMEOUT", "10")),
+    )
+
+# Separate pools so expensive agent turns cannot starve counselor turns
+admission_pools = {
+    "chat": create_admission_pool("chat", 32, 64),
+    "agent": create_admission_pool("agent", 8, 16),
+}
+
+def admission_pool(use_agent: bool) -> Optional[AdmissionPool]:
+    return admission_pools["agent" if use_agent else "chat"]
+
+def _pool_samples(metric: str, attribute: str):
+    return lambda: (
+        (metric, {"pool": name}, getattr(pool, attribute))
+        for name, pool in admission_pools.items() if pool is not None
+    )
+
+REGISTRY.register_collector("rag_admission_queue_depth", "Requests waiting for an admission slot",
+                            _pool_samples("rag_admission_queue_depth", "queue_depth"))
+REGISTRY.register_collector("rag_admission_in_flight", "Requests holding an admission slot",
+                            _pool_samples("rag_admission_in_flight", "in_flight"))
+
+@asynccontextmanager
+async def admitted(use_agent: bool):
+    """Hold a slot of the request's pool for the block"""
+    pool = admission_pool(use_agent)
+    if pool is None:
+        yield
+        return
+    async with pool.slot():
+        yield
+
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     """Lifespan event handler for startup and shutdown"""
@@ -66,11 +118,25 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+@app.exception_handler(Overloaded)
+async def overloaded_handler(request, exc: Overloaded):
+    """Shed requests get 429 (queue full) or 503 (waited too long) with Retry-After"""
+    logger.warning(f"Shedding request: {exc}")
+    return JSONResponse(
+        status_code=exc.status_code,
+        content={"detail": f"Server busy ({exc.reason}), please retry", "status_code": exc.status_code},
+        headers={"Retry-After": str(exc.retry_after)},
+    )
+
 # Pydantic models for request/response
 class ChatRequest(BaseModel):
     user_id: str = Field(..., description="Unique identifier for the user", min_length=1, max_length=100)
     query: str = Field(..., description="User's message/question", min_length=1, max_length=2000)
     use_agent: bool = Field(False, description="Whether to use agent mode for complex queries")
+    include_timings: bool = Field(False, description="Return per-stage latencies (ms) in the response")
+    max_steps: Optional[int] = Field(None, ge=1, le=16, description="Agent mode: max tool-choosing LLM calls (default: AGENT_MAX_STEPS)")
+    max_seconds: Optional[float] = Field(None, gt=0, le=120, description="Agent mode: wall-clock budget in seconds (default: AGENT_MAX_SECONDS)")
+    max_tokens: Optional[int] = Field(None, ge=500, le=200000, description="Agent mode: LLM token budget (default: AGENT_MAX_TOKENS)")
     
     model_config = {
         "json_schema_extra": {
@@ -81,6 +147,9 @@ class ChatRequest(BaseModel):
             }
         }
     }
+    
+    def budget(self) -> Dict[str, Any]:
+        return {"max_steps": self.max_steps, "max_seconds": self.max_seconds, "max_tokens": self.max_tokens}
 
 class ChatResponse(BaseModel):
     user_id: str = Field(..., description="User identifier")
@@ -91,6 +160,9 @@ class ChatResponse(BaseModel):
     timestamp: float = Field(..., description="Unix timestamp of response")
     error: Optional[str] = Field(None, description="Error message if any")
     status_code: int = Field(200, description="HTTP status code")
+    timings: Optional[Dict[str, float]] = Field(None, description="Per-stage latencies in ms, when requested")
+    budget: Optional[Dict[str, Any]] = Field(None, description="Agent mode: steps, seconds and tokens used against their limits, and why the turn stopped")
+    usage: Optional[Dict[str, int]] = Field(None, description="LLM calls and prompt, cached and completion tokens spent on this turn")
     
     model_config = {
         "json_schema_extra": {
@@ -113,6 +185,9 @@ class HealthResponse(BaseModel):
     timestamp: float
     pinecone_connected: bool
     models_loaded: bool
+    vector_stores: Optional[Dict[str, Dict[str, Any]]] = Field(
+        None, description="Circuit breaker state, replica fallbacks and replica age per vector store"
+    )
     status_code: int = Field(200, description="HTTP status code")
 
 class ConversationClearResponse(BaseModel):
@@ -134,14 +209,18 @@ async def health_check():
     Health check endpoint to verify API and system status
     """
     try:
-        status = "healthy" if system_initialized else "degraded"
+        vector_stores = get_vector_store_health() if system_initialized else {}
+        # An open breaker means retrieval is being served from the local replica
+        breakers_closed = all(store["breaker"] == "closed" for store in vector_stores.values())
+        status = "healthy" if system_initialized and breakers_closed else "degraded"
         
         return HealthResponse(
             status=status,
             message="Document RAG API is running",
             timestamp=datetime.now().timestamp(),
-            pinecone_connected=system_initialized,
+            pinecone_connected=system_initialized and breakers_closed,
             models_loaded=system_initialized,
+            vector_stores=vector_stores or None,
             status_code=200
         )
     except Exception as e:
@@ -155,6 +234,15 @@ async def health_check():
             status_code=500
         )
 
+# Metrics endpoint
+@app.get("/metrics", response_class=PlainTextResponse, tags=["Health"])
+async def metrics_endpoint():
+    """
+    Prometheus metrics: request, graph node, LLM, tool, embedding and vector
+    query latency histograms, LLM token counters and component cache stats
+    """
+    return PlainTextResponse(render_metrics(), media_type="text/plain; version=0.0.4")
+
 # Main chat endpoint
 @app.post("/chat", response_model=ChatResponse, tags=["Chat"])
 async def chat_endpoint(request: ChatRequest):
@@ -178,14 +266,20 @@ async def chat_endpoint(request: ChatRequest):
             detail="Document RAG system is not initialized. Please check server logs."
         )
     
+    async with admitted(request.use_agent):
+        return await _chat(request)
+
+async def _chat(request: ChatRequest) -> ChatResponse:
     try:
         logger.info(f"Processing chat request for user {request.user_id}")
         
-        # Get response using function-based approach
-        response_data = get_response(
+        # Async path keeps the event loop free while the LLM and retrieval run
+        response_data = await aget_response(
             message=request.query,
             user_id=request.user_id,
-            use_agent=request.use_agent
+            use_agent=request.use_agent,
+            include_timings=request.include_timings,
+            budget=request.budget(),
         )
         
         return ChatResponse(**response_data)
@@ -208,22 +302,82 @@ async def chat_agent_endpoint(request: ChatRequest):
     - Complex document searches across multiple sources
     - Questions requiring information synthesis
     - Detailed research queries
+    
+    **Budget** (optional; defaults from AGENT_MAX_STEPS, AGENT_MAX_SECONDS, AGENT_MAX_TOKENS):
+    - **max_steps**, **max_seconds**, **max_tokens**: the agent stops searching and answers
+      from what it has found before exceeding any of them; usage is returned under `budget`
     """
     # Force agent mode
     request.use_agent = True
     return await chat_endpoint(request)
 
+# Streaming endpoint
+@app.post("/chat/stream", tags=["Chat"])
+async def chat_stream_endpoint(request: ChatRequest):
+    """
+    Streaming chat endpoint using Server-Sent Events
+    
+    Emits events as the turn progresses:
+    - **status**: retrieval started/finished, with the tools involved
+    - **token**: a chunk of the answer as the LLM generates it
+    - **done**: final frame with the same fields as `/chat` (response, data_source, ...)
+    - **error**: final frame when the turn failed
+    """
+    if not system_initialized:
+        raise HTTPException(
+            status_code=503, 
+            detail="Document RAG system is not initialized. Please check server logs."
+        )
+    
+    logger.info(f"Processing streaming chat request for user {request.user_id}")
+    
+    # The slot is held until the stream finishes, not just until this handler returns
+    pool = admission_pool(request.use_agent)
+    release = await pool.lease() if pool is not None else (lambda: None)
+    
+    async def event_source():
+        try:
+            async for event in astream_response(
+                message=request.query,
+                user_id=request.user_id,
+                use_agent=request.use_agent,
+                budget=request.budget(),
+            ):
+                yield f"event: {event['event']}\ndata: {json.dumps(event)}\n\n"
+        except Exception as e:
+            logger.error(f"Error streaming chat response: {e}")
+            error = {"event": "error", "user_id": request.user_id, "error": str(e), "status_code": 500}
+            yield f"event: error\ndata: {json.dumps(error)}\n\n"
+        finally:
+            release()
+    
+    return StreamingResponse(
+        event_source(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+        # Also covers a client that disconnects before the stream starts
+        background=BackgroundTask(release),
+    )
+
 
 # Run the application
 if __name__ == "__main__":
     # Get port from environment or default to 8000
     port = int(os.getenv("PORT", 8021))
+    # Worker processes share conversation state through the SQLite checkpointer
+    workers = int(os.getenv("WORKERS", "1"))
+    # Auto-reload is for development only and works with a single process
+    reload = os.getenv("RELOAD", "0") == "1"
+    if reload and workers > 1:
+        print("⚠️ RELOAD=1 ignored with WORKERS > 1")
+        reload = False
     
     # Run with uvicorn
     uvicorn.run(
         "app:app",
         host="0.0.0.0",
         port=port,
-        reload=True,  # Set to False in production
+        workers=workers,
+        reload=reload,
         log_level="info"
     )
@@ -0,0 +1,7 @@
+"""
+Offline benchmarks for the CapAmerica RAG service
+
+Run from the repository root, e.g. ``python -m benchmarks.bench_async``.
+Every benchmark uses the stand-in backends from ``benchmarks.fakes`` so no
+OpenAI or Pinecone calls are made.
+"""
@@ -0,0 +1,89 @@
+"""
+Agent mode under budgets: latency, LLM calls and tokens per turn
+
+Runs agent turns against the fake backends with a fake model that keeps
+searching (--rounds tool steps before it would answer on its own), once per
+variant:
+
+- sequential vs parallel: a question needing --parts lookups, issued one per
+  step or all in one step (the tool calls of a step run concurrently)
+- unbounded: the searching model with no limits and no early exit
+- default budget: AGENT_* defaults (steps, seconds, tokens, context)
+- tight budget: per-request limits (--max-seconds, --max-tokens)
+
+Reports p50/p95 turn latency, LLM calls and tokens per turn, and why turns
+stopped.
+
+    python -m benchmarks.bench_agent
+    python -m benchmarks.bench_agent --llm-latency 0.5 --rounds 10
+"""
+
+import argparse
+import asyncio
+import time
+from collections import Counter
+
+from benchmarks.bench_scenarios import percentile
+from benchmarks.fakes import install_fake_backends
+
+QUESTIONS = [
+    "Which caps work for a golf tournament and what do 144 cost with a leather patch?",
+    "I need hats for a beach event, in navy and white, around 200 units",
+    "Compare your trucker and performance caps for a running club",
+    "What decoration options are there for visors and how much is embroidery?",
+    "Suggest youth-sized caps in bright colors for a summer camp",
+    "Do you have structured snap backs with woven patches for a brewery?",
+]
+
+# No limit a turn could reach, and no early exit on the amount of context
+UNBOUNDED = {"max_steps": 1000, "max_seconds": 1e9, "max_tokens": 10**9, "context_chunks": 10**9}
+
+
+async def run(rag, label: str, rounds: int, parallel: int, budget: dict, repeats: int) -> None:
+    rag.llm.tool_rounds, rag.llm.parallel_tools = rounds, parallel
+    latencies, tokens, reasons = [], [], Counter()
+    calls_before = rag.llm.calls
+    for r in range(repeats):
+        for q, question in enumerate(QUESTIONS):
+            start = time.perf_counter()
+            result = await rag.aget_response(question, f"agent_{label}_{r}_{q}", use_agent=True, budget=budget)
+            latencies.append(time.perf_counter() - start)
+            assert result["status_code"] == 200, result
+            tokens.append(result["budget"]["tokens"])
+            reasons[result["budget"]["stopped"]] += 1
+    turns = len(latencies)
+    print(f"{label:>34} {percentile(latencies, 0.5) * 1000:>7.0f} {percentile(latencies, 0.95) * 1000:>7.0f} "
+          f"{(rag.llm.calls - calls_before) / turns:>10.1f} {sum(tokens) / turns:>8.0f}  "
+          + ", ".join(f"{reason} {count}" for reason, count in reasons.most_common()))
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--llm-latency", type=float, default=0.2)
+    parser.add_argument("--vector-latency", type=float, default=0.05)
+    parser.add_argument("--catalog-size", type=int, default=500, help="products in the fake catalog")
+    parser.add_argument("--parts", type=int, default=3, help="lookups the sequential/parallel question needs")
+    parser.add_argument("--rounds", type=int, default=8, help="tool steps the searching model takes")
+    parser.add_argument("--max-seconds", type=float, default=1.0, help="tight budget: wall clock")
+    parser.add_argument("--max-tokens", type=int, default=3000, help="tight budget: tokens")
+    parser.add_argument("--repeats", type=int, default=2)
+    args = parser.parse_args()
+
+    rag = install_fake_backends(args.llm_latency, args.vector_latency, catalog_size=args.catalog_size)
+    # Every turn must run the agent; repeated questions would otherwise be answered from cache
+    rag.answer_cache = None
+    rag.request_coalescer = None
+
+    print(f"\n== {len(QUESTIONS) * args.repeats} agent turns per variant, LLM {args.llm_latency * 1000:.0f} ms, "
+          f"vector query {args.vector_latency * 1000:.0f} ms")
+    print(f"{'variant':>34} {'p50 ms':>7} {'p95 ms':>7} {'LLM calls':>10} {'tokens':>8}  stopped")
+    await run(rag, f"{args.parts} lookups, one per step", args.parts, 1, UNBOUNDED, args.repeats)
+    await run(rag, f"{args.parts} lookups in one step", 1, args.parts, UNBOUNDED, args.repeats)
+    await run(rag, f"searching {args.rounds} steps, unbounded", args.rounds, 1, UNBOUNDED, args.repeats)
+    await run(rag, "searching, default budget", args.rounds, 1, {}, args.repeats)
+    await run(rag, f"searching, {args.max_seconds:g}s / {args.max_tokens} tokens", args.rounds, 1,
+              {"max_seconds": args.max_seconds, "max_tokens": args.max_tokens}, args.repeats)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,81 @@
+"""
+First-turn latency and LLM calls with and without the semantic answer cache
+
+Simulates many new conversations opening with questions drawn from a small
+pool, which is what the production traffic looks like (the system-prompt
+examples and demo scenarios). The fake embeddings are hash-based, so only
+identical wordings (after normalization) match here; real embeddings also
+match close paraphrases above ANSWER_CACHE_SIMILARITY.
+
+    python -m benchmarks.bench_answer_cache --conversations 200
+"""
+
+import argparse
+import asyncio
+import random
+import statistics
+import time
+
+from benchmarks.fakes import install_fake_backends
+
+OPENING_QUESTIONS = [
+    "I need caps for a golf tournament",
+    "What trucker hats do you have?",
+    "How much for 48 embroidered caps?",
+    "Do you have moisture-wicking performance caps?",
+    "What leather patch options do you offer?",
+    "Do you offer free samples?",
+    "Which visors come in navy?",
+    "What's your cheapest cap for 500 units?",
+]
+
+
+def percentile(values, q: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(q * (len(ordered) - 1))))]
+
+
+async def replay(rag, label: str, conversations: int, seed: int) -> dict:
+    rng = random.Random(seed)
+    latencies = []
+    calls_before = rag.llm.calls
+    for i in range(conversations):
+        question = rng.choice(OPENING_QUESTIONS)
+        start = time.perf_counter()
+        result = await rag.aget_response(question, f"cache_{label}_{i}")
+        latencies.append(time.perf_counter() - start)
+        assert result["status_code"] == 200, result
+    return {
+        "llm_calls": rag.llm.calls - calls_before,
+        "p50": percentile(latencies, 0.5) * 1000,
+        "p95": percentile(latencies, 0.95) * 1000,
+        "mean": statistics.mean(latencies) * 1000,
+    }
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--llm-latency", type=float, default=0.2)
+    parser.add_argument("--vector-latency", type=float, default=0.03)
+    parser.add_argument("--conversations", type=int, default=200)
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+
+    rag = install_fake_backends(args.llm_latency, args.vector_latency)
+    cache = rag.answer_cache
+
+    rag.answer_cache = None
+    baseline = await replay(rag, "off", args.conversations, args.seed)
+    rag.answer_cache = cache
+    cached = await replay(rag, "on", args.conversations, args.seed)
+
+    print(f"\n{'':>9} {'LLM calls':>10} {'p50 ms':>8} {'p95 ms':>8} {'mean ms':>8}")
+    for name, result in (("no cache", baseline), ("cache", cached)):
+        print(f"{name:>9} {result['llm_calls']:>10} {result['p50']:>8.0f} {result['p95']:>8.0f} {result['mean']:>8.0f}")
+    stats = cache.stats()
+    print(f"\nAnswer cache: {stats['hits']} hits / {stats['lookups']} lookups (hit rate {stats['hit_rate']:.0%}), "
+          f"{stats['entries']} entries, {stats['seconds_saved']:.1f}s of generation saved")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,63 @@
+"""
+Throughput of the async request path versus the blocking one
+
+Each request is one counselor turn (tool-selection LLM call, retrieval,
+generation) against the fake backends. The blocking path calls get_response
+from inside the event loop, exactly as app.chat_endpoint used to, so requests
+queue behind each other; the async path awaits aget_response.
+
+    python -m benchmarks.bench_async --concurrency 1 8 64 256
+"""
+
+import argparse
+import asyncio
+import time
+
+from benchmarks.fakes import install_fake_backends
+
+
+async def run_level(rag, concurrency: int, requests_per_level: int, use_async: bool) -> float:
+    """Run a batch of turns with at most `concurrency` in flight; returns req/s"""
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def one(i: int):
+        async with semaphore:
+            user_id = f"bench_{concurrency}_{i}"
+            if use_async:
+                result = await rag.aget_response("navy trucker caps pricing", user_id)
+            else:
+                result = rag.get_response("navy trucker caps pricing", user_id)
+            assert result["status_code"] == 200, result
+
+    start = time.perf_counter()
+    await asyncio.gather(*(one(i) for i in range(requests_per_level)))
+    return requests_per_level / (time.perf_counter() - start)
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 8, 64, 256])
+    parser.add_argument("--requests", type=int, default=256, help="requests per concurrency level")
+    parser.add_argument("--llm-latency", type=float, default=0.05)
+    parser.add_argument("--vector-latency", type=float, default=0.02)
+    parser.add_argument("--skip-blocking", action="store_true", help="only measure the async path")
+    args = parser.parse_args()
+
+    rag = install_fake_backends(args.llm_latency, args.vector_latency)
+    # Every turn must run the graph; repeated questions would otherwise be answered from cache
+    rag.answer_cache = None
+    per_turn = 2 * args.llm_latency + args.vector_latency
+    print(f"\nSimulated backend time per turn: {per_turn * 1000:.0f} ms")
+    print(f"{'concurrency':>12} {'blocking req/s':>16} {'async req/s':>14}")
+    for concurrency in args.concurrency:
+        # The blocking path is serial regardless of concurrency; cap its batch size
+        blocking = "-"
+        if not args.skip_blocking:
+            blocking_requests = min(args.requests, 32)
+            blocking = f"{await run_level(rag, concurrency, blocking_requests, use_async=False):.1f}"
+        async_rps = await run_level(rag, concurrency, args.requests, use_async=True)
+        print(f"{concurrency:>12} {blocking:>16} {async_rps:>14.1f}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,125 @@
+"""
+Context assembly: prompt tokens, duplicates and answer context per turn
+
+Loads a catalog with the production document layout (ingest.product_document)
+into the fake vector store twice, as caps_catalog1.json and a repriced
+caps_catalog_v2.json, like the near-duplicate catalog files in the real
+index. Then it asks one question about one product per turn, in counselor
+mode, with:
+
+- verbatim top 3: CONTEXT_ASSEMBLY=0, the tools' top documents with full headers
+- assembled: wider candidates, dedup, MMR and the token budget (context_assembly.py)
+
+Reports prompt tokens per turn (from the responses' "usage"), context tokens
+and snippets, duplicate products in the context, how often the product
+asked about is in the context (a proxy for answer quality) and p50/p95 turn
+latency with prompt prefill charged at --prefill-tokens-per-second.
+
+    python -m benchmarks.bench_context
+    python -m benchmarks.bench_context --products 500 --token-budget 800
+"""
+
+import argparse
+import asyncio
+import os
+import random
+import re
+import time
+
+from langchain_core.documents import Document
+
+from agent_budget import context_chunks
+from benchmarks.bench_ingest import PRICE_TXT, synthetic_products
+from benchmarks.bench_scenarios import percentile
+from benchmarks.fakes import COLORS, install_fake_backends
+
+PRODUCT_ID = re.compile(r"Product ID: (\w+)")
+
+
+def catalog_documents(count: int):
+    """Every product in caps_catalog1.json and, with new prices, caps_catalog_v2.json"""
+    from ingest import product_document
+
+    products = synthetic_products(count)
+    docs = [product_document(product, "caps_catalog1.json") for product in products]
+    for product in products:
+        product["pricing"]["Flat Embroidery"]["24"] = "$14.50"
+        docs.append(product_document(product, "caps_catalog_v2.json"))
+    for i, doc in enumerate(docs):
+        doc.id = f"{doc.metadata['source']}:{i}"
+    docs.append(Document(id="txt1.txt:0", page_content=PRICE_TXT * 3,
+                         metadata={"source": "txt1.txt", "category": "pricing_patches"}))
+    return products, docs
+
+
+async def run(rag, label: str, products, turns: int, seed: int = 7) -> None:
+    # The same questions for every variant
+    rng = random.Random(seed)
+    latencies, prompt_tokens, context_tokens, snippets = [], [], [], []
+    duplicates, found = 0, 0
+    for t in range(turns):
+        product = rng.choice(products)
+        # Half the questions name the product ID, which takes the exact-match path
+        if t % 2:
+            question = f"How much are 48 {product['id']} with a woven patch?"
+        else:
+            question = f"Do you have the {product['title']} in {rng.choice(COLORS)}?"
+        user_id = f"context_{label}_{t}"
+        start = time.perf_counter()
+        result = await rag.aget_response(question, user_id)
+        latencies.append(time.perf_counter() - start)
+        assert result["status_code"] == 200, result
+        prompt_tokens.append(result["usage"]["prompt_tokens"])
+
+        messages = rag.conversational_graph.get_state(rag.get_user_config(user_id)).values["messages"]
+        chunks = [chunk for m in rag.current_turn_messages(messages) if m.type == "tool"
+                  for chunk in context_chunks(str(m.content))]
+        context_tokens.append(sum(len(chunk.split()) for chunk in chunks))
+        snippets.append(len(chunks))
+        ids = [match.group(1) for match in map(PRODUCT_ID.search, chunks) if match]
+        duplicates += len(ids) - len(set(ids))
+        found += product["id"] in ids
+
+    print(f"{label:>16} {sum(prompt_tokens) / turns:>8.0f} {sum(context_tokens) / turns:>9.0f} "
+          f"{sum(snippets) / turns:>9.1f} {duplicates / turns:>11.2f} {found / turns:>8.0%} "
+          f"{percentile(latencies, 0.5) * 1000:>7.0f} {percentile(latencies, 0.95) * 1000:>7.0f}")
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--products", type=int, default=200, help="products per catalog file")
+    parser.add_argument("--turns", type=int, default=60)
+    parser.add_argument("--llm-latency", type=float, default=0.2, help="time to first token, excluding prefill (s)")
+    parser.add_argument("--prefill-tokens-per-second", type=float, default=5000,
+                        help="prompt tokens processed per second (0 = prefill is free)")
+    parser.add_argument("--vector-latency", type=float, default=0.05)
+    parser.add_argument("--fetch-k", type=int, default=8, help="CONTEXT_FETCH_K")
+    parser.add_argument("--token-budget", type=int, default=1200, help="CONTEXT_TOKEN_BUDGET")
+    args = parser.parse_args()
+
+    os.environ["CONTEXT_FETCH_K"] = str(args.fetch_k)
+    os.environ["CONTEXT_TOKEN_BUDGET"] = str(args.token_budget)
+    rag = install_fake_backends(args.llm_latency, args.vector_latency)
+    rag.llm.prefill_tokens_per_second = args.prefill_tokens_per_second
+    products, docs = catalog_documents(args.products)
+    rag.pdf_vector_store.add_documents(docs)
+    rag.setup_hybrid_retrievers()
+    # Every turn must reach the model
+    rag.answer_cache = None
+    rag.request_coalescer = None
+
+    print(f"\n== {args.turns} product questions, {len(docs)} catalog documents "
+          f"({args.products} products in two catalog files), prefill at {args.prefill_tokens_per_second:g} tokens/s")
+    print(f"{'context':>16} {'prompt':>8} {'context':>9} {'snippets':>9} {'dup. prods':>11} {'product':>8} "
+          f"{'p50 ms':>7} {'p95 ms':>7}")
+    assembler = rag.context_assembler
+    rag.context_assembler = None
+    await run(rag, "verbatim top 3", products, args.turns)
+    rag.context_assembler = assembler
+    await run(rag, "assembled", products, args.turns)
+    print("\nprompt is tokens per turn over the turn's LLM calls; context is the words of the retrieved "
+          "context; product is how often the product asked about was in it.")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,74 @@
+"""
+Recall and latency of pure-vector versus hybrid (BM25 + vector) retrieval
+
+Queries are generated from the synthetic catalog with known answers:
+exact product IDs, color + style descriptions, and add-on pricing. The
+fake embeddings are hash-based and carry no semantics, so the vector
+recall here is a floor; the point is what the lexical side and the ID fast
+path add, and how much embedding latency the fast path skips.
+
+    python -m benchmarks.bench_hybrid --embedding-latency 0.03
+"""
+
+import argparse
+import statistics
+import time
+
+from benchmarks.fakes import SlowEmbeddings, SlowVectorStore, synthetic_catalog_documents
+from hybrid_search import HybridRetriever, documents_from_store
+
+
+def labelled_queries(docs):
+    """(query, expected product_id or source) pairs"""
+    queries = []
+    for doc in docs:
+        product_id = doc.metadata.get("product_id")
+        if not product_id:
+            continue
+        title = doc.page_content.split("Title: ")[1].split("\n")[0]
+        price_48 = doc.page_content.split("48 units: ")[1].split("\n")[0]
+        queries.append((f"price of {product_id} for 48 caps", product_id))
+        queries.append((f"which {title.lower()} costs {price_48} at 48 units", product_id))
+    queries.append(("how much is a molded rubber patch", "txt1.txt"))
+    return queries
+
+
+def matches(doc, expected) -> bool:
+    return doc.metadata.get("product_id") == expected or doc.metadata.get("source") == expected
+
+
+def run(name, search, queries, k):
+    hits, latencies = 0, []
+    for query, expected in queries:
+        start = time.perf_counter()
+        docs = search(query, k)
+        latencies.append(time.perf_counter() - start)
+        hits += any(matches(doc, expected) for doc in docs)
+    latencies.sort()
+    p95 = latencies[int(0.95 * (len(latencies) - 1))]
+    print(f"{name:>8} recall@{k}: {hits / len(queries):.2f}   "
+          f"p50 {statistics.median(latencies) * 1000:.2f} ms   p95 {p95 * 1000:.2f} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--embedding-latency", type=float, default=0.03)
+    parser.add_argument("--k", type=int, default=3)
+    args = parser.parse_args()
+
+    embeddings = SlowEmbeddings(size=64, latency=0)
+    store = SlowVectorStore(embeddings, latency=0)
+    store.add_documents(synthetic_catalog_documents())
+    embeddings.latency = args.embedding_latency
+    retriever = HybridRetriever(store, documents_from_store(store))
+    queries = labelled_queries(synthetic_catalog_documents())
+
+    print(f"\n{len(queries)} labelled queries, simulated embedding latency {args.embedding_latency * 1000:.0f} ms")
+    run("vector", lambda q, k: store.similarity_search(q, k=k), queries, args.k)
+    embeddings.calls = 0
+    run("hybrid", retriever.search, queries, args.k)
+    print(f"hybrid embedding calls: {embeddings.calls} of {len(queries)} queries")
+
+
+if __name__ == "__main__":
+    main()
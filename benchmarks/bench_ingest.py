@@ -0,0 +1,155 @@
+"""
+Incremental ingestion benchmark against the local fake OpenAI/Pinecone server
+
+Writes a synthetic data directory (JSON catalogs, TXT pricing files and a
+website CSV) to a temp dir and runs ingest.py's pipeline with the real
+OpenAIEmbeddings and Pinecone clients against
+benchmarks/fake_http_server.py. Runs, in order:
+
+- full run with small sequential batches (the old one-shot upload shape)
+- full run with large concurrent batches, from an empty manifest
+- no-op rerun: nothing changed, so nothing is embedded
+- delta run after --changed products get new prices and --removed are dropped
+- first run without a manifest against an index that also holds every chunk
+  under an old id (an earlier upload); reconciliation deletes the old ids
+
+Reports docs/sec, embedding requests sent and the requests saved against a
+full re-embed, and checks the fake index holds exactly the current chunks.
+
+    python -m benchmarks.bench_ingest
+    python -m benchmarks.bench_ingest --products 2000 --embed-latency 0.05
+"""
+
+import argparse
+import csv
+import json
+import logging
+import os
+import random
+import tempfile
+from typing import Any, Dict, List
+
+from benchmarks.fake_http_server import FakeHTTPServer
+from benchmarks.fakes import COLORS, STYLES
+
+PRICE_TXT = """Decoration pricing
+Embroidered Patch: $4.00 per piece
+Woven Patch: $5.00 per piece
+Molded Rubber Patch: $6.00 per piece
+"""
+
+
+def write_catalog(data_dir: str, products: List[Dict[str, Any]], files: int = 2) -> None:
+    per_file = -(-len(products) // files)
+    for i in range(files):
+        with open(os.path.join(data_dir, f"caps_catalog_{i}.json"), "w") as f:
+            json.dump(products[i * per_file:(i + 1) * per_file], f)
+
+
+def synthetic_products(count: int) -> List[Dict[str, Any]]:
+    return [{
+        "id": f"i{1000 + i}",
+        "title": f"{STYLES[i % len(STYLES)]} {i}",
+        "description": {"features": ["Structured crown", f"{6 - i % 2} panel"], "sizing": "OSFM"},
+        "pricing": {"Flat Embroidery": {"24": f"${12.25 + i % 7:.2f}", "48": f"${11.25 + i % 7:.2f}"}},
+        "available_colors": COLORS[i % 3:i % 3 + 4] + ([f"{COLORS[0]} (Out of Stock)"] if i % 5 == 0 else []),
+    } for i in range(count)]
+
+
+def write_data(data_dir: str, products: List[Dict[str, Any]], pages: int) -> str:
+    write_catalog(data_dir, products)
+    with open(os.path.join(data_dir, "patch_pricing.txt"), "w") as f:
+        f.write(PRICE_TXT * 20)
+    with open(os.path.join(data_dir, "about.txt"), "w") as f:
+        f.write("CapAmerica has made custom headwear in the USA since 1976. " * 40)
+    csv_path = os.path.join(data_dir, "website.csv")
+    with open(csv_path, "w", newline="") as f:
+        writer = csv.DictWriter(f, fieldnames=["url", "title", "content"])
+        writer.writeheader()
+        for i in range(pages):
+            writer.writerow({"url": f"https://capamerica.example/page/{i}", "title": f"Page {i}",
+                             "content": f"Page {i}. " + "Custom caps, decoration options and lead times. " * 30})
+    return csv_path
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--products", type=int, default=1000, help="catalog products")
+    parser.add_argument("--pages", type=int, default=200, help="website CSV rows")
+    parser.add_argument("--embed-latency", type=float, default=0.03, help="fake API response time (s)")
+    parser.add_argument("--changed", type=int, default=25, help="products repriced before the delta run")
+    parser.add_argument("--removed", type=int, default=10, help="products dropped before the delta run")
+    parser.add_argument("--batch-size", type=int, default=256)
+    parser.add_argument("--concurrency", type=int, default=4)
+    args = parser.parse_args()
+
+    logging.getLogger("httpx").setLevel(logging.WARNING)
+    from langchain_openai import OpenAIEmbeddings
+    from pinecone import Pinecone
+
+    from ingest import (PineconeSink, get_manifest_path, ingest, load_catalog_documents,
+                        load_txt_documents, load_website_documents)
+    from network import openai_client_kwargs, pinecone_index_kwargs
+
+    model = "text-embedding-3-large"
+    work_dir = tempfile.mkdtemp(prefix="bench_ingest_")
+    data_dir = os.path.join(work_dir, "data")
+    os.makedirs(data_dir)
+    products = synthetic_products(args.products)
+    csv_path = write_data(data_dir, products, args.pages)
+
+    def load():
+        return load_catalog_documents(data_dir) + load_txt_documents(data_dir) + load_website_documents(csv_path)
+
+    with FakeHTTPServer(latency=args.embed_latency, catalog_size=0) as server:
+        embeddings = OpenAIEmbeddings(model=model, api_key="fake", base_url=server.url + "/v1",
+                                      check_embedding_ctx_length=False,
+                                      **openai_client_kwargs("EMBEDDING_TIMEOUT", 10.0))
+        index = Pinecone(api_key="fake").Index(host=server.url, **pinecone_index_kwargs())
+
+        print(f"\n== {args.products} products, {args.pages} website pages, "
+              f"{args.embed_latency * 1000:.0f} ms per API call")
+        print(f"{'run':>34} {'docs':>6} {'embedded':>9} {'deleted':>8} {'requests':>9} {'saved':>6} {'docs/s':>8}")
+
+        def run(label: str, manifest_name: str, batch_size: int, concurrency: int) -> Dict[str, Any]:
+            server.requests.clear()
+            documents = load()
+            report = ingest(documents, PineconeSink(index), embeddings,
+                            get_manifest_path(manifest_name, work_dir), model,
+                            batch_size=batch_size, concurrency=concurrency)
+            print(f"{label:>34} {report['documents']:>6} {report['upserted']:>9} {report['deleted']:>8} "
+                  f"{server.requests['/v1/embeddings']:>9} {report['embedding_calls_saved']:>6} "
+                  f"{report['docs_per_second']:>8.0f}")
+            return report
+
+        server.vectors.clear()
+        run("full, batch 16, sequential", "baseline", 16, 1)
+        server.vectors.clear()
+        run(f"full, batch {args.batch_size}, {args.concurrency} concurrent", "incremental",
+            args.batch_size, args.concurrency)
+        run("no-op rerun", "incremental", args.batch_size, args.concurrency)
+
+        rng = random.Random(7)
+        for product in rng.sample(products, args.changed):
+            product["pricing"]["Flat Embroidery"]["24"] = "$99.00"
+        kept = products[args.removed:]
+        for name in os.listdir(data_dir):
+            if name.endswith(".json"):
+                os.remove(os.path.join(data_dir, name))
+        write_catalog(data_dir, kept)
+        run(f"delta: {args.changed} repriced, {args.removed} removed", "incremental",
+            args.batch_size, args.concurrency)
+
+        with server._lock:
+            for i, (vector_id, entry) in enumerate(list(server.vectors.items())):
+                server.vectors[f"legacy-{i}"] = entry
+        run("no manifest, index with old ids", "first_run", args.batch_size, args.concurrency)
+
+        expected = {doc.id for doc in load()}
+        in_sync = set(server.vectors) == expected
+        print(f"\n{'✅' if in_sync else '⚠️'} index holds {len(server.vectors)} vectors, "
+              f"{len(expected)} current chunks{'' if in_sync else ' (out of sync)'}")
+
+
+if __name__ == "__main__":
+    main()
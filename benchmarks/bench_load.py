@@ -0,0 +1,261 @@
+"""
+Traffic replay load test against the FastAPI app
+
+Replays conversations against app.py, either in-process through the ASGI
+interface (default; the app starts with the offline fake backends) or over
+HTTP against a running server (--url). Conversations come from a JSONL log
+or are generated synthetically; each is a sequence of turns for one user_id
+sent to /chat or /chat/agent, one after another with a think time between
+turns. New conversations arrive as a Poisson process at each rate given by
+--rates (conversations per second), one step per rate.
+
+Each step reports latency percentiles per endpoint, error rate, achieved
+throughput, event-loop lag (in-process only: how late a 10 ms timer fires)
+and RSS growth. Turns within a conversation are closed-loop, so an
+overloaded server shows up as growing latency rather than dropped load: the
+first step whose p95 exceeds --slo (or whose error rate exceeds 1%) is
+reported as the saturation point.
+
+Log format, one turn per line (turns of a user_id are replayed in order;
+"t" is the recorded offset in seconds and, when present, drives arrivals):
+
+    {"user_id": "u1", "query": "Do you have navy trucker caps?", "use_agent": false, "t": 0.0}
+
+    python -m benchmarks.bench_load --rates 1 2 4 8 --duration 20
+    python -m benchmarks.bench_load --log traffic.jsonl --speed 2
+    python -m benchmarks.bench_load --url http://localhost:8021 --rates 2 4
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import os
+import random
+import tempfile
+import time
+from collections import defaultdict
+from typing import Dict, List, Optional, Tuple
+
+import httpx
+
+from benchmarks.bench_scenarios import FOLLOW_UPS, OPENERS, peak_rss_mb, percentile
+
+# (user_id, [(query, use_agent), ...], arrival offset in seconds or None)
+Conversation = Tuple[str, List[Tuple[str, bool]], Optional[float]]
+
+
+def current_rss_mb() -> float:
+    """Resident set size now (Linux); peak RSS elsewhere"""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / (1024 * 1024)
+    except OSError:
+        return peak_rss_mb()
+
+
+def load_log(path: str) -> List[Conversation]:
+    turns: Dict[str, List[Tuple[str, bool]]] = defaultdict(list)
+    starts: Dict[str, Optional[float]] = {}
+    with open(path) as f:
+        for line in f:
+            if not line.strip():
+                continue
+            record = json.loads(line)
+            user_id = str(record["user_id"])
+            turns[user_id].append((record["query"], bool(record.get("use_agent", False))))
+            starts.setdefault(user_id, record.get("t"))
+    return [(user_id, user_turns, starts[user_id]) for user_id, user_turns in turns.items()]
+
+
+def synthetic_conversations(rng: random.Random, count: int, max_turns: int, agent_share: float) -> List[Conversation]:
+    conversations = []
+    for c in range(count):
+        use_agent = rng.random() < agent_share
+        turns = [rng.choice(OPENERS)] + [rng.choice(FOLLOW_UPS) for _ in range(rng.randint(0, max_turns - 1))]
+        conversations.append((f"load_{c}", [(turn, use_agent) for turn in turns], None))
+    return conversations
+
+
+class Step:
+    """Measurements for one arrival rate"""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.latencies: Dict[str, List[float]] = defaultdict(list)
+        self.completed: List[float] = []
+        self.errors = 0
+        self.requests = 0
+        self.offered = 0
+        self.loop_lag: List[float] = []
+        self.rss: List[Tuple[float, float]] = []
+
+
+async def send_turn(client: httpx.AsyncClient, step: Step, user_id: str, query: str, use_agent: bool) -> None:
+    endpoint = "/chat/agent" if use_agent else "/chat"
+    start = time.perf_counter()
+    try:
+        response = await client.post(endpoint, json={"user_id": user_id, "query": query})
+        ok = response.status_code == 200 and response.json().get("status_code", 200) == 200
+    except Exception:
+        ok = False
+    step.latencies[endpoint].append(time.perf_counter() - start)
+    step.completed.append(time.perf_counter() - step.started)
+    step.requests += 1
+    step.errors += not ok
+
+
+async def run_conversation(client, step: Step, conversation: Conversation, think_time: float, rng: random.Random):
+    user_id, turns, _ = conversation
+    for i, (query, use_agent) in enumerate(turns):
+        if i:
+            await asyncio.sleep(rng.expovariate(1 / think_time) if think_time else 0)
+        await send_turn(client, step, user_id, query, use_agent)
+
+
+async def monitor(step: Step, stop: asyncio.Event, in_process: bool, interval: float = 0.01) -> None:
+    """Sample event-loop lag and RSS until stopped"""
+    started = time.perf_counter()
+    last_rss = 0.0
+    while not stop.is_set():
+        before = time.perf_counter()
+        await asyncio.sleep(interval)
+        if in_process:
+            step.loop_lag.append(max(0.0, time.perf_counter() - before - interval))
+        if time.perf_counter() - last_rss >= 1.0:
+            last_rss = time.perf_counter()
+            step.rss.append((last_rss - started, current_rss_mb()))
+
+
+async def run_step(client, conversations: List[Conversation], rate: Optional[float], duration: float,
+                   think_time: float, speed: float, rng: random.Random, in_process: bool) -> Tuple[Step, float]:
+    step = Step()
+    stop = asyncio.Event()
+    monitor_task = asyncio.create_task(monitor(step, stop, in_process))
+    tasks = []
+    start = step.started
+    for index, conversation in enumerate(conversations):
+        recorded = conversation[2]
+        if rate is None and recorded is not None:
+            # Replay recorded arrival times, compressed by speed
+            delay = recorded / speed - (time.perf_counter() - start)
+        else:
+            delay = rng.expovariate(rate) if index else 0.0
+        if delay > 0:
+            await asyncio.sleep(delay)
+        if rate is not None and time.perf_counter() - start >= duration:
+            break
+        tasks.append(asyncio.create_task(run_conversation(client, step, conversation, think_time, rng)))
+        step.offered += len(conversation[1])
+    await asyncio.gather(*tasks)
+    elapsed = time.perf_counter() - start
+    stop.set()
+    await monitor_task
+    return step, elapsed
+
+
+def report(label: str, step: Step, elapsed: float, window: float, slo: float) -> bool:
+    """Print one step; True when the step is saturated
+
+    Throughput counts requests completed within the arrival window; offered
+    load is the turns of the conversations that arrived in it.
+    """
+    all_latencies = [value for values in step.latencies.values() for value in values]
+    window = window or elapsed
+    throughput = sum(t <= window for t in step.completed) / window
+    error_rate = step.errors / step.requests if step.requests else 0.0
+    p95 = percentile(all_latencies, 0.95) if all_latencies else 0.0
+    print(f"\n== {label}: {step.requests} requests in {elapsed:.1f}s, offered {step.offered / window:.1f} req/s, "
+          f"completed {throughput:.1f} req/s, error rate {error_rate:.1%}")
+    print(f"{'endpoint':>12} {'count':>6} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'max ms':>8}")
+    for endpoint, values in sorted(step.latencies.items()):
+        print(f"{endpoint:>12} {len(values):>6} {percentile(values, 0.5) * 1000:>8.0f} "
+              f"{percentile(values, 0.95) * 1000:>8.0f} {percentile(values, 0.99) * 1000:>8.0f} "
+              f"{max(values) * 1000:>8.0f}")
+    if step.loop_lag:
+        print(f"Event-loop lag: p50 {percentile(step.loop_lag, 0.5) * 1000:.1f} ms, "
+              f"p99 {percentile(step.loop_lag, 0.99) * 1000:.1f} ms, max {max(step.loop_lag) * 1000:.1f} ms")
+    if step.rss:
+        samples = ", ".join(f"{t:.0f}s:{mb:.0f}" for t, mb in step.rss[:: max(1, len(step.rss) // 8)])
+        print(f"RSS MB: {step.rss[0][1]:.0f} -> {step.rss[-1][1]:.0f} "
+              f"(+{step.rss[-1][1] - step.rss[0][1]:.1f}) [{samples}]")
+    return p95 > slo or error_rate > 0.01
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--url", help="base URL of a running server (default: in-process ASGI)")
+    parser.add_argument("--log", help="JSONL conversation log to replay (default: synthetic traffic)")
+    parser.add_argument("--rates", type=float, nargs="+", default=[1, 2, 4, 8],
+                        help="conversation arrival rates per second, one step each")
+    parser.add_argument("--duration", type=float, default=15, help="seconds of arrivals per step")
+    parser.add_argument("--speed", type=float, default=1.0, help="replay speed-up for recorded arrival times")
+    parser.add_argument("--think-time", type=float, default=0.5, help="mean seconds between a user's turns")
+    parser.add_argument("--max-turns", type=int, default=5, help="synthetic: max turns per conversation")
+    parser.add_argument("--agent-share", type=float, default=0.25, help="synthetic: share of agent conversations")
+    parser.add_argument("--slo", type=float, default=2.0, help="p95 seconds considered saturated")
+    parser.add_argument("--timeout", type=float, default=60.0)
+    parser.add_argument("--llm-latency", type=float, default=0.05)
+    parser.add_argument("--tokens-per-second", type=float, default=400.0)
+    parser.add_argument("--vector-latency", type=float, default=0.02)
+    parser.add_argument("--embedding-latency", type=float, default=0.02)
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+
+    # Per-request INFO lines from the app and httpx would drown the report
+    logging.getLogger("app").setLevel(logging.WARNING)
+    logging.getLogger("httpx").setLevel(logging.WARNING)
+    rng = random.Random(args.seed)
+    recorded = load_log(args.log) if args.log else None
+    replay_times = recorded is not None and all(start is not None for _, _, start in recorded)
+
+    lifespan = None
+    if args.url:
+        client = httpx.AsyncClient(base_url=args.url, timeout=args.timeout)
+    else:
+        os.environ.setdefault("MODEL_BACKEND", "fake")
+        os.environ.setdefault("VECTOR_BACKEND", "fake")
+        os.environ.setdefault("CHECKPOINT_DB_PATH", os.path.join(tempfile.mkdtemp(prefix="bench_load_"), "checkpoints.db"))
+        os.environ.update({
+            "FAKE_LLM_LATENCY": str(args.llm_latency),
+            "FAKE_LLM_TOKENS_PER_SECOND": str(args.tokens_per_second),
+            "FAKE_VECTOR_LATENCY": str(args.vector_latency),
+            "FAKE_EMBEDDING_LATENCY": str(args.embedding_latency),
+        })
+        from app import app
+        lifespan = app.router.lifespan_context(app)
+        await lifespan.__aenter__()
+        client = httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://app",
+                                   timeout=args.timeout)
+
+    saturation = None
+    try:
+        async with client:
+            if replay_times:
+                step, elapsed = await run_step(client, sorted(recorded, key=lambda c: c[2]), None, 0.0,
+                                               args.think_time, args.speed, rng, args.url is None)
+                report(f"replay of {args.log} at {args.speed}x", step, elapsed, 0.0, args.slo)
+                return
+            for level, rate in enumerate(args.rates):
+                # Enough conversations to keep arrivals going for the whole step
+                count = int(rate * args.duration * 2) + 1
+                if recorded is not None:
+                    conversations = [(f"{user_id}_{level}_{i}", turns, None)
+                                     for i, (user_id, turns, _) in enumerate(recorded * (count // len(recorded) + 1))]
+                else:
+                    conversations = [(f"{user_id}_{level}", turns, None) for user_id, turns, _ in
+                                     synthetic_conversations(rng, count, args.max_turns, args.agent_share)]
+                step, elapsed = await run_step(client, conversations, rate, args.duration,
+                                               args.think_time, args.speed, rng, args.url is None)
+                if report(f"{rate:g} conversations/s", step, elapsed, args.duration, args.slo):
+                    saturation = saturation or rate
+    finally:
+        if lifespan is not None:
+            await lifespan.__aexit__(None, None, None)
+
+    if args.rates and not replay_times:
+        print(f"\nSaturation: {'at ' + format(saturation, 'g') + ' conversations/s' if saturation else 'not reached'}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,190 @@
+"""
+Network layer benchmark against the local fake OpenAI/Pinecone server
+
+Runs the real clients (ChatOpenAI, OpenAIEmbeddings, Pinecone Index through
+PineconeVectorStore) against benchmarks/fake_http_server.py, so it needs no
+network or API keys. Three parts:
+
+- hedging: sequential vector queries with a slow tail (--slow-fraction of
+  requests take --slow-latency); raw store vs ResilientVectorStore without
+  and with hedging. Reports p50/p95/p99/max and the extra requests sent.
+- retries: embeddings with --error-rate injected 503s, without and with
+  retries, and vector queries raw and through ResilientVectorStore (the
+  query client leaves retries to the store). Reports the success rate.
+- connections: concurrent async vector queries through langchain_pinecone's
+  async client vs the pooled sync client (async_via_threads), and async
+  chat calls on the shared httpx client. Reports connections opened and
+  errors (the async client shares one session that each query closes).
+- outage: vector queries while Pinecone fails every request, then after it
+  recovers; with only deadline + retries vs behind a circuit breaker that
+  falls back to a local FAISS replica snapshotted beforehand.
+
+    python -m benchmarks.bench_network
+    python -m benchmarks.bench_network --queries 400 --slow-fraction 0.03 --slow-latency 0.3
+"""
+
+import argparse
+import asyncio
+import logging
+import os
+import tempfile
+import time
+from typing import Callable, List, Tuple
+
+from benchmarks.bench_scenarios import percentile
+from benchmarks.fake_http_server import FakeHTTPServer
+
+
+def latency_row(label: str, latencies: List[float], extra: str = "") -> None:
+    print(f"{label:>28} {percentile(latencies, 0.5) * 1000:>8.1f} {percentile(latencies, 0.95) * 1000:>8.1f} "
+          f"{percentile(latencies, 0.99) * 1000:>8.1f} {max(latencies) * 1000:>8.1f}  {extra}")
+
+
+def timed_calls(call: Callable[[], object], count: int) -> List[float]:
+    latencies = []
+    for _ in range(count):
+        start = time.perf_counter()
+        call()
+        latencies.append(time.perf_counter() - start)
+    return latencies
+
+
+def success_rate(call: Callable[[], object], count: int) -> float:
+    ok = 0
+    for _ in range(count):
+        try:
+            call()
+            ok += 1
+        except Exception:
+            pass
+    return ok / count
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--queries", type=int, default=300, help="vector queries per variant")
+    parser.add_argument("--latency", type=float, default=0.01, help="normal response time (s)")
+    parser.add_argument("--slow-fraction", type=float, default=0.03, help="share of slow responses")
+    parser.add_argument("--slow-latency", type=float, default=0.25, help="slow response time (s)")
+    parser.add_argument("--error-rate", type=float, default=0.1, help="share of 503s in the retry part")
+    parser.add_argument("--retry-calls", type=int, default=40, help="calls per variant in the retry part")
+    parser.add_argument("--concurrency", type=int, default=16, help="concurrent requests in the connection part")
+    parser.add_argument("--outage-queries", type=int, default=20, help="queries during the outage per variant")
+    args = parser.parse_args()
+
+    logging.getLogger("httpx").setLevel(logging.WARNING)
+    os.environ.setdefault("OPENAI_API_KEY", "fake")
+    from langchain.chat_models import init_chat_model
+    from langchain_openai import OpenAIEmbeddings
+    from langchain_pinecone import PineconeVectorStore
+
+    from circuit_breaker import CircuitBreaker, FallbackVectorStore
+    from network import ResilientVectorStore, openai_client_kwargs, pinecone_query_index
+
+    with FakeHTTPServer(latency=args.latency, slow_fraction=args.slow_fraction,
+                        slow_latency=args.slow_latency) as server:
+        base_url = server.url + "/v1"
+
+        def embeddings(max_retries: int) -> OpenAIEmbeddings:
+            kwargs = dict(openai_client_kwargs("EMBEDDING_TIMEOUT", 10.0), max_retries=max_retries)
+            return OpenAIEmbeddings(model="text-embedding-3-large", base_url=base_url,
+                                    check_embedding_ctx_length=False, **kwargs)
+
+        index = pinecone_query_index("fake", host=server.url)
+        store = PineconeVectorStore(embedding=embeddings(2), index=index)
+        vector = store.embeddings.embed_query("navy trucker cap")
+
+        print(f"\n== Hedging: {args.queries} queries, {args.slow_fraction:.0%} take {args.slow_latency * 1000:.0f} ms")
+        print(f"{'variant':>28} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'max ms':>8}")
+        variants = [
+            ("raw PineconeVectorStore", store),
+            ("deadline + retries", ResilientVectorStore(store, timeout=5.0, retries=2)),
+            ("deadline + retries + hedge", ResilientVectorStore(store, timeout=5.0, retries=2, hedge=True)),
+        ]
+        for label, variant in variants:
+            # Warm-up fills the latency window that sets the hedging threshold
+            for _ in range(30):
+                variant.similarity_search_by_vector_with_score(vector, k=4)
+            server.requests.clear()
+            latencies = timed_calls(lambda: variant.similarity_search_by_vector_with_score(vector, k=4), args.queries)
+            extra = f"{server.requests['/query'] / args.queries - 1:+.1%} requests"
+            if isinstance(variant, ResilientVectorStore):
+                stats = variant.stats()
+                extra += f", hedges {stats['hedges']}, hedge wins {stats['hedge_wins']}"
+            latency_row(label, latencies, extra)
+
+        server.slow_fraction, server.error_rate = 0.0, args.error_rate
+        print(f"\n== Retries: {args.error_rate:.0%} of requests fail with 503, {args.retry_calls} calls each")
+        rate = success_rate(lambda: store.similarity_search_by_vector_with_score(vector, k=4), args.retry_calls)
+        print(f"{'vector query (client)':>28} success {rate:.1%}")
+        resilient = ResilientVectorStore(store, timeout=5.0, retries=2)
+        rate = success_rate(lambda: resilient.similarity_search_by_vector_with_score(vector, k=4), args.retry_calls)
+        print(f"{'vector query, retries=2':>28} success {rate:.1%}")
+        for retries in (0, 2):
+            client = embeddings(retries)
+            rate = success_rate(lambda: client.embed_documents(["navy trucker cap"]), args.retry_calls)
+            print(f"{'embeddings, max_retries=' + str(retries):>28} success {rate:.1%}")
+
+        server.error_rate = 0.0
+        print(f"\n== Connections: {args.queries} async requests, {args.concurrency} at a time")
+        llm = init_chat_model("gpt-4o-mini", model_provider="openai", base_url=base_url,
+                              **openai_client_kwargs("LLM_TIMEOUT", 60.0))
+
+        async def run(call) -> Tuple[List[float], int]:
+            semaphore = asyncio.Semaphore(args.concurrency)
+            latencies, errors = [], 0
+
+            async def one():
+                nonlocal errors
+                async with semaphore:
+                    start = time.perf_counter()
+                    try:
+                        # The native async client can hang on a closed session
+                        await asyncio.wait_for(call(), 10)
+                    except Exception:
+                        errors += 1
+                    latencies.append(time.perf_counter() - start)
+            await asyncio.gather(*(one() for _ in range(args.queries)))
+            return latencies, errors
+
+        print(f"{'variant':>28} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'max ms':>8}")
+        pooled = ResilientVectorStore(store, async_via_threads=True)
+        for label, call in [
+            ("pinecone async client", lambda: store.asimilarity_search_by_vector_with_score(vector, k=4)),
+            ("pooled sync index", lambda: pooled.asimilarity_search_by_vector_with_score(vector, k=4)),
+            ("chat, shared httpx client", lambda: llm.ainvoke("Do you have navy trucker caps?")),
+        ]:
+            server.requests.clear()
+            latencies, errors = asyncio.run(run(call))
+            latency_row(label, latencies, f"{server.requests['connections']} connections opened, {errors} errors")
+
+        print(f"\n== Outage: Pinecone returns 503 for {args.outage_queries} queries, then recovers")
+        print(f"{'variant':>28} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'max ms':>8}")
+        replica_dir = os.path.join(tempfile.mkdtemp(prefix="bench_network_"), "replica")
+        guarded = FallbackVectorStore(ResilientVectorStore(store, timeout=2.0, retries=1),
+                                      CircuitBreaker("pdf", failure_threshold=3, latency_threshold=1.0, reset_seconds=1.0),
+                                      replica_dir)
+        guarded.snapshot_replica()
+        for label, variant in [("deadline + retries", ResilientVectorStore(store, timeout=2.0, retries=1)),
+                               ("breaker + replica", guarded)]:
+            server.outages = {"/query"}
+            latencies, answered = [], 0
+            for _ in range(args.outage_queries):
+                start = time.perf_counter()
+                try:
+                    answered += bool(variant.similarity_search_by_vector_with_score(vector, k=4))
+                except Exception:
+                    pass
+                latencies.append(time.perf_counter() - start)
+            server.outages = set()
+            time.sleep(1.1)
+            recovered = success_rate(lambda: variant.similarity_search_by_vector_with_score(vector, k=4), 5)
+            extra = f"answered {answered}/{args.outage_queries}, after recovery {recovered:.0%}"
+            if isinstance(variant, FallbackVectorStore):
+                stats = variant.stats()
+                extra += f", fallbacks {stats['fallbacks']}, breaker {stats['breaker_state']}"
+            latency_row(label, latencies, extra)
+
+
+if __name__ == "__main__":
+    main()
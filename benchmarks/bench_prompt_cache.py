@@ -0,0 +1,100 @@
+"""
+Prompt layout and provider prompt caching: prompt, cached and completion tokens
+
+Replays multi-turn counselor conversations against the fake backends with a
+fake model that mimics provider prompt caching (the longest previously seen
+message prefix is reported as cached tokens, and only uncached prompt tokens
+cost prefill time), once per layout:
+
+- per-turn system prompt: the retrieved context appended to the system
+  prompt, ahead of the history (the previous layout)
+- cacheable prefix: static system prompt and history first, context and
+  question last (rag.generation_prompt)
+
+Reports per-turn prompt, cached and completion tokens from the responses'
+"usage", the cached share, p50/p95 turn latency and the cost per 1,000 turns
+at the given per-million-token prices. The fake counts words as tokens.
+
+    python -m benchmarks.bench_prompt_cache
+    python -m benchmarks.bench_prompt_cache --turns 8 --prefill-tokens-per-second 2000
+"""
+
+import argparse
+import asyncio
+import time
+from typing import Any, List
+
+from langchain_core.messages import SystemMessage
+
+from benchmarks.bench_scenarios import FOLLOW_UPS, OPENERS, percentile
+from benchmarks.fakes import install_fake_backends
+
+
+def per_turn_system_prompt(history: List[Any], context_prompt: str, question: List[Any]) -> List[Any]:
+    """The previous layout: a new system message every turn, ahead of the history"""
+    import rag
+
+    return [SystemMessage(rag.get_headwear_catalog_system_prompt() + "\n\n" + context_prompt), *history, *question]
+
+
+async def run(rag, label: str, run_id: int, conversations: int, turns: int, prices: List[float]) -> None:
+    rag.llm.cached_prefixes = set()
+    latencies = []
+    totals = {"llm_calls": 0, "prompt_tokens": 0, "cached_tokens": 0, "completion_tokens": 0}
+    for c in range(conversations):
+        user_id = f"prompt_{label}_{c}"
+        for t in range(turns):
+            question = OPENERS[c % len(OPENERS)] if t == 0 else FOLLOW_UPS[(c + t) % len(FOLLOW_UPS)]
+            # Real customers rarely repeat each other word for word
+            question = f"{question} (order {run_id}{c:03d})"
+            start = time.perf_counter()
+            result = await rag.aget_response(question, user_id)
+            latencies.append(time.perf_counter() - start)
+            assert result["status_code"] == 200, result
+            for kind, count in result["usage"].items():
+                totals[kind] += count
+
+    count = len(latencies)
+    input_price, cached_price, output_price = prices
+    uncached = totals["prompt_tokens"] - totals["cached_tokens"]
+    cost = (uncached * input_price + totals["cached_tokens"] * cached_price
+            + totals["completion_tokens"] * output_price) / 1e6 / count * 1000
+    print(f"{label:>24} {totals['prompt_tokens'] / count:>8.0f} {totals['cached_tokens'] / count:>8.0f} "
+          f"{totals['cached_tokens'] / max(1, totals['prompt_tokens']):>7.1%} "
+          f"{totals['completion_tokens'] / count:>11.0f} {percentile(latencies, 0.5) * 1000:>7.0f} "
+          f"{percentile(latencies, 0.95) * 1000:>7.0f} {cost:>10.4f}")
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--conversations", type=int, default=8)
+    parser.add_argument("--turns", type=int, default=6, help="turns per conversation")
+    parser.add_argument("--llm-latency", type=float, default=0.2, help="time to first token, excluding prefill (s)")
+    parser.add_argument("--prefill-tokens-per-second", type=float, default=5000,
+                        help="uncached prompt tokens processed per second (0 = prefill is free)")
+    parser.add_argument("--vector-latency", type=float, default=0.05)
+    parser.add_argument("--prices", type=float, nargs=3, default=[0.15, 0.075, 0.60],
+                        metavar=("INPUT", "CACHED", "OUTPUT"), help="USD per million tokens (gpt-4o-mini list prices)")
+    args = parser.parse_args()
+
+    rag = install_fake_backends(args.llm_latency, args.vector_latency)
+    rag.llm.prompt_cache = True
+    rag.llm.prefill_tokens_per_second = args.prefill_tokens_per_second
+    # Every turn must reach the model
+    rag.answer_cache = None
+    rag.request_coalescer = None
+
+    print(f"\n== {args.conversations} conversations of {args.turns} turns per layout, "
+          f"LLM {args.llm_latency * 1000:.0f} ms + prefill at {args.prefill_tokens_per_second:g} tokens/s")
+    print(f"{'layout':>24} {'prompt':>8} {'cached':>8} {'cached%':>7} {'completion':>11} "
+          f"{'p50 ms':>7} {'p95 ms':>7} {'$/1k turns':>10}")
+    layout = rag.generation_prompt
+    rag.generation_prompt = per_turn_system_prompt
+    await run(rag, "per-turn system prompt", 1, args.conversations, args.turns, args.prices)
+    rag.generation_prompt = layout
+    await run(rag, "cacheable prefix", 2, args.conversations, args.turns, args.prices)
+    print("\nprompt, cached and completion are tokens per turn, summed over the turn's LLM calls.")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,124 @@
+"""
+Reduced-dimension and quantized index benchmark
+
+Compares compact local indexes (faiss_store.CompactFAISS) against the
+full-precision 3072-dimension flat index: recall@k of the baseline's top k,
+search latency and memory per vector. Variants cut the vectors to fewer
+dimensions (what EMBEDDING_DIMENSIONS / the API's `dimensions` parameter
+returns) and store them as float32, int8 or product-quantized codes, with
+and without re-scoring the top candidates against the float32 vectors.
+
+By default the vectors are synthetic: topic clusters with variance that
+decays over the dimensions, like text-embedding-3 output, whose leading
+dimensions carry most of the meaning. Their recall for truncation is
+indicative only; pass --index-dir with a local index exported from Pinecone
+(python faiss_store.py --index cap-rag-index) to measure the real vectors.
+Queries are stored vectors plus noise.
+
+    python -m benchmarks.bench_quantization
+    python -m benchmarks.bench_quantization --index-dir faiss_index/cap-rag-index --k 4
+"""
+
+import argparse
+import time
+from typing import List, Optional, Tuple
+
+import faiss
+import numpy as np
+from langchain_core.embeddings import DeterministicFakeEmbedding
+
+from benchmarks.bench_scenarios import percentile
+from faiss_store import build_compact_store, load_faiss_index, truncate_vectors
+
+VARIANTS: List[Tuple[Optional[int], str, bool]] = [
+    # (dimensions, quantization, re-score)
+    (None, "none", False),
+    (1024, "none", False),
+    (256, "none", False),
+    (None, "int8", True),
+    (1024, "int8", True),
+    (256, "int8", False),
+    (256, "int8", True),
+    (1024, "pq", True),
+    (256, "pq", False),
+    (256, "pq", True),
+]
+
+
+def synthetic_vectors(count: int, dimensions: int, topics: int, seed: int) -> np.ndarray:
+    rng = np.random.default_rng(seed)
+    scale = (1.0 + np.arange(dimensions) / 32.0) ** -0.5
+    centroids = rng.standard_normal((topics, dimensions)).astype(np.float32)
+    vectors = centroids[rng.integers(0, topics, count)] + 0.8 * rng.standard_normal((count, dimensions))
+    return (vectors * scale).astype(np.float32)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--documents", type=int, default=10000, help="synthetic vectors")
+    parser.add_argument("--dimensions", type=int, default=3072, help="synthetic vector size")
+    parser.add_argument("--topics", type=int, default=200, help="synthetic topic clusters")
+    parser.add_argument("--index-dir", help="use the vectors of this local FAISS index instead")
+    parser.add_argument("--queries", type=int, default=300)
+    parser.add_argument("--noise", type=float, default=0.6, help="query noise relative to a stored vector")
+    parser.add_argument("--k", type=int, default=4, help="results per query")
+    parser.add_argument("--rescore-factor", type=int, default=4, help="candidates re-scored per result")
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+
+    embeddings = DeterministicFakeEmbedding(size=8)
+    if args.index_dir:
+        source = load_faiss_index(args.index_dir, embeddings)
+        vectors = source.index.reconstruct_n(0, source.index.ntotal)
+        label = args.index_dir
+    else:
+        vectors = synthetic_vectors(args.documents, args.dimensions, args.topics, args.seed)
+        label = f"synthetic, {args.topics} topics"
+    vectors = truncate_vectors(vectors)
+    count, full_dimensions = vectors.shape
+    ids = [f"doc-{i}" for i in range(count)]
+    texts, metadatas = [""] * count, [{} for _ in range(count)]
+
+    rng = np.random.default_rng(args.seed + 1)
+    picks = rng.integers(0, count, args.queries)
+    queries = vectors[picks] + args.noise * rng.standard_normal((args.queries, full_dimensions)).astype(np.float32) \
+        * np.abs(vectors[picks]).mean(axis=1, keepdims=True) * np.sqrt(np.pi / 2)
+    queries = truncate_vectors(queries)
+
+    # Ground truth: exact top k over the full-precision vectors
+    exact = faiss.IndexFlatIP(full_dimensions)
+    exact.add(vectors)
+    _, truth = exact.search(queries, args.k)
+    truth_ids = [{ids[i] for i in row} for row in truth]
+
+    print(f"\n== {count} vectors of {full_dimensions} dimensions ({label}), {args.queries} queries, "
+          f"recall@{args.k} against full precision")
+    print(f"{'dims':>6} {'storage':>8} {'re-score':>9} {'recall':>7} {'p50 ms':>7} {'p95 ms':>7} "
+          f"{'B/vector':>9} {'index MB':>9} {'query KB':>9}")
+    for dimensions, quantization, rescore in VARIANTS:
+        dimensions = min(dimensions or full_dimensions, full_dimensions)
+        started = time.perf_counter()
+        store = build_compact_store(texts, vectors, metadatas, ids, embeddings, dimensions, quantization)
+        build_seconds = time.perf_counter() - started
+        if not rescore:
+            store.full_vectors = None
+        store.rescore_factor = args.rescore_factor
+
+        latencies, hits = [], 0
+        for query, expected in zip(queries, truth_ids):
+            start = time.perf_counter()
+            results = store.similarity_search_with_score_by_vector(query.tolist(), k=args.k)
+            latencies.append(time.perf_counter() - start)
+            hits += len(expected & {doc.id for doc, _ in results})
+
+        index_bytes = faiss.serialize_index(store.index).nbytes
+        print(f"{dimensions:>6} {quantization:>8} {'yes' if rescore else 'no':>9} "
+              f"{hits / (args.queries * args.k):>7.1%} {percentile(latencies, 0.5) * 1000:>7.2f} "
+              f"{percentile(latencies, 0.95) * 1000:>7.2f} {index_bytes / count:>9.0f} "
+              f"{index_bytes / 2**20:>9.1f} {dimensions * 4 / 1024:>9.1f}  (built in {build_seconds:.1f}s)")
+    print("\nB/vector and index MB are held in memory; re-scored variants also keep the float32 vectors "
+          "on disk (vectors.npy, memory-mapped). query KB is the float32 size of one query embedding.")
+
+
+if __name__ == "__main__":
+    main()
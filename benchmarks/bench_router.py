@@ -0,0 +1,83 @@
+"""
+LLM calls and latency with and without the local intent router
+
+Replays a mixed traffic sample (catalog and pricing questions, small talk,
+follow-ups, exact quotes) through the counselor graph twice against the fake
+backends: once with every turn going through the tool-selection LLM call,
+once with the router in front of it.
+
+    python -m benchmarks.bench_router --llm-latency 0.3
+"""
+
+import argparse
+import asyncio
+import statistics
+import time
+
+from benchmarks.fakes import install_fake_backends
+
+# One conversation per entry; turns after the first have history
+CONVERSATIONS = [
+    ["Hi there!", "Do you have navy trucker caps?", "what about that one in gray?", "thanks so much"],
+    ["How much are performance caps for a golf event?", "price for 48 i7041 caps with a leather patch"],
+    ["Tell me about i8502", "which colors are in stock for it?", "great, thanks"],
+    ["How long does shipping take?", "Do you offer free samples of foam trucker hats?"],
+    ["hello", "I'm planning a company retreat", "what hats would suit a beach setting with 200 people?"],
+    ["What embroidery options do you offer on visors?", "48", "ok perfect, bye"],
+]
+
+
+def percentile(values, q: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(q * (len(ordered) - 1))))]
+
+
+async def replay(rag, label: str, rounds: int) -> dict:
+    latencies = []
+    calls_before = rag.llm.calls
+    for r in range(rounds):
+        for c, turns in enumerate(CONVERSATIONS):
+            user_id = f"router_{label}_{r}_{c}"
+            for turn in turns:
+                start = time.perf_counter()
+                result = await rag.aget_response(turn, user_id)
+                latencies.append(time.perf_counter() - start)
+                assert result["status_code"] == 200, result
+    return {
+        "turns": len(latencies),
+        "llm_calls": rag.llm.calls - calls_before,
+        "p50": percentile(latencies, 0.50) * 1000,
+        "p95": percentile(latencies, 0.95) * 1000,
+        "mean": statistics.mean(latencies) * 1000,
+    }
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--llm-latency", type=float, default=0.2)
+    parser.add_argument("--vector-latency", type=float, default=0.03)
+    parser.add_argument("--rounds", type=int, default=3)
+    args = parser.parse_args()
+
+    rag = install_fake_backends(args.llm_latency, args.vector_latency)
+    # Every turn must run the graph; repeated questions would otherwise be answered from cache
+    rag.answer_cache = None
+    router = rag.intent_router
+
+    rag.intent_router = None
+    baseline = await replay(rag, "off", args.rounds)
+    rag.intent_router = router
+    routed = await replay(rag, "on", args.rounds)
+
+    print(f"\n{'':>8} {'turns':>6} {'LLM calls':>10} {'p50 ms':>8} {'p95 ms':>8} {'mean ms':>8}")
+    for name, result in (("no router", baseline), ("router", routed)):
+        print(f"{name:>8} {result['turns']:>6} {result['llm_calls']:>10} {result['p50']:>8.0f} "
+              f"{result['p95']:>8.0f} {result['mean']:>8.0f}")
+    stats = router.stats()
+    print(f"\nRouter decisions: {stats['retrieve']} retrieval, {stats['chitchat']} small talk, "
+          f"{stats['llm']} to LLM; {stats['llm_calls_saved']} tool-selection calls saved "
+          f"({baseline['llm_calls'] - routed['llm_calls']} fewer LLM calls in total)")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
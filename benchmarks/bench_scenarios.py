@@ -0,0 +1,195 @@
+"""
+Scenario benchmarks for aget_response on the offline backends
+
+Initializes the full system through initialize_rag_system with the fake model
+and vector backends (MODEL_BACKEND=fake, VECTOR_BACKEND=fake), so everything
+else - embedding cache, checkpointer, router - runs as configured in
+production. The answer cache and request coalescing are off, as in the other
+benchmarks: the scenarios repeat their questions, and a turn served from
+either would not measure the pipeline. Scenarios:
+
+- counselor: multi-turn conversations, one at a time, counselor mode
+- agent: the same conversations in agent mode
+- long_thread: one conversation of many turns (history growth, summarization)
+- concurrent: many users holding multi-turn conversations at once
+
+Each reports p50/p95/p99 turn latency, turns per second and the process's
+peak RSS after the scenario. Every scenario runs --repeat times with the
+same conversations (new user ids) and the run with the lowest p95 is kept:
+other load on the machine only ever slows a run down. Results can be saved as a baseline and later
+runs compared against it; the exit status is 1 when a scenario's p95 or
+throughput regressed by more than --tolerance.
+
+    python -m benchmarks.bench_scenarios --save-baseline benchmarks/baselines/offline.json
+    python -m benchmarks.bench_scenarios --baseline benchmarks/baselines/offline.json
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import random
+import resource
+import sys
+import tempfile
+import time
+from typing import Dict, List
+
+SCENARIOS = ["counselor", "agent", "long_thread", "concurrent"]
+
+OPENERS = [
+    "Do you have navy trucker caps?",
+    "Which performance caps work for a golf tournament?",
+    "Tell me about i8502",
+    "How much are 144 snap backs with a leather patch?",
+    "What colors does the foam trucker come in?",
+    "Do you offer free samples?",
+    "I need visors for a beach volleyball event",
+    "What embroidery options are available on knit beanies?",
+]
+FOLLOW_UPS = [
+    "what about that one in gray?",
+    "how much for 48 of them?",
+    "does it come in youth sizes too?",
+    "can you add a woven patch instead?",
+    "which of those ships fastest?",
+    "thanks, that helps",
+]
+
+
+def percentile(values: List[float], q: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(q * (len(ordered) - 1))))]
+
+
+def peak_rss_mb() -> float:
+    # ru_maxrss is KiB on Linux, bytes on macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+def conversation(rng: random.Random, turns: int) -> List[str]:
+    """An opener followed by follow-ups, drawn deterministically from rng"""
+    return [rng.choice(OPENERS)] + [rng.choice(FOLLOW_UPS) for _ in range(turns - 1)]
+
+
+async def run_conversation(rag, user_id: str, turns: List[str], use_agent: bool,
+                           latencies: List[float], errors: List[dict]) -> None:
+    for turn in turns:
+        start = time.perf_counter()
+        result = await rag.aget_response(turn, user_id, use_agent=use_agent)
+        latencies.append(time.perf_counter() - start)
+        if result["status_code"] != 200:
+            errors.append(result)
+
+
+async def run_scenario(rag, name: str, args) -> Dict[str, float]:
+    rng = random.Random(f"{args.seed}:{name}")
+    latencies: List[float] = []
+    errors: List[dict] = []
+    prefix = f"{name}_{time.time_ns()}"
+    start = time.perf_counter()
+    if name in ("counselor", "agent"):
+        for c in range(args.conversations):
+            await run_conversation(rag, f"{prefix}_{c}", conversation(rng, args.turns),
+                                   name == "agent", latencies, errors)
+    elif name == "long_thread":
+        await run_conversation(rag, f"{prefix}_0", conversation(rng, args.long_turns), False, latencies, errors)
+    elif name == "concurrent":
+        await asyncio.gather(*(
+            run_conversation(rag, f"{prefix}_{u}", conversation(rng, args.turns), u % 4 == 0, latencies, errors)
+            for u in range(args.users)
+        ))
+    elapsed = time.perf_counter() - start
+    return {
+        "turns": len(latencies),
+        "errors": len(errors),
+        "p50_ms": percentile(latencies, 0.50) * 1000,
+        "p95_ms": percentile(latencies, 0.95) * 1000,
+        "p99_ms": percentile(latencies, 0.99) * 1000,
+        "rps": len(latencies) / elapsed,
+        "peak_rss_mb": peak_rss_mb(),
+    }
+
+
+def compare(results: Dict[str, dict], baseline: Dict[str, dict], tolerance: float) -> bool:
+    """Print changes against the baseline; True when anything regressed beyond tolerance"""
+    regressed = False
+    print(f"\nAgainst baseline (tolerance {tolerance:.0%}):")
+    print(f"{'scenario':>12} {'p50':>9} {'p95':>9} {'p99':>9} {'rps':>9} {'rss':>9}")
+    for name, result in results.items():
+        base = baseline.get(name)
+        if not base:
+            print(f"{name:>12} (no baseline)")
+            continue
+        changes = {key: result[key] / base[key] - 1 if base[key] else 0.0
+                   for key in ("p50_ms", "p95_ms", "p99_ms", "rps", "peak_rss_mb")}
+        worse = changes["p95_ms"] > tolerance or -changes["rps"] > tolerance
+        regressed |= worse
+        print(f"{name:>12} " + " ".join(f"{changes[key]:>+9.1%}" for key in changes)
+              + ("  REGRESSION" if worse else ""))
+    return regressed
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--scenarios", nargs="+", choices=SCENARIOS, default=SCENARIOS)
+    parser.add_argument("--conversations", type=int, default=20, help="conversations in counselor/agent")
+    parser.add_argument("--turns", type=int, default=4, help="turns per conversation")
+    parser.add_argument("--long-turns", type=int, default=40, help="turns in long_thread")
+    parser.add_argument("--users", type=int, default=64, help="simultaneous users in concurrent")
+    parser.add_argument("--llm-latency", type=float, default=0.05, help="seconds to first token")
+    parser.add_argument("--tokens-per-second", type=float, default=400.0, help="LLM generation rate")
+    parser.add_argument("--embedding-latency", type=float, default=0.02)
+    parser.add_argument("--vector-latency", type=float, default=0.02)
+    parser.add_argument("--catalog-size", type=int, default=200, help="products in the synthetic catalog")
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--repeat", type=int, default=3, help="runs per scenario; the one with the lowest p95 counts")
+    parser.add_argument("--save-baseline", help="write results to this JSON file")
+    parser.add_argument("--baseline", help="compare results with this JSON file")
+    parser.add_argument("--tolerance", type=float, default=0.10, help="allowed p95/rps regression")
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="bench_scenarios_")
+    os.environ.update({
+        "MODEL_BACKEND": "fake",
+        "VECTOR_BACKEND": "fake",
+        "FAKE_LLM_LATENCY": str(args.llm_latency),
+        "FAKE_LLM_TOKENS_PER_SECOND": str(args.tokens_per_second),
+        "FAKE_EMBEDDING_LATENCY": str(args.embedding_latency),
+        "FAKE_VECTOR_LATENCY": str(args.vector_latency),
+        "FAKE_CATALOG_SIZE": str(args.catalog_size),
+        # Every turn runs the pipeline
+        "ANSWER_CACHE": "0",
+        "REQUEST_COALESCING": "0",
+        # A fresh checkpoint database per run
+        "CHECKPOINT_DB_PATH": os.path.join(workdir, "checkpoints.db"),
+    })
+    import rag
+    rag.initialize_rag_system()
+
+    results = {}
+    print(f"\n{'scenario':>12} {'turns':>6} {'errors':>6} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} "
+          f"{'turns/s':>8} {'peak RSS MB':>12}")
+    for name in args.scenarios:
+        runs = [await run_scenario(rag, name, args) for _ in range(max(1, args.repeat))]
+        result = results[name] = min(runs, key=lambda run: run["p95_ms"])
+        print(f"{name:>12} {result['turns']:>6} {result['errors']:>6} {result['p50_ms']:>8.0f} "
+              f"{result['p95_ms']:>8.0f} {result['p99_ms']:>8.0f} {result['rps']:>8.1f} "
+              f"{result['peak_rss_mb']:>12.0f}")
+
+    if args.save_baseline:
+        os.makedirs(os.path.dirname(args.save_baseline) or ".", exist_ok=True)
+        with open(args.save_baseline, "w") as f:
+            json.dump({"config": vars(args) | {"save_baseline": None, "baseline": None}, "results": results},
+                      f, indent=2)
+        print(f"\nSaved baseline to {args.save_baseline}")
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        if compare(results, baseline["results"], args.tolerance):
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
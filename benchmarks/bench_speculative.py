@@ -0,0 +1,81 @@
+"""
+Turn latency with and without speculative retrieval
+
+Speculation only helps turns that go through the tool-selection LLM call, so
+the intent router is switched off here. The fake LLM searches for the user's
+own words except on every Nth tool call (--rewrite-every), where it rewrites
+the query and the speculation is discarded.
+
+    python -m benchmarks.bench_speculative --llm-latency 0.3 --vector-latency 0.08
+"""
+
+import argparse
+import asyncio
+import statistics
+import time
+
+from benchmarks.fakes import install_fake_backends
+from speculative import SpeculativeRetrieval
+
+QUESTIONS = [
+    "Do you have navy trucker caps?",
+    "lightweight performance hats for a golf event",
+    "What colors does the foam trucker come in?",
+    "Do you offer free samples?",
+    "visors with embroidered logos",
+]
+
+
+def percentile(values, q: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(q * (len(ordered) - 1))))]
+
+
+async def replay(rag, label: str, turns: int, concurrency: int) -> dict:
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies = []
+
+    async def one(i: int):
+        async with semaphore:
+            start = time.perf_counter()
+            result = await rag.aget_response(QUESTIONS[i % len(QUESTIONS)], f"spec_{label}_{i}")
+            latencies.append(time.perf_counter() - start)
+            assert result["status_code"] == 200, result
+
+    await asyncio.gather(*(one(i) for i in range(turns)))
+    return {"p50": percentile(latencies, 0.5) * 1000, "p95": percentile(latencies, 0.95) * 1000,
+            "mean": statistics.mean(latencies) * 1000}
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--llm-latency", type=float, default=0.2)
+    parser.add_argument("--vector-latency", type=float, default=0.05)
+    parser.add_argument("--embedding-latency", type=float, default=0.05)
+    parser.add_argument("--rewrite-every", type=int, default=4, help="every Nth tool call rewrites the query")
+    parser.add_argument("--turns", type=int, default=100)
+    parser.add_argument("--concurrency", type=int, default=10)
+    args = parser.parse_args()
+
+    rag = install_fake_backends(args.llm_latency, args.vector_latency, args.embedding_latency)
+    # Every turn must run the graph; repeated questions would otherwise be answered from cache
+    rag.answer_cache = None
+    rag.intent_router = None
+    rag.llm.rewrite_every = args.rewrite_every
+
+    rag.speculative_retrieval = None
+    baseline = await replay(rag, "off", args.turns, args.concurrency)
+    rag.speculative_retrieval = SpeculativeRetrieval(rag.vector_results, rag.avector_results)
+    speculative = await replay(rag, "on", args.turns, args.concurrency)
+
+    print(f"\n{'':>12} {'p50 ms':>8} {'p95 ms':>8} {'mean ms':>8}")
+    for name, result in (("sequential", baseline), ("speculative", speculative)):
+        print(f"{name:>12} {result['p50']:>8.0f} {result['p95']:>8.0f} {result['mean']:>8.0f}")
+    stats = rag.speculative_retrieval.stats()
+    print(f"\nSpeculations: {stats['started']} started, {stats['hits']} reused "
+          f"(hit rate {stats['hit_rate']:.0%}), {stats['misses']} tool queries missed, "
+          f"{stats['unused']} discarded; {stats['seconds_saved']:.1f}s of retrieval overlapped")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
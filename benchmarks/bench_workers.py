@@ -0,0 +1,124 @@
+"""
+Throughput and correctness with several worker processes sharing conversation state
+
+Each worker is a separate process with its own fake backends (like a uvicorn
+worker) and the same SQLite checkpoint database. Turns are handed out
+turn-major from one queue, so consecutive turns of the same user usually land
+on different workers at the same time, as they would behind a load balancer.
+After each run every conversation is checked for lost turns.
+
+    python -m benchmarks.bench_workers --workers 1 2 4
+    python -m benchmarks.bench_workers --workers 4 --no-locks   # shows lost updates
+"""
+
+import argparse
+import asyncio
+import multiprocessing as mp
+import os
+import tempfile
+import time
+
+# Messages one counselor turn adds: question, tool call, tool result, answer
+MESSAGES_PER_TURN = 4
+
+
+def worker_main(db_path: str, jobs, ready, start, done, concurrency: int, llm_latency: float,
+                vector_latency: float, use_locks: bool):
+    os.environ["CHECKPOINT_BACKEND"] = "sqlite"
+    os.environ["CHECKPOINT_DB_PATH"] = db_path
+    from benchmarks.fakes import install_fake_backends
+
+    rag = install_fake_backends(llm_latency, vector_latency)
+    # Every turn must run the graph; repeated questions would otherwise be answered from cache
+    rag.answer_cache = None
+    if not use_locks:
+        rag.thread_locks = None
+
+    async def consume(loop):
+        completed = 0
+        while True:
+            job = await loop.run_in_executor(None, jobs.get)
+            if job is None:
+                return completed
+            user_id, turn = job
+            result = await rag.aget_response(f"turn {turn}: navy trucker caps pricing", user_id)
+            assert result["status_code"] == 200, result
+            completed += 1
+
+    async def run():
+        loop = asyncio.get_running_loop()
+        counts = await asyncio.gather(*(consume(loop) for _ in range(concurrency)))
+        return sum(counts)
+
+    ready.set()
+    start.wait()
+    done.put(asyncio.run(run()))
+
+
+def count_lost_turns(db_path: str, users: int, turns: int) -> int:
+    from checkpoint_store import SQLiteCheckpointSaver
+
+    saver = SQLiteCheckpointSaver(db_path)
+    lost = 0
+    for u in range(users):
+        checkpoint = saver.get_tuple({"configurable": {"thread_id": f"user_bench_{u}"}})
+        messages = checkpoint.checkpoint["channel_values"].get("messages", []) if checkpoint else []
+        lost += turns - len(messages) // MESSAGES_PER_TURN
+    return lost
+
+
+def run_level(workers: int, args) -> tuple:
+    ctx = mp.get_context("spawn")
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = os.path.join(tmp, "checkpoints.db")
+        jobs, done, start = ctx.Queue(), ctx.Queue(), ctx.Event()
+        readies = []
+        processes = []
+        for _ in range(workers):
+            ready = ctx.Event()
+            process = ctx.Process(target=worker_main, args=(
+                db_path, jobs, ready, start, done, args.concurrency, args.llm_latency,
+                args.vector_latency, not args.no_locks,
+            ))
+            process.start()
+            readies.append(ready)
+            processes.append(process)
+        for ready in readies:
+            ready.wait()
+
+        for turn in range(args.turns):
+            for u in range(args.users):
+                jobs.put((f"bench_{u}", turn))
+        for _ in range(workers * args.concurrency):
+            jobs.put(None)
+
+        started = time.perf_counter()
+        start.set()
+        completed = sum(done.get() for _ in processes)
+        elapsed = time.perf_counter() - started
+        for process in processes:
+            process.join()
+        return completed / elapsed, count_lost_turns(db_path, args.users, args.turns)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4])
+    parser.add_argument("--users", type=int, default=20)
+    parser.add_argument("--turns", type=int, default=6, help="turns per user (kept below the history fold point)")
+    parser.add_argument("--concurrency", type=int, default=16, help="in-flight turns per worker")
+    parser.add_argument("--llm-latency", type=float, default=0.01)
+    parser.add_argument("--vector-latency", type=float, default=0.005)
+    parser.add_argument("--no-locks", action="store_true", help="disable per-conversation locking")
+    args = parser.parse_args()
+
+    print(f"\n{args.users} users x {args.turns} turns, {args.concurrency} in flight per worker, "
+          f"locks {'off' if args.no_locks else 'on'}")
+    print(f"{'workers':>8} {'req/s':>8} {'lost turns':>11}")
+    for workers in args.workers:
+        rps, lost = run_level(workers, args)
+        print(f"{workers:>8} {rps:>8.1f} {lost:>11}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,278 @@
+"""
+Local fake of the OpenAI and Pinecone HTTP APIs, for offline network tests
+
+Serves just enough of each API for the real clients to work against it:
+
+- POST /v1/chat/completions  (OpenAI; JSON or SSE when "stream" is set)
+- POST /v1/embeddings        (OpenAI; deterministic vectors per input text)
+- POST /query                (Pinecone index data plane; catalog matches)
+- GET  /vectors/list, /vectors/fetch  (Pinecone; for exporting the index)
+- POST /vectors/upsert, /vectors/delete  (Pinecone; for ingestion)
+
+Point ChatOpenAI / OpenAIEmbeddings at it with base_url=<url>/v1 (or
+OPENAI_BASE_URL) and Pinecone with pc.Index(host=<url>). Every response
+waits `latency` seconds; a `slow_fraction` of requests waits `slow_latency`
+instead (a long tail for hedging), and an `error_rate` share fails with 503
+(for retries). Paths starting with a prefix in `outages` always fail (e.g.
+{"/query"} takes Pinecone down while OpenAI keeps working). Counters record
+requests and connections per endpoint.
+
+    with FakeHTTPServer(latency=0.01, slow_fraction=0.05, slow_latency=0.2) as server:
+        embeddings = OpenAIEmbeddings(api_key="fake", base_url=server.url + "/v1")
+"""
+
+import hashlib
+import json
+import random
+import threading
+import time
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, List, Optional, Tuple
+from urllib.parse import parse_qs
+
+from langchain_core.documents import Document
+
+from benchmarks.fakes import synthetic_catalog_documents
+
+
+def fake_vector(text: str, dimensions: int) -> List[float]:
+    """Deterministic unit vector for text"""
+    seed = int.from_bytes(hashlib.sha1(text.encode("utf-8")).digest()[:8], "big")
+    rng = random.Random(seed)
+    values = [rng.gauss(0, 1) for _ in range(dimensions)]
+    norm = sum(v * v for v in values) ** 0.5 or 1.0
+    return [v / norm for v in values]
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    server: "_Server"
+
+    def log_message(self, format: str, *args: Any) -> None:
+        pass
+
+    def setup(self) -> None:
+        super().setup()
+        self.server.owner.count("connections")
+
+    def _send_json(self, status: int, body: Dict[str, Any]) -> None:
+        payload = json.dumps(body).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def do_GET(self) -> None:
+        owner = self.server.owner
+        path, _, query = self.path.partition("?")
+        params = parse_qs(query)
+        routes = {"/vectors/list": owner.list_vectors, "/vectors/fetch": owner.fetch_vectors}
+        if path not in routes:
+            self._send_json(404, {"error": {"message": f"no route {self.path}"}})
+            return
+        owner.count(path)
+        delay, fail = owner.draw(path)
+        time.sleep(delay)
+        if fail:
+            owner.count("errors")
+            self._send_json(503, {"error": {"message": "injected failure"}})
+            return
+        self._send_json(200, routes[path](params))
+
+    def do_POST(self) -> None:
+        owner = self.server.owner
+        body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+        routes = {
+            "/v1/chat/completions": owner.chat_completion,
+            "/v1/embeddings": owner.embeddings,
+            "/query": owner.query,
+            "/vectors/upsert": owner.upsert_vectors,
+            "/vectors/delete": owner.delete_vectors,
+        }
+        route = routes.get(self.path.split("?")[0])
+        if route is None:
+            self._send_json(404, {"error": {"message": f"no route {self.path}"}})
+            return
+        owner.count(self.path)
+        delay, fail = owner.draw(self.path)
+        time.sleep(delay)
+        if fail:
+            owner.count("errors")
+            self._send_json(503, {"error": {"message": "injected failure", "type": "server_error"}})
+            return
+        if self.path.startswith("/v1/chat") and body.get("stream"):
+            self._stream_chat(owner.chat_completion(body))
+            return
+        self._send_json(200, route(body))
+
+    def _stream_chat(self, completion: Dict[str, Any]) -> None:
+        text = completion["choices"][0]["message"]["content"]
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        base = {key: completion[key] for key in ("id", "object", "created", "model")}
+        base["object"] = "chat.completion.chunk"
+        events = [dict(base, choices=[{"index": 0, "delta": {"role": "assistant", "content": word + " "},
+                                       "finish_reason": None}]) for word in text.split()]
+        events.append(dict(base, choices=[{"index": 0, "delta": {}, "finish_reason": "stop"}]))
+        for event in events:
+            self._chunk(f"data: {json.dumps(event)}\n\n".encode("utf-8"))
+        self._chunk(b"data: [DONE]\n\n")
+        self._chunk(b"")
+
+    def _chunk(self, data: bytes) -> None:
+        self.wfile.write(f"{len(data):x}\r\n".encode("ascii") + data + b"\r\n")
+
+
+class _Server(ThreadingHTTPServer):
+    daemon_threads = True
+    # Bursts of new connections must not overflow the listen backlog
+    request_queue_size = 256
+    owner: "FakeHTTPServer"
+
+    def handle_error(self, request, client_address) -> None:
+        # Clients closing pooled connections are expected
+        pass
+
+
+class FakeHTTPServer:
+    """OpenAI + Pinecone lookalike on 127.0.0.1, run in a background thread"""
+
+    def __init__(self, latency: float = 0.0, slow_fraction: float = 0.0, slow_latency: float = 0.0,
+                 error_rate: float = 0.0, dimensions: int = 64, catalog_size: int = 50, seed: int = 7):
+        self.latency = latency
+        self.slow_fraction = slow_fraction
+        self.slow_latency = slow_latency
+        self.error_rate = error_rate
+        self.outages: set = set()
+        self.dimensions = dimensions
+        self.requests: Counter = Counter()
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+        # id -> (document, vector); upserts and deletes change it
+        self.vectors: Dict[str, Tuple[Document, List[float]]] = {
+            doc.metadata.get("product_id") or f"doc-{i}": (doc, fake_vector(doc.page_content, dimensions))
+            for i, doc in enumerate(synthetic_catalog_documents(catalog_size))
+        }
+        self._server: Optional[_Server] = None
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self) -> "FakeHTTPServer":
+        self._server = _Server(("127.0.0.1", 0), _Handler)
+        self._server.owner = self
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+
+    def __enter__(self) -> "FakeHTTPServer":
+        return self.start()
+
+    def __exit__(self, *exc: Any) -> None:
+        self.stop()
+
+    def count(self, key: str) -> None:
+        with self._lock:
+            self.requests[key] += 1
+
+    def draw(self, path: str):
+        """(delay, whether to fail) for the next request to path"""
+        with self._lock:
+            slow = self._rng.random() < self.slow_fraction
+            fail = self._rng.random() < self.error_rate
+        fail = fail or any(path.startswith(prefix) for prefix in self.outages)
+        return (self.slow_latency if slow else self.latency), fail
+
+    # API bodies
+
+    def chat_completion(self, body: Dict[str, Any]) -> Dict[str, Any]:
+        question = next((m.get("content") for m in reversed(body.get("messages", []))
+                         if m.get("role") == "user"), "") or ""
+        answer = f"Here is what I found about {str(question)[:60]}."
+        prompt_tokens = sum(len(str(m.get("content", "")).split()) for m in body.get("messages", []))
+        return {
+            "id": f"chatcmpl-{time.time_ns()}",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": body.get("model", "fake"),
+            "choices": [{"index": 0, "message": {"role": "assistant", "content": answer}, "finish_reason": "stop"}],
+            "usage": {"prompt_tokens": prompt_tokens, "completion_tokens": len(answer.split()),
+                      "total_tokens": prompt_tokens + len(answer.split())},
+        }
+
+    def embeddings(self, body: Dict[str, Any]) -> Dict[str, Any]:
+        inputs = body.get("input", [])
+        inputs = [inputs] if isinstance(inputs, (str, int)) else inputs
+        # langchain_openai sends token ids when tiktoken is available
+        texts = [" ".join(map(str, item)) if isinstance(item, list) else str(item) for item in inputs]
+        dimensions = int(body.get("dimensions") or self.dimensions)
+        return {
+            "object": "list",
+            "model": body.get("model", "fake"),
+            "data": [{"object": "embedding", "index": i, "embedding": fake_vector(text, dimensions)}
+                     for i, text in enumerate(texts)],
+            "usage": {"prompt_tokens": len(texts), "total_tokens": len(texts)},
+        }
+
+    def query(self, body: Dict[str, Any]) -> Dict[str, Any]:
+        vector = body.get("vector") or []
+        records = list(self.vectors.items())
+        scored = sorted(((sum(a * b for a, b in zip(vector, doc_vector)), vector_id, doc)
+                         for vector_id, (doc, doc_vector) in records),
+                        key=lambda match: match[0], reverse=True)[: int(body.get("topK", 4))]
+        return {
+            "matches": [{"id": vector_id, "score": score, "metadata": dict(doc.metadata, text=doc.page_content)}
+                        for score, vector_id, doc in scored],
+            "namespace": body.get("namespace", ""),
+        }
+
+    def list_vectors(self, params: Dict[str, List[str]]) -> Dict[str, Any]:
+        start = int((params.get("paginationToken") or ["0"])[0])
+        limit = int((params.get("limit") or ["100"])[0])
+        end = start + limit
+        ids = list(self.vectors)
+        return {
+            "vectors": [{"id": vector_id} for vector_id in ids[start:end]],
+            "pagination": {"next": str(end)} if end < len(ids) else None,
+            "namespace": (params.get("namespace") or [""])[0],
+            "usage": {"readUnits": 1},
+        }
+
+    def fetch_vectors(self, params: Dict[str, List[str]]) -> Dict[str, Any]:
+        wanted = set(params.get("ids", []))
+        return {
+            "vectors": {vector_id: {"id": vector_id, "values": vector, "metadata": dict(doc.metadata, text=doc.page_content)}
+                        for vector_id, (doc, vector) in list(self.vectors.items()) if vector_id in wanted},
+            "namespace": (params.get("namespace") or [""])[0],
+            "usage": {"readUnits": 1},
+        }
+
+    def upsert_vectors(self, body: Dict[str, Any]) -> Dict[str, Any]:
+        records = body.get("vectors", [])
+        with self._lock:
+            for record in records:
+                metadata = dict(record.get("metadata") or {})
+                text = metadata.pop("text", "")
+                self.vectors[record["id"]] = (Document(page_content=text, metadata=metadata), record["values"])
+        return {"upsertedCount": len(records)}
+
+    def delete_vectors(self, body: Dict[str, Any]) -> Dict[str, Any]:
+        with self._lock:
+            if body.get("deleteAll"):
+                self.vectors.clear()
+            for vector_id in body.get("ids", []):
+                self.vectors.pop(vector_id, None)
+        return {}
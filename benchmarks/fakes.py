@@ -0,0 +1,278 @@
+"""
+Deterministic stand-ins for the LLM, embeddings and vector stores
+
+The fakes simulate backend latency with ``time.sleep`` on the sync path and
+``asyncio.sleep`` on the async path, so they behave like network-bound
+clients without touching the network.
+
+rag.py builds them when MODEL_BACKEND=fake / VECTOR_BACKEND=fake (see
+fake_chat_model, fake_embeddings and fake_vector_stores); benchmarks that
+drive the graphs directly use install_fake_backends.
+"""
+
+import asyncio
+import hashlib
+import json
+import time
+import uuid
+from typing import Any, List, Optional, Set, Tuple
+
+from langchain_core.callbacks import AsyncCallbackManagerForLLMRun, CallbackManagerForLLMRun
+from langchain_core.documents import Document
+from langchain_core.embeddings import DeterministicFakeEmbedding
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, BaseMessage
+from langchain_core.outputs import ChatGeneration, ChatResult
+from langchain_core.utils.function_calling import convert_to_openai_tool
+from langchain_core.vectorstores import InMemoryVectorStore
+
+
+class FakeChatModel(BaseChatModel):
+    """Chat model that calls the catalog tool once, then answers.
+
+    When tools are bound and the last message is from the user, the model
+    emits a single tool call for the first bound tool whose name matches
+    ``tool_name`` (or the first tool). Otherwise it returns a canned answer.
+
+    An agent that keeps searching is simulated with ``tool_rounds`` (tool
+    steps per turn before answering) and ``parallel_tools`` (tool calls per
+    step, each for a different part of the question). Later rounds search
+    for new wording unless ``repeat_queries`` is set.
+
+    Each call waits ``latency`` (time to first token) plus the completion's
+    tokens at ``tokens_per_second`` (0 = no generation time), plus the prompt
+    tokens not served from cache at ``prefill_tokens_per_second`` (0 = free).
+
+    With ``prompt_cache`` set, the model mimics provider prompt caching: the
+    longest message prefix (with the same tools) it has seen before counts
+    as cached tokens in the usage it reports.
+    """
+
+    latency: float = 0.05
+    tokens_per_second: float = 0.0
+    calls: int = 0
+    tool_name: str = "retrieve_product_catalog"
+    # Every Nth tool call searches for a rewritten query instead of the user's words (0 = never)
+    rewrite_every: int = 0
+    tool_rounds: int = 1
+    parallel_tools: int = 1
+    repeat_queries: bool = False
+    prefill_tokens_per_second: float = 0.0
+    prompt_cache: bool = False
+    cached_prefixes: Set[str] = set()
+    answer: str = "Based on the catalog, i7041 is a great fit at $15.25 per unit for 48 caps."
+
+    @property
+    def _llm_type(self) -> str:
+        return "fake-chat"
+
+    def bind_tools(self, tools, **kwargs):
+        return self.bind(tools=[convert_to_openai_tool(t) for t in tools], **kwargs)
+
+    def _tool_round(self, messages: List[BaseMessage]) -> Optional[int]:
+        """Tool steps already taken this turn, or None when it is not the model's move to search"""
+        if not messages or messages[-1].type not in ("human", "tool"):
+            return None
+        humans = [i for i, m in enumerate(messages) if m.type == "human"]
+        return sum(1 for m in messages[humans[-1] if humans else 0:] if getattr(m, "tool_calls", None))
+
+    def _cached_tokens(self, messages: List[BaseMessage], tools: Optional[list]) -> int:
+        """Tokens of the longest prompt prefix seen before; remembers every prefix of this prompt"""
+        prefix = hashlib.sha1(json.dumps(tools or [], sort_keys=True, default=str).encode("utf-8"))
+        tokens, cached = 0, 0
+        for message in messages:
+            prefix.update(f"{message.type}\0{message.content}\0{getattr(message, 'tool_calls', '')}\0".encode("utf-8"))
+            tokens += len(str(message.content).split())
+            digest = prefix.hexdigest()
+            if digest in self.cached_prefixes:
+                cached = tokens
+            else:
+                self.cached_prefixes.add(digest)
+        return cached
+
+    def _respond(self, messages: List[BaseMessage], tools: Optional[list]) -> ChatResult:
+        rounds = self._tool_round(messages) if tools else None
+        if rounds is not None and rounds < self.tool_rounds:
+            names = [t["function"]["name"] for t in tools]
+            name = self.tool_name if self.tool_name in names else names[0]
+            question = next(str(m.content) for m in reversed(messages) if m.type == "human")
+            queries = [question] + [f"{question} (part {i + 1})" for i in range(1, self.parallel_tools)]
+            if rounds and not self.repeat_queries:
+                queries = [f"{query} (round {rounds + 1})" for query in queries]
+            if self.rewrite_every and self.calls % self.rewrite_every == 0:
+                queries[0] = "best selling custom headwear options"
+            message = AIMessage(
+                content="",
+                tool_calls=[{
+                    "name": name,
+                    "args": {"query": query},
+                    "id": f"call_{uuid.uuid4().hex[:12]}",
+                } for query in queries],
+            )
+        else:
+            message = AIMessage(content=self.answer)
+        # Word counts stand in for tokens so usage metrics have something to report
+        prompt_tokens = sum(len(str(m.content).split()) for m in messages)
+        completion_tokens = len(str(message.content).split()) + 8 * len(message.tool_calls)
+        message.usage_metadata = {
+            "input_tokens": prompt_tokens,
+            "output_tokens": completion_tokens,
+            "total_tokens": prompt_tokens + completion_tokens,
+        }
+        if self.prompt_cache:
+            message.usage_metadata["input_token_details"] = {"cache_read": self._cached_tokens(messages, tools)}
+        return ChatResult(generations=[ChatGeneration(message=message)])
+
+    def _delay(self, result: ChatResult) -> float:
+        usage = result.generations[0].message.usage_metadata
+        delay = self.latency
+        if self.tokens_per_second:
+            delay += usage["output_tokens"] / self.tokens_per_second
+        if self.prefill_tokens_per_second:
+            cached = usage.get("input_token_details", {}).get("cache_read", 0)
+            delay += (usage["input_tokens"] - cached) / self.prefill_tokens_per_second
+        return delay
+
+    def _generate(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+                  run_manager: Optional[CallbackManagerForLLMRun] = None, **kwargs: Any) -> ChatResult:
+        self.calls += 1
+        result = self._respond(messages, kwargs.get("tools"))
+        time.sleep(self._delay(result))
+        return result
+
+    async def _agenerate(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+                         run_manager: Optional[AsyncCallbackManagerForLLMRun] = None, **kwargs: Any) -> ChatResult:
+        self.calls += 1
+        result = self._respond(messages, kwargs.get("tools"))
+        await asyncio.sleep(self._delay(result))
+        return result
+
+
+class SlowEmbeddings(DeterministicFakeEmbedding):
+    """Hash-based fake embeddings with a simulated API round trip per call."""
+
+    latency: float = 0.02
+    calls: int = 0
+
+    def embed_query(self, text: str) -> List[float]:
+        self.calls += 1
+        time.sleep(self.latency)
+        return super().embed_query(text)
+
+    async def aembed_query(self, text: str) -> List[float]:
+        self.calls += 1
+        await asyncio.sleep(self.latency)
+        return super().embed_query(text)
+
+
+class SlowVectorStore(InMemoryVectorStore):
+    """In-memory vector store with a simulated network round trip per query."""
+
+    def __init__(self, embedding, latency: float = 0.02):
+        super().__init__(embedding)
+        self.latency = latency
+
+    # Every search path, by text or by vector, pays one round trip
+
+    def similarity_search_with_score_by_vector(self, embedding: List[float], k: int = 4,
+                                               **kwargs: Any) -> List[Tuple[Document, float]]:
+        time.sleep(self.latency)
+        return super().similarity_search_with_score_by_vector(embedding, k, **kwargs)
+
+    async def asimilarity_search_with_score_by_vector(self, embedding: List[float], k: int = 4,
+                                                      **kwargs: Any) -> List[Tuple[Document, float]]:
+        await asyncio.sleep(self.latency)
+        return super().similarity_search_with_score_by_vector(embedding, k, **kwargs)
+
+    def similarity_search_with_score(self, query: str, k: int = 4, **kwargs: Any) -> List[Tuple[Document, float]]:
+        return self.similarity_search_with_score_by_vector(self.embedding.embed_query(query), k, **kwargs)
+
+    async def asimilarity_search_with_score(self, query: str, k: int = 4,
+                                            **kwargs: Any) -> List[Tuple[Document, float]]:
+        embedding = await self.embedding.aembed_query(query)
+        return await self.asimilarity_search_with_score_by_vector(embedding, k, **kwargs)
+
+    def similarity_search(self, query: str, k: int = 4, **kwargs: Any) -> List[Document]:
+        return [doc for doc, _ in self.similarity_search_with_score(query, k, **kwargs)]
+
+    async def asimilarity_search(self, query: str, k: int = 4, **kwargs: Any) -> List[Document]:
+        return [doc for doc, _ in await self.asimilarity_search_with_score(query, k, **kwargs)]
+
+
+PRODUCT_IDS = ["i7041", "i8502", "i8505", "i8530", "i8540", "i2012", "i3057", "i7042", "i5054", "i3068"]
+STYLES = ["Performance Cap", "Trucker Cap", "Snap Back", "Visor", "Foam Trucker"]
+COLORS = ["Black", "Navy", "Gray", "White", "Red", "Maroon", "Royal", "Olive"]
+
+
+def synthetic_product_ids(size: int = 0) -> List[str]:
+    """PRODUCT_IDS, extended with generated IDs up to size products"""
+    return PRODUCT_IDS + [f"i{9000 + i}" for i in range(max(0, size - len(PRODUCT_IDS)))]
+
+
+def synthetic_catalog_documents(size: int = 0) -> List[Document]:
+    """A headwear catalog shaped like the production product documents
+
+    Always holds the PRODUCT_IDS products; size > len(PRODUCT_IDS) adds
+    generated products so retrieval runs against a realistically sized index.
+    """
+    docs = []
+    for i, product_id in enumerate(synthetic_product_ids(size)):
+        style = STYLES[i % len(STYLES)]
+        colors = ", ".join(COLORS[i % 3:i % 3 + 5])
+        base = 11.25 + i
+        docs.append(Document(
+            page_content=(
+                f"Product ID: {product_id}\nTitle: {style}\n\n"
+                f"Pricing:\nFlat Embroidery:\n  24 units: ${base + 2:.2f}\n  48 units: ${base:.2f}\n\n"
+                f"Available Colors:\n{colors}"
+            ),
+            metadata={"source": "caps_catalog_v2.json", "category": "headwear_product", "product_id": product_id},
+        ))
+    docs.append(Document(
+        page_content="Molded Rubber Patch: $6.0\nGenuine Leather patch: $5.0\nWoven Patch: $5.0\nEmbroidered Patch: $4.0",
+        metadata={"source": "txt1.txt", "category": "pricing_patches"},
+    ))
+    return docs
+
+
+def synthetic_website_documents() -> List[Document]:
+    """A handful of website pages shaped like the production CSV documents"""
+    return [
+        Document(page_content="CapAmerica offers free samples for qualified orders.",
+                 metadata={"source": "website.csv", "category": "samples"}),
+        Document(page_content="CapAmerica has made quality custom headwear in the USA since 1976.",
+                 metadata={"source": "website.csv", "category": "about"}),
+    ]
+
+
+def fake_chat_model(latency: float = 0.05, tokens_per_second: float = 0.0) -> FakeChatModel:
+    return FakeChatModel(latency=latency, tokens_per_second=tokens_per_second)
+
+
+def fake_embeddings(latency: float = 0.0, size: int = 64) -> SlowEmbeddings:
+    return SlowEmbeddings(size=size, latency=latency)
+
+
+def fake_vector_stores(embeddings, latency: float = 0.02,
+                       catalog_size: int = 0) -> Tuple[SlowVectorStore, SlowVectorStore]:
+    """(website/CSV store, product catalog store) seeded with the synthetic data"""
+    csv_store = SlowVectorStore(embeddings, latency=latency)
+    csv_store.add_documents(synthetic_website_documents())
+    pdf_store = SlowVectorStore(embeddings, latency=latency)
+    pdf_store.add_documents(synthetic_catalog_documents(catalog_size))
+    return csv_store, pdf_store
+
+
+def install_fake_backends(llm_latency: float = 0.05, vector_latency: float = 0.02, embedding_latency: float = 0.0,
+                          catalog_size: int = 0):
+    """Point the rag module globals at the fakes and build the graphs"""
+    import rag
+
+    rag.llm = fake_chat_model(llm_latency)
+    rag.embeddings = fake_embeddings(embedding_latency)
+    rag.csv_vector_store, rag.pdf_vector_store = fake_vector_stores(rag.embeddings, vector_latency, catalog_size)
+    rag.setup_hybrid_retrievers()
+    tools = rag.create_retrieval_tools()
+    rag.setup_conversational_chain(tools)
+    rag.setup_agent(tools)
+    return rag
@@ -0,0 +1,425 @@
+"""
+Structured headwear catalog index and deterministic pricing engine
+
+Loads the JSON product catalogs (the same files that are embedded into the
+product index) into dictionaries keyed by product ID, color, style and
+quantity tier, so exact-ID lookups and price quotes are dictionary hits
+instead of vector searches plus LLM arithmetic.
+
+Product JSON shape (one array of these per file):
+    {
+      "id": "i7041",
+      "title": "Lightweight Aerated Performance Cap",
+      "description": {"features": [...], "sizing": "XS / OSFM"},
+      "pricing": {"Flat Embroidery": {"24": 17.5, "48": 15.75, ...},
+                  "3D Embroidery": {...}},
+      "available_colors": ["Black (Out of Stock)", "Navy", ...]
+    }
+"""
+
+import glob
+import json
+import os
+import re
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+# Base pricing includes flat embroidery up to this many stitches
+BASE_STITCH_ALLOWANCE = 10000
+EXTRA_STITCH_PRICE_PER_1000 = 0.80
+
+# Per-unit add-on prices from the decoration/patch pricing sheets; the system
+# prompt's price list is generated from these (addon_price_guide)
+ADDON_PRICES = {
+    "side_embroidery": 3.00,
+    "back_embroidery": 3.00,
+    "across_back_seam": 3.00,
+    "fabric_strap": 3.00,
+    "second_location_knit": 4.50,
+    "molded_rubber_patch": 6.00,
+    "flexstyle_applique": 5.00,
+    "genuine_leather_patch": 5.00,
+    "debossed_leather_patch": 5.00,
+    "faux_leather_patch": 4.00,
+    "woven_patch": 5.00,
+    "embroidered_patch": 4.00,
+    "sublimated_patch": 4.00,
+    "custom_label": 0.90,
+    "american_flag_patch": 5.00,
+}
+
+# Per-unit add-ons priced as a range (the sheets list several styles)
+ADDON_PRICE_RANGES = {
+    "pom": (1.40, 5.00),
+}
+
+# How addon_price_guide groups and names the add-ons; every priced add-on appears once
+ADDON_GROUPS = {
+    "Embroidery Locations": {
+        "side_embroidery": "side", "back_embroidery": "back", "across_back_seam": "across back seam",
+        "fabric_strap": "fabric strap", "second_location_knit": "second location on knits",
+    },
+    "Patches": {
+        "molded_rubber_patch": "molded rubber", "flexstyle_applique": "FlexStyle applique",
+        "genuine_leather_patch": "genuine leather", "debossed_leather_patch": "debossed leather",
+        "faux_leather_patch": "faux leather", "woven_patch": "woven", "embroidered_patch": "embroidered",
+        "sublimated_patch": "sublimated", "american_flag_patch": "American flag",
+    },
+    "Special Options": {"custom_label": "custom labels", "pom": "poms"},
+}
+
+# Free-form names customers and the model use, after _normalize
+ADDON_ALIASES = {
+    "side": "side_embroidery",
+    "3d side": "side_embroidery",
+    "side embroidery": "side_embroidery",
+    "back": "back_embroidery",
+    "back embroidery": "back_embroidery",
+    "across back seam": "across_back_seam",
+    "back seam": "across_back_seam",
+    "strap": "fabric_strap",
+    "fabric strap": "fabric_strap",
+    "second location knit": "second_location_knit",
+    "rubber": "molded_rubber_patch",
+    "rubber patch": "molded_rubber_patch",
+    "molded rubber": "molded_rubber_patch",
+    "molded rubber patch": "molded_rubber_patch",
+    "flexstyle": "flexstyle_applique",
+    "applique": "flexstyle_applique",
+    "flexstyle applique": "flexstyle_applique",
+    "genuine leather": "genuine_leather_patch",
+    "genuine leather patch": "genuine_leather_patch",
+    "debossed leather": "debossed_leather_patch",
+    "debossed leather patch": "debossed_leather_patch",
+    "faux leather": "faux_leather_patch",
+    "faux leather patch": "faux_leather_patch",
+    "woven": "woven_patch",
+    "woven patch": "woven_patch",
+    "embroidered patch": "embroidered_patch",
+    "sublimated": "sublimated_patch",
+    "sublimated patch": "sublimated_patch",
+    "label": "custom_label",
+    "custom label": "custom_label",
+    "flag patch": "american_flag_patch",
+    "american flag": "american_flag_patch",
+    "american flag patch": "american_flag_patch",
+    "pom": "pom",
+    "pom pom": "pom",
+}
+
+# Names that fit several add-ons; the caller has to pick one
+AMBIGUOUS_ADDONS = {
+    "patch": ("molded_rubber_patch", "genuine_leather_patch", "debossed_leather_patch", "faux_leather_patch",
+              "woven_patch", "embroidered_patch", "sublimated_patch", "american_flag_patch"),
+    "leather": ("genuine_leather_patch", "debossed_leather_patch", "faux_leather_patch"),
+    "leather patch": ("genuine_leather_patch", "debossed_leather_patch", "faux_leather_patch"),
+    "embroidery": ("side_embroidery", "back_embroidery"),
+    "embroidered": ("side_embroidery", "back_embroidery", "embroidered_patch"),
+}
+
+EMBROIDERY_TYPES = {
+    "flat": "Flat Embroidery",
+    "3d": "3D Embroidery",
+}
+
+# Style keywords matched against product titles
+STYLE_KEYWORDS = ("performance", "trucker", "snap back", "snapback", "visor", "foam", "water resistant", "mesh")
+
+OUT_OF_STOCK_MARKER = "(out of stock)"
+
+
+def _normalize(value: str) -> str:
+    return " ".join(str(value).casefold().replace("-", " ").replace("_", " ").split())
+
+
+def _parse_tier(key: str) -> Optional[int]:
+    """Lower bound of a pricing tier key such as "24", "15-24" or "2500+" """
+    match = re.match(r"\s*(\d[\d,]*)", str(key))
+    return int(match.group(1).replace(",", "")) if match else None
+
+
+def _parse_price(value: Any) -> Optional[float]:
+    if isinstance(value, (int, float)):
+        return float(value)
+    match = re.search(r"\d+(?:\.\d+)?", str(value))
+    return float(match.group(0)) if match else None
+
+
+def normalize_addon(name: str) -> str:
+    """Map free-form add-on names ("Leather patch", "3D side") to ADDON_PRICES/ADDON_PRICE_RANGES keys
+
+    Raises ValueError listing the valid add-ons for unknown or ambiguous names.
+    """
+    normalized = _normalize(name).replace("patches", "patch")
+    if normalized.endswith("s") and not normalized.endswith("ss"):
+        candidates = (normalized, normalized[:-1])
+    else:
+        candidates = (normalized,)
+    for candidate in candidates:
+        key = candidate.replace(" ", "_")
+        if key in ADDON_PRICES or key in ADDON_PRICE_RANGES:
+            return key
+        if candidate in ADDON_ALIASES:
+            return ADDON_ALIASES[candidate]
+    for candidate in candidates:
+        if candidate in AMBIGUOUS_ADDONS:
+            raise ValueError(f"Ambiguous add-on {name!r}: one of {', '.join(AMBIGUOUS_ADDONS[candidate])}")
+    if normalize_embroidery(normalized) is not None:
+        raise ValueError(f"{name!r} is an embroidery type, not an add-on; pass it as embroidery")
+    valid = ", ".join([*ADDON_PRICES, *ADDON_PRICE_RANGES])
+    raise ValueError(f"Unknown add-on {name!r}; valid add-ons: {valid}")
+
+
+def addon_price(key: str) -> str:
+    if key in ADDON_PRICE_RANGES:
+        low, high = ADDON_PRICE_RANGES[key]
+        return f"${low:.2f}-{high:.2f}"
+    return f"${ADDON_PRICES[key]:.2f}"
+
+
+def addon_price_guide() -> str:
+    """Customization price list for the system prompt, from the same prices calculate_price uses"""
+    lines = []
+    for group, names in ADDON_GROUPS.items():
+        prices = ", ".join(f"{name} ({addon_price(key)})" for key, name in names.items())
+        if group == "Embroidery Locations":
+            prices = "front panel (included), " + prices
+        lines.append(f"- **{group}**: {prices}")
+    lines.append(f"- **Extra Stitches**: ${EXTRA_STITCH_PRICE_PER_1000:.2f} per 1,000 stitches beyond "
+                 f"{BASE_STITCH_ALLOWANCE:,}")
+    return "\n".join(lines)
+
+
+def normalize_embroidery(embroidery: str) -> Optional[str]:
+    """EMBROIDERY_TYPES value for "flat", "Flat Embroidery", "3D", "3-D embroidery"...; None if unknown"""
+    key = _normalize(embroidery).replace(" ", "")
+    if key.endswith("embroidery"):
+        key = key[:-len("embroidery")]
+    return EMBROIDERY_TYPES.get(key)
+
+
+@dataclass
+class Product:
+    product_id: str
+    title: str
+    features: List[str]
+    sizing: str
+    # embroidery type -> sorted [(tier lower bound, unit price)]
+    pricing: Dict[str, List[Tuple[int, float]]]
+    colors: Dict[str, bool]  # color -> in stock
+    source: str = ""
+    styles: List[str] = field(default_factory=list)
+
+    def summary(self) -> str:
+        colors = ", ".join(
+            color if in_stock else f"{color} (Out of Stock)" for color, in_stock in self.colors.items()
+        )
+        lines = [f"Product ID: {self.product_id}", f"Title: {self.title}"]
+        if self.features:
+            lines.append("Features: " + "; ".join(self.features))
+        if self.sizing:
+            lines.append(f"Sizing: {self.sizing}")
+        for embroidery, tiers in self.pricing.items():
+            lines.append(f"{embroidery}: " + ", ".join(f"{tier}+ units ${price:.2f}" for tier, price in tiers))
+        if colors:
+            lines.append(f"Colors: {colors}")
+        return "\n".join(lines)
+
+
+class ProductIndex:
+    """In-memory catalog keyed by product ID, color, style and quantity tier
+
+    The color, style and title-word dicts map to sets of product keys, so
+    find() intersects sets instead of scanning the products.
+    """
+
+    def __init__(self, products: List[Product], version: str = ""):
+        self.version = version
+        self.products: Dict[str, Product] = {}
+        self.by_color: Dict[str, Set[str]] = {}
+        self.in_stock_by_color: Dict[str, Set[str]] = {}
+        self.by_style: Dict[str, Set[str]] = {}
+        self.by_title_word: Dict[str, Set[str]] = {}
+        for product in products:
+            # Later files win, so a newer catalog version overrides older copies
+            self.products[product.product_id.casefold()] = product
+        self._order = {key: i for i, key in enumerate(self.products)}
+        for key, product in self.products.items():
+            for color, in_stock in product.colors.items():
+                self.by_color.setdefault(_normalize(color), set()).add(key)
+                if in_stock:
+                    self.in_stock_by_color.setdefault(_normalize(color), set()).add(key)
+            for style in product.styles:
+                self.by_style.setdefault(style, set()).add(key)
+            for word in _normalize(product.title).split():
+                self.by_title_word.setdefault(word, set()).add(key)
+
+    def __len__(self) -> int:
+        return len(self.products)
+
+    def get(self, product_id: str) -> Optional[Product]:
+        return self.products.get(product_id.strip().casefold())
+
+    def find(self, color: str = "", style: str = "", in_stock_only: bool = False) -> List[Product]:
+        """Products matching all given filters (empty filters match everything)"""
+        if not color and not style:
+            return list(self.products.values())
+        keys: Optional[Set[str]] = None
+        if color:
+            wanted = _normalize(color)
+            # Partial color names ("blue" -> "Royal Blue", "Navy Blue")
+            containing = [name for name in self.by_color if wanted in name]
+            names = [wanted] if wanted in self.by_color else containing
+            keys = set().union(*(self.by_color[name] for name in names))
+            if in_stock_only:
+                keys &= set().union(*(self.in_stock_by_color.get(name, set()) for name in containing))
+        if style:
+            wanted = _normalize(style).replace("snapback", "snap back")
+            words = wanted.split()
+            # Titles holding every word of the style, then the phrase itself
+            titled = set.intersection(*(self.by_title_word.get(word, set()) for word in words)) if words else set()
+            matches = self.by_style.get(wanted, set()) | {
+                key for key in titled if wanted in _normalize(self.products[key].title)
+            }
+            keys = matches if keys is None else keys & matches
+        return [self.products[key] for key in sorted(keys, key=self._order.__getitem__)]
+
+    @staticmethod
+    def pricing_key(product: Product, embroidery: str) -> str:
+        """Product pricing key for an embroidery name; catalog-specific keys match case-insensitively"""
+        known = normalize_embroidery(embroidery)
+        if known is not None:
+            return known
+        for key in product.pricing:
+            if _normalize(key) == _normalize(embroidery):
+                return key
+        return embroidery
+
+    def unit_price(self, product_id: str, quantity: int, embroidery: str = "flat") -> Tuple[int, float]:
+        """(tier, unit price) for an order quantity; the largest tier not above it applies"""
+        product = self.get(product_id)
+        if product is None:
+            raise KeyError(f"Unknown product ID: {product_id}")
+        pricing_key = self.pricing_key(product, embroidery)
+        tiers = product.pricing.get(pricing_key)
+        if not tiers:
+            available = ", ".join(product.pricing) or "none"
+            raise ValueError(f"{product.product_id} has no {pricing_key} pricing (available: {available})")
+        if quantity < tiers[0][0]:
+            raise ValueError(f"Minimum order for {product.product_id} is {tiers[0][0]} units")
+        tier, price = tiers[0]
+        for tier_qty, tier_price in tiers:
+            if quantity >= tier_qty:
+                tier, price = tier_qty, tier_price
+        return tier, price
+
+    def quote(self, product_id: str, quantity: int, embroidery: str = "flat",
+              addons: Optional[List[str]] = None, stitch_count: int = 0,
+              color: str = "") -> Dict[str, Any]:
+        """Exact price quote: tiered base price plus per-unit add-ons and extra stitches"""
+        product = self.get(product_id)
+        if product is None:
+            raise KeyError(f"Unknown product ID: {product_id}")
+        tier, base_price = self.unit_price(product_id, quantity, embroidery)
+
+        addon_lines = []
+        for addon in addons or []:
+            key = normalize_addon(addon)
+            if key in ADDON_PRICE_RANGES:
+                low, high = ADDON_PRICE_RANGES[key]
+                addon_lines.append({"addon": key, "unit_price": low, "unit_price_max": high})
+            else:
+                addon_lines.append({"addon": key, "unit_price": ADDON_PRICES[key]})
+
+        extra_stitches = max(0, stitch_count - BASE_STITCH_ALLOWANCE)
+        # Charged per started block of 1,000 stitches
+        stitch_blocks = -(-extra_stitches // 1000)
+        stitch_charge = round(stitch_blocks * EXTRA_STITCH_PRICE_PER_1000, 2)
+
+        unit_total = round(base_price + sum(line["unit_price"] for line in addon_lines) + stitch_charge, 2)
+        result = {
+            "product_id": product.product_id,
+            "title": product.title,
+            "quantity": quantity,
+            "tier": tier,
+            "embroidery": self.pricing_key(product, embroidery),
+            "base_unit_price": base_price,
+            "addons": addon_lines,
+            "extra_stitch_charge": stitch_charge,
+            "unit_total": unit_total,
+            "order_total": round(unit_total * quantity, 2),
+            "catalog_version": self.version,
+        }
+        # Range-priced add-ons (poms): unit_total/order_total are the low end
+        if any("unit_price_max" in line for line in addon_lines):
+            unit_max = round(unit_total + sum(line["unit_price_max"] - line["unit_price"]
+                                              for line in addon_lines if "unit_price_max" in line), 2)
+            result["unit_total_max"] = unit_max
+            result["order_total_max"] = round(unit_max * quantity, 2)
+        if color:
+            matches = {name: ok for name, ok in product.colors.items() if _normalize(color) in _normalize(name)}
+            result["color"] = color
+            result["color_available"] = any(matches.values()) if matches else False
+        return result
+
+
+def _parse_product(item: Dict[str, Any], source: str) -> Optional[Product]:
+    product_id = str(item.get("id") or item.get("product_id") or "").strip()
+    if not product_id:
+        return None
+    description = item.get("description") or {}
+    if isinstance(description, str):
+        description = {"features": [description]}
+
+    pricing = {}
+    for embroidery, tiers in (item.get("pricing") or {}).items():
+        if not isinstance(tiers, dict):
+            continue
+        parsed = []
+        for key, value in tiers.items():
+            tier, price = _parse_tier(key), _parse_price(value)
+            if tier is not None and price is not None:
+                parsed.append((tier, price))
+        if parsed:
+            pricing[embroidery] = sorted(parsed)
+
+    colors = {}
+    for raw in item.get("available_colors") or []:
+        in_stock = OUT_OF_STOCK_MARKER not in str(raw).casefold()
+        name = re.sub(r"\s*\(out of stock\)\s*", "", str(raw), flags=re.IGNORECASE).strip()
+        colors[name] = in_stock
+
+    title = str(item.get("title", ""))
+    normalized_title = _normalize(title).replace("snapback", "snap back")
+    styles = [keyword.replace("snapback", "snap back") for keyword in STYLE_KEYWORDS if keyword in normalized_title]
+    return Product(
+        product_id=product_id,
+        title=title,
+        features=list(description.get("features") or []),
+        sizing=str(description.get("sizing", "")),
+        pricing=pricing,
+        colors=colors,
+        source=source,
+        styles=sorted(set(styles)),
+    )
+
+
+def load_product_index(data_dir: str) -> ProductIndex:
+    """Build the index from every *.json catalog file in data_dir"""
+    paths = sorted(glob.glob(os.path.join(data_dir, "*.json")))
+    if not paths:
+        raise FileNotFoundError(f"No catalog JSON files in {data_dir}")
+
+    products, mtimes = [], []
+    for path in paths:
+        with open(path, encoding="utf-8") as f:
+            items = json.load(f)
+        if isinstance(items, dict):
+            items = items.get("products", [])
+        for item in items:
+            product = _parse_product(item, os.path.basename(path))
+            if product is not None:
+                products.append(product)
+        mtimes.append(os.path.getmtime(path))
+
+    return ProductIndex(products, version=f"{len(paths)}-{int(max(mtimes))}")
@@ -0,0 +1,383 @@
+"""
+Persistent, bounded LangGraph checkpointer
+
+MemorySaver keeps every checkpoint of every thread in process memory forever.
+SQLiteCheckpointSaver instead stores conversation state in a SQLite file:
+
+- only the latest checkpoint (plus its pending writes) per thread/namespace
+  is kept, which is all the graphs in rag.py ever read back
+- values are serialized with the LangGraph msgpack serializer and
+  compressed with zstandard
+- a small in-memory LRU of hot threads (serialized bytes) fronts the file
+- threads idle longer than ttl_seconds are evicted, and the total number of
+  threads is capped at max_threads (least recently used first)
+- delete_thread removes a thread for real
+- on_delete, if set, is called with the IDs of every deleted or evicted
+  thread (rag.py uses it to drop their lock files)
+
+Resident memory therefore stays flat no matter how many user_ids are seen.
+
+Several worker processes (uvicorn --workers N) can share one database file:
+SQLite runs in WAL mode and every thread row carries a version that is bumped
+on each write, so a worker revalidates its LRU entry with a primary-key
+lookup and reloads a thread another worker has advanced.
+"""
+
+import asyncio
+import json
+import random
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, AsyncIterator, Callable, Dict, Iterator, Optional, Sequence, Tuple
+
+import zstandard
+from langchain_core.runnables import RunnableConfig
+from langgraph.checkpoint.base import (
+    WRITES_IDX_MAP,
+    BaseCheckpointSaver,
+    ChannelVersions,
+    Checkpoint,
+    CheckpointMetadata,
+    CheckpointTuple,
+    get_checkpoint_id,
+    get_checkpoint_metadata,
+)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS checkpoints (
+    thread_id TEXT NOT NULL,
+    checkpoint_ns TEXT NOT NULL,
+    checkpoint_id TEXT NOT NULL,
+    parent_checkpoint_id TEXT,
+    type TEXT NOT NULL,
+    checkpoint BLOB NOT NULL,
+    metadata_type TEXT NOT NULL,
+    metadata BLOB NOT NULL,
+    PRIMARY KEY (thread_id, checkpoint_ns)
+);
+CREATE TABLE IF NOT EXISTS writes (
+    thread_id TEXT NOT NULL,
+    checkpoint_ns TEXT NOT NULL,
+    checkpoint_id TEXT NOT NULL,
+    task_id TEXT NOT NULL,
+    idx INTEGER NOT NULL,
+    channel TEXT NOT NULL,
+    type TEXT NOT NULL,
+    value BLOB NOT NULL,
+    task_path TEXT NOT NULL DEFAULT '',
+    PRIMARY KEY (thread_id, checkpoint_ns, checkpoint_id, task_id, idx)
+);
+CREATE TABLE IF NOT EXISTS threads (
+    thread_id TEXT PRIMARY KEY,
+    last_access REAL NOT NULL,
+    version INTEGER NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS threads_last_access ON threads (last_access);
+"""
+
+# Serialized latest checkpoint of one namespace:
+# (checkpoint_id, parent_checkpoint_id, (type, bytes), (metadata type, bytes), [writes])
+_Row = Tuple[str, Optional[str], Tuple[str, bytes], Tuple[str, bytes], list]
+
+
+class SQLiteCheckpointSaver(BaseCheckpointSaver[str]):
+    """Latest-checkpoint-only SQLite saver with an LRU front and TTL/size eviction"""
+
+    def __init__(self, path: str = "checkpoints.db", *, cache_threads: int = 1024,
+                 max_threads: Optional[int] = 100000, ttl_seconds: Optional[float] = 7 * 86400,
+                 sweep_interval: float = 60.0, compression_level: int = 3, serde=None):
+        super().__init__(serde=serde)
+        self.path = path
+        self.cache_threads = cache_threads
+        self.max_threads = max_threads
+        self.ttl_seconds = ttl_seconds
+        self.sweep_interval = sweep_interval
+        self.compression_level = compression_level
+        # zstd contexts are not thread-safe; async methods run on a thread pool
+        self._zstd = threading.local()
+        self._lock = threading.RLock()
+        # thread_id -> (version, {checkpoint_ns: _Row})
+        self._cache: "OrderedDict[str, Tuple[int, Dict[str, _Row]]]" = OrderedDict()
+        self._last_sweep = 0.0
+        self.evicted_threads = 0
+        self.on_delete: Optional[Callable[[Sequence[str]], None]] = None
+
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=30, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(SCHEMA)
+        columns = [row[1] for row in self._conn.execute("PRAGMA table_info(threads)")]
+        if "version" not in columns:
+            self._conn.execute("ALTER TABLE threads ADD COLUMN version INTEGER NOT NULL DEFAULT 0")
+
+    # Serialization
+
+    def _contexts(self):
+        if not hasattr(self._zstd, "compressor"):
+            self._zstd.compressor = zstandard.ZstdCompressor(level=self.compression_level)
+            self._zstd.decompressor = zstandard.ZstdDecompressor()
+        return self._zstd
+
+    def _dump(self, value: Any) -> Tuple[str, bytes]:
+        type_, data = self.serde.dumps_typed(value)
+        return type_, self._contexts().compressor.compress(data)
+
+    def _load(self, typed: Tuple[str, bytes]) -> Any:
+        type_, data = typed
+        return self.serde.loads_typed((type_, self._contexts().decompressor.decompress(data)))
+
+    # LRU front
+
+    def _cache_put(self, thread_id: str, version: int, rows: Dict[str, _Row]) -> None:
+        self._cache[thread_id] = (version, rows)
+        self._cache.move_to_end(thread_id)
+        while len(self._cache) > self.cache_threads:
+            self._cache.popitem(last=False)
+
+    def _load_thread(self, thread_id: str) -> Dict[str, _Row]:
+        # One read transaction, so checkpoint and writes come from the same snapshot
+        self._conn.execute("BEGIN")
+        try:
+            row = self._conn.execute("SELECT version FROM threads WHERE thread_id = ?", (thread_id,)).fetchone()
+            if row is None:
+                self._cache.pop(thread_id, None)
+                return {}
+            version = row[0]
+            cached = self._cache.get(thread_id)
+            if cached is not None and cached[0] == version:
+                self._cache.move_to_end(thread_id)
+                return cached[1]
+            rows = self._read_rows(thread_id)
+        finally:
+            self._conn.execute("COMMIT")
+        self._cache_put(thread_id, version, rows)
+        return rows
+
+    def _read_rows(self, thread_id: str) -> Dict[str, _Row]:
+        rows = {}
+        for ns, checkpoint_id, parent_id, type_, blob, meta_type, meta_blob in self._conn.execute(
+            "SELECT checkpoint_ns, checkpoint_id, parent_checkpoint_id, type, checkpoint, metadata_type, metadata "
+            "FROM checkpoints WHERE thread_id = ?", (thread_id,)
+        ):
+            writes = self._conn.execute(
+                "SELECT task_id, idx, channel, type, value, task_path FROM writes "
+                "WHERE thread_id = ? AND checkpoint_ns = ? AND checkpoint_id = ? ORDER BY task_id, idx",
+                (thread_id, ns, checkpoint_id),
+            ).fetchall()
+            rows[ns] = (checkpoint_id, parent_id, (type_, blob), (meta_type, meta_blob), [tuple(w) for w in writes])
+        return rows
+
+    def _to_tuple(self, thread_id: str, ns: str, row: _Row) -> CheckpointTuple:
+        checkpoint_id, parent_id, checkpoint_blob, metadata_blob, writes = row
+        return CheckpointTuple(
+            config={"configurable": {"thread_id": thread_id, "checkpoint_ns": ns, "checkpoint_id": checkpoint_id}},
+            checkpoint=self._load(checkpoint_blob),
+            metadata=self._load(metadata_blob),
+            parent_config=(
+                {"configurable": {"thread_id": thread_id, "checkpoint_ns": ns, "checkpoint_id": parent_id}}
+                if parent_id else None
+            ),
+            pending_writes=[(task_id, channel, self._load((type_, value))) for task_id, _, channel, type_, value, _ in writes],
+        )
+
+    # BaseCheckpointSaver interface
+
+    def get_tuple(self, config: RunnableConfig) -> Optional[CheckpointTuple]:
+        thread_id = config["configurable"]["thread_id"]
+        ns = config["configurable"].get("checkpoint_ns", "")
+        with self._lock:
+            row = self._load_thread(thread_id).get(ns)
+            if row is None:
+                return None
+            checkpoint_id = get_checkpoint_id(config)
+            if checkpoint_id and checkpoint_id != row[0]:
+                # Only the latest checkpoint is retained
+                return None
+            return self._to_tuple(thread_id, ns, row)
+
+    def list(self, config: Optional[RunnableConfig], *, filter: Optional[Dict[str, Any]] = None,
+             before: Optional[RunnableConfig] = None, limit: Optional[int] = None) -> Iterator[CheckpointTuple]:
+        with self._lock:
+            if config:
+                thread_ids = [config["configurable"]["thread_id"]]
+            else:
+                thread_ids = [row[0] for row in self._conn.execute("SELECT thread_id FROM threads")]
+            config_ns = config["configurable"].get("checkpoint_ns") if config else None
+            config_id = get_checkpoint_id(config) if config else None
+            before_id = get_checkpoint_id(before) if before else None
+            results = []
+            for thread_id in thread_ids:
+                for ns, row in self._load_thread(thread_id).items():
+                    if config_ns is not None and ns != config_ns:
+                        continue
+                    if (config_id and row[0] != config_id) or (before_id and row[0] >= before_id):
+                        continue
+                    checkpoint_tuple = self._to_tuple(thread_id, ns, row)
+                    if filter and not all(checkpoint_tuple.metadata.get(k) == v for k, v in filter.items()):
+                        continue
+                    results.append(checkpoint_tuple)
+        for checkpoint_tuple in results[:limit] if limit is not None else results:
+            yield checkpoint_tuple
+
+    def put(self, config: RunnableConfig, checkpoint: Checkpoint, metadata: CheckpointMetadata,
+            new_versions: ChannelVersions) -> RunnableConfig:
+        thread_id = config["configurable"]["thread_id"]
+        ns = config["configurable"].get("checkpoint_ns", "")
+        parent_id = config["configurable"].get("checkpoint_id")
+        checkpoint_blob = self._dump(checkpoint)
+        metadata_blob = self._dump(get_checkpoint_metadata(config, metadata))
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO checkpoints VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                    (thread_id, ns, checkpoint["id"], parent_id, checkpoint_blob[0], checkpoint_blob[1],
+                     metadata_blob[0], metadata_blob[1]),
+                )
+                # Writes of superseded checkpoints are never read again
+                self._conn.execute(
+                    "DELETE FROM writes WHERE thread_id = ? AND checkpoint_ns = ? AND checkpoint_id != ?",
+                    (thread_id, ns, checkpoint["id"]),
+                )
+                version = self._bump_version(thread_id)
+                cached = self._cache.get(thread_id)
+                # Keep the cached thread only if no other worker wrote in between
+                fresh = cached is not None and cached[0] == version - 1
+                self._conn.execute("COMMIT")
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+            if fresh:
+                rows = cached[1]
+                rows[ns] = (checkpoint["id"], parent_id, checkpoint_blob, metadata_blob, [])
+                self._cache_put(thread_id, version, rows)
+            else:
+                self._cache.pop(thread_id, None)
+            self._maybe_sweep()
+        return {"configurable": {"thread_id": thread_id, "checkpoint_ns": ns, "checkpoint_id": checkpoint["id"]}}
+
+    def put_writes(self, config: RunnableConfig, writes: Sequence[Tuple[str, Any]], task_id: str,
+                   task_path: str = "") -> None:
+        thread_id = config["configurable"]["thread_id"]
+        ns = config["configurable"].get("checkpoint_ns", "")
+        checkpoint_id = config["configurable"]["checkpoint_id"]
+        rows = []
+        for idx, (channel, value) in enumerate(writes):
+            type_, blob = self._dump(value)
+            rows.append((thread_id, ns, checkpoint_id, task_id, WRITES_IDX_MAP.get(channel, idx),
+                         channel, type_, blob, task_path))
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                # Special channels (errors, interrupts) overwrite; regular writes are first-wins
+                self._conn.executemany(
+                    "INSERT OR REPLACE INTO writes VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)"
+                    if all(WRITES_IDX_MAP.get(row[5], 0) < 0 for row in rows) else
+                    "INSERT OR IGNORE INTO writes VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                    rows,
+                )
+                self._bump_version(thread_id)
+                self._conn.execute("COMMIT")
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+            # Reload this thread on next read so pending writes are included
+            self._cache.pop(thread_id, None)
+
+    def delete_thread(self, thread_id: str) -> None:
+        with self._lock:
+            self._delete_threads([thread_id])
+
+    def get_next_version(self, current: Optional[str], channel: None) -> str:
+        if current is None:
+            current_v = 0
+        elif isinstance(current, int):
+            current_v = current
+        else:
+            current_v = int(current.split(".")[0])
+        return f"{current_v + 1:032}.{random.random():016}"
+
+    # Async interface: SQLite work runs off the event loop
+
+    async def aget_tuple(self, config: RunnableConfig) -> Optional[CheckpointTuple]:
+        return await asyncio.to_thread(self.get_tuple, config)
+
+    async def alist(self, config: Optional[RunnableConfig], *, filter: Optional[Dict[str, Any]] = None,
+                    before: Optional[RunnableConfig] = None, limit: Optional[int] = None) -> AsyncIterator[CheckpointTuple]:
+        results = await asyncio.to_thread(lambda: list(self.list(config, filter=filter, before=before, limit=limit)))
+        for checkpoint_tuple in results:
+            yield checkpoint_tuple
+
+    async def aput(self, config: RunnableConfig, checkpoint: Checkpoint, metadata: CheckpointMetadata,
+                   new_versions: ChannelVersions) -> RunnableConfig:
+        return await asyncio.to_thread(self.put, config, checkpoint, metadata, new_versions)
+
+    async def aput_writes(self, config: RunnableConfig, writes: Sequence[Tuple[str, Any]], task_id: str,
+                          task_path: str = "") -> None:
+        await asyncio.to_thread(self.put_writes, config, writes, task_id, task_path)
+
+    async def adelete_thread(self, thread_id: str) -> None:
+        await asyncio.to_thread(self.delete_thread, thread_id)
+
+    # Eviction
+
+    def _bump_version(self, thread_id: str) -> int:
+        """Record a write to thread_id (inside the caller's transaction); returns the new version"""
+        (version,) = self._conn.execute(
+            "INSERT INTO threads (thread_id, last_access, version) VALUES (?, ?, 1) "
+            "ON CONFLICT (thread_id) DO UPDATE SET last_access = excluded.last_access, version = version + 1 "
+            "RETURNING version",
+            (thread_id, time.time()),
+        ).fetchone()
+        return version
+
+    def _delete_threads(self, thread_ids: Sequence[str]) -> None:
+        if not thread_ids:
+            return
+        params = [(thread_id,) for thread_id in thread_ids]
+        self._conn.execute("BEGIN IMMEDIATE")
+        try:
+            for table in ("checkpoints", "writes", "threads"):
+                self._conn.executemany(f"DELETE FROM {table} WHERE thread_id = ?", params)
+            self._conn.execute("COMMIT")
+        except BaseException:
+            self._conn.execute("ROLLBACK")
+            raise
+        for thread_id in thread_ids:
+            self._cache.pop(thread_id, None)
+        if self.on_delete is not None:
+            self.on_delete(thread_ids)
+
+    def _maybe_sweep(self) -> None:
+        now = time.time()
+        if now - self._last_sweep >= self.sweep_interval:
+            self._last_sweep = now
+            self.evict()
+
+    def evict(self) -> int:
+        """Drop idle threads past the TTL and the least recently used beyond max_threads"""
+        with self._lock:
+            doomed = []
+            if self.ttl_seconds is not None:
+                doomed += [row[0] for row in self._conn.execute(
+                    "SELECT thread_id FROM threads WHERE last_access < ?", (time.time() - self.ttl_seconds,)
+                )]
+            if self.max_threads is not None:
+                (count,) = self._conn.execute("SELECT COUNT(*) FROM threads").fetchone()
+                excess = count - len(doomed) - self.max_threads
+                if excess > 0:
+                    doomed += [row[0] for row in self._conn.execute(
+                        "SELECT thread_id FROM threads WHERE thread_id NOT IN (SELECT value FROM json_each(?)) "
+                        "ORDER BY last_access LIMIT ?", (json.dumps(doomed), excess)
+                    )]
+            self._delete_threads(doomed)
+            self.evicted_threads += len(doomed)
+            return len(doomed)
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            (threads,) = self._conn.execute("SELECT COUNT(*) FROM threads").fetchone()
+            return {"threads": threads, "cached_threads": len(self._cache), "evicted_threads": self.evicted_threads}
+
@@ -0,0 +1,244 @@
+"""
+Circuit breaker with a local read-only replica for the vector stores
+
+When Pinecone is slow or down every retrieval waits out its deadline and the
+turn still fails. CircuitBreaker counts consecutive failures, where a query
+slower than latency_threshold also counts as one, and opens after
+failure_threshold of them. While it is open the primary is not called at
+all. After reset_seconds a single half-open probe goes to the primary:
+success closes the breaker, failure opens it again.
+
+FallbackVectorStore puts a breaker in front of a store. Queries the breaker
+refuses, and queries that fail on the primary, are answered from a local
+FAISS replica of the index. The replica is a snapshot written to disk
+during normal operation (see snapshot_replica and faiss_store.snapshot_store)
+and loaded lazily, read-only and memory-mapped.
+"""
+
+import asyncio
+import os
+import shutil
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from langchain_core.documents import Document
+
+from faiss_store import load_faiss_index, load_index_meta, snapshot_store
+from metrics import VECTOR_FALLBACKS
+
+CLOSED, OPEN, HALF_OPEN = "closed", "open", "half_open"
+STATE_VALUES = {CLOSED: 0, HALF_OPEN: 1, OPEN: 2}
+
+
+class CircuitOpenError(RuntimeError):
+    """The breaker is open and no replica is available"""
+
+
+class CircuitBreaker:
+    """Consecutive-failure breaker with latency tripping and a single half-open probe"""
+
+    def __init__(self, name: str, failure_threshold: int = 5, latency_threshold: float = 2.0,
+                 reset_seconds: float = 30.0):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.latency_threshold = latency_threshold
+        self.reset_seconds = reset_seconds
+        self.state = CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self._probing = False
+        self._lock = threading.Lock()
+        self.counts: Dict[str, int] = {"opened": 0, "probes": 0, "rejected": 0}
+
+    def allow(self) -> bool:
+        """Whether a call may go to the primary; in half-open only the one probe may"""
+        with self._lock:
+            if self.state == CLOSED:
+                return True
+            if self.state == OPEN and time.monotonic() - self.opened_at >= self.reset_seconds:
+                self.state = HALF_OPEN
+            if self.state == HALF_OPEN and not self._probing:
+                self._probing = True
+                self.counts["probes"] += 1
+                return True
+            self.counts["rejected"] += 1
+            return False
+
+    def record(self, seconds: float, error: Optional[BaseException] = None) -> None:
+        """Outcome of a call that allow() let through"""
+        failed = error is not None or seconds > self.latency_threshold
+        with self._lock:
+            probe, self._probing = self._probing, False
+            if not failed:
+                # A straggler that started before the breaker opened does not close it
+                if probe or self.state == CLOSED:
+                    self.failures = 0
+                    self.state = CLOSED
+                return
+            self.failures += 1
+            if probe or self.failures >= self.failure_threshold:
+                if self.state != OPEN:
+                    self.counts["opened"] += 1
+                self.state = OPEN
+                self.opened_at = time.monotonic()
+
+    def abandon(self) -> None:
+        """A call that allow() let through was cancelled before it finished"""
+        with self._lock:
+            self._probing = False
+
+    def stats(self) -> Dict[str, Any]:
+        return {**self.counts, "state": self.state, "consecutive_failures": self.failures}
+
+
+class FallbackVectorStore:
+    """Vector store behind a circuit breaker, falling back to a local replica
+
+    Query methods (by text or by vector, sync and async) are overridden;
+    everything else is delegated to the primary store.
+    """
+
+    def __init__(self, store, breaker: CircuitBreaker, replica_dir: Optional[str] = None):
+        self.wrapped = store
+        self.breaker = breaker
+        self.replica_dir = replica_dir
+        self._replica = None
+        self._replica_lock = threading.Lock()
+        self.counts: Dict[str, int] = {"fallbacks": 0, "fallback_errors": 0, "snapshots": 0}
+
+    def __getattr__(self, name: str):
+        if name == "wrapped":
+            raise AttributeError(name)
+        return getattr(self.wrapped, name)
+
+    # Replica
+
+    @property
+    def replica(self):
+        """The loaded replica, or None when no snapshot exists yet"""
+        if self._replica is None and self.replica_dir and os.path.exists(self.replica_dir):
+            with self._replica_lock:
+                if self._replica is None:
+                    try:
+                        self._replica = load_faiss_index(self.replica_dir, self.wrapped.embeddings)
+                    except Exception as e:
+                        print(f"⚠️ Could not load replica {self.replica_dir}: {e}")
+        return self._replica
+
+    def snapshot_replica(self) -> bool:
+        """Write a fresh replica next to the old one, then swap it in; False when skipped
+
+        Only runs while the breaker is closed, so a struggling primary is not
+        loaded with a full export.
+        """
+        if not self.replica_dir or self.breaker.state != CLOSED:
+            return False
+        # Per-process names: several workers may snapshot the same index
+        staging = f"{self.replica_dir}.staging-{os.getpid()}"
+        previous = f"{self.replica_dir}.previous-{os.getpid()}"
+        shutil.rmtree(staging, ignore_errors=True)
+        try:
+            snapshot_store(self.wrapped, self.wrapped.embeddings, staging)
+            with self._replica_lock:
+                if os.path.exists(self.replica_dir):
+                    os.rename(self.replica_dir, previous)
+                os.rename(staging, self.replica_dir)
+                self._replica = None
+        finally:
+            shutil.rmtree(staging, ignore_errors=True)
+            shutil.rmtree(previous, ignore_errors=True)
+        self.counts["snapshots"] += 1
+        return True
+
+    def replica_age(self) -> Optional[float]:
+        """Seconds since the replica on disk was written"""
+        created = load_index_meta(self.replica_dir).get("created_at") if self.replica_dir else None
+        return time.time() - created if created else None
+
+    # Routing
+
+    def _fallback(self, reason: str, call: Callable[[Any], Any], error: Optional[BaseException] = None):
+        replica = self.replica
+        if replica is None:
+            self.counts["fallback_errors"] += 1
+            if error is not None:
+                raise error
+            raise CircuitOpenError(f"{self.breaker.name} circuit is open and no replica is available")
+        self.counts["fallbacks"] += 1
+        VECTOR_FALLBACKS.inc(store=self.breaker.name, reason=reason)
+        return call(replica)
+
+    def _call(self, call: Callable[[Any], Any]):
+        if not self.breaker.allow():
+            return self._fallback("open", call)
+        started = time.perf_counter()
+        try:
+            result = call(self.wrapped)
+        except Exception as e:
+            self.breaker.record(time.perf_counter() - started, e)
+            return self._fallback("error", call, e)
+        self.breaker.record(time.perf_counter() - started)
+        return result
+
+    async def _acall(self, call: Callable[[Any], Any]):
+        if not self.breaker.allow():
+            return await self._fallback("open", call)
+        started = time.perf_counter()
+        try:
+            result = await call(self.wrapped)
+        except asyncio.CancelledError:
+            self.breaker.abandon()
+            raise
+        except Exception as e:
+            self.breaker.record(time.perf_counter() - started, e)
+            return await self._fallback("error", call, e)
+        self.breaker.record(time.perf_counter() - started)
+        return result
+
+    # Query methods
+
+    def similarity_search_by_vector_with_score(self, embedding: List[float], k: int = 4,
+                                               **kwargs: Any) -> List[Tuple[Document, float]]:
+        return self._call(lambda store: _search_by_vector(store, embedding, k, kwargs))
+
+    async def asimilarity_search_by_vector_with_score(self, embedding: List[float], k: int = 4,
+                                                      **kwargs: Any) -> List[Tuple[Document, float]]:
+        return await self._acall(lambda store: _asearch_by_vector(store, embedding, k, kwargs))
+
+    def similarity_search_with_score(self, query: str, k: int = 4, **kwargs: Any) -> List[Tuple[Document, float]]:
+        return self._call(lambda store: store.similarity_search_with_score(query, k=k, **kwargs))
+
+    async def asimilarity_search_with_score(self, query: str, k: int = 4,
+                                            **kwargs: Any) -> List[Tuple[Document, float]]:
+        return await self._acall(lambda store: store.asimilarity_search_with_score(query, k=k, **kwargs))
+
+    def similarity_search(self, query: str, k: int = 4, **kwargs: Any) -> List[Document]:
+        return self._call(lambda store: store.similarity_search(query, k=k, **kwargs))
+
+    async def asimilarity_search(self, query: str, k: int = 4, **kwargs: Any) -> List[Document]:
+        return await self._acall(lambda store: store.asimilarity_search(query, k=k, **kwargs))
+
+    def stats(self) -> Dict[str, Any]:
+        stats = self.wrapped.stats() if hasattr(self.wrapped, "stats") else {}
+        age = self.replica_age()
+        return {
+            **stats,
+            **self.counts,
+            **{f"breaker_{key}": value for key, value in self.breaker.stats().items()},
+            "replica_available": self.replica_dir is not None and os.path.exists(self.replica_dir),
+            "replica_age_seconds": round(age, 1) if age is not None else None,
+        }
+
+
+def _search_by_vector(store, embedding: List[float], k: int, kwargs: Dict[str, Any]) -> List[Tuple[Document, float]]:
+    if hasattr(store, "similarity_search_by_vector_with_score"):
+        return store.similarity_search_by_vector_with_score(embedding, k=k, **kwargs)
+    return store.similarity_search_with_score_by_vector(embedding, k=k, **kwargs)
+
+
+async def _asearch_by_vector(store, embedding: List[float], k: int,
+                             kwargs: Dict[str, Any]) -> List[Tuple[Document, float]]:
+    if hasattr(store, "asimilarity_search_by_vector_with_score"):
+        return await store.asimilarity_search_by_vector_with_score(embedding, k=k, **kwargs)
+    return await store.asimilarity_search_with_score_by_vector(embedding, k=k, **kwargs)
@@ -0,0 +1,129 @@
+"""
+Coalescing of identical in-flight requests
+
+A double-clicked "send" produces two identical turns for the same
+conversation. Turns are already serialized per thread (rag.conversation_lock),
+so without coalescing the second one would wait for the first and then run
+the whole pipeline again, adding a duplicate turn to the history.
+
+RequestCoalescer runs the first request and hands its result to every
+identical request (same key: thread, normalized query, mode, options) that
+arrives while it is running or within a short window after it finished.
+A finished result is only reused while the state it was computed from is
+unchanged (the `version` callable, e.g. the conversation's checkpoint ID):
+the same message sent again after another turn runs again. Works for
+threads and coroutines alike: results are shared through a
+concurrent.futures.Future.
+"""
+
+import asyncio
+import copy
+import threading
+import time
+from concurrent.futures import Future
+from typing import Any, Awaitable, Callable, Dict, Hashable, Optional, Tuple
+
+
+class RequestCoalescer:
+    """Share one execution among identical requests in flight or within `window` seconds"""
+
+    def __init__(self, window: float = 2.0):
+        self.window = window
+        self._inflight: Dict[Hashable, Future] = {}
+        # key -> (result, finished at, version after it ran); only successful results are reused
+        self._recent: Dict[Hashable, Tuple[Any, float, Hashable]] = {}
+        self._lock = threading.Lock()
+        self.counts: Dict[str, int] = {
+            "executed": 0, "coalesced_inflight": 0, "coalesced_recent": 0, "recent_outdated": 0,
+        }
+
+    def _recent_entry(self, key: Hashable) -> Optional[Tuple[Any, float, Hashable]]:
+        with self._lock:
+            now = time.monotonic()
+            for stale in [k for k, (_, finished, _) in self._recent.items() if now - finished > self.window]:
+                del self._recent[stale]
+            return self._recent.get(key)
+
+    def _join(self, key: Hashable, reuse: Optional[Tuple[Any, float, Hashable]]) -> Tuple[Future, bool]:
+        """(future for key, whether the caller must execute the request)
+
+        reuse is the recent entry the caller checked is still current, if any.
+        """
+        with self._lock:
+            entry = self._recent.get(key)
+            if entry is not None and entry is reuse:
+                self.counts["coalesced_recent"] += 1
+                future = Future()
+                future.set_result(entry[0])
+                return future, False
+            if entry is not None:
+                # The conversation moved on since this result was computed
+                del self._recent[key]
+                self.counts["recent_outdated"] += 1
+            future = self._inflight.get(key)
+            if future is not None:
+                self.counts["coalesced_inflight"] += 1
+                return future, False
+            future = self._inflight[key] = Future()
+            self.counts["executed"] += 1
+            return future, True
+
+    def _finish(self, key: Hashable, future: Future, result: Any = None, error: BaseException = None,
+                reusable: bool = True, version: Hashable = None) -> None:
+        with self._lock:
+            self._inflight.pop(key, None)
+            if error is None and reusable and self.window > 0:
+                self._recent[key] = (result, time.monotonic(), version)
+        if error is None:
+            future.set_result(result)
+        else:
+            future.set_exception(error)
+
+    def run(self, key: Hashable, execute: Callable[[], Any], reusable: Callable[[Any], bool] = lambda _: True,
+            version: Optional[Callable[[], Hashable]] = None) -> Any:
+        """Execute once per identical key
+
+        With version (reads the current state, e.g. the checkpoint ID), execute
+        returns (result, version after it ran), and a finished result is only
+        reused while version() still returns the same value.
+        """
+        entry = self._recent_entry(key)
+        if entry is not None and version is not None and version() != entry[2]:
+            entry = None
+        future, leader = self._join(key, entry)
+        if not leader:
+            return copy.deepcopy(future.result())
+        try:
+            result, produced = execute() if version is not None else (execute(), None)
+        except BaseException as e:
+            self._finish(key, future, error=e)
+            raise
+        self._finish(key, future, result, reusable=reusable(result), version=produced)
+        return copy.deepcopy(result)
+
+    async def arun(self, key: Hashable, execute: Callable[[], Awaitable[Any]],
+                   reusable: Callable[[Any], bool] = lambda _: True,
+                   version: Optional[Callable[[], Awaitable[Hashable]]] = None) -> Any:
+        """Async variant of run; version is a coroutine function"""
+        entry = self._recent_entry(key)
+        if entry is not None and version is not None and await version() != entry[2]:
+            entry = None
+        future, leader = self._join(key, entry)
+        if not leader:
+            # Shield: a cancelled follower must not cancel the shared result
+            return copy.deepcopy(await asyncio.shield(asyncio.wrap_future(future)))
+        try:
+            result, produced = await execute() if version is not None else (await execute(), None)
+        except BaseException as e:
+            self._finish(key, future, error=e)
+            raise
+        self._finish(key, future, result, reusable=reusable(result), version=produced)
+        return copy.deepcopy(result)
+
+    def stats(self) -> Dict[str, Any]:
+        total = self.counts["executed"] + self.counts["coalesced_inflight"] + self.counts["coalesced_recent"]
+        return {
+            **self.counts,
+            "inflight": len(self._inflight),
+            "coalesced_rate": (total - self.counts["executed"]) / total if total else 0.0,
+        }
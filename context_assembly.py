@@ -0,0 +1,199 @@
+"""
+Context assembly between retrieval and generation
+
+The retrieval tools used to paste their top three documents verbatim under
+four lines of headers each, and near-duplicate catalog entries (the same
+product in caps_catalog1.json and caps_catalog_v2.json) took two of the
+three slots. ContextAssembler picks the tool's results from a wider set of
+candidates instead:
+
+- drops near-duplicates: the same product ID, the same normalized text, or
+  similarity to an already picked snippet of duplicate_similarity or more
+- orders the rest by maximal marginal relevance (MMR), trading retrieval
+  rank against similarity to the snippets already picked
+- keeps at most k snippets within the token budget
+- emits compact snippets: one "Source:" header line, then the text without
+  blank lines or indentation
+
+Similarity is lexical (TF-IDF cosine) by default, which needs no
+API call; with embeddings it is the cosine of the candidates' embeddings,
+one embed_documents call per tool call.
+"""
+
+import os
+from typing import List, Sequence
+
+import numpy as np
+from langchain_core.documents import Document
+
+from agent_budget import context_chunks
+from history import count_tokens
+from hybrid_search import tokenize
+from metrics import CONTEXT_DOCUMENTS
+from retrieval import content_hash
+
+SOURCE_LABELS = {"csv": "website", "pdf": "catalog"}
+
+
+def compact_text(text: str) -> str:
+    """Text without blank lines, indentation or runs of spaces"""
+    return "\n".join(" ".join(line.split()) for line in text.splitlines() if line.strip())
+
+
+def snippet(doc: Document) -> str:
+    """Compact structured snippet: "Source: <file> | <data source> | <category>" and the text"""
+    metadata = doc.metadata
+    header = [str(metadata.get("source", "Unknown"))]
+    if metadata.get("data_source") in SOURCE_LABELS:
+        header.append(SOURCE_LABELS[metadata["data_source"]])
+    if metadata.get("category"):
+        header.append(str(metadata["category"]))
+    return f"Source: {' | '.join(header)}\n{compact_text(doc.page_content)}"
+
+
+def duplicate_key(doc: Document) -> str:
+    """Catalog entries of one product are duplicates whatever file they came from"""
+    product_id = doc.metadata.get("product_id")
+    if product_id and product_id != "N/A":
+        return f"product:{str(product_id).casefold()}"
+    return content_hash(doc.page_content.casefold())
+
+
+def lexical_vectors(texts: Sequence[str]) -> np.ndarray:
+    """TF-IDF vectors over the texts' shared vocabulary
+
+    IDF is taken over the texts themselves, so the template every catalog
+    entry shares (field names, tier labels) carries no weight and only what
+    tells the candidates apart counts.
+    """
+    vocabulary = {}
+    rows = [[vocabulary.setdefault(term, len(vocabulary)) for term in tokenize(text)] for text in texts]
+    vectors = np.zeros((len(texts), max(1, len(vocabulary))), dtype=np.float32)
+    for i, row in enumerate(rows):
+        np.add.at(vectors[i], row, 1.0)
+    document_frequency = (vectors > 0).sum(axis=0)
+    return vectors * np.log((len(texts) + 1) / (document_frequency + 1))
+
+
+def cosine_matrix(vectors: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    vectors = vectors / np.where(norms == 0, 1.0, norms)
+    return vectors @ vectors.T
+
+
+class ContextAssembler:
+    """Dedup, MMR and token budgeting of retrieved documents"""
+
+    def __init__(self, fetch_k: int = 8, token_budget: int = 1200, mmr_lambda: float = 0.7,
+                 duplicate_similarity: float = 0.9, embeddings=None, model_name: str = "gpt-4o-mini"):
+        self.fetch_k = fetch_k
+        self.token_budget = token_budget
+        self.mmr_lambda = mmr_lambda
+        self.duplicate_similarity = duplicate_similarity
+        self.embeddings = embeddings
+        self.model_name = model_name
+
+    @classmethod
+    def from_env(cls, embeddings=None, model_name: str = "gpt-4o-mini") -> "ContextAssembler":
+        """CONTEXT_* settings; CONTEXT_SIMILARITY=embedding compares candidates by their embeddings"""
+        use_embeddings = os.getenv("CONTEXT_SIMILARITY", "lexical").lower() == "embedding"
+        return cls(
+            fetch_k=int(os.getenv("CONTEXT_FETCH_K", "8")),
+            token_budget=int(os.getenv("CONTEXT_TOKEN_BUDGET", "1200")),
+            mmr_lambda=float(os.getenv("CONTEXT_MMR_LAMBDA", "0.7")),
+            duplicate_similarity=float(os.getenv("CONTEXT_DUPLICATE_SIMILARITY", "0.9")),
+            embeddings=embeddings if use_embeddings else None,
+            model_name=model_name,
+        )
+
+    def _unique(self, docs: Sequence[Document]) -> List[Document]:
+        """Best-ranked copy of each document by product ID or normalized text"""
+        unique, seen = [], set()
+        for doc in docs:
+            key = duplicate_key(doc)
+            if key not in seen:
+                seen.add(key)
+                unique.append(doc)
+        if len(unique) < len(docs):
+            CONTEXT_DOCUMENTS.inc(len(docs) - len(unique), outcome="duplicate")
+        return unique
+
+    def _pick(self, docs: List[Document], similarity: np.ndarray, k: int) -> List[Document]:
+        """MMR over the candidates in retrieval order, skipping near-duplicates, within the budget"""
+        relevance = 1.0 - np.arange(len(docs)) / len(docs)
+        # Catalog entries share one template: different products are never near-duplicates
+        product_ids = [doc.metadata.get("product_id") for doc in docs]
+        duplicates = similarity.copy()
+        for i, a in enumerate(product_ids):
+            for j, b in enumerate(product_ids):
+                if a and b and a != b:
+                    duplicates[i, j] = 0.0
+        remaining = list(range(len(docs)))
+        picked: List[int] = []
+        snippets: List[Document] = []
+        outcomes = {"duplicate": 0, "over_budget": 0}
+        used = 0
+        while remaining and len(snippets) < k:
+            redundancy = similarity[np.ix_(remaining, picked)].max(axis=1) if picked else np.zeros(len(remaining))
+            scores = self.mmr_lambda * relevance[remaining] - (1 - self.mmr_lambda) * redundancy
+            best = int(np.argmax(scores))
+            index = remaining.pop(best)
+            if picked and duplicates[index, picked].max() >= self.duplicate_similarity:
+                outcomes["duplicate"] += 1
+                continue
+            cost = count_tokens(snippet(docs[index]), self.model_name)
+            # The first snippet is always kept; later ones only while they fit
+            if snippets and used + cost > self.token_budget:
+                outcomes["over_budget"] += 1
+                continue
+            picked.append(index)
+            snippets.append(docs[index])
+            used += cost
+        outcomes.update(kept=len(snippets), not_selected=len(remaining))
+        for outcome, count in outcomes.items():
+            if count:
+                CONTEXT_DOCUMENTS.inc(count, outcome=outcome)
+        return snippets
+
+    def select(self, docs: Sequence[Document], k: int) -> List[Document]:
+        """Up to k diverse, non-duplicate documents from the ranked candidates, within the budget"""
+        docs = self._unique(docs)
+        if not docs:
+            return []
+        texts = [doc.page_content for doc in docs]
+        if self.embeddings is None or len(docs) == 1:
+            vectors = lexical_vectors(texts)
+        else:
+            vectors = np.asarray(self.embeddings.embed_documents(texts), dtype=np.float32)
+        return self._pick(docs, cosine_matrix(vectors), k)
+
+    async def aselect(self, docs: Sequence[Document], k: int) -> List[Document]:
+        """Async variant of select"""
+        if self.embeddings is None:
+            return self.select(docs, k)
+        docs = self._unique(docs)
+        if len(docs) <= 1:
+            return self.select(docs, k)
+        vectors = await self.embeddings.aembed_documents([doc.page_content for doc in docs])
+        return self._pick(docs, cosine_matrix(np.asarray(vectors, dtype=np.float32)), k)
+
+    def format(self, docs: Sequence[Document]) -> str:
+        return "\n\n".join(snippet(doc) for doc in docs)
+
+    def merge(self, contents: Sequence[str]) -> str:
+        """Context of several tool messages: their snippets interleaved, exact repeats dropped,
+        within the token budget"""
+        per_message = [context_chunks(content) for content in contents]
+        merged, seen, used = [], set(), 0
+        for rank in range(max((len(parts) for parts in per_message), default=0)):
+            for parts in per_message:
+                if rank >= len(parts):
+                    continue
+                digest = content_hash(parts[rank])
+                cost = count_tokens(parts[rank], self.model_name)
+                if digest in seen or (merged and used + cost > self.token_budget):
+                    continue
+                seen.add(digest)
+                merged.append(parts[rank])
+                used += cost
+        return "\n\n".join(merged)
@@ -0,0 +1,213 @@
+"""
+Query-embedding cache shared by every retrieval path
+
+Wraps the embeddings model so the same query string is embedded once, no
+matter how many tools, users or turns ask for it:
+
+- in-memory LRU bounded by entry count
+- TTL expiry so cached vectors eventually follow model/deployment changes
+- optional SQLite tier that survives restarts and is shared by workers
+- concurrent misses for the same key wait for a single upstream call; if
+  that caller is cancelled, a waiter makes the call instead
+- hit/miss counters via stats()
+
+Keys are the model name plus the normalized text (case-folded, whitespace
+collapsed), so "Navy  trucker caps" and "navy trucker caps" share an entry.
+"""
+
+import asyncio
+import hashlib
+import sqlite3
+import threading
+import time
+from array import array
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
+
+from langchain_core.embeddings import Embeddings
+
+from metrics import EMBEDDING_SECONDS, timed
+
+
+def normalize_text(text: str) -> str:
+    """Canonical form of a query for cache keys"""
+    return " ".join(text.casefold().split())
+
+
+class CachedEmbeddings(Embeddings):
+    """Embeddings wrapper with an LRU/TTL query cache and optional SQLite tier
+
+    Only embed_query/aembed_query are cached; embed_documents is index-time
+    work and passes straight through.
+    """
+
+    def __init__(self, underlying: Embeddings, model_name: str,
+                 max_entries: int = 4096, ttl_seconds: float = 86400,
+                 persist_path: Optional[str] = None):
+        self.underlying = underlying
+        self.model_name = model_name
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._memory: "OrderedDict[str, Tuple[float, List[float]]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._inflight: Dict[str, threading.Event] = {}
+        self._ainflight: Dict[str, asyncio.Future] = {}
+        self._counters = {"hits": 0, "disk_hits": 0, "misses": 0, "coalesced": 0, "evictions": 0, "expired": 0}
+
+        self._db = None
+        if persist_path:
+            self._db = sqlite3.connect(persist_path, check_same_thread=False, timeout=30)
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS query_embeddings ("
+                "key TEXT PRIMARY KEY, created REAL NOT NULL, vector BLOB NOT NULL)"
+            )
+            self._db.commit()
+
+    def cache_key(self, text: str) -> str:
+        digest = hashlib.sha256(normalize_text(text).encode("utf-8")).hexdigest()
+        return f"{self.model_name}:{digest}"
+
+    # Cache tiers
+
+    def _get(self, key: str) -> Optional[List[float]]:
+        now = time.time()
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None:
+                created, vector = entry
+                if now - created <= self.ttl_seconds:
+                    self._memory.move_to_end(key)
+                    self._counters["hits"] += 1
+                    return vector
+                del self._memory[key]
+                self._counters["expired"] += 1
+
+            if self._db is not None:
+                row = self._db.execute(
+                    "SELECT created, vector FROM query_embeddings WHERE key = ?", (key,)
+                ).fetchone()
+                if row is not None:
+                    created, blob = row
+                    if now - created <= self.ttl_seconds:
+                        vector = array("f", blob).tolist()
+                        self._put_memory(key, created, vector)
+                        self._counters["disk_hits"] += 1
+                        return vector
+                    self._db.execute("DELETE FROM query_embeddings WHERE key = ?", (key,))
+                    self._db.commit()
+                    self._counters["expired"] += 1
+        return None
+
+    def _put_memory(self, key: str, created: float, vector: List[float]) -> None:
+        # Caller holds self._lock
+        self._memory[key] = (created, vector)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_entries:
+            self._memory.popitem(last=False)
+            self._counters["evictions"] += 1
+
+    def _put(self, key: str, vector: List[float]) -> None:
+        created = time.time()
+        with self._lock:
+            self._counters["misses"] += 1
+            self._put_memory(key, created, vector)
+            if self._db is not None:
+                self._db.execute(
+                    "INSERT OR REPLACE INTO query_embeddings (key, created, vector) VALUES (?, ?, ?)",
+                    (key, created, array("f", vector).tobytes()),
+                )
+                self._db.commit()
+
+    # Embeddings interface
+
+    def embed_query(self, text: str) -> List[float]:
+        key = self.cache_key(text)
+        while True:
+            vector = self._get(key)
+            if vector is not None:
+                return vector
+            with self._lock:
+                waiter = self._inflight.get(key)
+                if waiter is None:
+                    self._inflight[key] = threading.Event()
+                    break
+            # Another thread is embedding the same text; reuse its result
+            with self._lock:
+                self._counters["coalesced"] += 1
+            waiter.wait()
+
+        try:
+            with timed(EMBEDDING_SECONDS, "embedding", kind="query"):
+                vector = self.underlying.embed_query(text)
+            self._put(key, vector)
+            return vector
+        finally:
+            with self._lock:
+                self._inflight.pop(key).set()
+
+    async def aembed_query(self, text: str) -> List[float]:
+        key = self.cache_key(text)
+        while True:
+            vector = self._get(key)
+            if vector is not None:
+                return vector
+
+            pending = self._ainflight.get(key)
+            if pending is None:
+                break
+            with self._lock:
+                self._counters["coalesced"] += 1
+            try:
+                return await asyncio.shield(pending)
+            except asyncio.CancelledError:
+                # The leader was cancelled, not this caller: take over the call
+                if pending.cancelled() and not asyncio.current_task().cancelling():
+                    continue
+                raise
+
+        future = asyncio.get_running_loop().create_future()
+        self._ainflight[key] = future
+        try:
+            with timed(EMBEDDING_SECONDS, "embedding", kind="query"):
+                vector = await self.underlying.aembed_query(text)
+            self._put(key, vector)
+            future.set_result(vector)
+            return vector
+        except asyncio.CancelledError:
+            # Waiters retry instead of failing with this caller's cancellation
+            future.cancel()
+            raise
+        except BaseException as e:
+            future.set_exception(e)
+            # Mark the exception retrieved when nobody else was waiting
+            future.exception()
+            raise
+        finally:
+            self._ainflight.pop(key, None)
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        with timed(EMBEDDING_SECONDS, "embedding", kind="documents"):
+            return self.underlying.embed_documents(texts)
+
+    async def aembed_documents(self, texts: List[str]) -> List[List[float]]:
+        with timed(EMBEDDING_SECONDS, "embedding", kind="documents"):
+            return await self.underlying.aembed_documents(texts)
+
+    # Maintenance
+
+    def clear(self) -> None:
+        with self._lock:
+            self._memory.clear()
+            if self._db is not None:
+                self._db.execute("DELETE FROM query_embeddings")
+                self._db.commit()
+
+    def stats(self) -> Dict[str, float]:
+        with self._lock:
+            counters = dict(self._counters)
+            counters["size"] = len(self._memory)
+        saved = counters["hits"] + counters["disk_hits"] + counters["coalesced"]
+        lookups = saved + counters["misses"]
+        counters["hit_rate"] = saved / lookups if lookups else 0.0
+        return counters
@@ -0,0 +1,425 @@
+"""
+Local FAISS vector-store backend
+
+Drop-in replacement for the Pinecone indexes used by rag.py. Each index lives
+in its own directory (e.g. faiss_index/cap-rag-index/) in the LangChain
+FAISS layout:
+
+- index.faiss: the FAISS index, loaded memory-mapped and read-only
+- index.pkl: pickled (docstore, index_to_docstore_id)
+- index_meta.json: how the vectors were stored (dimension, normalization, ...)
+
+Vectors are L2-normalized and searched by inner product, so scores are cosine
+similarities (higher is better), the same convention as the Pinecone indexes.
+
+An index can also be stored compactly (see CompactFAISS): vectors truncated
+to fewer dimensions (text-embedding-3 vectors keep their meaning when
+truncated and renormalized, like the API's `dimensions` parameter) and/or
+quantized to int8 or product-quantized codes. Compact indexes keep the
+float32 vectors in vectors.npy, memory-mapped, and re-score the top
+candidates of the quantized search with them.
+
+Snapshot the Pinecone indexes to disk (no re-embedding) with:
+    python faiss_store.py --index cap-website-data --index cap-rag-index
+    python faiss_store.py --index cap-rag-index --dimensions 256 --quantization int8
+    python faiss_store.py --index cap-rag-index --from-local --output-dir faiss_compact --quantization pq
+"""
+
+import argparse
+import json
+import os
+import pickle
+import time
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import faiss
+import numpy as np
+from langchain_community.docstore.in_memory import InMemoryDocstore
+from langchain_community.vectorstores import FAISS
+from langchain_community.vectorstores.utils import DistanceStrategy, maximal_marginal_relevance
+from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
+
+INDEX_FILE = "index.faiss"
+DOCSTORE_FILE = "index.pkl"
+META_FILE = "index_meta.json"
+VECTORS_FILE = "vectors.npy"
+
+QUANTIZATIONS = ("none", "int8", "pq")
+
+DEFAULT_INDEX_DIR = "faiss_index"
+
+
+def get_index_dir(index_name: str, base_dir: Optional[str] = None) -> str:
+    """Directory holding the local copy of a named index"""
+    return os.path.join(base_dir or os.getenv("FAISS_INDEX_DIR", DEFAULT_INDEX_DIR), index_name)
+
+
+def _new_store(embeddings: Embeddings, index, docstore, index_to_docstore_id) -> FAISS:
+    return FAISS(
+        embedding_function=embeddings,
+        index=index,
+        docstore=docstore,
+        index_to_docstore_id=index_to_docstore_id,
+        normalize_L2=True,
+        distance_strategy=DistanceStrategy.MAX_INNER_PRODUCT,
+    )
+
+
+class ReadOnlyIndexError(RuntimeError):
+    """Compact indexes cannot be modified"""
+
+
+class CompactFAISS(FAISS):
+    """FAISS store over a truncated and/or quantized index (read-only)
+
+    Query vectors are cut to the index dimension and renormalized, so full
+    3072-dimension query embeddings work against a 256-dimension index. With
+    full_vectors (float32 rows aligned with the index) the quantized search
+    fetches rescore_factor times the candidates and ranks them by their exact
+    cosine similarity. MMR search scores and compares its candidates with
+    the same exact vectors.
+    """
+
+    def __init__(self, *args: Any, full_vectors: Optional[np.ndarray] = None, quantization: str = "none",
+                 rescore_factor: int = 4, **kwargs: Any):
+        super().__init__(*args, **kwargs)
+        self.full_vectors = full_vectors
+        self.quantization = quantization
+        self.rescore_factor = max(1, rescore_factor)
+
+    def similarity_search_with_score_by_vector(self, embedding: List[float], k: int = 4, filter=None,
+                                               fetch_k: int = 20, **kwargs: Any) -> List[Tuple[Document, float]]:
+        vector = truncate_vectors([embedding], self.index.d)
+        candidates = k if filter is None else max(k, fetch_k)
+        if self.full_vectors is not None:
+            candidates *= self.rescore_factor
+        scores, indices = self.index.search(vector, candidates)
+        ranked = [(float(score), int(i)) for score, i in zip(scores[0], indices[0]) if i != -1]
+        if self.full_vectors is not None and ranked:
+            positions = sorted(i for _, i in ranked)
+            exact = np.asarray(self.full_vectors[positions]) @ vector[0]
+            ranked = sorted(zip(exact.tolist(), positions), reverse=True)
+
+        filter_func = self._create_filter_func(filter) if filter is not None else None
+        score_threshold = kwargs.get("score_threshold")
+        docs = []
+        for score, position in ranked:
+            doc = self.docstore.search(self.index_to_docstore_id[position])
+            if not isinstance(doc, Document):
+                raise ValueError(f"Could not find document for position {position}")
+            if filter_func is not None and not filter_func(doc.metadata):
+                continue
+            if score_threshold is not None and score < score_threshold:
+                continue
+            docs.append((doc, score))
+            if len(docs) == k:
+                break
+        return docs
+
+    def max_marginal_relevance_search_with_score_by_vector(self, embedding: List[float], *, k: int = 4,
+                                                           fetch_k: int = 20, lambda_mult: float = 0.5,
+                                                           filter=None) -> List[Tuple[Document, float]]:
+        vector = truncate_vectors([embedding], self.index.d)
+        _, indices = self.index.search(vector, fetch_k if filter is None else fetch_k * 2)
+        positions = [int(i) for i in indices[0] if i != -1]
+        if filter is not None:
+            filter_func = self._create_filter_func(filter)
+            positions = [i for i in positions
+                         if filter_func(self.docstore.search(self.index_to_docstore_id[i]).metadata)]
+        if not positions:
+            return []
+        positions.sort()
+        if self.full_vectors is not None:
+            candidates = np.asarray(self.full_vectors[positions], dtype=np.float32)
+        else:
+            candidates = np.stack([self.index.reconstruct(i) for i in positions])
+        scores = candidates @ vector[0]
+        docs = []
+        for selected in maximal_marginal_relevance(vector[0], candidates, k=k, lambda_mult=lambda_mult):
+            doc = self.docstore.search(self.index_to_docstore_id[positions[selected]])
+            if not isinstance(doc, Document):
+                raise ValueError(f"Could not find document for position {positions[selected]}")
+            docs.append((doc, float(scores[selected])))
+        return docs
+
+    def add_embeddings(self, *args: Any, **kwargs: Any) -> List[str]:
+        raise ReadOnlyIndexError("Compact indexes are read-only; rebuild them with faiss_store.py")
+
+    def add_texts(self, *args: Any, **kwargs: Any) -> List[str]:
+        raise ReadOnlyIndexError("Compact indexes are read-only; rebuild them with faiss_store.py")
+
+    def delete(self, *args: Any, **kwargs: Any) -> Optional[bool]:
+        raise ReadOnlyIndexError("Compact indexes are read-only; rebuild them with faiss_store.py")
+
+
+def _compact_store(embeddings: Embeddings, index, docstore, index_to_docstore_id,
+                   full_vectors: Optional[np.ndarray], quantization: str) -> CompactFAISS:
+    return CompactFAISS(
+        embedding_function=embeddings,
+        index=index,
+        docstore=docstore,
+        index_to_docstore_id=index_to_docstore_id,
+        normalize_L2=True,
+        distance_strategy=DistanceStrategy.MAX_INNER_PRODUCT,
+        full_vectors=full_vectors,
+        quantization=quantization,
+        rescore_factor=int(os.getenv("FAISS_RESCORE_FACTOR", "4")),
+    )
+
+
+def truncate_vectors(vectors: Sequence[Sequence[float]], dimensions: Optional[int] = None) -> np.ndarray:
+    """float32 array of the vectors cut to their first dimensions, L2-normalized"""
+    array = np.array(vectors, dtype=np.float32)
+    if dimensions:
+        array = np.ascontiguousarray(array[:, :dimensions])
+    faiss.normalize_L2(array)
+    return array
+
+
+def quantized_index(vectors: np.ndarray, quantization: str = "none"):
+    """Inner-product FAISS index over normalized vectors: flat, int8 or product-quantized"""
+    dimension = vectors.shape[1]
+    if quantization == "int8":
+        index = faiss.IndexScalarQuantizer(dimension, faiss.ScalarQuantizer.QT_8bit, faiss.METRIC_INNER_PRODUCT)
+    elif quantization == "pq":
+        # 8-dimension sub-vectors; k-means wants ~39 training vectors per centroid
+        subvectors = next(m for m in range(max(1, dimension // 8), 0, -1) if dimension % m == 0)
+        bits = max(1, min(8, int(np.log2(max(2, len(vectors) / 39)))))
+        index = faiss.IndexPQ(dimension, subvectors, bits, faiss.METRIC_INNER_PRODUCT)
+    elif quantization == "none":
+        index = faiss.IndexFlatIP(dimension)
+    else:
+        raise ValueError(f"Unknown quantization: {quantization} (expected one of {', '.join(QUANTIZATIONS)})")
+    index.train(vectors)
+    index.add(vectors)
+    return index
+
+
+def build_compact_store(texts: Sequence[str],
+                        vectors: Sequence[Sequence[float]],
+                        metadatas: Sequence[Dict[str, Any]],
+                        ids: Sequence[str],
+                        embeddings: Embeddings,
+                        dimensions: Optional[int] = None,
+                        quantization: str = "none") -> CompactFAISS:
+    """In-memory compact store; the float32 vectors are kept for re-scoring when quantized"""
+    full = truncate_vectors(vectors, dimensions)
+    docstore = InMemoryDocstore({
+        doc_id: Document(id=doc_id, page_content=text, metadata=dict(metadata))
+        for doc_id, text, metadata in zip(ids, texts, metadatas)
+    })
+    return _compact_store(embeddings, quantized_index(full, quantization), docstore, dict(enumerate(ids)),
+                          full if quantization != "none" else None, quantization)
+
+
+def save_faiss_index(store: FAISS, index_dir: str, source: str = "documents") -> None:
+    """Persist a FAISS store plus the metadata needed to load it back"""
+    store.save_local(index_dir)
+    meta = {
+        "dimension": store.index.d,
+        "count": store.index.ntotal,
+        "normalize_L2": True,
+        "distance_strategy": DistanceStrategy.MAX_INNER_PRODUCT.value,
+        "source": source,
+        "created_at": time.time(),
+    }
+    if isinstance(store, CompactFAISS):
+        meta["quantization"] = store.quantization
+        if store.full_vectors is not None:
+            np.save(os.path.join(index_dir, VECTORS_FILE), np.asarray(store.full_vectors, dtype=np.float32))
+    with open(os.path.join(index_dir, META_FILE), "w") as f:
+        json.dump(meta, f, indent=2)
+
+
+def build_faiss_index(documents: List[Document], embeddings: Embeddings, index_dir: str) -> FAISS:
+    """Embed documents and write a local index"""
+    store = FAISS.from_documents(
+        documents,
+        embeddings,
+        normalize_L2=True,
+        distance_strategy=DistanceStrategy.MAX_INNER_PRODUCT,
+    )
+    save_faiss_index(store, index_dir)
+    return store
+
+
+def build_faiss_index_from_vectors(texts: Sequence[str],
+                                   vectors: Sequence[Sequence[float]],
+                                   metadatas: Sequence[Dict[str, Any]],
+                                   ids: Sequence[str],
+                                   embeddings: Embeddings,
+                                   index_dir: str,
+                                   source: str = "vectors",
+                                   dimensions: Optional[int] = None,
+                                   quantization: str = "none") -> FAISS:
+    """Write a local index from vectors that were already embedded
+
+    dimensions and quantization write a compact index (see CompactFAISS).
+    """
+    if dimensions or quantization != "none":
+        store = build_compact_store(texts, vectors, metadatas, ids, embeddings, dimensions, quantization)
+        save_faiss_index(store, index_dir, source=source)
+        return store
+    store = FAISS.from_embeddings(
+        list(zip(texts, vectors)),
+        embeddings,
+        metadatas=list(metadatas),
+        ids=list(ids),
+        normalize_L2=True,
+        distance_strategy=DistanceStrategy.MAX_INNER_PRODUCT,
+    )
+    save_faiss_index(store, index_dir, source=source)
+    return store
+
+
+def load_faiss_index(index_dir: str, embeddings: Embeddings, mmap: bool = True) -> FAISS:
+    """Load a local index, memory-mapping the vectors when FAISS supports it
+
+    Compact indexes load as CompactFAISS, their float32 vectors memory-mapped;
+    FAISS_RESCORE_FACTOR sets how many candidates per result are re-scored.
+    """
+    index_path = os.path.join(index_dir, INDEX_FILE)
+    if not os.path.exists(index_path):
+        raise FileNotFoundError(f"No FAISS index at {index_path}")
+
+    index = None
+    if mmap:
+        try:
+            index = faiss.read_index(index_path, faiss.IO_FLAG_MMAP | faiss.IO_FLAG_READ_ONLY)
+        except RuntimeError:
+            # Index types without mmap support are read into memory instead
+            index = None
+    if index is None:
+        index = faiss.read_index(index_path)
+
+    # The docstore pickle is written by save_faiss_index, never by a third party
+    with open(os.path.join(index_dir, DOCSTORE_FILE), "rb") as f:
+        docstore, index_to_docstore_id = pickle.load(f)
+
+    meta = load_index_meta(index_dir)
+    if "quantization" in meta:
+        vectors_path = os.path.join(index_dir, VECTORS_FILE)
+        full_vectors = np.load(vectors_path, mmap_mode="r") if os.path.exists(vectors_path) else None
+        return _compact_store(embeddings, index, docstore, index_to_docstore_id, full_vectors, meta["quantization"])
+    return _new_store(embeddings, index, docstore, index_to_docstore_id)
+
+
+def load_index_meta(index_dir: str) -> Dict[str, Any]:
+    """Metadata written next to a local index (empty if missing)"""
+    try:
+        with open(os.path.join(index_dir, META_FILE)) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def export_pinecone_index(index, embeddings: Embeddings, index_dir: str,
+                          text_key: str = "text", namespace: Optional[str] = None,
+                          batch_size: int = 100, dimensions: Optional[int] = None,
+                          quantization: str = "none") -> FAISS:
+    """Snapshot a Pinecone index (vectors + metadata) into a local FAISS index
+
+    Reuses the stored vectors, so no embedding calls are made; dimensions and
+    quantization write a compact index.
+    """
+    texts, vectors, metadatas, ids = [], [], [], []
+    list_kwargs = {"namespace": namespace} if namespace else {}
+    for id_batch in index.list(**list_kwargs):
+        for start in range(0, len(id_batch), batch_size):
+            batch = id_batch[start:start + batch_size]
+            fetched = index.fetch(ids=batch, namespace=namespace)
+            for vector_id, vector in fetched.vectors.items():
+                metadata = dict(vector.metadata or {})
+                texts.append(str(metadata.pop(text_key, "")))
+                vectors.append(list(vector.values))
+                metadatas.append(metadata)
+                ids.append(vector_id)
+
+    if not ids:
+        raise ValueError("Pinecone index is empty; nothing to export")
+
+    return build_faiss_index_from_vectors(texts, vectors, metadatas, ids, embeddings, index_dir, source="pinecone",
+                                          dimensions=dimensions, quantization=quantization)
+
+
+def compact_faiss_index(store: FAISS, embeddings: Embeddings, index_dir: str,
+                        dimensions: Optional[int] = None, quantization: str = "none") -> FAISS:
+    """Write a truncated and/or quantized copy of a full-precision local index
+
+    The vectors are read back from the index, so no embedding calls are made.
+    """
+    count = store.index.ntotal
+    vectors = store.index.reconstruct_n(0, count)
+    ids = [store.index_to_docstore_id[i] for i in range(count)]
+    docs = [store.docstore.search(doc_id) for doc_id in ids]
+    return build_faiss_index_from_vectors([doc.page_content for doc in docs], vectors, [doc.metadata for doc in docs],
+                                          ids, embeddings, index_dir, source="faiss",
+                                          dimensions=dimensions, quantization=quantization)
+
+
+def snapshot_store(store, embeddings: Embeddings, index_dir: str) -> FAISS:
+    """Write a local FAISS copy of a Pinecone, FAISS or in-memory vector store
+
+    Stored vectors are reused, so no embedding calls are made. Wrappers
+    (network.ResilientVectorStore, ...) are looked through.
+    """
+    while getattr(store, "wrapped", None) is not None:
+        store = store.wrapped
+    pinecone_index = getattr(store, "_index", None)
+    if pinecone_index is not None and hasattr(pinecone_index, "fetch"):
+        return export_pinecone_index(pinecone_index, embeddings, index_dir,
+                                     text_key=getattr(store, "_text_key", "text"))
+    if isinstance(store, CompactFAISS):
+        copy = _compact_store(embeddings, faiss.clone_index(store.index), store.docstore, store.index_to_docstore_id,
+                              store.full_vectors, store.quantization)
+        save_faiss_index(copy, index_dir, source="faiss")
+        return copy
+    if isinstance(store, FAISS):
+        copy = _new_store(embeddings, faiss.clone_index(store.index), store.docstore, store.index_to_docstore_id)
+        save_faiss_index(copy, index_dir, source="faiss")
+        return copy
+    records = getattr(store, "store", None)
+    if isinstance(records, dict) and records:
+        values = list(records.values())
+        return build_faiss_index_from_vectors(
+            [record["text"] for record in values],
+            [record["vector"] for record in values],
+            [record.get("metadata") or {} for record in values],
+            [record["id"] for record in values],
+            embeddings, index_dir, source="memory",
+        )
+    raise ValueError(f"Cannot snapshot a {type(store).__name__}")
+
+
+if __name__ == "__main__":
+    from dotenv import load_dotenv
+    from langchain_openai import OpenAIEmbeddings
+    from pinecone import Pinecone
+
+    load_dotenv()
+
+    parser = argparse.ArgumentParser(description="Snapshot Pinecone indexes into local FAISS indexes")
+    parser.add_argument("--index", action="append", required=True, help="Pinecone index name (repeatable)")
+    parser.add_argument("--from-local", action="store_true",
+                        help="compact the local index in $FAISS_INDEX_DIR instead of exporting from Pinecone")
+    parser.add_argument("--output-dir", default=None, help=f"Base directory (default: $FAISS_INDEX_DIR or {DEFAULT_INDEX_DIR})")
+    parser.add_argument("--dimensions", type=int, default=None, help="keep the first N dimensions of each vector")
+    parser.add_argument("--quantization", choices=QUANTIZATIONS, default="none",
+                        help="store int8 or product-quantized vectors, re-scored with the float32 ones")
+    args = parser.parse_args()
+
+    if args.from_local and (not args.output_dir or get_index_dir("", args.output_dir) == get_index_dir("")):
+        parser.error("--from-local needs an --output-dir other than the source directory")
+    query_embeddings = OpenAIEmbeddings(model="text-embedding-3-large")
+    for name in args.index:
+        target = get_index_dir(name, args.output_dir)
+        if args.from_local:
+            store = compact_faiss_index(load_faiss_index(get_index_dir(name), query_embeddings), query_embeddings,
+                                        target, dimensions=args.dimensions, quantization=args.quantization)
+        else:
+            store = export_pinecone_index(Pinecone(api_key=os.getenv("PINECONE_API_KEY")).Index(name),
+                                          query_embeddings, target,
+                                          dimensions=args.dimensions, quantization=args.quantization)
+        print(f"✅ Exported {store.index.ntotal} vectors ({store.index.d} dimensions, "
+              f"{args.quantization} quantization) from {name} to {target}")
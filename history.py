@@ -0,0 +1,154 @@
+"""
+Token-budgeted conversation history with rolling summarization
+
+Long sales conversations should not make every turn slower. HistoryManager
+keeps the last few turns verbatim, folds older turns into a running summary
+(updated incrementally by the LLM, a batch of turns at a time), and trims
+whatever is sent to the model to a per-request token budget counted with
+tiktoken.
+
+A "turn" is a human message plus everything up to the next human message.
+"""
+
+import os
+from functools import lru_cache
+from typing import List, Optional, Sequence, Tuple
+
+import tiktoken
+from langchain_core.messages import BaseMessage, HumanMessage, RemoveMessage, SystemMessage
+
+# Rough per-message overhead of the chat format (role, separators)
+MESSAGE_OVERHEAD_TOKENS = 4
+
+SUMMARY_PROMPT = """You maintain a running summary of a sales conversation between a CapAmerica headwear assistant and a customer.
+
+Current summary:
+{summary}
+
+New conversation turns to fold in:
+{turns}
+
+Write the updated summary in under 150 words. Keep concrete facts the assistant needs later: product IDs discussed, quantities, colors, decoration choices, quoted prices, budget and open questions. Drop pleasantries."""
+
+
+# Fallback when no tiktoken encoding can be loaded (e.g. offline without a cached BPE file)
+CHARS_PER_TOKEN = 4
+
+
+@lru_cache(maxsize=8)
+def _encoding(model_name: str):
+    try:
+        try:
+            return tiktoken.encoding_for_model(model_name)
+        except KeyError:
+            return tiktoken.get_encoding("o200k_base")
+    except Exception as e:
+        print(f"⚠️ tiktoken encoding unavailable ({e}); estimating tokens from characters")
+        return None
+
+
+def count_tokens(text: str, model_name: str = "gpt-4o-mini") -> int:
+    encoding = _encoding(model_name)
+    if encoding is None:
+        return len(text) // CHARS_PER_TOKEN + 1
+    return len(encoding.encode(text))
+
+
+def count_message_tokens(messages: Sequence[BaseMessage], model_name: str = "gpt-4o-mini") -> int:
+    return sum(count_tokens(str(m.content), model_name) + MESSAGE_OVERHEAD_TOKENS for m in messages)
+
+
+def split_turns(messages: Sequence[BaseMessage]) -> List[List[BaseMessage]]:
+    """Group messages into turns, each starting at a human message"""
+    turns: List[List[BaseMessage]] = []
+    for message in messages:
+        if message.type == "human" or not turns:
+            turns.append([])
+        turns[-1].append(message)
+    return turns
+
+
+def is_conversation_message(message: BaseMessage) -> bool:
+    """Human messages and final AI answers (no tool calls); tool traffic is excluded"""
+    if message.type == "human":
+        return True
+    return message.type == "ai" and not getattr(message, "tool_calls", None)
+
+
+class HistoryManager:
+    """Select and compact conversation history under a token budget"""
+
+    def __init__(self, keep_turns: int = 6, token_budget: int = 3000, fold_batch: int = 4,
+                 model_name: str = "gpt-4o-mini"):
+        # The current turn must never be folded away
+        self.keep_turns = max(1, keep_turns)
+        self.token_budget = token_budget
+        self.fold_batch = fold_batch
+        self.model_name = model_name
+
+    @classmethod
+    def from_env(cls, model_name: str = "gpt-4o-mini") -> "HistoryManager":
+        return cls(
+            keep_turns=int(os.getenv("HISTORY_KEEP_TURNS", "6")),
+            token_budget=int(os.getenv("HISTORY_TOKEN_BUDGET", "3000")),
+            fold_batch=int(os.getenv("HISTORY_FOLD_BATCH", "4")),
+            model_name=model_name,
+        )
+
+    def summary_message(self, summary: str) -> Optional[SystemMessage]:
+        if not summary:
+            return None
+        return SystemMessage(f"**CONVERSATION SUMMARY (earlier turns):**\n{summary}")
+
+    def select(self, messages: Sequence[BaseMessage], summary: str = "") -> List[BaseMessage]:
+        """Summary plus the most recent conversation turns that fit the token budget
+
+        The newest turn is always kept; older turns are dropped whole, oldest
+        first, until the selection fits.
+        """
+        turns = [
+            [m for m in turn if is_conversation_message(m)]
+            for turn in split_turns(messages)
+        ]
+        turns = [turn for turn in turns if turn][-self.keep_turns - self.fold_batch:]
+
+        summary_message = self.summary_message(summary)
+        used = count_message_tokens([summary_message], self.model_name) if summary_message else 0
+        selected: List[List[BaseMessage]] = []
+        for turn in reversed(turns):
+            cost = count_message_tokens(turn, self.model_name)
+            if selected and used + cost > self.token_budget:
+                break
+            selected.append(turn)
+            used += cost
+
+        history = [m for turn in reversed(selected) for m in turn]
+        return ([summary_message] if summary_message else []) + history
+
+    def turns_to_fold(self, messages: Sequence[BaseMessage]) -> List[List[BaseMessage]]:
+        """Oldest turns to fold into the summary, once a full batch has accumulated"""
+        turns = split_turns(messages)
+        if len(turns) < self.keep_turns + self.fold_batch:
+            return []
+        return turns[:len(turns) - self.keep_turns]
+
+    def summary_prompt(self, summary: str, turns: Sequence[Sequence[BaseMessage]]) -> List[BaseMessage]:
+        lines = []
+        for turn in turns:
+            for message in turn:
+                if is_conversation_message(message) and message.content:
+                    role = "Customer" if message.type == "human" else "Assistant"
+                    lines.append(f"{role}: {message.content}")
+        return [HumanMessage(SUMMARY_PROMPT.format(summary=summary or "(none)", turns="\n".join(lines)))]
+
+    def fold_update(self, new_summary: str, turns: Sequence[Sequence[BaseMessage]]) -> dict:
+        """State update that stores the new summary and removes the folded messages"""
+        removals = [RemoveMessage(id=m.id) for turn in turns for m in turn if m.id]
+        return {"summary": new_summary, "messages": removals}
+
+    def split_current_turn(self, messages: Sequence[BaseMessage]) -> Tuple[List[BaseMessage], List[BaseMessage]]:
+        """(messages before the latest human message, the latest turn)"""
+        for i in range(len(messages) - 1, -1, -1):
+            if messages[i].type == "human":
+                return list(messages[:i]), list(messages[i:])
+        return [], list(messages)
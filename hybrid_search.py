@@ -0,0 +1,139 @@
+"""
+Hybrid lexical + vector retrieval
+
+Dense search is weak on exact tokens such as product IDs ("i7041") and color
+names. HybridRetriever keeps a local BM25 inverted index over the same
+documents as a vector store and fuses both rankings with reciprocal-rank
+fusion. Queries that name a product ID present in the index take a fast path
+that returns the matching documents without embedding the query at all.
+"""
+
+import math
+import re
+from collections import Counter, defaultdict
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from langchain_core.documents import Document
+
+from metrics import VECTOR_QUERY_SECONDS, store_label, timed
+from retrieval import RRF_K, content_hash
+
+TOKEN_PATTERN = re.compile(r"[a-z0-9]+(?:\.[0-9]+)?")
+PRODUCT_ID_PATTERN = re.compile(r"\b[a-z]\d{4}\b")
+
+
+def tokenize(text: str) -> List[str]:
+    return TOKEN_PATTERN.findall(text.casefold())
+
+
+def document_key(doc: Document) -> str:
+    """Stable identity used to fuse the same document across rankings"""
+    return doc.id or content_hash(doc.page_content)
+
+
+def reciprocal_rank_fusion(rankings: Sequence[Sequence[Document]], k: int = RRF_K) -> List[Tuple[Document, float]]:
+    """Fuse several best-first rankings into one, scoring sum(1 / (k + rank))"""
+    scores: Dict[str, float] = defaultdict(float)
+    docs: Dict[str, Document] = {}
+    for ranking in rankings:
+        for rank, doc in enumerate(ranking, start=1):
+            key = document_key(doc)
+            scores[key] += 1.0 / (k + rank)
+            docs.setdefault(key, doc)
+    return sorted(((docs[key], score) for key, score in scores.items()), key=lambda pair: pair[1], reverse=True)
+
+
+class BM25Index:
+    """Okapi BM25 over a fixed document set, backed by an inverted index"""
+
+    def __init__(self, documents: Sequence[Document], k1: float = 1.5, b: float = 0.75):
+        self.documents = list(documents)
+        self.k1 = k1
+        self.b = b
+        self.postings: Dict[str, List[Tuple[int, int]]] = defaultdict(list)
+        self.doc_lengths: List[int] = []
+        for i, doc in enumerate(self.documents):
+            # Index metadata such as product_id and category alongside the text
+            metadata_text = " ".join(str(v) for v in doc.metadata.values() if isinstance(v, str))
+            terms = Counter(tokenize(doc.page_content + " " + metadata_text))
+            self.doc_lengths.append(sum(terms.values()))
+            for term, tf in terms.items():
+                self.postings[term].append((i, tf))
+        self.avg_length = (sum(self.doc_lengths) / len(self.doc_lengths)) if self.doc_lengths else 0.0
+        n = len(self.documents)
+        self.idf = {
+            term: math.log(1 + (n - len(postings) + 0.5) / (len(postings) + 0.5))
+            for term, postings in self.postings.items()
+        }
+
+    def search(self, query: str, k: int = 10) -> List[Tuple[Document, float]]:
+        scores: Dict[int, float] = defaultdict(float)
+        for term in set(tokenize(query)):
+            idf = self.idf.get(term)
+            if idf is None:
+                continue
+            for i, tf in self.postings[term]:
+                norm = self.k1 * (1 - self.b + self.b * self.doc_lengths[i] / self.avg_length)
+                scores[i] += idf * tf * (self.k1 + 1) / (tf + norm)
+        best = sorted(scores.items(), key=lambda pair: pair[1], reverse=True)[:k]
+        return [(self.documents[i], score) for i, score in best]
+
+
+class HybridRetriever:
+    """BM25 + vector retrieval with RRF fusion and an exact product-ID fast path"""
+
+    def __init__(self, vector_store, documents: Sequence[Document], fetch_k: int = 10):
+        self.vector_store = vector_store
+        self.fetch_k = fetch_k
+        self.lexical_index = BM25Index(documents)
+        self.by_product_id: Dict[str, List[Document]] = defaultdict(list)
+        for doc in self.lexical_index.documents:
+            product_id = doc.metadata.get("product_id")
+            if product_id:
+                self.by_product_id[str(product_id).casefold()].append(doc)
+
+    def exact_matches(self, query: str) -> List[Document]:
+        """Documents whose product ID appears verbatim in the query"""
+        matches = []
+        for product_id in PRODUCT_ID_PATTERN.findall(query.casefold()):
+            matches.extend(self.by_product_id.get(product_id, []))
+        return matches
+
+    def fuse(self, query: str, vector_pairs: Sequence[Tuple[Document, float]], k: int) -> List[Tuple[Document, float]]:
+        """Fuse precomputed vector results with the lexical ranking for the query"""
+        lexical = [doc for doc, _ in self.lexical_index.search(query, self.fetch_k)]
+        return reciprocal_rank_fusion([[doc for doc, _ in vector_pairs], lexical])[:k]
+
+    def search(self, query: str, k: int = 3) -> List[Document]:
+        exact = self.exact_matches(query)
+        if exact:
+            return exact[:k]
+        # Includes the query embedding, which is also timed on its own
+        with timed(VECTOR_QUERY_SECONDS, "vector_query", store=store_label(self.vector_store)):
+            vector_pairs = self.vector_store.similarity_search_with_score(query, k=self.fetch_k)
+        return [doc for doc, _ in self.fuse(query, vector_pairs, k)]
+
+    async def asearch(self, query: str, k: int = 3) -> List[Document]:
+        exact = self.exact_matches(query)
+        if exact:
+            return exact[:k]
+        with timed(VECTOR_QUERY_SECONDS, "vector_query", store=store_label(self.vector_store)):
+            vector_pairs = await self.vector_store.asimilarity_search_with_score(query, k=self.fetch_k)
+        return [doc for doc, _ in self.fuse(query, vector_pairs, k)]
+
+
+def documents_from_store(store) -> Optional[List[Document]]:
+    """All documents held by a local vector store (FAISS or in-memory), else None"""
+    docstore = getattr(store, "docstore", None)
+    if docstore is not None and hasattr(docstore, "_dict"):
+        return [
+            Document(id=doc_id, page_content=doc.page_content, metadata=doc.metadata)
+            for doc_id, doc in docstore._dict.items()
+        ]
+    records = getattr(store, "store", None)
+    if isinstance(records, dict):
+        return [
+            Document(id=doc_id, page_content=record["text"], metadata=record.get("metadata", {}))
+            for doc_id, record in records.items()
+        ]
+    return None
@@ -0,0 +1,479 @@
+"""
+Incremental ingestion of the catalog and website data into the vector indexes
+
+Loads the JSON product catalogs and TXT pricing files (product index,
+cap-rag-index) and the website CSV export (website index, cap-website-data),
+chunks them and hashes every chunk. A manifest per index records the hash
+of each chunk that was embedded and upserted, so a run only embeds and
+upserts chunks that are new or changed, and deletes the ones that no longer
+exist. A re-run with unchanged data makes no embedding calls at all.
+
+The manifest only knows what ingest.py wrote. A run without one (the first
+run against indexes filled by an older upload, or --full) reconciles: it
+lists the ids in the index and deletes every vector that is not in the
+plan, so no document ends up indexed twice under an old and a new id.
+--reconcile does the same with a manifest, for vectors written by hand.
+
+Embedding runs in large batches, several at a time; each batch is upserted
+as soon as it is embedded and recorded in the manifest, so an interrupted
+run resumes where it stopped. Chunk hashes include the embedding model, so
+switching models re-embeds everything.
+
+    python ingest.py --data-dir data --website-csv data/website.csv
+    python ingest.py --data-dir data --dry-run        # show the delta only
+    python ingest.py --data-dir data --reconcile      # also prune ids the manifest does not know
+    python ingest.py --backend faiss --data-dir data  # local FAISS indexes
+"""
+
+import argparse
+import csv
+import glob
+import hashlib
+import json
+import os
+import threading
+import time
+from concurrent.futures import FIRST_EXCEPTION, ThreadPoolExecutor, wait
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+
+from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
+from langchain_text_splitters import RecursiveCharacterTextSplitter
+
+from catalog import _parse_product
+
+MANIFEST_VERSION = 1
+DEFAULT_MANIFEST_DIR = "ingest_manifests"
+
+# Pinecone metadata values must be strings, numbers, booleans or lists of strings
+_METADATA_TYPES = (str, int, float, bool)
+
+# (category, all keywords that must appear) checked in order
+TXT_CATEGORIES = [
+    ("pricing_patches", ("patch", "$")),
+    ("pricing_patches", ("embroidery", "$")),
+    ("pricing_patches", ("decoration", "$")),
+    ("pricing_base", ("base", "stitches")),
+    ("pricing_base", ("base", "pricing")),
+    ("product_catalog_info", ("catalog",)),
+    ("product_catalog_info", ("browse",)),
+    ("marketing_samples", ("sample",)),
+    ("pricing_general", ("price",)),
+    ("pricing_general", ("$",)),
+]
+
+
+def get_manifest_path(index_name: str, manifest_dir: Optional[str] = None) -> str:
+    return os.path.join(manifest_dir or os.getenv("INGEST_MANIFEST_DIR", DEFAULT_MANIFEST_DIR), f"{index_name}.json")
+
+
+# Loading and chunking
+
+def _splitter(chunk_size: int = 1000, chunk_overlap: int = 200) -> RecursiveCharacterTextSplitter:
+    return RecursiveCharacterTextSplitter(chunk_size=chunk_size, chunk_overlap=chunk_overlap)
+
+
+def product_document(item: Dict[str, Any], source: str) -> Optional[Document]:
+    """One document per catalog product, in the layout the product index uses"""
+    product = _parse_product(item, source)
+    if product is None:
+        return None
+    lines = [f"Product ID: {product.product_id}", f"Title: {product.title}"]
+    if product.features:
+        lines += ["", "Features:"] + [f"- {feature}" for feature in product.features]
+    if product.sizing:
+        lines += ["", f"Sizing: {product.sizing}"]
+    if product.pricing:
+        lines += ["", "Pricing:"]
+        for embroidery, tiers in product.pricing.items():
+            lines.append(f"{embroidery}:")
+            lines += [f"  {tier} units: ${price}" for tier, price in tiers]
+    if product.colors:
+        colors = [color if in_stock else f"{color} (Out of Stock)" for color, in_stock in product.colors.items()]
+        lines += ["", "Available Colors:", ", ".join(colors)]
+    prices = [price for tiers in product.pricing.values() for _, price in tiers]
+    metadata = {
+        "source": source,
+        "file_type": "json",
+        "product_id": product.product_id,
+        "title": product.title,
+        "category": "headwear_product",
+        "has_stock_issues": not all(product.colors.values()),
+    }
+    if prices:
+        metadata["base_price"] = min(prices)
+    return Document(id=f"product:{product.product_id}", page_content="\n".join(lines), metadata=metadata)
+
+
+def load_catalog_documents(data_dir: str) -> List[Document]:
+    """Products from every *.json catalog in data_dir; later files win on duplicate IDs"""
+    by_product: Dict[str, Document] = {}
+    for path in sorted(glob.glob(os.path.join(data_dir, "*.json"))):
+        with open(path, encoding="utf-8") as f:
+            items = json.load(f)
+        if isinstance(items, dict):
+            items = items.get("products", [])
+        for item in items:
+            doc = product_document(item, os.path.basename(path))
+            if doc is not None:
+                by_product[doc.metadata["product_id"].casefold()] = doc
+    return list(by_product.values())
+
+
+def categorize_txt(content: str) -> str:
+    text = content.casefold()
+    for category, keywords in TXT_CATEGORIES:
+        if all(keyword in text for keyword in keywords):
+            return category
+    return "general_info"
+
+
+def load_txt_documents(data_dir: str, chunk_size: int = 1000, chunk_overlap: int = 200) -> List[Document]:
+    """Chunks of every *.txt pricing/info file in data_dir"""
+    splitter = _splitter(chunk_size, chunk_overlap)
+    docs = []
+    for path in sorted(glob.glob(os.path.join(data_dir, "*.txt"))):
+        with open(path, encoding="utf-8") as f:
+            content = f.read()
+        if not content.strip():
+            continue
+        source = os.path.basename(path)
+        metadata = {"source": source, "file_type": "txt", "category": categorize_txt(content)}
+        for i, chunk in enumerate(splitter.split_text(content)):
+            docs.append(Document(id=f"{source}:{i}", page_content=chunk, metadata=dict(metadata, chunk=i)))
+    return docs
+
+
+def load_website_documents(csv_path: str, chunk_size: int = 1000, chunk_overlap: int = 200) -> List[Document]:
+    """Chunks of the website CSV export
+
+    The text comes from the first of the content/text/page_content/body
+    columns; url/title/category columns become metadata. Rows are keyed by
+    url when present, else by row number.
+    """
+    splitter = _splitter(chunk_size, chunk_overlap)
+    source = os.path.basename(csv_path)
+    docs = []
+    with open(csv_path, encoding="utf-8", newline="") as f:
+        for row_number, row in enumerate(csv.DictReader(f)):
+            row = {(key or "").strip().casefold(): (value or "").strip() for key, value in row.items()}
+            text_column = next((c for c in ("content", "text", "page_content", "body") if row.get(c)), None)
+            if text_column:
+                text = row[text_column]
+            else:
+                text = "\n".join(f"{key}: {value}" for key, value in row.items() if value)
+            if not text:
+                continue
+            key = row.get("url") or str(row_number)
+            metadata = {"source": source, "file_type": "csv", "category": row.get("category") or "website"}
+            metadata.update({column: row[column] for column in ("url", "title") if row.get(column)})
+            for i, chunk in enumerate(splitter.split_text(text)):
+                docs.append(Document(id=f"{source}:{key}:{i}", page_content=chunk, metadata=dict(metadata, chunk=i)))
+    return docs
+
+
+# Hashing and the manifest
+
+def clean_metadata(metadata: Dict[str, Any]) -> Dict[str, Any]:
+    """Metadata restricted to the value types vector indexes accept"""
+    cleaned = {}
+    for key, value in metadata.items():
+        if isinstance(value, _METADATA_TYPES):
+            cleaned[key] = value
+        elif isinstance(value, (list, tuple)):
+            cleaned[key] = [str(v) for v in value]
+    return cleaned
+
+
+def document_hash(doc: Document, embedding_model: str) -> str:
+    payload = json.dumps([embedding_model, doc.page_content, clean_metadata(doc.metadata)], sort_keys=True)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def load_manifest(path: str) -> Dict[str, Any]:
+    try:
+        with open(path) as f:
+            manifest = json.load(f)
+    except (OSError, ValueError):
+        return {"version": MANIFEST_VERSION, "documents": {}}
+    if manifest.get("version") != MANIFEST_VERSION:
+        return {"version": MANIFEST_VERSION, "documents": {}}
+    return manifest
+
+
+def save_manifest(path: str, manifest: Dict[str, Any]) -> None:
+    """Write the manifest atomically"""
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    tmp = f"{path}.tmp-{os.getpid()}"
+    with open(tmp, "w") as f:
+        json.dump(manifest, f, indent=1, sort_keys=True)
+    os.replace(tmp, path)
+
+
+def plan_changes(documents: Sequence[Document], manifest: Dict[str, Any], embedding_model: str,
+                 indexed_ids: Iterable[str] = ()) -> Tuple[List[Tuple[Document, str]], List[str], int]:
+    """(documents to embed and upsert with their hashes, ids to delete, unchanged count)
+
+    indexed_ids are the ids found in the index; those not in the plan are deleted too.
+    """
+    known = manifest.get("documents", {})
+    changed, seen = [], set()
+    for doc in documents:
+        if doc.id in seen:
+            continue
+        seen.add(doc.id)
+        digest = document_hash(doc, embedding_model)
+        if known.get(doc.id) != digest:
+            changed.append((doc, digest))
+    removed = sorted((set(known) | set(indexed_ids)) - seen)
+    return changed, removed, len(seen) - len(changed)
+
+
+# Index writers
+
+class PineconeSink:
+    """Upserts to and deletes from a Pinecone index, text stored under text_key like PineconeVectorStore"""
+
+    def __init__(self, index, text_key: str = "text", namespace: Optional[str] = None, upsert_batch_size: int = 100):
+        self.index = index
+        self.text_key = text_key
+        self.namespace = namespace
+        # Pinecone requests are limited to 2 MB; 100 vectors of 3072 dimensions fit
+        self.upsert_batch_size = upsert_batch_size
+
+    # Upserts are durable once the call returns, so the manifest can record them per batch
+    writes_through = True
+
+    def list_ids(self) -> List[str]:
+        """Every vector id in the namespace"""
+        try:
+            return [vector_id for page in self.index.list(namespace=self.namespace) for vector_id in page]
+        except Exception as e:
+            # Pod-based indexes cannot list their ids
+            raise RuntimeError(f"Cannot list the index to reconcile it ({e}); delete all its vectors "
+                               "and run again with --no-reconcile") from e
+
+    def upsert(self, docs: Sequence[Document], vectors: Sequence[List[float]]) -> None:
+        records = [
+            {"id": doc.id, "values": list(vector), "metadata": dict(clean_metadata(doc.metadata), **{self.text_key: doc.page_content})}
+            for doc, vector in zip(docs, vectors)
+        ]
+        for start in range(0, len(records), self.upsert_batch_size):
+            self.index.upsert(vectors=records[start:start + self.upsert_batch_size], namespace=self.namespace)
+
+    def delete(self, ids: Sequence[str]) -> None:
+        for start in range(0, len(ids), 1000):
+            self.index.delete(ids=list(ids[start:start + 1000]), namespace=self.namespace)
+
+    def close(self) -> None:
+        pass
+
+
+class FaissSink:
+    """Updates a local FAISS index in place and saves it when the run finishes"""
+
+    # Nothing is on disk before close()
+    writes_through = False
+
+    def __init__(self, index_dir: str, embeddings: Embeddings):
+        from faiss_store import CompactFAISS, load_faiss_index
+        self.index_dir = index_dir
+        self.embeddings = embeddings
+        self._lock = threading.Lock()
+        try:
+            # Loaded into memory (not memory-mapped) so it can be modified
+            self.store = load_faiss_index(index_dir, embeddings, mmap=False)
+        except FileNotFoundError:
+            self.store = None
+        if isinstance(self.store, CompactFAISS):
+            raise ValueError(f"{index_dir} is a compact index; update the full index and compact it again with faiss_store.py --from-local")
+
+    def upsert(self, docs: Sequence[Document], vectors: Sequence[List[float]]) -> None:
+        from faiss_store import _new_store
+        import faiss
+        with self._lock:
+            if self.store is None:
+                from langchain_community.docstore.in_memory import InMemoryDocstore
+                self.store = _new_store(self.embeddings, faiss.IndexFlatIP(len(vectors[0])), InMemoryDocstore(), {})
+            self._delete([doc.id for doc in docs])
+            self.store.add_embeddings(
+                list(zip([doc.page_content for doc in docs], vectors)),
+                metadatas=[clean_metadata(doc.metadata) for doc in docs],
+                ids=[doc.id for doc in docs],
+            )
+
+    def list_ids(self) -> List[str]:
+        with self._lock:
+            return [] if self.store is None else list(self.store.index_to_docstore_id.values())
+
+    def _delete(self, ids: Sequence[str]) -> None:
+        existing = [doc_id for doc_id in ids if doc_id in self.store.docstore._dict]
+        if existing:
+            self.store.delete(existing)
+
+    def delete(self, ids: Sequence[str]) -> None:
+        with self._lock:
+            if self.store is not None:
+                self._delete(ids)
+
+    def close(self) -> None:
+        from faiss_store import save_faiss_index
+        if self.store is not None:
+            save_faiss_index(self.store, self.index_dir, source="ingest")
+
+
+# The pipeline
+
+def _batches(items: Sequence[Any], size: int) -> Iterable[Sequence[Any]]:
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+
+def ingest(documents: Sequence[Document], sink, embeddings: Embeddings, manifest_path: str,
+           embedding_model: str, batch_size: int = 256, concurrency: int = 4,
+           dry_run: bool = False, reconcile: Optional[bool] = None, full: bool = False) -> Dict[str, Any]:
+    """Embed and upsert new or changed documents, delete removed ones, update the manifest
+
+    reconcile lists the index and deletes ids that are not in the plan; by
+    default it runs when the manifest is empty. full plans against an empty
+    manifest (everything is re-embedded, ids the old manifest recorded are
+    still deleted) and replaces the manifest as batches finish; a dry run
+    leaves the file alone. The first failed batch cancels the batches not
+    yet started. Returns counts: documents,
+    unchanged, upserted, deleted, reconciled (stale ids found by listing),
+    embedding_calls, embedding_calls_saved (calls a full re-embed would
+    have made), seconds and docs_per_second.
+    """
+    started = time.perf_counter()
+    manifest = load_manifest(manifest_path)
+    recorded = set()
+    if full:
+        recorded = set(manifest.get("documents", {}))
+        manifest = {"version": MANIFEST_VERSION, "documents": {}}
+    if reconcile is None:
+        reconcile = not manifest.get("documents")
+    indexed_ids = set(sink.list_ids()) if reconcile else set()
+    changed, removed, unchanged = plan_changes(documents, manifest, embedding_model, indexed_ids | recorded)
+    batches = list(_batches(changed, batch_size))
+    full_calls = -(-len({doc.id for doc in documents}) // batch_size)
+    report = {
+        "documents": len(documents),
+        "unchanged": unchanged,
+        "upserted": 0,
+        "deleted": 0,
+        "embedding_calls": 0,
+        "embedding_calls_saved": full_calls - len(batches),
+        "reconciled": len(indexed_ids - {doc.id for doc in documents} - set(manifest.get("documents", {}))),
+    }
+    if dry_run:
+        report.update(upserted=len(changed), deleted=len(removed), seconds=time.perf_counter() - started,
+                      docs_per_second=0.0, dry_run=True)
+        return report
+
+    manifest.setdefault("documents", {})
+    manifest["embedding_model"] = embedding_model
+    lock = threading.Lock()
+
+    def save() -> None:
+        manifest["updated_at"] = time.time()
+        save_manifest(manifest_path, manifest)
+
+    def run_batch(batch: Sequence[Tuple[Document, str]]) -> None:
+        docs = [doc for doc, _ in batch]
+        vectors = embeddings.embed_documents([doc.page_content for doc in docs])
+        sink.upsert(docs, vectors)
+        with lock:
+            report["embedding_calls"] += 1
+            report["upserted"] += len(docs)
+            manifest["documents"].update({doc.id: digest for doc, digest in batch})
+            # A killed run keeps every batch the index already holds
+            if sink.writes_through:
+                save()
+
+    try:
+        with ThreadPoolExecutor(max_workers=max(1, concurrency), thread_name_prefix="ingest") as executor:
+            futures = [executor.submit(run_batch, batch) for batch in batches]
+            done, pending = wait(futures, return_when=FIRST_EXCEPTION)
+            # After a failure the rest is left for the next run
+            for future in pending:
+                future.cancel()
+            for future in done:
+                future.result()
+        if removed:
+            sink.delete(removed)
+            for doc_id in removed:
+                manifest["documents"].pop(doc_id, None)
+            report["deleted"] = len(removed)
+    finally:
+        # Record whatever completed, so the next run only does the rest
+        sink.close()
+        with lock:
+            save()
+
+    seconds = time.perf_counter() - started
+    report["seconds"] = seconds
+    report["docs_per_second"] = len(documents) / seconds if seconds else 0.0
+    return report
+
+
+def print_report(index_name: str, report: Dict[str, Any]) -> None:
+    prefix = "🔎 Would update" if report.get("dry_run") else "✅ Updated"
+    print(f"{prefix} {index_name}: {report['documents']} documents, {report['unchanged']} unchanged, "
+          f"{report['upserted']} upserted, {report['deleted']} deleted ({report['reconciled']} found by listing), "
+          f"{report['embedding_calls']} embedding calls ({report['embedding_calls_saved']} saved), "
+          f"{report.get('docs_per_second', 0.0):.0f} docs/s")
+
+
+if __name__ == "__main__":
+    from dotenv import load_dotenv
+    from langchain_openai import OpenAIEmbeddings
+
+    from network import openai_client_kwargs, pinecone_index_kwargs
+
+    load_dotenv()
+
+    parser = argparse.ArgumentParser(description="Incrementally ingest the catalog and website data")
+    parser.add_argument("--data-dir", default=os.getenv("CATALOG_DATA_DIR", "data"),
+                        help="directory with the *.json catalogs and *.txt pricing files")
+    parser.add_argument("--website-csv", help="website CSV export (default: skip the website index)")
+    parser.add_argument("--catalog-index", default="cap-rag-index")
+    parser.add_argument("--website-index", default="cap-website-data")
+    parser.add_argument("--backend", choices=["pinecone", "faiss"], default="pinecone")
+    parser.add_argument("--embedding-model", default="text-embedding-3-large")
+    parser.add_argument("--dimensions", type=int, default=int(os.getenv("EMBEDDING_DIMENSIONS", "0")) or None,
+                        help="embedding size; the index must have been created with it (default: full size)")
+    parser.add_argument("--batch-size", type=int, default=int(os.getenv("INGEST_BATCH_SIZE", "256")))
+    parser.add_argument("--concurrency", type=int, default=int(os.getenv("INGEST_CONCURRENCY", "4")))
+    parser.add_argument("--manifest-dir", default=None, help=f"default: $INGEST_MANIFEST_DIR or {DEFAULT_MANIFEST_DIR}")
+    parser.add_argument("--full", action="store_true",
+                        help="ignore the manifest, re-embed everything and prune ids not in the data")
+    parser.add_argument("--reconcile", action="store_true",
+                        help="list the index and delete ids not in the data (automatic without a manifest)")
+    parser.add_argument("--no-reconcile", action="store_true",
+                        help="never list the index, e.g. a cleared pod-based index that cannot list ids")
+    parser.add_argument("--dry-run", action="store_true", help="report the delta without embedding or writing")
+    args = parser.parse_args()
+
+    embeddings = OpenAIEmbeddings(model=args.embedding_model, dimensions=args.dimensions,
+                                  **openai_client_kwargs("EMBEDDING_TIMEOUT", 10.0))
+    # Vectors of another size are stale, so the size is part of every chunk hash
+    embedding_model = f"{args.embedding_model}@{args.dimensions}" if args.dimensions else args.embedding_model
+    jobs = [(args.catalog_index, load_catalog_documents(args.data_dir) + load_txt_documents(args.data_dir))]
+    if args.website_csv:
+        jobs.append((args.website_index, load_website_documents(args.website_csv)))
+
+    pc = None
+    for index_name, documents in jobs:
+        manifest_path = get_manifest_path(index_name, args.manifest_dir)
+        if args.backend == "pinecone":
+            from pinecone import Pinecone
+            pc = pc or Pinecone(api_key=os.getenv("PINECONE_API_KEY"))
+            sink = PineconeSink(pc.Index(index_name, **pinecone_index_kwargs()))
+        else:
+            from faiss_store import get_index_dir
+            sink = FaissSink(get_index_dir(index_name), embeddings)
+        report = ingest(documents, sink, embeddings, manifest_path, embedding_model,
+                        batch_size=args.batch_size, concurrency=args.concurrency, dry_run=args.dry_run,
+                        reconcile=False if args.no_reconcile else True if args.reconcile or args.full else None,
+                        full=args.full)
+        print_report(index_name, report)
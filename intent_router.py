@@ -0,0 +1,247 @@
+"""
+Local intent router that runs before the tool-selection LLM call
+
+Most counselor turns are either an obvious catalog/pricing question (which
+always ends in a retrieval tool call) or obvious small talk (which needs no
+retrieval). IntentRouter recognizes both locally so the graph can skip the
+process_query LLM round trip:
+
+- a keyword / product-ID matcher, always on
+- an optional nearest-centroid classifier over query embeddings (the
+  embeddings are cached, and the retrieval tool reuses the same vector), used
+  only when the keywords are inconclusive
+
+Anything else, including follow-ups that lean on earlier turns ("what about
+that one in navy?") and, when the calculate_price tool is available, quote
+requests (a price question with a quantity for a product ID, a product or the
+product under discussion), falls back to the LLM. Plain pricing questions
+("how much are trucker caps?") are answered from the catalog's price tables.
+"""
+
+import re
+import threading
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Sequence
+
+import numpy as np
+
+from hybrid_search import PRODUCT_ID_PATTERN, tokenize
+
+RETRIEVE = "retrieve"
+CHITCHAT = "chitchat"
+LLM = "llm"
+
+PRODUCT_TERMS = {
+    "cap", "caps", "hat", "hats", "headwear", "trucker", "truckers", "snapback", "snapbacks", "visor", "visors",
+    "beanie", "beanies", "knit", "mesh", "foam", "performance", "fitted", "adjustable", "brim", "bill", "crown",
+    "embroidery", "embroidered", "3d", "patch", "patches", "leather", "woven", "rubber", "applique", "stitch",
+    "stitches", "logo", "logos", "decoration", "color", "colors", "colour", "colours", "navy", "black", "white",
+    "gray", "grey", "red", "royal", "olive", "maroon", "khaki", "camo", "stock", "sizes", "sizing", "catalog",
+    "products", "product", "style", "styles",
+}
+PRICING_TERMS = {
+    "price", "prices", "pricing", "cost", "costs", "quote", "quotes", "much", "cheap", "cheapest", "budget",
+    "discount", "bulk", "minimum", "units", "per", "total", "tier", "tiers",
+}
+COMPANY_TERMS = {
+    "shipping", "ship", "delivery", "deliver", "turnaround", "lead", "return", "returns", "refund", "warranty",
+    "contact", "phone", "email", "address", "located", "location", "company", "history", "about", "artwork",
+    "proof", "proofs", "samples", "sample", "account", "payment", "policy", "policies", "rush",
+}
+CHITCHAT_TERMS = {
+    "hi", "hello", "hey", "hiya", "there", "good", "morning", "afternoon", "evening", "thanks", "thank", "you",
+    "thx", "ty", "so", "a", "lot", "ok", "okay", "great", "cool", "awesome", "perfect", "nice", "bye",
+    "goodbye", "see", "later", "have", "day", "cheers", "appreciate", "it", "that", "helps", "helpful",
+}
+# Words that make a message depend on earlier turns
+FOLLOW_UP_TERMS = {
+    "it", "that", "those", "these", "them", "this", "one", "ones", "same", "instead", "also", "too", "else",
+    "other", "another", "previous", "above", "earlier",
+}
+# Short messages without product terms are ambiguous (e.g. "48", "yes please")
+MIN_SELF_CONTAINED_TOKENS = 3
+QUANTITY_PATTERN = re.compile(r"\b\d{2,}\b")
+
+# Seed examples for the optional embedding classifier
+CLASSIFIER_EXAMPLES = {
+    "catalog": [
+        "Do you have trucker caps in navy?",
+        "Show me performance hats with moisture wicking",
+        "What colors does the foam trucker come in?",
+        "I need lightweight caps for a golf tournament",
+        "Which snap back styles are in stock?",
+    ],
+    "pricing": [
+        "How much for 144 embroidered caps?",
+        "What is the price per unit for 48 hats with a leather patch?",
+        "Give me a quote for 500 caps with 3D embroidery",
+        "What does side embroidery cost?",
+    ],
+    "company": [
+        "How long does shipping take?",
+        "Do you offer free samples?",
+        "What is your return policy?",
+        "Where is CapAmerica located?",
+        "How do I send my artwork?",
+    ],
+    CHITCHAT: [
+        "Hi there!",
+        "Thanks so much, that helps",
+        "Good morning",
+        "Great, have a nice day",
+        "Bye!",
+    ],
+}
+LABEL_TOOLS = {"catalog": "retrieve_product_catalog", "pricing": "retrieve_product_catalog", "company": "retrieve_csv_data"}
+
+
+@dataclass
+class Route:
+    intent: str                 # RETRIEVE, CHITCHAT or LLM
+    tool: Optional[str] = None  # retrieval tool for RETRIEVE
+    reason: str = ""
+
+
+class IntentRouter:
+    """Decide locally whether a turn needs retrieval, no retrieval, or the LLM"""
+
+    def __init__(self, tool_names: Sequence[str], embeddings=None, use_classifier: bool = False,
+                 min_similarity: float = 0.4, min_margin: float = 0.05):
+        self.tool_names = set(tool_names)
+        self.embeddings = embeddings if use_classifier else None
+        self.min_similarity = min_similarity
+        self.min_margin = min_margin
+        self._labels: List[str] = []
+        self._centroids: Optional[np.ndarray] = None
+        self._lock = threading.Lock()
+        self.counts: Dict[str, int] = {RETRIEVE: 0, CHITCHAT: 0, LLM: 0, "classifier": 0}
+
+    # Keyword / ID matcher
+
+    def _quotes_prices(self) -> bool:
+        return "calculate_price" in self.tool_names
+
+    def _is_quote_request(self, text: str, terms: set, has_history: bool) -> bool:
+        """A price question with a quantity, which calculate_price answers exactly"""
+        if not self._quotes_prices() or not terms & PRICING_TERMS or not QUANTITY_PATTERN.search(text):
+            return False
+        return bool(PRODUCT_ID_PATTERN.search(text.casefold()) or terms & PRODUCT_TERMS or has_history)
+
+    def _tool_for(self, terms: set) -> Optional[str]:
+        product = bool(terms & (PRODUCT_TERMS | PRICING_TERMS))
+        company = bool(terms & COMPANY_TERMS)
+        if product and company:
+            tool = "retrieve_all_sources"
+        elif company:
+            tool = "retrieve_csv_data"
+        else:
+            tool = "retrieve_product_catalog"
+        return tool if tool in self.tool_names else None
+
+    def match(self, text: str, has_history: bool) -> Optional[Route]:
+        """Keyword decision, or None when inconclusive"""
+        tokens = tokenize(text)
+        terms = set(tokens)
+        if not tokens:
+            return None
+        # The LLM fills in calculate_price's arguments; the classifier is skipped too
+        if self._is_quote_request(text, terms, has_history):
+            return Route(LLM, reason="quote")
+        if PRODUCT_ID_PATTERN.search(text.casefold()):
+            tool = "retrieve_product_catalog" if "retrieve_product_catalog" in self.tool_names else None
+            return Route(RETRIEVE, tool, "product id") if tool else None
+        if len(tokens) <= 8 and terms <= CHITCHAT_TERMS:
+            return Route(CHITCHAT, reason="small talk")
+        # References to earlier turns need the LLM to rewrite the query
+        if has_history and terms & FOLLOW_UP_TERMS:
+            return None
+        if len(tokens) < MIN_SELF_CONTAINED_TOKENS:
+            return None
+        if terms & (PRODUCT_TERMS | PRICING_TERMS | COMPANY_TERMS):
+            tool = self._tool_for(terms)
+            return Route(RETRIEVE, tool, "keywords") if tool else None
+        return None
+
+    # Embedding classifier
+
+    def _fit(self, vectors: Sequence[Sequence[float]]) -> None:
+        labels = [label for label, examples in CLASSIFIER_EXAMPLES.items() for _ in examples]
+        matrix = np.asarray(vectors, dtype=np.float32)
+        matrix /= np.linalg.norm(matrix, axis=1, keepdims=True) + 1e-12
+        self._labels = list(CLASSIFIER_EXAMPLES)
+        centroids = np.stack([matrix[[i for i, l in enumerate(labels) if l == label]].mean(axis=0) for label in self._labels])
+        self._centroids = centroids / (np.linalg.norm(centroids, axis=1, keepdims=True) + 1e-12)
+
+    def _seed_texts(self) -> List[str]:
+        return [example for examples in CLASSIFIER_EXAMPLES.values() for example in examples]
+
+    def _ensure_fitted(self) -> None:
+        with self._lock:
+            if self._centroids is None:
+                self._fit(self.embeddings.embed_documents(self._seed_texts()))
+
+    async def _aensure_fitted(self) -> None:
+        if self._centroids is None:
+            vectors = await self.embeddings.aembed_documents(self._seed_texts())
+            with self._lock:
+                if self._centroids is None:
+                    self._fit(vectors)
+
+    def _classify(self, vector: Sequence[float]) -> Optional[Route]:
+        query = np.asarray(vector, dtype=np.float32)
+        query /= np.linalg.norm(query) + 1e-12
+        similarities = self._centroids @ query
+        order = np.argsort(similarities)[::-1]
+        best, second = similarities[order[0]], similarities[order[1]]
+        if best < self.min_similarity or best - second < self.min_margin:
+            return None
+        label = self._labels[order[0]]
+        if label == CHITCHAT:
+            return Route(CHITCHAT, reason="classifier")
+        tool = LABEL_TOOLS[label]
+        return Route(RETRIEVE, tool, "classifier") if tool in self.tool_names else None
+
+    def _classifier_applies(self, text: str, has_history: bool) -> bool:
+        if self.embeddings is None:
+            return False
+        # Follow-ups still go to the LLM; the classifier only sees self-contained messages
+        return not (has_history and set(tokenize(text)) & FOLLOW_UP_TERMS)
+
+    # Entry points
+
+    def _record(self, route: Route) -> Route:
+        self.counts[route.intent] += 1
+        if route.reason == "classifier":
+            self.counts["classifier"] += 1
+        return route
+
+    def route(self, text: str, has_history: bool = False) -> Route:
+        route = self.match(text, has_history)
+        if route is None and self._classifier_applies(text, has_history):
+            try:
+                self._ensure_fitted()
+                route = self._classify(self.embeddings.embed_query(text))
+            except Exception as e:
+                print(f"⚠️ Intent classifier unavailable: {e}")
+        return self._record(route or Route(LLM, reason="unsure"))
+
+    async def aroute(self, text: str, has_history: bool = False) -> Route:
+        route = self.match(text, has_history)
+        if route is None and self._classifier_applies(text, has_history):
+            try:
+                await self._aensure_fitted()
+                route = self._classify(await self.embeddings.aembed_query(text))
+            except Exception as e:
+                print(f"⚠️ Intent classifier unavailable: {e}")
+        return self._record(route or Route(LLM, reason="unsure"))
+
+    def stats(self) -> Dict[str, float]:
+        total = sum(self.counts[intent] for intent in (RETRIEVE, CHITCHAT, LLM))
+        routed = self.counts[RETRIEVE] + self.counts[CHITCHAT]
+        return {
+            **self.counts,
+            "total": total,
+            # Each locally routed turn skips the tool-selection LLM call
+            "llm_calls_saved": routed,
+            "routed_rate": routed / total if total else 0.0,
+        }
@@ -0,0 +1,334 @@
+"""
+Low-overhead latency and usage metrics with Prometheus text exposition
+
+Counters and histograms live in process memory (a lock and a few list
+updates per observation) and are rendered in the Prometheus text format by
+GET /metrics. No client library is required.
+
+Besides the process-wide histograms, every observation made through
+``timed``/``record_stage`` is also added to the per-request collector opened
+by ``collect_timings``, which is how ChatResponse.timings is filled. The
+collector lives in a ContextVar, so graph nodes and tasks spawned for the
+request see it without any plumbing.
+
+MetricsCallbackHandler feeds graph node, LLM and tool timings plus token
+counts from LangChain callbacks; embedding and vector-query timings are
+recorded where those calls are made. One handler is created per request, so
+runs that never finish (a cancelled stream) go away with the request.
+"""
+
+import bisect
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
+from uuid import UUID
+
+from langchain_core.callbacks import BaseCallbackHandler
+from langchain_core.outputs import LLMResult
+
+# Seconds; spans cache hits (sub-millisecond) to slow LLM calls
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+Sample = Tuple[str, Dict[str, str], float]
+
+
+def _format_labels(labels: Dict[str, str]) -> str:
+    if not labels:
+        return ""
+    escaped = (
+        key + '="' + str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") + '"'
+        for key, value in labels.items()
+    )
+    return "{" + ",".join(escaped) + "}"
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+
+class Counter:
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values: Dict[Tuple[str, ...], float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1.0, **labels: str) -> None:
+        key = tuple(str(labels.get(name, "")) for name in self.labelnames)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            items = list(self._values.items())
+        for key, value in items:
+            lines.append(f"{self.name}{_format_labels(dict(zip(self.labelnames, key)))} {_format_value(value)}")
+        return lines
+
+
+class Histogram:
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = DEFAULT_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # label values -> [per-bucket counts (+Inf last), sum, count]
+        self._values: Dict[Tuple[str, ...], list] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, **labels: str) -> None:
+        key = tuple(str(labels.get(name, "")) for name in self.labelnames)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                state = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            state[0][index] += 1
+            state[1] += value
+            state[2] += 1
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            items = [(key, (list(state[0]), state[1], state[2])) for key, state in self._values.items()]
+        for key, (counts, total, count) in items:
+            labels = dict(zip(self.labelnames, key))
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += bucket_count
+                bucket_labels = _format_labels({**labels, "le": _format_value(bound)})
+                lines.append(f"{self.name}_bucket{bucket_labels} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(labels)} {_format_value(total)}")
+            lines.append(f"{self.name}_count{_format_labels(labels)} {count}")
+        return lines
+
+
+class Registry:
+    """Metrics plus collector callbacks for values owned by other components (cache stats)"""
+
+    def __init__(self):
+        self._metrics: List[Any] = []
+        self._collectors: List[Tuple[str, str, Callable[[], Iterable[Sample]]]] = []
+
+    def counter(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Counter:
+        metric = Counter(name, documentation, labelnames)
+        self._metrics.append(metric)
+        return metric
+
+    def histogram(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                  buckets: Sequence[float] = DEFAULT_BUCKETS) -> Histogram:
+        metric = Histogram(name, documentation, labelnames, buckets)
+        self._metrics.append(metric)
+        return metric
+
+    def register_collector(self, name: str, documentation: str, collect: Callable[[], Iterable[Sample]]) -> None:
+        """Gauge family whose samples come from collect() at scrape time"""
+        self._collectors.append((name, documentation, collect))
+
+    def render(self) -> str:
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        for name, documentation, collect in self._collectors:
+            lines += [f"# HELP {name} {documentation}", f"# TYPE {name} gauge"]
+            try:
+                samples = list(collect())
+            except Exception as e:
+                print(f"⚠️ Metrics collector {name} failed: {e}")
+                continue
+            for sample_name, labels, value in samples:
+                lines.append(f"{sample_name}{_format_labels(labels)} {_format_value(value)}")
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+REQUEST_SECONDS = REGISTRY.histogram("rag_request_seconds", "End-to-end turn latency", ["mode", "status"])
+NODE_SECONDS = REGISTRY.histogram("rag_graph_node_seconds", "Graph node latency", ["node"])
+LLM_SECONDS = REGISTRY.histogram("rag_llm_seconds", "LLM call latency", ["node"])
+LLM_TOKENS = REGISTRY.counter("rag_llm_tokens_total", "LLM tokens by kind (prompt, completion, cached)", ["node", "kind"])
+LLM_ERRORS = REGISTRY.counter("rag_llm_errors_total", "Failed LLM calls", ["node"])
+TOOL_SECONDS = REGISTRY.histogram("rag_tool_seconds", "Tool call latency", ["tool"])
+EMBEDDING_SECONDS = REGISTRY.histogram("rag_embedding_seconds", "Embedding provider call latency", ["kind"])
+VECTOR_QUERY_SECONDS = REGISTRY.histogram("rag_vector_query_seconds", "Vector index query latency", ["store"])
+STAGE_SECONDS = REGISTRY.histogram("rag_stage_seconds", "Other request stages (lock wait, answer cache lookup)", ["stage"])
+ADMISSION_WAIT_SECONDS = REGISTRY.histogram("rag_admission_wait_seconds", "Time requests waited for a slot", ["pool"])
+ADMISSION_REJECTED = REGISTRY.counter("rag_admission_rejected_total", "Requests shed by admission control", ["pool", "reason"])
+VECTOR_FALLBACKS = REGISTRY.counter("rag_vector_fallbacks_total", "Vector queries answered by the local replica",
+                                    ["store", "reason"])
+AGENT_STOPS = REGISTRY.counter("rag_agent_stops_total", "Agent turns by why they stopped (answered or a budget limit)",
+                               ["reason"])
+CONTEXT_DOCUMENTS = REGISTRY.counter("rag_context_documents_total",
+                                     "Retrieved candidates by context assembly outcome (kept, duplicate, over_budget, not_selected)",
+                                     ["outcome"])
+AGENT_STEPS = REGISTRY.histogram("rag_agent_steps", "Tool-choosing LLM calls per agent turn", [],
+                                 buckets=(1, 2, 3, 4, 6, 8, 12, 16))
+
+_request_timings: ContextVar[Optional[Dict[str, float]]] = ContextVar("request_timings", default=None)
+
+
+@contextmanager
+def collect_timings() -> Iterator[Dict[str, float]]:
+    """Open a per-request collector; stages observed inside accumulate into the dict (ms)"""
+    timings: Dict[str, float] = {}
+    token = _request_timings.set(timings)
+    try:
+        yield timings
+    finally:
+        _request_timings.reset(token)
+
+
+def record_stage(stage: str, seconds: float) -> None:
+    timings = _request_timings.get()
+    if timings is not None:
+        timings[stage] = round(timings.get(stage, 0.0) + seconds * 1000, 3)
+
+
+def observe_stage(stage: str, seconds: float) -> None:
+    """Record a request stage in rag_stage_seconds and the request's timings"""
+    STAGE_SECONDS.observe(seconds, stage=stage)
+    record_stage(stage, seconds)
+
+
+@contextmanager
+def timed(histogram: Histogram, request_stage: Optional[str] = None, **labels: str) -> Iterator[None]:
+    """Observe the block's duration in histogram and, if given, as a stage of the current request"""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - start
+        histogram.observe(elapsed, **labels)
+        if request_stage:
+            record_stage(request_stage, elapsed)
+
+
+def store_label(store: Any) -> str:
+    """Class name of a vector store for metric labels, looking through wrappers"""
+    while getattr(store, "wrapped", None) is not None:
+        store = store.wrapped
+    return type(store).__name__
+
+
+def _usage(response: LLMResult) -> Dict[str, int]:
+    """prompt/completion/cached token counts from an LLM result, when the provider reports them"""
+    for generations in response.generations:
+        for generation in generations:
+            usage = getattr(getattr(generation, "message", None), "usage_metadata", None)
+            if usage:
+                details = usage.get("input_token_details") or {}
+                return {
+                    "prompt": usage.get("input_tokens", 0),
+                    "completion": usage.get("output_tokens", 0),
+                    "cached": details.get("cache_read", 0) or 0,
+                }
+    token_usage = (response.llm_output or {}).get("token_usage") or {}
+    if token_usage:
+        cached = (token_usage.get("prompt_tokens_details") or {}).get("cached_tokens", 0) or 0
+        return {
+            "prompt": token_usage.get("prompt_tokens", 0),
+            "completion": token_usage.get("completion_tokens", 0),
+            "cached": cached,
+        }
+    return {}
+
+
+class MetricsCallbackHandler(BaseCallbackHandler):
+    """Times graph nodes, LLM calls and tools from LangChain callbacks
+
+    Use one instance per request: a cancelled run gets neither an end nor an
+    error callback, and its start time must not outlive the request.
+    """
+
+    # Called directly on the event loop: no executor hop per callback
+    run_inline = True
+
+    def __init__(self):
+        self._starts: Dict[UUID, Tuple[str, str, float]] = {}
+
+    def _start(self, run_id: UUID, kind: str, label: str) -> None:
+        self._starts[run_id] = (kind, label, time.perf_counter())
+
+    def _finish(self, run_id: UUID) -> Optional[Tuple[str, str, float]]:
+        start = self._starts.pop(run_id, None)
+        if start is None:
+            return None
+        kind, label, started = start
+        return kind, label, time.perf_counter() - started
+
+    def on_chain_start(self, serialized: Optional[Dict[str, Any]], inputs: Any, *, run_id: UUID,
+                       metadata: Optional[Dict[str, Any]] = None, **kwargs: Any) -> None:
+        node = (metadata or {}).get("langgraph_node")
+        # Only the node's own run, not the runnables nested inside it
+        if node and kwargs.get("name") == node and "langgraph_step" in (metadata or {}):
+            if any(tag.startswith("graph:step:") for tag in kwargs.get("tags") or []):
+                self._start(run_id, "node", node)
+
+    def on_chain_end(self, outputs: Any, *, run_id: UUID, **kwargs: Any) -> None:
+        finished = self._finish(run_id)
+        if finished:
+            _, node, elapsed = finished
+            NODE_SECONDS.observe(elapsed, node=node)
+            record_stage(f"node.{node}", elapsed)
+
+    def on_chain_error(self, error: BaseException, *, run_id: UUID, **kwargs: Any) -> None:
+        self.on_chain_end(None, run_id=run_id)
+
+    def on_chat_model_start(self, serialized: Optional[Dict[str, Any]], messages: Any, *, run_id: UUID,
+                            metadata: Optional[Dict[str, Any]] = None, **kwargs: Any) -> None:
+        self._start(run_id, "llm", (metadata or {}).get("langgraph_node", ""))
+
+    def on_llm_start(self, serialized: Optional[Dict[str, Any]], prompts: Any, *, run_id: UUID,
+                     metadata: Optional[Dict[str, Any]] = None, **kwargs: Any) -> None:
+        self._start(run_id, "llm", (metadata or {}).get("langgraph_node", ""))
+
+    def on_llm_end(self, response: LLMResult, *, run_id: UUID, **kwargs: Any) -> None:
+        finished = self._finish(run_id)
+        if not finished:
+            return
+        _, node, elapsed = finished
+        LLM_SECONDS.observe(elapsed, node=node)
+        record_stage("llm", elapsed)
+        for kind, count in _usage(response).items():
+            if count:
+                LLM_TOKENS.inc(count, node=node, kind=kind)
+
+    def on_llm_error(self, error: BaseException, *, run_id: UUID, **kwargs: Any) -> None:
+        finished = self._finish(run_id)
+        if finished:
+            LLM_ERRORS.inc(node=finished[1])
+
+    def on_tool_start(self, serialized: Optional[Dict[str, Any]], input_str: str, *, run_id: UUID,
+                      **kwargs: Any) -> None:
+        self._start(run_id, "tool", kwargs.get("name") or (serialized or {}).get("name", ""))
+
+    def on_tool_end(self, output: Any, *, run_id: UUID, **kwargs: Any) -> None:
+        finished = self._finish(run_id)
+        if finished:
+            _, tool, elapsed = finished
+            TOOL_SECONDS.observe(elapsed, tool=tool)
+            record_stage(f"tool.{tool}", elapsed)
+
+    def on_tool_error(self, error: BaseException, *, run_id: UUID, **kwargs: Any) -> None:
+        self.on_tool_end(None, run_id=run_id)
+
+
+class TokenUsageCallbackHandler(BaseCallbackHandler):
+    """Adds up the LLM calls and prompt/cached/completion tokens of one request"""
+
+    run_inline = True
+
+    def __init__(self):
+        self.usage: Dict[str, int] = {"llm_calls": 0, "prompt_tokens": 0, "cached_tokens": 0, "completion_tokens": 0}
+
+    def on_llm_end(self, response: LLMResult, *, run_id: UUID, **kwargs: Any) -> None:
+        self.usage["llm_calls"] += 1
+        for kind, count in _usage(response).items():
+            self.usage[f"{kind}_tokens"] += count
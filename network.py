@@ -0,0 +1,349 @@
+"""
+Shared network layer for the OpenAI and Pinecone clients
+
+- one pooled httpx.Client and one httpx.AsyncClient (connection limits,
+  keep-alive) shared by the chat model and the embeddings, with
+  per-operation timeouts and the OpenAI SDK's jittered retries
+- Pinecone index connection pools sized to match, and query indexes
+  without the SDK's own urllib3 retries (pinecone_query_index)
+- ResilientVectorStore, a wrapper for any vector store that gives each
+  query a deadline, retries failures with full-jitter backoff and can hedge:
+  when a query is still running after the store's recent p95 latency, an
+  identical one is sent and whichever answers first wins (vector queries
+  are idempotent, so the duplicate is harmless)
+
+Settings come from the environment (see README): HTTP_MAX_CONNECTIONS,
+HTTP_MAX_KEEPALIVE, HTTP_KEEPALIVE_EXPIRY, HTTP_CONNECT_TIMEOUT, LLM_TIMEOUT,
+EMBEDDING_TIMEOUT, HTTP_MAX_RETRIES, VECTOR_QUERY_TIMEOUT,
+VECTOR_QUERY_RETRIES and VECTOR_HEDGING.
+"""
+
+import asyncio
+import os
+import random
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Any, Dict, Iterator, List, Optional, Sequence, Tuple
+
+import httpx
+from langchain_core.documents import Document
+
+# Runs sync vector queries so a hedge can be sent while the first is pending
+_query_executor = ThreadPoolExecutor(max_workers=32, thread_name_prefix="vector-query")
+
+_clients_lock = threading.Lock()
+_http_client: Optional[httpx.Client] = None
+_async_http_client: Optional[httpx.AsyncClient] = None
+
+
+def _env_float(name: str, default: float) -> float:
+    return float(os.getenv(name, str(default)))
+
+
+def http_limits() -> httpx.Limits:
+    return httpx.Limits(
+        max_connections=int(os.getenv("HTTP_MAX_CONNECTIONS", "100")),
+        max_keepalive_connections=int(os.getenv("HTTP_MAX_KEEPALIVE", "20")),
+        keepalive_expiry=_env_float("HTTP_KEEPALIVE_EXPIRY", 30.0),
+    )
+
+
+def http_timeout(read: float) -> httpx.Timeout:
+    return httpx.Timeout(read, connect=_env_float("HTTP_CONNECT_TIMEOUT", 5.0))
+
+
+def shared_http_client() -> httpx.Client:
+    """Process-wide pooled sync client"""
+    global _http_client
+    with _clients_lock:
+        if _http_client is None:
+            _http_client = httpx.Client(limits=http_limits(), timeout=http_timeout(_env_float("LLM_TIMEOUT", 60.0)))
+        return _http_client
+
+
+def shared_async_http_client() -> httpx.AsyncClient:
+    """Process-wide pooled async client"""
+    global _async_http_client
+    with _clients_lock:
+        if _async_http_client is None:
+            _async_http_client = httpx.AsyncClient(
+                limits=http_limits(), timeout=http_timeout(_env_float("LLM_TIMEOUT", 60.0)),
+            )
+        return _async_http_client
+
+
+def openai_client_kwargs(timeout_env: str, default_timeout: float) -> Dict[str, Any]:
+    """Keyword arguments for ChatOpenAI / OpenAIEmbeddings: shared clients, deadline, retries
+
+    The OpenAI SDK retries connection errors, 408/409/429 and 5xx with
+    jittered exponential backoff; HTTP_MAX_RETRIES bounds the attempts.
+    """
+    return {
+        "http_client": shared_http_client(),
+        "http_async_client": shared_async_http_client(),
+        "request_timeout": http_timeout(_env_float(timeout_env, default_timeout)),
+        "max_retries": int(os.getenv("HTTP_MAX_RETRIES", "2")),
+    }
+
+
+def pinecone_index_kwargs() -> Dict[str, Any]:
+    """Connection pool sizing for Pinecone Index clients (urllib3 based)"""
+    return {
+        "pool_threads": int(os.getenv("PINECONE_POOL_THREADS", "8")),
+        "connection_pool_maxsize": int(os.getenv("HTTP_MAX_KEEPALIVE", "20")),
+    }
+
+
+def pinecone_query_index(api_key: Optional[str], name: str = "", host: str = ""):
+    """Pinecone Index (by name or host) for queries through ResilientVectorStore
+
+    The SDK's urllib3 pool retries 5xx five times with its own backoff inside
+    every attempt, which outlasts VECTOR_QUERY_TIMEOUT and leaves the store's
+    deadline, retries and hedges nothing to act on; the store retries instead.
+    The Index is built from an OpenApiConfiguration of our own with retries
+    off, passed through the Index constructor's openapi_config argument.
+    """
+    import certifi
+    from pinecone import Pinecone
+    from pinecone.config import OpenApiConfiguration
+    from pinecone.db_data import Index
+
+    if not host:
+        host = Pinecone(api_key=api_key).describe_index(name).host
+    config = OpenApiConfiguration(ssl_ca_cert=certifi.where())
+    config.retries = 0
+    return Index(api_key=api_key, host=host, openapi_config=config, **pinecone_index_kwargs())
+
+
+def backoff_delays(retries: int, base: float = 0.05, cap: float = 1.0) -> Iterator[float]:
+    """Full-jitter exponential backoff: uniform(0, min(cap, base * 2**attempt))"""
+    for attempt in range(retries):
+        yield random.uniform(0, min(cap, base * 2 ** attempt))
+
+
+class LatencyTracker:
+    """Recent successful latencies of one store, for the hedging threshold"""
+
+    def __init__(self, window: int = 256, min_samples: int = 20):
+        self._samples: deque = deque(maxlen=window)
+        self.min_samples = min_samples
+        self._lock = threading.Lock()
+
+    def observe(self, seconds: float) -> None:
+        with self._lock:
+            self._samples.append(seconds)
+
+    def quantile(self, q: float) -> Optional[float]:
+        with self._lock:
+            if len(self._samples) < self.min_samples:
+                return None
+            ordered = sorted(self._samples)
+        return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+def _raw_search(store, vector: Sequence[float], k: int, kwargs: Dict[str, Any]) -> List[Tuple[Document, float]]:
+    if hasattr(store, "similarity_search_by_vector_with_score"):
+        return store.similarity_search_by_vector_with_score(list(vector), k=k, **kwargs)
+    return store.similarity_search_with_score_by_vector(list(vector), k=k, **kwargs)
+
+
+async def _araw_search(store, vector: Sequence[float], k: int,
+                       kwargs: Dict[str, Any]) -> List[Tuple[Document, float]]:
+    if hasattr(store, "asimilarity_search_by_vector_with_score"):
+        return await store.asimilarity_search_by_vector_with_score(list(vector), k=k, **kwargs)
+    if hasattr(store, "asimilarity_search_with_score_by_vector"):
+        return await store.asimilarity_search_with_score_by_vector(list(vector), k=k, **kwargs)
+    return await asyncio.to_thread(_raw_search, store, vector, k, kwargs)
+
+
+class ResilientVectorStore:
+    """Deadline, jittered retries and optional hedging around a vector store's queries
+
+    Query methods (by text or by vector, sync and async) are overridden;
+    everything else is delegated to the wrapped store. With async_via_threads,
+    async queries run the sync client in a worker thread: langchain_pinecone's
+    async path opens and closes an HTTP session per query, while the sync
+    Index keeps its connections pooled.
+
+    Threads cannot be interrupted: when an attempt returns or times out, its
+    other queries (the losing hedge, a query past the deadline) are cancelled
+    if still queued, and otherwise run to completion on the shared 32-thread
+    pool, counted as "abandoned". Their time is bounded by the client's own
+    HTTP timeouts, not by the store's deadline.
+    """
+
+    def __init__(self, store, timeout: float = 5.0, retries: int = 2, hedge: bool = False,
+                 hedge_quantile: float = 0.95, name: str = "", async_via_threads: bool = False):
+        self.wrapped = store
+        self.async_via_threads = async_via_threads
+        self.timeout = timeout
+        self.retries = retries
+        self.hedge = hedge
+        self.hedge_quantile = hedge_quantile
+        self.name = name
+        self.latency = LatencyTracker()
+        self.counts: Dict[str, int] = {
+            "queries": 0, "retries": 0, "hedges": 0, "hedge_wins": 0, "timeouts": 0, "failures": 0, "abandoned": 0,
+        }
+        # Sync attempts and async_via_threads run in executor threads
+        self._counts_lock = threading.Lock()
+
+    def __getattr__(self, name: str):
+        if name == "wrapped":
+            raise AttributeError(name)
+        return getattr(self.wrapped, name)
+
+    def _count(self, key: str, amount: int = 1) -> None:
+        with self._counts_lock:
+            self.counts[key] += amount
+
+    def _hedge_delay(self) -> Optional[float]:
+        return self.latency.quantile(self.hedge_quantile) if self.hedge else None
+
+    def _abandon(self, futures) -> None:
+        for future in futures:
+            # Queued queries never start; running ones finish in the background
+            if not future.cancel():
+                self._count("abandoned")
+
+    # One attempt, possibly hedged
+
+    def _attempt(self, vector: Sequence[float], k: int, kwargs: Dict[str, Any],
+                 deadline: float) -> List[Tuple[Document, float]]:
+        started = time.perf_counter()
+        pending = {_query_executor.submit(_raw_search, self.wrapped, vector, k, kwargs)}
+        hedge_delay = self._hedge_delay()
+        hedge_query = None
+        error: Optional[BaseException] = None
+        try:
+            while pending:
+                remaining = deadline - time.perf_counter()
+                if remaining <= 0:
+                    break
+                wait_for = min(remaining, hedge_delay) if hedge_delay is not None and hedge_query is None else remaining
+                done, pending = wait(pending, timeout=wait_for, return_when=FIRST_COMPLETED)
+                for future in done:
+                    if future.exception() is None:
+                        self.latency.observe(time.perf_counter() - started)
+                        self._count("hedge_wins", future is hedge_query)
+                        return future.result()
+                    error = future.exception()
+                if not done and hedge_query is None and hedge_delay is not None:
+                    self._count("hedges")
+                    hedge_query = _query_executor.submit(_raw_search, self.wrapped, vector, k, kwargs)
+                    pending.add(hedge_query)
+        finally:
+            self._abandon(pending)
+        if error is not None and not pending:
+            raise error
+        self._count("timeouts")
+        raise TimeoutError(f"vector query {self.name} exceeded {self.timeout}s")
+
+    def _aquery(self, vector: Sequence[float], k: int, kwargs: Dict[str, Any]) -> asyncio.Future:
+        if self.async_via_threads:
+            return asyncio.wrap_future(_query_executor.submit(_raw_search, self.wrapped, vector, k, kwargs))
+        return asyncio.ensure_future(_araw_search(self.wrapped, vector, k, kwargs))
+
+    async def _aattempt(self, vector: Sequence[float], k: int, kwargs: Dict[str, Any],
+                        deadline: float) -> List[Tuple[Document, float]]:
+        started = time.perf_counter()
+        pending = {self._aquery(vector, k, kwargs)}
+        hedge_delay = self._hedge_delay()
+        hedge_query = None
+        error: Optional[BaseException] = None
+        try:
+            while pending:
+                remaining = deadline - time.perf_counter()
+                if remaining <= 0:
+                    break
+                wait_for = min(remaining, hedge_delay) if hedge_delay is not None and hedge_query is None else remaining
+                done, pending = await asyncio.wait(pending, timeout=wait_for, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        self.latency.observe(time.perf_counter() - started)
+                        self._count("hedge_wins", task is hedge_query)
+                        return task.result()
+                    error = task.exception()
+                if not done and hedge_query is None and hedge_delay is not None:
+                    self._count("hedges")
+                    hedge_query = self._aquery(vector, k, kwargs)
+                    pending.add(hedge_query)
+        finally:
+            for task in pending:
+                task.cancel()
+        if error is not None and not pending:
+            raise error
+        self._count("timeouts")
+        raise TimeoutError(f"vector query {self.name} exceeded {self.timeout}s")
+
+    # Retries within the operation's deadline
+
+    def similarity_search_by_vector_with_score(self, embedding: List[float], k: int = 4,
+                                               **kwargs: Any) -> List[Tuple[Document, float]]:
+        self._count("queries")
+        deadline = time.perf_counter() + self.timeout
+        delays = backoff_delays(self.retries)
+        while True:
+            try:
+                return self._attempt(embedding, k, kwargs, deadline)
+            except Exception:
+                delay = next(delays, None)
+                if delay is None or time.perf_counter() + delay >= deadline:
+                    self._count("failures")
+                    raise
+                self._count("retries")
+                time.sleep(delay)
+
+    async def asimilarity_search_by_vector_with_score(self, embedding: List[float], k: int = 4,
+                                                      **kwargs: Any) -> List[Tuple[Document, float]]:
+        self._count("queries")
+        deadline = time.perf_counter() + self.timeout
+        delays = backoff_delays(self.retries)
+        while True:
+            try:
+                return await self._aattempt(embedding, k, kwargs, deadline)
+            except Exception:
+                delay = next(delays, None)
+                if delay is None or time.perf_counter() + delay >= deadline:
+                    self._count("failures")
+                    raise
+                self._count("retries")
+                await asyncio.sleep(delay)
+
+    # Text queries embed once, then go through the resilient path
+
+    def similarity_search_with_score(self, query: str, k: int = 4, **kwargs: Any) -> List[Tuple[Document, float]]:
+        return self.similarity_search_by_vector_with_score(self.embeddings.embed_query(query), k, **kwargs)
+
+    async def asimilarity_search_with_score(self, query: str, k: int = 4,
+                                            **kwargs: Any) -> List[Tuple[Document, float]]:
+        return await self.asimilarity_search_by_vector_with_score(await self.embeddings.aembed_query(query), k,
+                                                                  **kwargs)
+
+    def similarity_search(self, query: str, k: int = 4, **kwargs: Any) -> List[Document]:
+        return [doc for doc, _ in self.similarity_search_with_score(query, k, **kwargs)]
+
+    async def asimilarity_search(self, query: str, k: int = 4, **kwargs: Any) -> List[Document]:
+        return [doc for doc, _ in await self.asimilarity_search_with_score(query, k, **kwargs)]
+
+    def stats(self) -> Dict[str, Any]:
+        with self._counts_lock:
+            counts = dict(self.counts)
+        return {**counts, "p95": self.latency.quantile(0.95) or 0.0}
+
+
+def resilient_store(store, name: str = "", async_via_threads: bool = False) -> Optional[ResilientVectorStore]:
+    """Wrap store with the environment's query deadline, retries and hedging"""
+    if store is None or isinstance(store, ResilientVectorStore):
+        return store
+    return ResilientVectorStore(
+        store,
+        timeout=_env_float("VECTOR_QUERY_TIMEOUT", 5.0),
+        retries=int(os.getenv("VECTOR_QUERY_RETRIES", "2")),
+        hedge=os.getenv("VECTOR_HEDGING", "0") == "1",
+        hedge_quantile=_env_float("VECTOR_HEDGE_QUANTILE", 0.95),
+        name=name,
+        async_via_threads=async_via_threads,
+    )
@@ -1,37 +1,66 @@
 """
 CapAmerica Headwear Catalog Assistant - RAG Implementation
-AI-powered sales assistant for headwear product catalog using Pinecone vector database
+AI-powered sales assistant for headwear product catalog using Pinecone (or a local FAISS) vector database
 
 Features:
 - Function-based architecture for flexibility
-- User-specific conversation memory with MemorySaver
+- User-specific conversation memory in a bounded, persistent checkpoint store
 - Specialized headwear product recommendations and pricing
 - Product catalog search (JSON/TXT data)
 - Website content retrieval (CSV data)
 - Multi-step retrieval for complex product queries
 - Pricing calculations and customization guidance
+- Async and token-streaming response paths for the API
 """
 
+import asyncio
+import contextvars
 import os
+import threading
 import time
-from typing import List, Dict, Any, Optional
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager, contextmanager
+from typing import List, Dict, Any, Optional, Iterator, AsyncIterator, Tuple, Sequence
 from datetime import datetime
 
 # LangChain imports
 from langchain.chat_models import init_chat_model
 from langchain_openai import OpenAIEmbeddings
 from langchain_pinecone import PineconeVectorStore
-from langchain_core.tools import tool
-from langchain_core.messages import SystemMessage, HumanMessage, AIMessage
+from langchain_core.tools import StructuredTool
+from langchain_core.messages import SystemMessage, HumanMessage, AIMessage, ToolMessage
 from langchain_core.documents import Document
+from langchain_core.runnables import RunnableConfig, RunnableLambda
 
 # LangGraph imports
 from langgraph.graph import MessagesState, StateGraph, END
-from langgraph.prebuilt import ToolNode, tools_condition, create_react_agent
+from langgraph.prebuilt import ToolNode, tools_condition
 from langgraph.checkpoint.memory import MemorySaver
 
-# Pinecone imports
-from pinecone import Pinecone
+# Local vector-store backend
+from faiss_store import get_index_dir, load_faiss_index
+from embedding_cache import CachedEmbeddings, normalize_text
+from retrieval import asearch_all_by_vector, merge_results, search_all_by_vector
+from catalog import addon_price_guide, load_product_index
+from hybrid_search import HybridRetriever, documents_from_store
+from history import HistoryManager
+from checkpoint_store import SQLiteCheckpointSaver
+from thread_locks import ThreadLocks
+from intent_router import CHITCHAT, RETRIEVE, IntentRouter
+from speculative import SpeculativeRetrieval
+from answer_cache import AnswerCache, document_fingerprint_key, documents_fingerprint
+from coalescing import RequestCoalescer
+from network import openai_client_kwargs, pinecone_query_index, resilient_store
+from circuit_breaker import STATE_VALUES, CircuitBreaker, FallbackVectorStore
+from context_assembly import ContextAssembler
+from agent_budget import (
+    ANSWERED, MAX_SECONDS, AgentBudget, budget_usage, record_call, record_context, record_timeout, remaining_seconds,
+    step_seconds, stop_reason,
+)
+from metrics import (
+    AGENT_STEPS, AGENT_STOPS, REGISTRY, REQUEST_SECONDS, STAGE_SECONDS, VECTOR_QUERY_SECONDS, MetricsCallbackHandler, TokenUsageCallbackHandler, collect_timings, observe_stage, store_label, timed,
+)
 
 from dotenv import load_dotenv
 
@@ -46,18 +75,71 @@ pdf_vector_store = None
 conversational_graph = None
 agent_executor = None
 memory_saver = None
+thread_locks = None
+intent_router = None
+speculative_retrieval = None
+answer_cache = None
+request_coalescer = None
+replica_snapshots = None
+product_index = None
+context_assembler = None
+hybrid_retrievers = {}
+history_manager = None
+csv_index_name_in_use = "cap-website-data"
+pdf_index_name_in_use = "cap-rag-index"
 
 # Removed crisis detection - not needed for generic document Q&A
 
-def initialize_models(model_name: str = "gpt-4o-mini"):
-    """Initialize chat model and embeddings"""
+EMBEDDING_MODEL = "text-embedding-3-large"
+
+def initialize_models(model_name: str = "gpt-4o-mini", backend: Optional[str] = None):
+    """Initialize chat model and embeddings
+    
+    backend: "openai" (default) or "fake"; falls back to the MODEL_BACKEND
+    environment variable when not given. The fake backend (benchmarks/fakes.py)
+    runs offline with simulated latency: FAKE_LLM_LATENCY, FAKE_LLM_TOKENS_PER_SECOND
+    and FAKE_EMBEDDING_LATENCY.
+    
+    The OpenAI clients share one pooled HTTP client per sync/async path (see
+    network.py), with deadlines from LLM_TIMEOUT and EMBEDDING_TIMEOUT.
+    
+    EMBEDDING_DIMENSIONS asks the API for shorter vectors (text-embedding-3 keeps
+    the leading dimensions); the indexes must hold vectors of the same size, or
+    be compact FAISS indexes, which truncate query vectors themselves.
+    
+    Query embeddings go through a shared cache (see embedding_cache.py), tuned by
+    EMBEDDING_CACHE_SIZE, EMBEDDING_CACHE_TTL (seconds) and EMBEDDING_CACHE_PATH
+    (SQLite file for the persistent tier; unset keeps the cache in memory only).
+    """
     global llm, embeddings
     
-    # Initialize chat model
-    llm = init_chat_model(model_name, model_provider="openai")
+    backend = (backend or os.getenv("MODEL_BACKEND", "openai")).lower()
+    if backend == "openai":
+        # Initialize chat model
+        # stream_usage: streamed answers report their token usage too
+        llm = init_chat_model(model_name, model_provider="openai", stream_usage=True,
+                              **openai_client_kwargs("LLM_TIMEOUT", 60.0))
+        # Initialize embeddings model - using text-embedding-3-large
+        dimensions = int(os.getenv("EMBEDDING_DIMENSIONS", "0")) or None
+        underlying = OpenAIEmbeddings(model=EMBEDDING_MODEL, dimensions=dimensions,
+                                      **openai_client_kwargs("EMBEDDING_TIMEOUT", 10.0))
+        # Cached vectors of another size must not be reused
+        embedding_model = f"{EMBEDDING_MODEL}@{dimensions}" if dimensions else EMBEDDING_MODEL
+    elif backend == "fake":
+        from benchmarks.fakes import fake_chat_model, fake_embeddings
+        llm = fake_chat_model(float(os.getenv("FAKE_LLM_LATENCY", "0.05")),
+                              float(os.getenv("FAKE_LLM_TOKENS_PER_SECOND", "0")))
+        underlying, embedding_model = fake_embeddings(float(os.getenv("FAKE_EMBEDDING_LATENCY", "0.02"))), "fake"
+    else:
+        raise ValueError(f"Unknown model backend: {backend}")
     
-    # Initialize embeddings model - using text-embedding-3-large
-    embeddings = OpenAIEmbeddings(model="text-embedding-3-large")
+    embeddings = CachedEmbeddings(
+        underlying,
+        model_name=embedding_model,
+        max_entries=int(os.getenv("EMBEDDING_CACHE_SIZE", "4096")),
+        ttl_seconds=float(os.getenv("EMBEDDING_CACHE_TTL", "86400")),
+        persist_path=os.getenv("EMBEDDING_CACHE_PATH") or None,
+    )
     
     print("✅ Models initialized successfully")
 
@@ -71,12 +153,9 @@ def setup_pinecone_connections(csv_index_name: str = "cap-website-data",
     if not api_key:
         raise ValueError("PINECONE_API_KEY not found in environment variables")
     
-    # Initialize Pinecone
-    pc = Pinecone(api_key=api_key)
-    
     # Connect to CSV index (interview and synthetic data)
     try:
-        csv_index = pc.Index(csv_index_name)
+        csv_index = pinecone_query_index(api_key, csv_index_name)
         csv_vector_store = PineconeVectorStore(
             embedding=embeddings,
             index=csv_index
@@ -88,7 +167,7 @@ def setup_pinecone_connections(csv_index_name: str = "cap-website-data",
     
     # Connect to PDF index (research papers and textbooks)
     try:
-        pdf_index = pc.Index(pdf_index_name)
+        pdf_index = pinecone_query_index(api_key, pdf_index_name)
         pdf_vector_store = PineconeVectorStore(
             embedding=embeddings,
             index=pdf_index
@@ -98,49 +177,628 @@ def setup_pinecone_connections(csv_index_name: str = "cap-website-data",
         print(f"⚠️ Could not connect to PDF index: {e}")
         pdf_vector_store = None
 
+def format_csv_docs(docs: List[Document]) -> str:
+    """Serialize website/CSV documents for a tool message"""
+    return "\n\n".join(
+        (f"Source: {doc.metadata.get('source', 'Unknown')}\n"
+         f"Type: {doc.metadata.get('category', 'Unknown')}\n"
+         f"Data Source: Website/CSV\n"
+         f"Content: {doc.page_content}")
+        for doc in docs
+    )
+
+def format_catalog_docs(docs: List[Document]) -> str:
+    """Serialize product catalog documents for a tool message"""
+    return "\n\n".join(
+        (f"Source: {doc.metadata.get('source', 'Unknown')}\n"
+         f"Category: {doc.metadata.get('category', 'Unknown')}\n"
+         f"Product ID: {doc.metadata.get('product_id', 'N/A')}\n"
+         f"Data Source: Product Catalog\n"
+         f"Content: {doc.page_content}")
+        for doc in docs
+    )
+
+def setup_faiss_stores(csv_index_name: str = "cap-website-data",
+                       pdf_index_name: str = "cap-rag-index",
+                       index_dir: Optional[str] = None):
+    """Load local FAISS copies of the indexes (memory-mapped, in-process search)"""
+    global csv_vector_store, pdf_vector_store
+    
+    try:
+        csv_vector_store = load_faiss_index(get_index_dir(csv_index_name, index_dir), embeddings)
+        print(f"✅ Loaded local CSV vector store: {csv_index_name}")
+    except Exception as e:
+        print(f"⚠️ Could not load local CSV index: {e}")
+        csv_vector_store = None
+    
+    try:
+        pdf_vector_store = load_faiss_index(get_index_dir(pdf_index_name, index_dir), embeddings)
+        print(f"✅ Loaded local PDF vector store: {pdf_index_name}")
+    except Exception as e:
+        print(f"⚠️ Could not load local PDF index: {e}")
+        pdf_vector_store = None
+
+def setup_fake_stores():
+    """In-memory stores seeded with the synthetic catalog (offline benchmarks)
+    
+    FAKE_VECTOR_LATENCY simulates the query round trip and FAKE_CATALOG_SIZE
+    sets the number of products.
+    """
+    global csv_vector_store, pdf_vector_store
+    
+    from benchmarks.fakes import fake_vector_stores
+    csv_vector_store, pdf_vector_store = fake_vector_stores(
+        embeddings,
+        latency=float(os.getenv("FAKE_VECTOR_LATENCY", "0.02")),
+        catalog_size=int(os.getenv("FAKE_CATALOG_SIZE", "200")),
+    )
+    print("✅ Loaded in-memory vector stores with the synthetic catalog")
+
+def setup_vector_stores(backend: Optional[str] = None,
+                        csv_index_name: str = "cap-website-data",
+                        pdf_index_name: str = "cap-rag-index"):
+    """Connect the vector stores for the configured backend
+    
+    backend: "pinecone" (default), "faiss" or "fake"; falls back to the
+    VECTOR_BACKEND environment variable when not given. Queries get a deadline,
+    retries and optional hedging (network.ResilientVectorStore), and remote
+    stores a circuit breaker with a local replica fallback.
+    """
+    global csv_vector_store, pdf_vector_store, csv_index_name_in_use, pdf_index_name_in_use
+    
+    backend = (backend or os.getenv("VECTOR_BACKEND", "pinecone")).lower()
+    csv_index_name_in_use, pdf_index_name_in_use = csv_index_name, pdf_index_name
+    if backend == "pinecone":
+        setup_pinecone_connections(csv_index_name, pdf_index_name)
+    elif backend == "faiss":
+        setup_faiss_stores(csv_index_name, pdf_index_name)
+    elif backend == "fake":
+        setup_fake_stores()
+    else:
+        raise ValueError(f"Unknown vector backend: {backend}")
+    # Pinecone's async client opens a session per query; its sync Index is pooled
+    csv_vector_store = resilient_store(csv_vector_store, "csv", async_via_threads=backend == "pinecone")
+    pdf_vector_store = resilient_store(pdf_vector_store, "pdf", async_via_threads=backend == "pinecone")
+    if backend != "faiss":
+        # A local index has nothing to fall back to
+        csv_vector_store = create_fallback_store(csv_vector_store, "csv", csv_index_name, backend)
+        pdf_vector_store = create_fallback_store(pdf_vector_store, "pdf", pdf_index_name, backend)
+        start_replica_snapshots()
+    invalidate_answer_cache()
+
+def create_fallback_store(store, source: str, index_name: str, backend: str):
+    """Circuit breaker in front of a vector store, with a local read-only replica
+    
+    CIRCUIT_BREAKER=0 disables it. The breaker opens after BREAKER_FAILURES
+    consecutive failed queries (queries slower than BREAKER_LATENCY seconds
+    count as failures) and probes the store again after BREAKER_RESET seconds.
+    The replica lives in REPLICA_DIR (default faiss_replica for Pinecone; the
+    fake backend keeps no replica unless REPLICA_DIR is set).
+    """
+    if store is None or os.getenv("CIRCUIT_BREAKER", "1") == "0":
+        return store
+    breaker = CircuitBreaker(
+        source,
+        failure_threshold=int(os.getenv("BREAKER_FAILURES", "5")),
+        latency_threshold=float(os.getenv("BREAKER_LATENCY", "2")),
+        reset_seconds=float(os.getenv("BREAKER_RESET", "30")),
+    )
+    replica_base = os.getenv("REPLICA_DIR") or ("faiss_replica" if backend == "pinecone" else None)
+    return FallbackVectorStore(store, breaker, get_index_dir(index_name, replica_base) if replica_base else None)
+
+def fallback_stores() -> Dict[str, FallbackVectorStore]:
+    """Vector stores behind a circuit breaker, by source"""
+    stores = {"csv": csv_vector_store, "pdf": pdf_vector_store}
+    return {source: store for source, store in stores.items() if isinstance(store, FallbackVectorStore)}
+
+def snapshot_replicas(max_age: float = 0.0):
+    """Refresh the local replicas older than max_age seconds (all when 0)"""
+    for source, store in fallback_stores().items():
+        if store.replica_dir is None:
+            continue
+        age = store.replica_age()
+        if age is not None and max_age and age < max_age:
+            continue
+        try:
+            if store.snapshot_replica():
+                print(f"✅ Snapshotted {source} replica to {store.replica_dir}")
+        except Exception as e:
+            print(f"⚠️ Could not snapshot {source} replica: {e}")
+
+def start_replica_snapshots():
+    """Keep the local replicas fresh from a background thread
+    
+    Replicas older than REPLICA_SNAPSHOT_INTERVAL seconds (default 21600)
+    are rewritten while their breaker is closed; 0 disables snapshots.
+    """
+    global replica_snapshots
+    
+    interval = float(os.getenv("REPLICA_SNAPSHOT_INTERVAL", "21600"))
+    if interval <= 0 or replica_snapshots is not None:
+        return
+    if not any(store.replica_dir for store in fallback_stores().values()):
+        return
+    
+    def loop():
+        while True:
+            snapshot_replicas(max_age=interval)
+            time.sleep(min(interval, 300))
+    
+    replica_snapshots = threading.Thread(target=loop, name="replica-snapshots", daemon=True)
+    replica_snapshots.start()
+
+def get_vector_store_health() -> Dict[str, Dict[str, Any]]:
+    """Breaker state, fallback count and replica freshness per vector store"""
+    health = {}
+    for source, store in fallback_stores().items():
+        stats = store.stats()
+        health[source] = {
+            "breaker": stats["breaker_state"],
+            "fallbacks": stats["fallbacks"],
+            "replica_available": stats["replica_available"],
+            "replica_age_seconds": stats["replica_age_seconds"],
+        }
+    return health
+
+def _breaker_samples():
+    for source, store in fallback_stores().items():
+        yield "rag_circuit_breaker_state", {"store": source}, STATE_VALUES[store.breaker.state]
+
+REGISTRY.register_collector("rag_circuit_breaker_state",
+                            "Vector store circuit breaker state (0 closed, 1 half-open, 2 open)", _breaker_samples)
+
+def setup_product_index(data_dir: Optional[str] = None):
+    """Load the structured product catalog used by the lookup and pricing tools
+    
+    data_dir defaults to $CATALOG_DATA_DIR or "data"; the tools are simply not
+    offered to the LLM when no catalog files are found.
+    """
+    global product_index
+    
+    data_dir = data_dir or os.getenv("CATALOG_DATA_DIR", "data")
+    try:
+        product_index = load_product_index(data_dir)
+        print(f"✅ Loaded structured catalog: {len(product_index)} products")
+    except Exception as e:
+        print(f"⚠️ Could not load structured catalog: {e}")
+        product_index = None
+    invalidate_answer_cache()
+
+def create_catalog_tools():
+    """Create exact product lookup and pricing tools backed by the product index"""
+    
+    def lookup_products(product_id: str = "", color: str = "", style: str = ""):
+        """Look up products exactly by product ID (e.g. i7041) or filter by color and/or style (trucker, snap back, visor, performance, foam). Returns features, sizing, pricing tiers and color stock."""
+        if product_index is None:
+            return "Structured catalog not available", []
+        
+        if product_id:
+            product = product_index.get(product_id)
+            products = [product] if product else []
+        else:
+            products = product_index.find(color=color, style=style)
+        if not products:
+            return f"No products found (product_id={product_id!r}, color={color!r}, style={style!r})", []
+        
+        content = "\n\n".join(
+            f"Data Source: Product Catalog\n{product.summary()}" for product in products[:10]
+        )
+        return content, [product.product_id for product in products]
+    
+    def calculate_price(product_id: str, quantity: int, embroidery: str = "flat",
+                        addons: Optional[List[str]] = None, stitch_count: int = 0, color: str = ""):
+        """Calculate an exact price quote for an order. embroidery is "flat" or "3d"; addons are decoration names such as side_embroidery, back_embroidery, embroidered_patch, genuine_leather_patch, faux_leather_patch, woven_patch, custom_label, american_flag_patch, pom; stitch_count is the design's total stitches (stitches over the base allowance cost extra)."""
+        if product_index is None:
+            return "Structured catalog not available", {}
+        
+        try:
+            quote = product_index.quote(product_id, quantity, embroidery, addons, stitch_count, color)
+        except (KeyError, ValueError) as e:
+            # Unknown product, ambiguous or unknown add-on (the message lists the options), minimum order
+            return f"Cannot quote: {e.args[0] if e.args else e}", {}
+        
+        lines = [
+            "Data Source: Product Catalog",
+            f"Quote for {quote['quantity']} x {quote['product_id']} ({quote['title']}), {quote['embroidery']}",
+            f"- Base: ${quote['base_unit_price']:.2f}/unit ({quote['tier']}+ unit tier)",
+        ]
+        for line in quote["addons"]:
+            if "unit_price_max" in line:
+                lines.append(f"- {line['addon']}: +${line['unit_price']:.2f}-{line['unit_price_max']:.2f}/unit (depends on style)")
+            else:
+                lines.append(f"- {line['addon']}: +${line['unit_price']:.2f}/unit")
+        if quote["extra_stitch_charge"]:
+            lines.append(f"- Extra stitches: +${quote['extra_stitch_charge']:.2f}/unit")
+        if "unit_total_max" in quote:
+            lines.append(f"- Unit total: ${quote['unit_total']:.2f}-{quote['unit_total_max']:.2f}")
+            lines.append(f"- Order total: ${quote['order_total']:.2f}-{quote['order_total_max']:.2f}")
+        else:
+            lines.append(f"- Unit total: ${quote['unit_total']:.2f}")
+            lines.append(f"- Order total: ${quote['order_total']:.2f}")
+        if "color_available" in quote:
+            lines.append(f"- Color {quote['color']}: {'in stock' if quote['color_available'] else 'not available / out of stock'}")
+        return "\n".join(lines), quote
+    
+    tools = [
+        StructuredTool.from_function(func=lookup_products, response_format="content_and_artifact"),
+        StructuredTool.from_function(func=calculate_price, response_format="content_and_artifact"),
+    ]
+    print("✅ Catalog lookup and pricing tools setup complete")
+    return tools
+
+def setup_hybrid_retrievers():
+    """Build BM25 indexes over the locally available documents of each store
+    
+    Local stores (FAISS, in-memory) expose their documents directly; for
+    Pinecone the local FAISS snapshot is used when one exists. Set
+    HYBRID_SEARCH=0 to use pure vector search.
+    """
+    global hybrid_retrievers
+    
+    hybrid_retrievers = {}
+    if os.getenv("HYBRID_SEARCH", "1") == "0":
+        return
+    
+    for source, store, index_name in (("csv", csv_vector_store, csv_index_name_in_use),
+                                      ("pdf", pdf_vector_store, pdf_index_name_in_use)):
+        if store is None:
+            continue
+        documents = documents_from_store(store)
+        if documents is None:
+            try:
+                documents = documents_from_store(load_faiss_index(get_index_dir(index_name), embeddings))
+            except Exception:
+                documents = None
+        if documents:
+            hybrid_retrievers[source] = HybridRetriever(store, documents)
+            print(f"✅ Hybrid lexical index ready for {source}: {len(documents)} documents")
+
+def search_source(source: str, query: str, k: int = 3) -> List[Document]:
+    """Search one data source, hybrid when a lexical index is available"""
+    retriever = hybrid_retrievers.get(source)
+    if retriever is not None:
+        return retriever.search(query, k)
+    store = csv_vector_store if source == "csv" else pdf_vector_store
+    with timed(VECTOR_QUERY_SECONDS, "vector_query", store=store_label(store)):
+        return store.similarity_search(query, k=k)
+
+async def asearch_source(source: str, query: str, k: int = 3) -> List[Document]:
+    """Async variant of search_source"""
+    retriever = hybrid_retrievers.get(source)
+    if retriever is not None:
+        return await retriever.asearch(query, k)
+    store = csv_vector_store if source == "csv" else pdf_vector_store
+    with timed(VECTOR_QUERY_SECONDS, "vector_query", store=store_label(store)):
+        return await store.asimilarity_search(query, k=k)
+
+def exact_id_matches(query: str, k: int) -> List[Document]:
+    """Documents of any source whose product ID appears verbatim in the query"""
+    matches = []
+    for source, retriever in hybrid_retrievers.items():
+        for doc in retriever.exact_matches(query):
+            matches.append(Document(id=doc.id, page_content=doc.page_content,
+                                    metadata=dict(doc.metadata, data_source=source)))
+    return matches[:k]
+
+def fan_out_fetch_k() -> int:
+    """Vector candidates per source; wider when they are fused with BM25 or assembled into context"""
+    return max([r.fetch_k for r in hybrid_retrievers.values()] + [candidate_k(3)])
+
+def hybrid_rerank(query: str, k: int) -> Dict[str, Any]:
+    """Per-source fusion functions for fan_out_search"""
+    return {
+        source: (lambda pairs, retriever=retriever: retriever.fuse(query, pairs, k))
+        for source, retriever in hybrid_retrievers.items()
+    }
+
+def vector_results(query: str, vector: Optional[Sequence[float]] = None) -> Dict[str, Any]:
+    """Raw vector (document, score) pairs for query from both indexes, one shared embedding"""
+    stores = {"csv": csv_vector_store, "pdf": pdf_vector_store}
+    if vector is None:
+        vector = embeddings.embed_query(query)
+    return search_all_by_vector(stores, vector, fan_out_fetch_k())
+
+async def avector_results(query: str, vector: Optional[Sequence[float]] = None) -> Dict[str, Any]:
+    """Async variant of vector_results"""
+    stores = {"csv": csv_vector_store, "pdf": pdf_vector_store}
+    if vector is None:
+        vector = await embeddings.aembed_query(query)
+    return await asearch_all_by_vector(stores, vector, fan_out_fetch_k())
+
+def create_speculative_retrieval():
+    """Retrieval on the raw message that the turn's tools reuse
+
+    SPECULATIVE_RETRIEVAL=1 starts it while process_query runs (first turns
+    start it from the answer cache lookup, with the embedding it computed).
+    SPECULATIVE_MIN_OVERLAP is the term overlap a tool query needs with the
+    user's message to reuse the results.
+    """
+    if os.getenv("SPECULATIVE_RETRIEVAL", "0") != "1":
+        return None
+    print("✅ Speculative retrieval enabled")
+    return SpeculativeRetrieval(
+        vector_results, avector_results, min_overlap=float(os.getenv("SPECULATIVE_MIN_OVERLAP", "0.6")),
+    )
+
+def create_answer_cache():
+    """Semantic cache of first-turn answers
+    
+    ANSWER_CACHE=0 disables it; ANSWER_CACHE_SIZE, ANSWER_CACHE_SIMILARITY and
+    ANSWER_CACHE_TTL tune capacity, match threshold and entry lifetime.
+    """
+    if os.getenv("ANSWER_CACHE", "1") == "0":
+        return None
+    print("✅ Answer cache enabled")
+    return AnswerCache(
+        max_entries=int(os.getenv("ANSWER_CACHE_SIZE", "1024")),
+        min_similarity=float(os.getenv("ANSWER_CACHE_SIMILARITY", "0.95")),
+        ttl_seconds=float(os.getenv("ANSWER_CACHE_TTL", "3600")),
+    )
+
+def create_request_coalescer():
+    """Coalescing of identical requests for the same conversation
+    
+    REQUEST_COALESCING=0 disables it; COALESCE_WINDOW is how many seconds a
+    finished turn's result is still handed to an identical request, as long
+    as the conversation has not moved on since.
+    """
+    if os.getenv("REQUEST_COALESCING", "1") == "0":
+        return None
+    return RequestCoalescer(window=float(os.getenv("COALESCE_WINDOW", "2")))
+
+def get_coalescing_stats() -> Dict[str, Any]:
+    """Requests answered from an identical in-flight or just-finished request"""
+    return request_coalescer.stats() if request_coalescer is not None else {}
+
+def invalidate_answer_cache():
+    """Drop cached answers; called whenever indexes or the catalog are (re)loaded"""
+    if answer_cache is not None:
+        answer_cache.invalidate()
+
+def get_answer_cache_stats() -> Dict[str, Any]:
+    """Answer cache hit rate and latency saved since startup"""
+    return answer_cache.stats() if answer_cache is not None else {}
+
+def catalog_version() -> str:
+    """Identity of the indexes and catalog answers are grounded in"""
+    return "|".join([
+        csv_index_name_in_use or "",
+        pdf_index_name_in_use or "",
+        product_index.version if product_index is not None else "",
+    ])
+
+def results_fingerprint(results: Dict[str, Any]) -> str:
+    """Fingerprint of the documents in vector results from both indexes"""
+    return documents_fingerprint(document_fingerprint_key(doc) for pairs in results.values() for doc, _ in pairs)
+
+def start_fingerprint(query: str, config: Dict[str, Any], key: Dict[str, Any], run_async: bool = False) -> None:
+    """Fingerprint a first-turn question without a search of its own
+
+    Exact product IDs are fingerprinted by their matches. Otherwise, with
+    SPECULATIVE_RETRIEVAL=1, the question's vector retrieval starts as the
+    thread's speculation on the lookup's embedding, which the turn's tools
+    reuse; key["speculation"] holds it until the fingerprint is read. Without
+    speculation nothing starts here: key_fingerprint searches with the
+    lookup's embedding only when a fingerprint is actually needed.
+    """
+    exact = exact_id_matches(query, fan_out_fetch_k())
+    if exact:
+        key["fingerprint"] = documents_fingerprint(document_fingerprint_key(doc) for doc in exact)
+    elif speculative_retrieval is not None and _thread_id(config):
+        start = speculative_retrieval.astart if run_async else speculative_retrieval.start
+        key["speculation"] = start(_thread_id(config), query, key["vector"])
+
+def key_fingerprint(key: Dict[str, Any]) -> Optional[str]:
+    """The lookup's fingerprint; None when its retrieval was cancelled or failed"""
+    if "fingerprint" not in key:
+        if "speculation" not in key:
+            key["fingerprint"] = results_fingerprint(vector_results(key["query"], key["vector"]))
+            return key["fingerprint"]
+        pending = key["speculation"].pending
+        if pending.cancelled() or (pending.done() and pending.exception() is not None):
+            return None
+        key["fingerprint"] = results_fingerprint(pending.result())
+    return key["fingerprint"]
+
+async def akey_fingerprint(key: Dict[str, Any]) -> Optional[str]:
+    """Async variant of key_fingerprint"""
+    if "fingerprint" not in key and "speculation" not in key:
+        key["fingerprint"] = results_fingerprint(await avector_results(key["query"], key["vector"]))
+    if "fingerprint" not in key:
+        try:
+            # Shield: the turn's tools may share the same search
+            await asyncio.shield(key["speculation"].pending)
+        except (asyncio.CancelledError, Exception):
+            if not key["speculation"].pending.done():
+                raise
+    return key_fingerprint(key)
+
+def get_speculation_stats() -> Dict[str, Any]:
+    """Speculative retrieval hit rate and time saved since startup"""
+    return speculative_retrieval.stats() if speculative_retrieval is not None else {}
+
+def _thread_id(config: Optional[RunnableConfig]) -> Optional[str]:
+    return ((config or {}).get("configurable") or {}).get("thread_id")
+
+def speculated_results(query: str, config: Optional[RunnableConfig]) -> Optional[Dict[str, Any]]:
+    """Vector results speculated for this turn, if they apply to query"""
+    thread_id = _thread_id(config)
+    if speculative_retrieval is None or thread_id is None:
+        return None
+    return speculative_retrieval.take(thread_id, query)
+
+async def aspeculated_results(query: str, config: Optional[RunnableConfig]) -> Optional[Dict[str, Any]]:
+    """Async variant of speculated_results"""
+    thread_id = _thread_id(config)
+    if speculative_retrieval is None or thread_id is None:
+        return None
+    return await speculative_retrieval.atake(thread_id, query)
+
+def docs_from_results(source: str, query: str, results: Optional[Dict[str, Any]], k: int) -> Optional[List[Document]]:
+    """What search_source would return, built from precomputed vector results"""
+    if not results or source not in results:
+        return None
+    retriever = hybrid_retrievers.get(source)
+    if retriever is None:
+        return [doc for doc, _ in results[source][:k]]
+    exact = retriever.exact_matches(query)
+    if exact:
+        return exact[:k]
+    return [doc for doc, _ in retriever.fuse(query, results[source], k)]
+
+def create_context_assembler():
+    """Context assembly for the retrieval tools
+    
+    CONTEXT_ASSEMBLY=0 restores the top-k documents with full headers.
+    Otherwise each tool call retrieves CONTEXT_FETCH_K candidates and keeps the
+    most relevant non-duplicate, diverse ones within CONTEXT_TOKEN_BUDGET as
+    compact snippets (see context_assembly.py).
+    """
+    if os.getenv("CONTEXT_ASSEMBLY", "1") == "0":
+        return None
+    assembler = ContextAssembler.from_env(embeddings, getattr(llm, "model_name", None) or "gpt-4o-mini")
+    print(f"✅ Context assembly enabled ({'embedding' if assembler.embeddings is not None else 'lexical'} similarity)")
+    return assembler
+
+def candidate_k(k: int) -> int:
+    """Documents a tool retrieves to return k: more when context assembly chooses among them"""
+    return max(k, context_assembler.fetch_k) if context_assembler is not None else k
+
+def tool_context(docs: List[Document], k: int, format_docs) -> Tuple[str, List[Document]]:
+    """Tool message content and artifact for the retrieved candidates"""
+    if context_assembler is None:
+        docs = docs[:k]
+        return format_docs(docs), docs
+    docs = context_assembler.select(docs, k)
+    return context_assembler.format(docs), docs
+
+async def atool_context(docs: List[Document], k: int, format_docs) -> Tuple[str, List[Document]]:
+    """Async variant of tool_context"""
+    if context_assembler is None:
+        docs = docs[:k]
+        return format_docs(docs), docs
+    docs = await context_assembler.aselect(docs, k)
+    return context_assembler.format(docs), docs
+
+def format_merged_docs(docs: List[Document]) -> str:
+    """Serialize fan-out results, keeping each document's own source header"""
+    return "\n\n".join(
+        format_csv_docs([doc]) if doc.metadata.get("data_source") == "csv" else format_catalog_docs([doc])
+        for doc in docs
+    )
+
 def create_retrieval_tools():
-    """Create retrieval tools for different data sources"""
+    """Create retrieval tools for different data sources
+    
+    Every tool has both a sync implementation (console chat) and an async
+    implementation (API), so graph.astream never blocks the event loop.
+    """
+    global context_assembler
+    context_assembler = create_context_assembler()
     
-    @tool(response_format="content_and_artifact")
-    def retrieve_csv_data(query: str):
+    def retrieve_csv_data(query: str, config: RunnableConfig):
         """Retrieve website content and structured data about CapAmerica company, services, and general information."""
         if not csv_vector_store:
             return "CSV vector store not available", []
         
         try:
-            retrieved_docs = csv_vector_store.similarity_search(query, k=3)
-            serialized = "\n\n".join(
-                (f"Source: {doc.metadata.get('source', 'Unknown')}\n"
-                 f"Type: {doc.metadata.get('category', 'Unknown')}\n"
-                 f"Data Source: Website/CSV\n"
-                 f"Content: {doc.page_content}")
-                for doc in retrieved_docs
-            )
-            return serialized, retrieved_docs
+            retrieved_docs = docs_from_results("csv", query, speculated_results(query, config), k=candidate_k(3))
+            if retrieved_docs is None:
+                retrieved_docs = search_source("csv", query, k=candidate_k(3))
+            return tool_context(retrieved_docs, 3, format_csv_docs)
         except Exception as e:
             return f"Error retrieving website data: {e}", []
     
-    @tool(response_format="content_and_artifact")
-    def retrieve_product_catalog(query: str):
+    async def aretrieve_csv_data(query: str, config: RunnableConfig):
+        """Async variant of retrieve_csv_data."""
+        if not csv_vector_store:
+            return "CSV vector store not available", []
+        
+        try:
+            retrieved_docs = docs_from_results("csv", query, await aspeculated_results(query, config), k=candidate_k(3))
+            if retrieved_docs is None:
+                retrieved_docs = await asearch_source("csv", query, k=candidate_k(3))
+            return await atool_context(retrieved_docs, 3, format_csv_docs)
+        except Exception as e:
+            return f"Error retrieving website data: {e}", []
+    
+    def retrieve_product_catalog(query: str, config: RunnableConfig):
         """Retrieve headwear product catalog information including caps, pricing, features, colors, customization options, and decoration pricing."""
         if not pdf_vector_store:
             return "Product catalog not available", []
         
         try:
-            retrieved_docs = pdf_vector_store.similarity_search(query, k=3)
-            serialized = "\n\n".join(
-                (f"Source: {doc.metadata.get('source', 'Unknown')}\n"
-                 f"Category: {doc.metadata.get('category', 'Unknown')}\n"
-                 f"Product ID: {doc.metadata.get('product_id', 'N/A')}\n"
-                 f"Data Source: Product Catalog\n"
-                 f"Content: {doc.page_content}")
-                for doc in retrieved_docs
-            )
-            return serialized, retrieved_docs
+            retrieved_docs = docs_from_results("pdf", query, speculated_results(query, config), k=candidate_k(3))
+            if retrieved_docs is None:
+                retrieved_docs = search_source("pdf", query, k=candidate_k(3))
+            return tool_context(retrieved_docs, 3, format_catalog_docs)
         except Exception as e:
             return f"Error retrieving product catalog: {e}", []
     
-    tools = [retrieve_csv_data, retrieve_product_catalog]
+    async def aretrieve_product_catalog(query: str, config: RunnableConfig):
+        """Async variant of retrieve_product_catalog."""
+        if not pdf_vector_store:
+            return "Product catalog not available", []
+        
+        try:
+            retrieved_docs = docs_from_results("pdf", query, await aspeculated_results(query, config), k=candidate_k(3))
+            if retrieved_docs is None:
+                retrieved_docs = await asearch_source("pdf", query, k=candidate_k(3))
+            return await atool_context(retrieved_docs, 3, format_catalog_docs)
+        except Exception as e:
+            return f"Error retrieving product catalog: {e}", []
+    
+    def retrieve_all_sources(query: str, config: RunnableConfig):
+        """Search the product catalog AND the website content in one step. Prefer this when a question may need both (e.g. products plus company policies, samples or services) or when unsure which source applies."""
+        stores = {"csv": csv_vector_store, "pdf": pdf_vector_store}
+        if not any(stores.values()):
+            return "No vector stores available", []
+        
+        try:
+            # Exact product IDs skip the embedding call entirely
+            retrieved_docs = exact_id_matches(query, k=candidate_k(5))
+            if not retrieved_docs:
+                # One shared query embedding for both indexes, unless speculation already ran it
+                results = speculated_results(query, config) or vector_results(query)
+                retrieved_docs = merge_results(results, k=candidate_k(5), rerank=hybrid_rerank(query, k=candidate_k(3)))
+            return tool_context(retrieved_docs, 5, format_merged_docs)
+        except Exception as e:
+            return f"Error retrieving catalog and website data: {e}", []
+    
+    async def aretrieve_all_sources(query: str, config: RunnableConfig):
+        """Async variant of retrieve_all_sources."""
+        stores = {"csv": csv_vector_store, "pdf": pdf_vector_store}
+        if not any(stores.values()):
+            return "No vector stores available", []
+        
+        try:
+            retrieved_docs = exact_id_matches(query, k=candidate_k(5))
+            if not retrieved_docs:
+                results = await aspeculated_results(query, config) or await avector_results(query)
+                retrieved_docs = merge_results(results, k=candidate_k(5), rerank=hybrid_rerank(query, k=candidate_k(3)))
+            return await atool_context(retrieved_docs, 5, format_merged_docs)
+        except Exception as e:
+            return f"Error retrieving catalog and website data: {e}", []
+    
+    # ToolNode runs parallel tool calls from one LLM turn concurrently
+    # (thread pool on the sync path, asyncio.gather on the async path)
+    tools = [
+        StructuredTool.from_function(
+            func=retrieve_all_sources,
+            coroutine=aretrieve_all_sources,
+            response_format="content_and_artifact",
+        ),
+        StructuredTool.from_function(
+            func=retrieve_csv_data,
+            coroutine=aretrieve_csv_data,
+            response_format="content_and_artifact",
+        ),
+        StructuredTool.from_function(
+            func=retrieve_product_catalog,
+            coroutine=aretrieve_product_catalog,
+            response_format="content_and_artifact",
+        ),
+    ]
     print("✅ Retrieval tools setup complete")
     return tools
 
@@ -170,10 +828,7 @@ You have access to our complete headwear catalog including:
 - **3D Embroidery**: Additional $3-5 per unit over flat embroidery
 
 **CUSTOMIZATION OPTIONS:**
-- **Embroidery Locations**: Front panel (included), side/back ($3.00), across back seam ($3.00)
-- **Patches**: Molded rubber ($6), leather ($4-5), woven ($5), embroidered ($4), sublimated ($4)
-- **Special Options**: Custom labels ($0.90), American flag patch ($5), poms ($1.40-5.00)
-- **Extra Stitches**: $0.80 per 1,000 stitches beyond base allowance
+""" + addon_price_guide() + """
 
 **RESPONSE GUIDELINES:**
 1. **Product Recommendations**: Suggest products based on customer needs (features, budget, style)
@@ -188,7 +843,7 @@ You have access to our complete headwear catalog including:
 - Start with the most relevant products/information
 - Use bullet points for product features and pricing tiers
 - Provide product IDs (e.g., i7041, i8502) for easy reference
-- Calculate total pricing when asked (base price + add-ons)
+- Calculate total pricing when asked (base price + add-ons); use the calculate_price tool for exact quotes when available
 - Suggest alternatives if exact request isn't available
 
 **CONVERSATION STYLE:**
@@ -206,37 +861,227 @@ You have access to our complete headwear catalog including:
 **EXAMPLE INTERACTIONS:**
 - "Looking for affordable navy caps" → Suggest i8505 ($11.50-13.00) or i3057 ($12.00)
 - "Need UV protection for outdoor events" → Highlight i7041, i8530, i8540 with UV features
-- "What's the cost for leather patches?" → Explain genuine leather ($5) vs faux leather ($4) options
+- "What's the cost for leather patches?" → Compare the genuine, debossed and faux leather patch prices above
 - "Bulk order pricing for 200 units" → Use 144-tier pricing as reference point
 
 Remember: Your goal is to help customers find the right headwear products and understand all costs involved. Be consultative, accurate, and helpful. Always base recommendations on the actual catalog data."""
 
+# Built once: every generation prompt starts with this exact message
+HEADWEAR_SYSTEM_MESSAGE = SystemMessage(get_headwear_catalog_system_prompt())
+
+def generation_prompt(history: List[Any], context_prompt: str, question: List[Any]) -> List[Any]:
+    """Generation prompt laid out for provider-side prompt caching
+    
+    The static system prompt and the earlier conversation come first: each turn
+    only appends to them, so the provider can serve that prefix from its prompt
+    cache. The retrieved context and the new question, which change every turn,
+    form the tail.
+    """
+    return [HEADWEAR_SYSTEM_MESSAGE, *history, SystemMessage(context_prompt), *question]
+
 # Crisis detection removed - not needed for generic document Q&A
 
+GENERATION_FALLBACK = "I'm here to support you, but I'm experiencing some technical difficulties right now. Please try rephrasing your question or contact support if the issue persists."
+
+class ConversationState(MessagesState):
+    """Messages plus the rolling summary of turns folded out of the history"""
+    summary: str
+    # Intent router decision for the current turn
+    route: str
+
+def create_intent_router(tools):
+    """Local router that lets obvious turns skip the tool-selection LLM call
+
+    INTENT_ROUTER=0 disables it; INTENT_CLASSIFIER=1 adds the embedding
+    classifier for messages the keyword matcher cannot decide.
+    """
+    if os.getenv("INTENT_ROUTER", "1") == "0":
+        return None
+    use_classifier = os.getenv("INTENT_CLASSIFIER", "0") == "1"
+    router = IntentRouter([tool.name for tool in tools], embeddings=embeddings, use_classifier=use_classifier)
+    print(f"✅ Intent router enabled{' with embedding classifier' if use_classifier else ''}")
+    return router
+
+def get_router_stats() -> Dict[str, float]:
+    """Intent router decisions and LLM calls saved since startup"""
+    return intent_router.stats() if intent_router is not None else {}
+
+def create_checkpointer():
+    """Conversation checkpointer shared by the graph and the agent
+
+    CHECKPOINT_BACKEND=sqlite (default) keeps the latest state per thread in a
+    SQLite file with idle TTL and thread-count eviction; "memory" restores the
+    unbounded in-process MemorySaver.
+    """
+    backend = os.getenv("CHECKPOINT_BACKEND", "sqlite").lower()
+    if backend == "memory":
+        print("✅ Using in-memory checkpointer")
+        return MemorySaver()
+    if backend != "sqlite":
+        raise ValueError(f"Unknown CHECKPOINT_BACKEND: {backend}")
+    path = os.getenv("CHECKPOINT_DB_PATH", "checkpoints.db")
+    saver = SQLiteCheckpointSaver(
+        path,
+        cache_threads=int(os.getenv("CHECKPOINT_CACHE_THREADS", "1024")),
+        max_threads=int(os.getenv("CHECKPOINT_MAX_THREADS", "100000")),
+        ttl_seconds=float(os.getenv("CHECKPOINT_TTL", str(7 * 86400))),
+    )
+    print(f"✅ Using SQLite checkpointer at {path}")
+    return saver
+
+def create_thread_locks():
+    """Per-conversation locks so concurrent turns for one user run one at a time
+
+    With the SQLite checkpointer the locks also hold across worker processes
+    sharing the database (lock files in CHECKPOINT_LOCK_DIR).
+    """
+    if os.getenv("CHECKPOINT_BACKEND", "sqlite").lower() == "memory":
+        return ThreadLocks()
+    db_path = os.getenv("CHECKPOINT_DB_PATH", "checkpoints.db")
+    return ThreadLocks(os.getenv("CHECKPOINT_LOCK_DIR") or f"{db_path}.locks")
+
+def summarize_history(state: ConversationState):
+    """Fold turns beyond the verbatim window into the summary, a batch at a time
+    
+    The last node of both graphs, so counselor and agent threads stay bounded.
+    """
+    turns = history_manager.turns_to_fold(state["messages"])
+    if not turns:
+        return {}
+    try:
+        prompt = history_manager.summary_prompt(state.get("summary", ""), turns)
+        return history_manager.fold_update(llm.invoke(prompt).content, turns)
+    except Exception as e:
+        # Keep the history as is; the token budget still bounds the prompt
+        print(f"Error summarizing history: {e}")
+        return {}
+
+async def asummarize_history(state: ConversationState):
+    """Async variant of summarize_history"""
+    turns = history_manager.turns_to_fold(state["messages"])
+    if not turns:
+        return {}
+    try:
+        prompt = history_manager.summary_prompt(state.get("summary", ""), turns)
+        return history_manager.fold_update((await llm.ainvoke(prompt)).content, turns)
+    except Exception as e:
+        print(f"Error summarizing history: {e}")
+        return {}
+
 def setup_conversational_chain(tools):
-    """Setup conversational RAG chain with user-specific memory"""
-    global conversational_graph, memory_saver
+    """Setup conversational RAG chain with user-specific memory
+    
+    History sent to the LLM is bounded by the HistoryManager: the last few
+    turns verbatim plus a rolling summary, trimmed to a token budget
+    (HISTORY_KEEP_TURNS, HISTORY_FOLD_BATCH, HISTORY_TOKEN_BUDGET).
+    """
+    global conversational_graph, memory_saver, thread_locks, history_manager, intent_router, speculative_retrieval
+    global answer_cache, request_coalescer
     
     # Create user-specific memory saver
-    memory_saver = MemorySaver()
+    memory_saver = create_checkpointer()
+    thread_locks = create_thread_locks()
+    if isinstance(memory_saver, SQLiteCheckpointSaver):
+        # Lock files of evicted or deleted conversations go with them
+        memory_saver.on_delete = thread_locks.discard
+    request_coalescer = create_request_coalescer()
+    history_manager = HistoryManager.from_env(getattr(llm, "model_name", None) or "gpt-4o-mini")
+    intent_router = create_intent_router(tools)
+    speculative_retrieval = create_speculative_retrieval()
+    answer_cache = create_answer_cache()
     
     # Create graph builder
-    graph_builder = StateGraph(MessagesState)
+    graph_builder = StateGraph(ConversationState)
+    
+    # Node 0: Local intent routing
+    def routed_update(state: ConversationState, route) -> Dict[str, Any]:
+        """State update for a routing decision; retrieval routes emit the tool call directly"""
+        update = {"route": route.intent}
+        if route.intent == RETRIEVE:
+            question = state["messages"][-1].content
+            update["messages"] = [AIMessage(content="", tool_calls=[{
+                "name": route.tool,
+                "args": {"query": question},
+                "id": f"route_{uuid.uuid4().hex[:12]}",
+            }])]
+        return update
+    
+    def has_history(state: ConversationState) -> bool:
+        earlier, _ = history_manager.split_current_turn(state["messages"])
+        return bool(earlier or state.get("summary"))
+    
+    def route_query(state: ConversationState):
+        """Route obvious catalog/pricing questions and small talk without an LLM call."""
+        if intent_router is None:
+            return {"route": "llm"}
+        return routed_update(state, intent_router.route(str(state["messages"][-1].content), has_history(state)))
+    
+    async def aroute_query(state: ConversationState):
+        """Async variant of route_query."""
+        if intent_router is None:
+            return {"route": "llm"}
+        route = await intent_router.aroute(str(state["messages"][-1].content), has_history(state))
+        return routed_update(state, route)
+    
+    def next_after_route(state: ConversationState) -> str:
+        if state.get("route") == RETRIEVE:
+            return "tools"
+        if state.get("route") == CHITCHAT:
+            return "generate_response"
+        return "process_query"
     
     # Node 1: Query processing
-    def process_query(state: MessagesState):
+    def speculate(state: ConversationState, config: RunnableConfig) -> Optional[str]:
+        """Thread to speculate retrieval for while the LLM picks tools, if any"""
+        thread_id = _thread_id(config)
+        question = str(state["messages"][-1].content)
+        # Product IDs take the exact-match path, which needs no vector search
+        if speculative_retrieval is None or not speculative_retrieval.on_message or thread_id is None:
+            return None
+        # The answer cache may already be retrieving for this message
+        if exact_id_matches(question, 1) or speculative_retrieval.pending_query(thread_id) == question:
+            return None
+        return thread_id
+    
+    def process_query(state: ConversationState, config: RunnableConfig):
         """Process query and generate tool calls or direct response."""
-        # Normal processing with tools
-        llm_with_tools = llm.bind_tools(tools)
-        response = llm_with_tools.invoke(state["messages"])
+        thread_id = speculate(state, config)
+        if thread_id:
+            speculative_retrieval.start(thread_id, str(state["messages"][-1].content))
+        try:
+            # Normal processing with tools, over the budgeted history only
+            llm_with_tools = llm.bind_tools(tools)
+            response = llm_with_tools.invoke(history_manager.select(state["messages"], state.get("summary", "")))
+        except BaseException:
+            if thread_id:
+                speculative_retrieval.discard(thread_id)
+            raise
+        if thread_id and not response.tool_calls:
+            speculative_retrieval.discard(thread_id)
+        return {"messages": [response]}
+    
+    async def aprocess_query(state: ConversationState, config: RunnableConfig):
+        """Async variant of process_query."""
+        thread_id = speculate(state, config)
+        if thread_id:
+            speculative_retrieval.astart(thread_id, str(state["messages"][-1].content))
+        try:
+            llm_with_tools = llm.bind_tools(tools)
+            response = await llm_with_tools.ainvoke(history_manager.select(state["messages"], state.get("summary", "")))
+        except BaseException:
+            if thread_id:
+                speculative_retrieval.discard(thread_id)
+            raise
+        if thread_id and not response.tool_calls:
+            speculative_retrieval.discard(thread_id)
         return {"messages": [response]}
     
     # Node 2: Tool execution (retrieval)
     tools_node = ToolNode(tools)
     
     # Node 3: Generate response using retrieved content
-    def generate_document_response(state: MessagesState):
-        """Generate response using retrieved document context."""
+    def build_generation_prompt(state: ConversationState):
+        """Build the generation prompt from the retrieved context and conversation."""
         # Get recent tool messages
         recent_tool_messages = []
         for message in reversed(state["messages"]):
@@ -248,34 +1093,33 @@ def setup_conversational_chain(tools):
         
         # Format retrieved content
         if tool_messages:
-            docs_content = "\n\n".join(doc.content for doc in tool_messages)
+            # Snippets of several tool calls are interleaved, deduplicated and kept within the context budget
+            if context_assembler is not None and len(tool_messages) > 1:
+                docs_content = context_assembler.merge([str(doc.content) for doc in tool_messages])
+            else:
+                docs_content = "\n\n".join(doc.content for doc in tool_messages)
             context_prompt = f"""
 **RETRIEVED CATALOG INFORMATION:**
 {docs_content}
 
 **Instructions:** Use this product catalog information to help the customer. Provide specific product recommendations with IDs, pricing for their quantity needs, and relevant features. Calculate total costs when customization is discussed. If you have product information, be specific with names, IDs, and prices. If the catalog doesn't have exactly what they need, suggest the closest alternatives.
 """
+        elif state.get("route") == CHITCHAT:
+            context_prompt = "**Small talk - reply briefly and warmly, and offer to help with headwear products, pricing or customization.**"
         else:
             context_prompt = "**No specific catalog data retrieved - Ask the customer for more details about what they're looking for (style, quantity, budget, features) so you can search the catalog more effectively.**"
         
-        # Filter conversation messages (exclude tool calls)
-        conversation_messages = []
-        for message in state["messages"]:
-            if message.type in ("human", "system"):
-                conversation_messages.append(message)
-            elif message.type == "ai":
-                # Only include AI messages that don't have tool calls
-                try:
-                    if not hasattr(message, 'tool_calls') or not message.tool_calls:
-                        conversation_messages.append(message)
-                except Exception:
-                    # If there's any issue checking tool_calls, include the message
-                    conversation_messages.append(message)
-            # Skip tool messages completely
-        
-        # Create the prompt with system message
-        system_prompt = get_headwear_catalog_system_prompt() + "\n\n" + context_prompt
-        prompt = [SystemMessage(system_prompt)] + conversation_messages
+        # Summary plus earlier human/AI turns within the token budget (tool traffic excluded)
+        earlier, current = history_manager.split_current_turn(state["messages"])
+        history = history_manager.select(earlier, state.get("summary", ""))
+        return generation_prompt(history, context_prompt, current[:1])
+    
+    def generate_document_response(state: ConversationState, config: RunnableConfig):
+        """Generate response using retrieved document context."""
+        # Tools are done with this turn's speculation
+        if speculative_retrieval is not None and _thread_id(config):
+            speculative_retrieval.discard(_thread_id(config))
+        prompt = build_generation_prompt(state)
         
         # Generate response
         try:
@@ -284,56 +1128,292 @@ def setup_conversational_chain(tools):
         except Exception as e:
             print(f"Error generating response: {e}")
             # Return a fallback response
-            fallback_response = AIMessage(content="I'm here to support you, but I'm experiencing some technical difficulties right now. Please try rephrasing your question or contact support if the issue persists.")
-            return {"messages": [fallback_response]}
+            return {"messages": [AIMessage(content=GENERATION_FALLBACK)]}
+    
+    async def agenerate_document_response(state: ConversationState, config: RunnableConfig):
+        """Async variant of generate_document_response."""
+        if speculative_retrieval is not None and _thread_id(config):
+            speculative_retrieval.discard(_thread_id(config))
+        prompt = build_generation_prompt(state)
+        
+        try:
+            response = await llm.ainvoke(prompt)
+            return {"messages": [response]}
+        except Exception as e:
+            print(f"Error generating response: {e}")
+            return {"messages": [AIMessage(content=GENERATION_FALLBACK)]}
     
     # Add nodes to graph
-    graph_builder.add_node("process_query", process_query)
+    # Each LLM node carries a sync and an async implementation so the same graph
+    # serves both stream() (console) and astream() (API)
+    graph_builder.add_node(
+        "route_query",
+        RunnableLambda(route_query, afunc=aroute_query, name="route_query"),
+    )
+    graph_builder.add_node(
+        "process_query",
+        RunnableLambda(process_query, afunc=aprocess_query, name="process_query"),
+    )
     graph_builder.add_node("tools", tools_node)
-    graph_builder.add_node("generate_response", generate_document_response)
+    graph_builder.add_node(
+        "generate_response",
+        RunnableLambda(generate_document_response, afunc=agenerate_document_response, name="generate_response"),
+    )
+    graph_builder.add_node(
+        "summarize_history",
+        RunnableLambda(summarize_history, afunc=asummarize_history, name="summarize_history"),
+    )
     
     # Set entry point and edges
-    graph_builder.set_entry_point("process_query")
+    graph_builder.set_entry_point("route_query")
+    graph_builder.add_conditional_edges(
+        "route_query",
+        next_after_route,
+        {"tools": "tools", "generate_response": "generate_response", "process_query": "process_query"},
+    )
     graph_builder.add_conditional_edges(
         "process_query",
         tools_condition,
-        {END: END, "tools": "tools"},
+        {END: "summarize_history", "tools": "tools"},
     )
     graph_builder.add_edge("tools", "generate_response")
-    graph_builder.add_edge("generate_response", END)
+    graph_builder.add_edge("generate_response", "summarize_history")
+    graph_builder.add_edge("summarize_history", END)
     
     # Compile with user-specific memory
     conversational_graph = graph_builder.compile(checkpointer=memory_saver)
     
     print("✅ Conversational RAG chain with user-specific memory setup complete")
 
+AGENT_SYSTEM_PROMPT = """You are CapAmerica's headwear catalog assistant. Use the tools to look up products, pricing and company information.
+When a question needs several lookups that do not depend on each other, request them all in the same step; they run at the same time.
+Stop calling tools as soon as you have enough information to answer."""
+
+AGENT_FINAL_PROMPT = "Answer the customer now using only the information retrieved so far; do not call tools. If something is still unknown, say what you would need to check."
+
+AGENT_TOOL_TIMEOUT = "The lookup did not finish in time."
+
+class AgentState(ConversationState):
+    """Shares the counselor's messages and summary; adds this turn's budget"""
+    budget: Dict[str, Any]
+
+# Runs sync agent steps so a turn can stop waiting for them at its deadline. Threads
+# cannot be interrupted: a step that times out keeps its worker until the call returns
+# (bounded by LLM_TIMEOUT and the tools' own deadlines), and a timed-out model call is
+# charged to the turn's budget. A step only starts on a free worker, within its own
+# deadline, so stuck calls cannot queue up work behind them. The async path cancels.
+AGENT_STEP_WORKERS = 32
+_agent_step_executor = ThreadPoolExecutor(max_workers=AGENT_STEP_WORKERS, thread_name_prefix="agent-step")
+_agent_step_slots = threading.BoundedSemaphore(AGENT_STEP_WORKERS)
+
+def _run_with_timeout(seconds: float, func, *args):
+    """func(*args) on a free worker thread; TimeoutError after seconds (a running call is left to finish)"""
+    deadline = time.perf_counter() + seconds
+    if seconds <= 0 or not _agent_step_slots.acquire(timeout=seconds):
+        raise TimeoutError
+    try:
+        future = _agent_step_executor.submit(contextvars.copy_context().run, func, *args)
+    except BaseException:
+        _agent_step_slots.release()
+        raise
+    future.add_done_callback(lambda _: _agent_step_slots.release())
+    return future.result(timeout=max(0.0, deadline - time.perf_counter()))
+
+def _agent_turn_budget(state: AgentState) -> Dict[str, Any]:
+    """This turn's budget; turns started without one get the AGENT_* defaults"""
+    return state.get("budget") or AgentBudget.from_env().start()
+
 def setup_agent(tools):
-    """Setup ReAct agent for complex product queries"""
+    """Setup the budgeted tool-calling agent for complex product queries
+    
+    A ReAct loop (LLM picks tools, tools run, repeat) bounded per turn by an
+    AgentBudget: steps, wall-clock seconds and tokens (AGENT_MAX_STEPS,
+    AGENT_MAX_SECONDS, AGENT_MAX_TOKENS, or per request). Tool calls from one
+    step run concurrently. After each tool round the agent stops early when a
+    limit would be exceeded, the context is sufficient (AGENT_CONTEXT_CHUNKS
+    distinct chunks) or nothing new was retrieved; the finalize node then
+    answers from what was retrieved, without tools. Every turn ends in
+    summarize_history, like the counselor's, so agent threads stay bounded.
+    """
     global agent_executor
     
-    # Create agent with user-specific memory
-    agent_executor = create_react_agent(
-        llm, 
-        tools, 
-        checkpointer=memory_saver
+    tools_node = ToolNode(tools)
+    
+    def agent_input(state: AgentState) -> List[Any]:
+        """System prompt, earlier turns within the history token budget, the whole current turn"""
+        earlier, current_turn = history_manager.split_current_turn(state["messages"])
+        return [SystemMessage(AGENT_SYSTEM_PROMPT)] + history_manager.select(earlier, state.get("summary", "")) + current_turn
+    
+    def answered(budget: Dict[str, Any], reason: str) -> Dict[str, Any]:
+        AGENT_STOPS.inc(reason=reason)
+        AGENT_STEPS.observe(budget["steps"])
+        return {**budget, "stopped": reason, "finished": time.time()}
+    
+    def step_update(budget: Dict[str, Any], prompt: List[Any], response: AIMessage, started: float) -> Dict[str, Any]:
+        budget = record_call(budget, prompt, response, time.perf_counter() - started)
+        if not response.tool_calls:
+            budget = answered(budget, ANSWERED)
+        return {"messages": [response], "budget": budget}
+    
+    def step_timed_out(budget: Dict[str, Any], prompt: List[Any], started: float) -> Dict[str, Any]:
+        budget = record_timeout(budget, prompt, time.perf_counter() - started)
+        return {"budget": {**budget, "stopped": MAX_SECONDS}}
+    
+    def call_agent(state: AgentState, config: RunnableConfig):
+        """Let the LLM answer or pick the next tools, within the turn's time."""
+        budget = _agent_turn_budget(state)
+        prompt = agent_input(state)
+        started = time.perf_counter()
+        try:
+            response = _run_with_timeout(step_seconds(budget), llm.bind_tools(tools, parallel_tool_calls=True).invoke,
+                                         prompt, config)
+        except TimeoutError:
+            return step_timed_out(budget, prompt, started)
+        return step_update(budget, prompt, response, started)
+    
+    async def acall_agent(state: AgentState, config: RunnableConfig):
+        """Async variant of call_agent."""
+        budget = _agent_turn_budget(state)
+        prompt = agent_input(state)
+        started = time.perf_counter()
+        try:
+            response = await asyncio.wait_for(
+                llm.bind_tools(tools, parallel_tool_calls=True).ainvoke(prompt, config), step_seconds(budget),
+            )
+        except TimeoutError:
+            return step_timed_out(budget, prompt, started)
+        return step_update(budget, prompt, response, started)
+    
+    def tools_update(state: AgentState, result: Dict[str, Any]) -> Dict[str, Any]:
+        next_prompt = agent_input(state) + result["messages"]
+        budget = record_context(_agent_turn_budget(state), result["messages"], next_prompt)
+        return {**result, "budget": {**budget, "stopped": stop_reason(budget)}}
+    
+    def tools_timed_out(state: AgentState) -> Dict[str, Any]:
+        """Every pending tool call answered with a timeout, and the turn sent to the final answer"""
+        calls = state["messages"][-1].tool_calls
+        messages = [ToolMessage(AGENT_TOOL_TIMEOUT, tool_call_id=call["id"], name=call["name"]) for call in calls]
+        return {"messages": messages, "budget": {**_agent_turn_budget(state), "stopped": MAX_SECONDS}}
+    
+    def run_tools(state: AgentState, config: RunnableConfig):
+        """Run this step's tool calls (concurrently) within the turn's time and check the budget."""
+        try:
+            result = _run_with_timeout(step_seconds(_agent_turn_budget(state)), tools_node.invoke, state, config)
+        except TimeoutError:
+            return tools_timed_out(state)
+        return tools_update(state, result)
+    
+    async def arun_tools(state: AgentState, config: RunnableConfig):
+        """Async variant of run_tools."""
+        try:
+            result = await asyncio.wait_for(tools_node.ainvoke(state, config), step_seconds(_agent_turn_budget(state)))
+        except TimeoutError:
+            return tools_timed_out(state)
+        return tools_update(state, result)
+    
+    def best_answer_so_far(state: AgentState) -> AIMessage:
+        """The last answer-like text of this turn when the final call fails"""
+        _, current_turn = history_manager.split_current_turn(state["messages"])
+        for message in reversed(current_turn):
+            if message.type == "ai" and message.content:
+                return AIMessage(content=message.content)
+        return AIMessage(content=GENERATION_FALLBACK)
+    
+    def final_prompt(state: AgentState) -> List[Any]:
+        return agent_input(state) + [SystemMessage(AGENT_FINAL_PROMPT)]
+    
+    def finalize(state: AgentState, config: RunnableConfig):
+        """Answer from the retrieved context once the budget or the context says stop."""
+        budget = _agent_turn_budget(state)
+        prompt = final_prompt(state)
+        started = time.perf_counter()
+        try:
+            response = _run_with_timeout(remaining_seconds(budget), llm.invoke, prompt, config)
+            budget = record_call(budget, prompt, response, time.perf_counter() - started, step=False)
+        except TimeoutError:
+            print("Agent answer timed out")
+            budget = record_timeout(budget, prompt, time.perf_counter() - started, step=False)
+            response = best_answer_so_far(state)
+        except Exception as e:
+            print(f"Error generating agent answer: {e!r}")
+            response = best_answer_so_far(state)
+        return {"messages": [response], "budget": answered(budget, budget["stopped"])}
+    
+    async def afinalize(state: AgentState, config: RunnableConfig):
+        """Async variant of finalize."""
+        budget = _agent_turn_budget(state)
+        prompt = final_prompt(state)
+        started = time.perf_counter()
+        try:
+            response = await asyncio.wait_for(llm.ainvoke(prompt, config), remaining_seconds(budget))
+            budget = record_call(budget, prompt, response, time.perf_counter() - started, step=False)
+        except TimeoutError:
+            print("Agent answer timed out")
+            budget = record_timeout(budget, prompt, time.perf_counter() - started, step=False)
+            response = best_answer_so_far(state)
+        except Exception as e:
+            print(f"Error generating agent answer: {e!r}")
+            response = best_answer_so_far(state)
+        return {"messages": [response], "budget": answered(budget, budget["stopped"])}
+    
+    def next_after_agent(state: AgentState) -> str:
+        if state["budget"].get("stopped") == MAX_SECONDS:
+            return "finalize"
+        return tools_condition(state)
+    
+    def next_after_tools(state: AgentState) -> str:
+        return "finalize" if state["budget"].get("stopped") else "agent"
+    
+    graph_builder = StateGraph(AgentState)
+    graph_builder.add_node("agent", RunnableLambda(call_agent, afunc=acall_agent, name="agent"))
+    graph_builder.add_node("tools", RunnableLambda(run_tools, afunc=arun_tools, name="tools"))
+    graph_builder.add_node("finalize", RunnableLambda(finalize, afunc=afinalize, name="finalize"))
+    graph_builder.add_node(
+        "summarize_history",
+        RunnableLambda(summarize_history, afunc=asummarize_history, name="summarize_history"),
     )
+    graph_builder.set_entry_point("agent")
+    graph_builder.add_conditional_edges(
+        "agent", next_after_agent, {END: "summarize_history", "tools": "tools", "finalize": "finalize"},
+    )
+    graph_builder.add_conditional_edges("tools", next_after_tools, {"agent": "agent", "finalize": "finalize"})
+    # Answered turns fold older history into the summary, as in the counselor graph
+    graph_builder.add_edge("finalize", "summarize_history")
+    graph_builder.add_edge("summarize_history", END)
+    
+    # Same checkpointer as the counselor graph: one conversation per user
+    agent_executor = graph_builder.compile(checkpointer=memory_saver)
     print("✅ Headwear Catalog agent setup complete")
 
 def initialize_rag_system(csv_index_name: str = "cap-website-data",
                          pdf_index_name: str = "cap-rag-index",
-                         model_name: str = "gpt-4o-mini"):
-    """Initialize the complete RAG system"""
+                         model_name: str = "gpt-4o-mini",
+                         vector_backend: Optional[str] = None,
+                         model_backend: Optional[str] = None):
+    """Initialize the complete RAG system
+    
+    vector_backend selects "pinecone", "faiss" or "fake" (default: $VECTOR_BACKEND or pinecone);
+    model_backend selects "openai" or "fake" (default: $MODEL_BACKEND or openai)
+    """
     print("🚀 Initializing CapAmerica Headwear Catalog System...")
     
     # Initialize models
-    initialize_models(model_name)
+    initialize_models(model_name, model_backend)
+    
+    # Setup vector store connections
+    setup_vector_stores(vector_backend, csv_index_name, pdf_index_name)
     
-    # Setup Pinecone connections
-    setup_pinecone_connections(csv_index_name, pdf_index_name)
+    # Lexical indexes for hybrid search
+    setup_hybrid_retrievers()
     
     # Create retrieval tools
     tools = create_retrieval_tools()
     
+    # Exact lookup and pricing tools over the structured catalog
+    setup_product_index()
+    if product_index is not None:
+        tools += create_catalog_tools()
+    
     # Setup conversational chain
     setup_conversational_chain(tools)
     
@@ -342,17 +1422,96 @@ def initialize_rag_system(csv_index_name: str = "cap-website-data",
     
     print("✅ CapAmerica Headwear Catalog System ready to help customers!")
 
-def get_user_config(user_id: str) -> Dict[str, Any]:
-    """Get configuration for user-specific memory thread"""
-    return {"configurable": {"thread_id": f"user_{user_id}"}}
+def get_embedding_cache_stats() -> Dict[str, float]:
+    """Hit/miss counters of the shared query-embedding cache"""
+    if isinstance(embeddings, CachedEmbeddings):
+        return embeddings.stats()
+    return {}
+
+def get_metrics_stats() -> Dict[str, Dict[str, Any]]:
+    """Stats of every component that keeps counters, keyed by component"""
+    components = {
+        "embedding_cache": get_embedding_cache_stats(),
+        "answer_cache": get_answer_cache_stats(),
+        "intent_router": get_router_stats(),
+        "speculative_retrieval": get_speculation_stats(),
+        "request_coalescing": get_coalescing_stats(),
+    }
+    if hasattr(memory_saver, "stats"):
+        components["checkpointer"] = memory_saver.stats()
+    if thread_locks is not None:
+        components["thread_locks"] = {"contended": thread_locks.contended, "discarded": thread_locks.discarded}
+    for source, store in (("csv", csv_vector_store), ("pdf", pdf_vector_store)):
+        if hasattr(store, "stats"):
+            components[f"vector_store_{source}"] = store.stats()
+    return components
+
+def _component_samples():
+    """Numeric component stats (cache hit rates, counters) as gauges for /metrics"""
+    for component, stats in get_metrics_stats().items():
+        for stat, value in stats.items():
+            if isinstance(value, (int, float)):
+                yield "rag_component_stat", {"component": component, "stat": stat}, value
+
+REGISTRY.register_collector("rag_component_stat", "Cache hit rates and counters of RAG components", _component_samples)
+
+def render_metrics() -> str:
+    """Prometheus text exposition of all metrics, for GET /metrics"""
+    return REGISTRY.render()
+
+def get_user_config(user_id: str, usage: Optional[TokenUsageCallbackHandler] = None) -> Dict[str, Any]:
+    """Get configuration for user-specific memory thread; usage, if given, counts the turn's LLM tokens"""
+    config = {"configurable": {"thread_id": f"user_{user_id}"}}
+    callbacks = []
+    # Node, LLM and tool timings; METRICS=0 turns the callback off
+    if os.getenv("METRICS", "1") == "1":
+        callbacks.append(MetricsCallbackHandler())
+    if usage is not None:
+        callbacks.append(usage)
+    if callbacks:
+        config["callbacks"] = callbacks
+    return config
+
+@contextmanager
+def conversation_lock(user_id: str) -> Iterator[None]:
+    """Serialize turns for one user across threads and worker processes"""
+    if thread_locks is None:
+        yield
+        return
+    waiting = time.perf_counter()
+    with thread_locks.hold(get_user_config(user_id)["configurable"]["thread_id"]):
+        observe_stage("lock_wait", time.perf_counter() - waiting)
+        yield
+
+@asynccontextmanager
+async def aconversation_lock(user_id: str) -> AsyncIterator[None]:
+    """Async variant of conversation_lock"""
+    if thread_locks is None:
+        yield
+        return
+    waiting = time.perf_counter()
+    async with thread_locks.ahold(get_user_config(user_id)["configurable"]["thread_id"]):
+        observe_stage("lock_wait", time.perf_counter() - waiting)
+        yield
+
+# Which data source each retrieval tool reads from
+TOOL_DATA_SOURCES = {
+    "retrieve_csv_data": "csv",
+    "retrieve_product_catalog": "pdf",
+    "lookup_products": "pdf",
+    "calculate_price": "pdf",
+}
+
+# Graph nodes whose LLM output is the customer-facing answer
+ANSWER_NODES = ("generate_response", "agent", "finalize")
 
 def detect_data_source_from_response(response_content: str) -> str:
     """Detect which data source was used based on the response content"""
     if not response_content:
         return "none"
     
-    has_csv = "Data Source: CSV" in response_content
-    has_pdf = "Data Source: PDF" in response_content
+    has_csv = "Data Source: CSV" in response_content or "Data Source: Website/CSV" in response_content
+    has_pdf = "Data Source: PDF" in response_content or "Data Source: Product Catalog" in response_content
     
     if has_csv and has_pdf:
         return "both"
@@ -363,123 +1522,574 @@ def detect_data_source_from_response(response_content: str) -> str:
     else:
         return "none"
 
-def get_response(message: str, user_id: str, use_agent: bool = False) -> Dict[str, Any]:
+def current_turn_messages(messages: List[Any]) -> List[Any]:
+    """Messages produced since the most recent user message in a thread"""
+    for i in range(len(messages) - 1, -1, -1):
+        if getattr(messages[i], "type", None) == "human":
+            return messages[i + 1:]
+    return list(messages)
+
+def detect_data_source_from_documents(artifact: Any) -> str:
+    """Data source of fan-out results from the data_source their documents are tagged with"""
+    if not isinstance(artifact, list):
+        return "none"
+    sources = {doc.metadata.get("data_source") for doc in artifact if isinstance(doc, Document)}
+    sources &= {"csv", "pdf"}
+    if len(sources) > 1:
+        return "both"
+    return sources.pop() if sources else "none"
+
+def detect_data_source_from_messages(messages: List[Any]) -> str:
+    """Detect which data sources the tool messages in a turn drew on"""
+    data_sources_used = set()
+    try:
+        for msg in messages:
+            if getattr(msg, "type", None) != "tool":
+                continue
+            source = TOOL_DATA_SOURCES.get(getattr(msg, "name", None))
+            if source is None:
+                source = detect_data_source_from_documents(getattr(msg, "artifact", None))
+            if source == "none":
+                source = detect_data_source_from_response(str(msg.content or ""))
+            if source == "both":
+                data_sources_used.update(("csv", "pdf"))
+            elif source != "none":
+                data_sources_used.add(source)
+    except Exception as e:
+        print(f"Warning: Error analyzing data sources: {e}")
+        # Continue without data source info
+    
+    if len(data_sources_used) > 1:
+        return "both"
+    elif "csv" in data_sources_used:
+        return "csv"
+    elif "pdf" in data_sources_used:
+        return "pdf"
+    return "none"
+
+def _turn_input(message: str, use_agent: bool, budget: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    """Graph input for a turn; agent turns start a fresh budget, per-request limits overriding AGENT_*"""
+    turn = {"messages": [{"role": "user", "content": message}]}
+    if use_agent:
+        turn["budget"] = AgentBudget.from_env(**(budget or {})).start()
+    return turn
+
+def _new_response_data(message: str, user_id: str, use_agent: bool,
+                       usage: Optional[TokenUsageCallbackHandler] = None) -> Dict[str, Any]:
+    """Create the response payload skeleton shared by sync and async paths
+    
+    "usage" is the live counter of the turn's LLM calls and tokens, complete once the turn ends.
+    """
+    return {
+        "user_id": user_id,
+        "query": message,
+        "response": "",
+        "mode": "agent" if use_agent else "counselor",
+        "data_source": "none",
+        "timestamp": time.time(),
+        "status_code": 200,
+        "usage": usage.usage if usage is not None else None,
+    }
+
+def _error_response_data(message: str, user_id: str, error: Exception) -> Dict[str, Any]:
+    """Response payload for unexpected errors"""
+    return {
+        "user_id": user_id,
+        "query": message,
+        "response": f"I apologize, but I encountered an error while processing your message. Please try again. If the problem persists, please contact support.",
+        "error": str(error),
+        "mode": "error",
+        "data_source": "none",
+        "timestamp": time.time(),
+        "status_code": 500
+    }
+
+def _stream_error_response_data(response_data: Dict[str, Any], stream_error: Exception) -> Dict[str, Any]:
+    """Mark a response payload as failed during graph streaming"""
+    print(f"Error in conversation stream: {stream_error}")
+    response_data["response"] = "I'm experiencing some technical difficulties. Please try again or rephrase your question."
+    response_data["data_source"] = "none"
+    response_data["status_code"] = 500
+    return response_data
+
+def _finalize_response_data(response_data: Dict[str, Any], last_state: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+    """Fill in response text and data source from the final graph state"""
+    all_messages = []
+    if last_state:
+        if "messages" in last_state and last_state["messages"]:
+            response_data["response"] = last_state["messages"][-1].content
+        all_messages = last_state.get("messages", [])
+    
+    response_data["data_source"] = detect_data_source_from_messages(current_turn_messages(all_messages))
+    if last_state and last_state.get("budget") and response_data["mode"] == "agent":
+        response_data["budget"] = budget_usage(last_state["budget"])
+    
+    # Fallback response if no response generated
+    if not response_data["response"]:
+        response_data["response"] = "I'm here to help, but I'm having trouble processing your message right now. Could you please try rephrasing your question?"
+        response_data["data_source"] = "none"
+    
+    return response_data
+
+# Node a cached turn is recorded as, so the thread ends up where a real turn would
+CACHED_TURN_NODES = {"counselor": "summarize_history", "agent": "summarize_history"}
+
+def _cacheable(values: Dict[str, Any]) -> bool:
+    """Only the first turn of a conversation is context-free enough to share answers"""
+    return answer_cache is not None and not values.get("messages") and not values.get("summary")
+
+def _cached_turn(response_data: Dict[str, Any], entry) -> Tuple[Dict[str, Any], Dict[str, Any]]:
+    """(response payload, state update recording the turn) for a cache hit"""
+    response_data["response"] = entry.response
+    response_data["data_source"] = entry.data_source
+    update = {"messages": [HumanMessage(response_data["query"]), AIMessage(entry.response)]}
+    return response_data, update
+
+def _store_answer(response_data: Dict[str, Any], key: Dict[str, Any], fingerprint: str, started: float):
+    """Cache a freshly generated first-turn answer if it was grounded in retrieval"""
+    if (response_data["status_code"] != 200 or response_data["data_source"] == "none"
+            or response_data["response"] == GENERATION_FALLBACK):
+        return
+    answer_cache.put(
+        response_data["query"], key["vector"], fingerprint, key["version"], key["mode"],
+        response_data["response"], response_data["data_source"], time.perf_counter() - started,
+    )
+
+def lookup_answer(graph, config: Dict[str, Any], response_data: Dict[str, Any]):
+    """Consult the answer cache before running the graph
+    
+    Returns ("hit", entry), ("miss", key) with what is needed to store the
+    answer afterwards, or (None, None) when the turn is not cacheable. The
+    fingerprint's retrieval is the turn's own (see start_fingerprint).
+    """
+    key = None
+    try:
+        if not _cacheable(graph.get_state(config).values):
+            return None, None
+        started = time.perf_counter()
+        query = response_data["query"]
+        key = {"query": query, "vector": embeddings.embed_query(query), "version": catalog_version(),
+               "mode": response_data["mode"]}
+        start_fingerprint(query, config, key)
+        entry = answer_cache.candidate(key["vector"], key["version"], key["mode"])
+        if entry is None:
+            return "miss", key
+        fingerprint = key_fingerprint(key)
+        if fingerprint is not None and answer_cache.confirm(entry, fingerprint, time.perf_counter() - started):
+            release_fingerprint(config, key)
+            return "hit", entry
+        return "miss", key
+    except Exception as e:
+        print(f"⚠️ Answer cache lookup failed: {e}")
+        release_fingerprint(config, key)
+        return None, None
+
+async def alookup_answer(graph, config: Dict[str, Any], response_data: Dict[str, Any]):
+    """Async variant of lookup_answer
+    
+    On a miss without a candidate the fingerprint's retrieval, if one was
+    started, keeps running as the turn's speculation, overlapping the graph run.
+    """
+    key = None
+    try:
+        if not _cacheable((await graph.aget_state(config)).values):
+            return None, None
+        started = time.perf_counter()
+        query = response_data["query"]
+        key = {"query": query, "vector": await embeddings.aembed_query(query), "version": catalog_version(),
+               "mode": response_data["mode"]}
+        start_fingerprint(query, config, key, run_async=True)
+        entry = answer_cache.candidate(key["vector"], key["version"], key["mode"])
+        if entry is None:
+            return "miss", key
+        fingerprint = await akey_fingerprint(key)
+        if fingerprint is not None and answer_cache.confirm(entry, fingerprint, time.perf_counter() - started):
+            release_fingerprint(config, key)
+            return "hit", entry
+        return "miss", key
+    except Exception as e:
+        print(f"⚠️ Answer cache lookup failed: {e}")
+        release_fingerprint(config, key)
+        return None, None
+
+_answer_store_executor = ThreadPoolExecutor(max_workers=4, thread_name_prefix="answer-store")
+
+def remember_answer(response_data: Dict[str, Any], config: Dict[str, Any], key: Dict[str, Any], started: float):
+    """Cache the answer of a first-turn miss
+
+    Without a speculation to read the fingerprint from, its search runs on a
+    worker after the response is returned instead of delaying it.
+    """
+    response_data = dict(response_data)
+
+    def store():
+        try:
+            fingerprint = key_fingerprint(key)
+            if fingerprint is not None:
+                _store_answer(response_data, key, fingerprint, started)
+        except Exception as e:
+            print(f"⚠️ Answer cache store failed: {e}")
+        finally:
+            release_fingerprint(config, key)
+
+    if "fingerprint" in key or "speculation" in key:
+        store()
+    else:
+        _answer_store_executor.submit(store)
+
+async def aremember_answer(response_data: Dict[str, Any], config: Dict[str, Any], key: Dict[str, Any], started: float):
+    """Async variant of remember_answer"""
+    if "fingerprint" not in key and "speculation" not in key:
+        remember_answer(response_data, config, key, started)
+        return
+    try:
+        fingerprint = await akey_fingerprint(key)
+        if fingerprint is not None:
+            _store_answer(response_data, key, fingerprint, started)
+    except Exception as e:
+        print(f"⚠️ Answer cache store failed: {e}")
+    finally:
+        release_fingerprint(config, key)
+
+def release_fingerprint(config: Dict[str, Any], key: Optional[Dict[str, Any]]) -> None:
+    """Drop the lookup's speculation if the turn did not already (agent turns, hits, errors)"""
+    if key and "speculation" in key and speculative_retrieval is not None:
+        if speculative_retrieval.pending_query(_thread_id(config)) == key["speculation"].query:
+            speculative_retrieval.discard(_thread_id(config))
+
+def _coalescing_key(message: str, user_id: str, use_agent: bool, budget: Optional[Dict[str, Any]],
+                    include_timings: bool) -> Tuple[Any, ...]:
+    # Identical turns for the same conversation, mode and options share one execution
+    limits = tuple(sorted(budget.items())) if budget else ()
+    return (get_user_config(user_id)["configurable"]["thread_id"], normalize_text(message), use_agent,
+            limits, include_timings)
+
+def thread_checkpoint_id(user_id: str) -> Optional[str]:
+    """ID of the conversation's latest checkpoint; changes with every turn"""
+    saved = memory_saver.get_tuple({"configurable": {"thread_id": get_user_config(user_id)["configurable"]["thread_id"]}})
+    return saved.config["configurable"].get("checkpoint_id") if saved else None
+
+async def athread_checkpoint_id(user_id: str) -> Optional[str]:
+    """Async variant of thread_checkpoint_id"""
+    saved = await memory_saver.aget_tuple({"configurable": {"thread_id": get_user_config(user_id)["configurable"]["thread_id"]}})
+    return saved.config["configurable"].get("checkpoint_id") if saved else None
+
+def _reusable_response(response_data: Dict[str, Any]) -> bool:
+    """Failed turns are shared with requests already waiting, but not with later ones"""
+    return response_data["status_code"] == 200
+
+def _record_request(response_data: Dict[str, Any], timings: Dict[str, float], started: float,
+                    include_timings: bool) -> Dict[str, Any]:
+    """Observe the turn's end-to-end latency and optionally attach its stage timings"""
+    elapsed = time.perf_counter() - started
+    REQUEST_SECONDS.observe(elapsed, mode=response_data["mode"], status=str(response_data["status_code"]))
+    if include_timings:
+        response_data["timings"] = {**timings, "total": round(elapsed * 1000, 3)}
+    return response_data
+
+def get_response(message: str, user_id: str, use_agent: bool = False, include_timings: bool = False,
+                 budget: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
     """
     Get response for API endpoint with user-specific memory
     
+    Blocking variant; the API uses aget_response so a slow turn does not stall
+    the event loop.
+    
+    Turns for one user run one at a time (conversation_lock); an identical
+    request for the same user that arrives while one is running, or within
+    COALESCE_WINDOW seconds of it finishing with no turn since, gets that
+    turn's result instead of running again.
+    
     Args:
         message: User's message
         user_id: Unique user identifier for conversation threading
         use_agent: Whether to use agent mode for complex queries
+        include_timings: Add per-stage latencies (ms) under "timings"
+        budget: Agent mode limits overriding AGENT_* (max_steps, max_seconds, max_tokens,
+            context_chunks); usage is reported under "budget"
         
     Returns:
-        Dict with response data including data source information
+        Dict with response data including data source information and the
+        turn's LLM calls and prompt/cached/completion tokens under "usage"
     """
+    started = time.perf_counter()
+    with collect_timings() as timings:
+        if request_coalescer is None:
+            response_data = _get_response(message, user_id, use_agent, budget)
+        else:
+            def execute():
+                turn = {}
+                return _get_response(message, user_id, use_agent, budget, turn), turn.get("checkpoint_id")
+            
+            response_data = request_coalescer.run(
+                _coalescing_key(message, user_id, use_agent, budget, include_timings),
+                execute,
+                _reusable_response,
+                version=lambda: thread_checkpoint_id(user_id),
+            )
+    return _record_request(response_data, timings, started, include_timings)
+
+def _get_response(message: str, user_id: str, use_agent: bool, budget: Optional[Dict[str, Any]] = None,
+                  turn: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    """One turn; turn, if given, gets the checkpoint ID the turn left the thread at (for coalescing)"""
     try:
-        config = get_user_config(user_id)
+        usage = TokenUsageCallbackHandler()
+        config = get_user_config(user_id, usage)
+        response_data = _new_response_data(message, user_id, use_agent, usage)
+        graph = agent_executor if use_agent else conversational_graph
         
-        response_data = {
-            "user_id": user_id,
-            "query": message,
-            "response": "",
-            "mode": "agent" if use_agent else "counselor",
-            "data_source": "none",
-            "timestamp": time.time(),
-            "status_code": 200
-        }
-        
-        # Store all messages to analyze data sources
-        all_messages = []
-        
-        # Choose between conversational chain or agent
+        # Only the final state is needed to build the response
+        started = time.perf_counter()
+        outcome, cached = None, None
+        last_state = None
         try:
-            if use_agent:
-                # Agent mode
-                events = list(agent_executor.stream(
-                    {"messages": [{"role": "user", "content": message}]},
-                    stream_mode="values",
-                    config=config,
-                ))
-                if events:
-                    last_event = events[-1]
-                    if "messages" in last_event and last_event["messages"]:
-                        response_data["response"] = last_event["messages"][-1].content
-                    all_messages = last_event.get("messages", [])
-            else:
-                # Counselor mode
-                steps = list(conversational_graph.stream(
-                    {"messages": [{"role": "user", "content": message}]},
+            with conversation_lock(user_id):
+                # Repeated first-turn questions are answered from the cache
+                with timed(STAGE_SECONDS, "answer_cache", stage="answer_cache"):
+                    outcome, cached = lookup_answer(graph, config, response_data)
+                if outcome == "hit":
+                    response_data, update = _cached_turn(response_data, cached)
+                    graph.update_state(config, update, as_node=CACHED_TURN_NODES[response_data["mode"]])
+                    if turn is not None:
+                        turn["checkpoint_id"] = thread_checkpoint_id(user_id)
+                    return response_data
+                for last_state in graph.stream(
+                    _turn_input(message, use_agent, budget),
                     stream_mode="values",
                     config=config,
-                ))
-                if steps:
-                    last_step = steps[-1]
-                    if "messages" in last_step and last_step["messages"]:
-                        response_data["response"] = last_step["messages"][-1].content
-                    all_messages = last_step.get("messages", [])
+                ):
+                    pass
+                # Still under the lock: no other turn can have advanced the thread
+                if turn is not None:
+                    turn["checkpoint_id"] = thread_checkpoint_id(user_id)
         except Exception as stream_error:
-            print(f"Error in conversation stream: {stream_error}")
-            response_data["response"] = "I'm experiencing some technical difficulties. Please try again or rephrase your question."
-            response_data["data_source"] = "none"
-            response_data["status_code"] = 500
-            return response_data
+            if outcome == "miss":
+                release_fingerprint(config, cached)
+            return _stream_error_response_data(response_data, stream_error)
         
-        # Analyze data sources from tool messages
-        data_sources_used = set()
-        try:
-            for msg in all_messages:
-                if hasattr(msg, 'type') and msg.type == "tool":
-                    if hasattr(msg, 'content') and msg.content:
-                        content = str(msg.content)
-                        if "Data Source: CSV" in content:
-                            data_sources_used.add("csv")
-                        if "Data Source: PDF" in content:
-                            data_sources_used.add("pdf")
-        except Exception as e:
-            print(f"Warning: Error analyzing data sources: {e}")
-            # Continue without data source info
+        response_data = _finalize_response_data(response_data, last_state)
+        if outcome == "miss":
+            remember_answer(response_data, config, cached, started)
+        return response_data
+        
+    except Exception as e:
+        return _error_response_data(message, user_id, e)
+
+async def aget_response(message: str, user_id: str, use_agent: bool = False, include_timings: bool = False,
+                        budget: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    """
+    Async variant of get_response used by the API
+    
+    Runs the graph with astream so LLM, embedding and vector-store calls
+    yield to the event loop instead of blocking the worker.
+    
+    Args:
+        message: User's message
+        user_id: Unique user identifier for conversation threading
+        use_agent: Whether to use agent mode for complex queries
+        include_timings: Add per-stage latencies (ms) under "timings"
+        budget: Agent mode limits overriding AGENT_* (see get_response)
         
-        # Determine data source
-        if len(data_sources_used) > 1:
-            response_data["data_source"] = "both"
-        elif "csv" in data_sources_used:
-            response_data["data_source"] = "csv"
-        elif "pdf" in data_sources_used:
-            response_data["data_source"] = "pdf"
+    Returns:
+        Dict with response data including data source information and the
+        turn's LLM calls and prompt/cached/completion tokens under "usage"
+    """
+    started = time.perf_counter()
+    with collect_timings() as timings:
+        if request_coalescer is None:
+            response_data = await _aget_response(message, user_id, use_agent, budget)
         else:
-            response_data["data_source"] = "none"
+            async def execute():
+                turn = {}
+                return await _aget_response(message, user_id, use_agent, budget, turn), turn.get("checkpoint_id")
+            
+            response_data = await request_coalescer.arun(
+                _coalescing_key(message, user_id, use_agent, budget, include_timings),
+                execute,
+                _reusable_response,
+                version=lambda: athread_checkpoint_id(user_id),
+            )
+    return _record_request(response_data, timings, started, include_timings)
+
+async def _aget_response(message: str, user_id: str, use_agent: bool, budget: Optional[Dict[str, Any]] = None,
+                         turn: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    """Async variant of _get_response"""
+    try:
+        usage = TokenUsageCallbackHandler()
+        config = get_user_config(user_id, usage)
+        response_data = _new_response_data(message, user_id, use_agent, usage)
+        graph = agent_executor if use_agent else conversational_graph
         
-        # Fallback response if no response generated
-        if not response_data["response"]:
-            response_data["response"] = "I'm here to help, but I'm having trouble processing your message right now. Could you please try rephrasing your question?"
-            response_data["data_source"] = "none"
+        started = time.perf_counter()
+        outcome, cached = None, None
+        last_state = None
+        try:
+            async with aconversation_lock(user_id):
+                with timed(STAGE_SECONDS, "answer_cache", stage="answer_cache"):
+                    outcome, cached = await alookup_answer(graph, config, response_data)
+                if outcome == "hit":
+                    response_data, update = _cached_turn(response_data, cached)
+                    await graph.aupdate_state(config, update, as_node=CACHED_TURN_NODES[response_data["mode"]])
+                    if turn is not None:
+                        turn["checkpoint_id"] = await athread_checkpoint_id(user_id)
+                    return response_data
+                async for last_state in graph.astream(
+                    _turn_input(message, use_agent, budget),
+                    stream_mode="values",
+                    config=config,
+                ):
+                    pass
+                # Still under the lock: no other turn can have advanced the thread
+                if turn is not None:
+                    turn["checkpoint_id"] = await athread_checkpoint_id(user_id)
+        except Exception as stream_error:
+            if outcome == "miss":
+                release_fingerprint(config, cached)
+            return _stream_error_response_data(response_data, stream_error)
         
+        response_data = _finalize_response_data(response_data, last_state)
+        if outcome == "miss":
+            await aremember_answer(response_data, config, cached, started)
         return response_data
         
     except Exception as e:
+        return _error_response_data(message, user_id, e)
+
+def _update_messages(update_chunk: Dict[str, Any]) -> List[Any]:
+    """Messages written by the nodes in one "updates" stream chunk"""
+    messages = []
+    for update in update_chunk.values():
+        if isinstance(update, dict):
+            messages.extend(update.get("messages", []))
+    return messages
+
+def _update_budget(update_chunk: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    """Agent budget written by the nodes in one "updates" stream chunk, if any"""
+    for update in update_chunk.values():
+        if isinstance(update, dict) and update.get("budget"):
+            return update["budget"]
+    return None
+
+def _stream_event(mode: str, chunk: Any) -> Optional[Dict[str, Any]]:
+    """Translate one item of a ["messages", "updates"] graph stream into a client event"""
+    if mode == "messages":
+        message_chunk, metadata = chunk
+        if (metadata.get("langgraph_node") in ANSWER_NODES
+                and message_chunk.content
+                and not getattr(message_chunk, "tool_call_chunks", None)):
+            return {"event": "token", "content": message_chunk.content}
+        return None
+    
+    messages = _update_messages(chunk)
+    tool_calls = [call for msg in messages for call in (getattr(msg, "tool_calls", None) or [])]
+    if tool_calls:
         return {
-            "user_id": user_id,
-            "query": message,
-            "response": f"I apologize, but I encountered an error while processing your message. Please try again. If the problem persists, please contact support.",
-            "error": str(e),
-            "mode": "error",
-            "data_source": "none",
-            "timestamp": time.time(),
-            "status_code": 500
+            "event": "status",
+            "stage": "retrieving",
+            "tools": [call["name"] for call in tool_calls],
         }
+    tool_messages = [msg for msg in messages if getattr(msg, "type", None) == "tool"]
+    if tool_messages:
+        return {
+            "event": "status",
+            "stage": "retrieved",
+            "tools": [msg.name for msg in tool_messages],
+            "documents": sum(len(msg.artifact or []) for msg in tool_messages),
+        }
+    return None
+
+def stream_response(message: str, user_id: str, use_agent: bool = False,
+                    budget: Optional[Dict[str, Any]] = None) -> Iterator[Dict[str, Any]]:
+    """
+    Stream a turn as events: LLM tokens as they are generated, retrieval status
+    updates, and a final "done" event carrying the full response payload
+    
+    Event shapes:
+        {"event": "status", "stage": "retrieving" | "retrieved", "tools": [...], ...}
+        {"event": "token", "content": "..."}
+        {"event": "done" | "error", **response_data}
+    """
+    usage = TokenUsageCallbackHandler()
+    response_data = _new_response_data(message, user_id, use_agent, usage)
+    graph = agent_executor if use_agent else conversational_graph
+    turn_messages, turn_budget = [], None
+    started = time.perf_counter()
+    try:
+        with conversation_lock(user_id):
+            for mode, chunk in graph.stream(
+                _turn_input(message, use_agent, budget),
+                stream_mode=["messages", "updates"],
+                config=get_user_config(user_id, usage),
+            ):
+                if mode == "updates":
+                    turn_messages.extend(_update_messages(chunk))
+                    turn_budget = _update_budget(chunk) or turn_budget
+                event = _stream_event(mode, chunk)
+                if event:
+                    yield event
+    except Exception as stream_error:
+        response_data = _stream_error_response_data(response_data, stream_error)
+        yield {"event": "error", **_record_request(response_data, {}, started, False)}
+        return
+    
+    response_data = _finalize_response_data(response_data, {"messages": turn_messages, "budget": turn_budget})
+    yield {"event": "done", **_record_request(response_data, {}, started, False)}
 
-def chat_interactive(message: str, user_id: str, use_agent: bool = False):
-    """Interactive chat interface for console use"""
+async def astream_response(message: str, user_id: str, use_agent: bool = False,
+                           budget: Optional[Dict[str, Any]] = None) -> AsyncIterator[Dict[str, Any]]:
+    """Async variant of stream_response used by the /chat/stream endpoint"""
+    usage = TokenUsageCallbackHandler()
+    response_data = _new_response_data(message, user_id, use_agent, usage)
+    graph = agent_executor if use_agent else conversational_graph
+    turn_messages, turn_budget = [], None
+    started = time.perf_counter()
+    try:
+        async with aconversation_lock(user_id):
+            async for mode, chunk in graph.astream(
+                _turn_input(message, use_agent, budget),
+                stream_mode=["messages", "updates"],
+                config=get_user_config(user_id, usage),
+            ):
+                if mode == "updates":
+                    turn_messages.extend(_update_messages(chunk))
+                    turn_budget = _update_budget(chunk) or turn_budget
+                event = _stream_event(mode, chunk)
+                if event:
+                    yield event
+    except Exception as stream_error:
+        response_data = _stream_error_response_data(response_data, stream_error)
+        yield {"event": "error", **_record_request(response_data, {}, started, False)}
+        return
+    
+    response_data = _finalize_response_data(response_data, {"messages": turn_messages, "budget": turn_budget})
+    yield {"event": "done", **_record_request(response_data, {}, started, False)}
+
+def chat_interactive(message: str, user_id: str, use_agent: bool = False, stream: bool = False):
+    """Interactive chat interface for console use
+    
+    With stream=True the answer is printed token by token as it is generated.
+    """
     config = get_user_config(user_id)
     
     print(f"\n👤 Customer ({user_id}): {message}")
     print("=" * 60)
     
+    if stream:
+        print("🤖 Agent Mode: Detailed catalog search" if use_agent else "🤖 Sales Assistant Mode: Product recommendations")
+        for event in stream_response(message, user_id, use_agent):
+            if event["event"] == "token":
+                print(event["content"], end="", flush=True)
+            elif event["event"] == "status":
+                print(f"🔎 {event['stage'].capitalize()}: {', '.join(event['tools'])}")
+            else:
+                print(f"\n\n📚 Data source: {event['data_source']}")
+        return
+    
     # Choose between conversational chain or agent
     if use_agent:
         print("🤖 Agent Mode: Detailed catalog search")
         for event in agent_executor.stream(
-            {"messages": [{"role": "user", "content": message}]},
+            _turn_input(message, use_agent=True),
             stream_mode="values",
             config=config,
         ):
@@ -499,15 +2109,16 @@ def get_conversation_summary(user_id: str) -> str:
 
 def clear_conversation(user_id: str):
     """Clear conversation memory for a user"""
+    if memory_saver is not None:
+        memory_saver.delete_thread(get_user_config(user_id)["configurable"]["thread_id"])
     print(f"🧹 Cleared conversation memory for user: {user_id}")
-    # The MemorySaver automatically handles user-specific threads
 
 def interactive_document_chat():
     """Interactive headwear catalog chat session"""
     print("🧢 CapAmerica Headwear Catalog Assistant")
     print("=" * 50)
     print("Welcome! I'm here to help you find the perfect headwear products.")
-    print("Type 'quit' to exit, 'agent' to use agent mode, 'clear' to clear conversation.")
+    print("Type 'quit' to exit, 'agent' to use agent mode, 'stream' to toggle token streaming, 'clear' to clear conversation.")
     print("=" * 50)
     
     # Initialize the system
@@ -521,6 +2132,7 @@ def interactive_document_chat():
     # Start conversation
     user_id = f"session_{int(time.time())}"
     use_agent = False
+    stream = False
     
     while True:
         try:
@@ -534,6 +2146,10 @@ def interactive_document_chat():
                 mode = "Agent" if use_agent else "Sales Assistant"
                 print(f"\n🔄 Switched to {mode} mode")
                 continue
+            elif user_input.lower() == 'stream':
+                stream = not stream
+                print(f"\n🔄 Token streaming {'on' if stream else 'off'}")
+                continue
             elif user_input.lower() == 'clear':
                 clear_conversation(user_id)
                 user_id = f"session_{int(time.time())}"
@@ -542,7 +2158,7 @@ def interactive_document_chat():
                 continue
             
             # Process the message
-            chat_interactive(user_input, user_id, use_agent)
+            chat_interactive(user_input, user_id, use_agent, stream)
             
         except KeyboardInterrupt:
             print("\n\n👋 Thank you for exploring our catalog. Have a great day!")
@@ -0,0 +1,141 @@
+"""
+Retrieval helpers shared by the rag.py tools
+
+Vector stores disagree on method names for score-returning search by
+vector, so these helpers hide that and provide the fan-out used by
+retrieve_all_sources: embed the query once, query every index
+concurrently, then merge and deduplicate by score.
+"""
+
+import asyncio
+import hashlib
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+from langchain_core.documents import Document
+
+from metrics import VECTOR_QUERY_SECONDS, store_label, timed
+
+# Reciprocal-rank-fusion constant; 60 is the value from the original RRF paper
+RRF_K = 60
+
+# Small shared pool for the sync fan-out; vector queries are I/O bound
+_fan_out_executor = ThreadPoolExecutor(max_workers=8, thread_name_prefix="retrieval")
+
+
+def search_by_vector(store, vector: Sequence[float], k: int) -> List[Tuple[Document, float]]:
+    """Score-returning similarity search by vector for Pinecone, FAISS or in-memory stores"""
+    with timed(VECTOR_QUERY_SECONDS, "vector_query", store=store_label(store)):
+        if hasattr(store, "similarity_search_by_vector_with_score"):
+            return store.similarity_search_by_vector_with_score(list(vector), k=k)
+        return store.similarity_search_with_score_by_vector(list(vector), k=k)
+
+
+async def asearch_by_vector(store, vector: Sequence[float], k: int) -> List[Tuple[Document, float]]:
+    """Async variant of search_by_vector"""
+    if hasattr(store, "asimilarity_search_by_vector_with_score"):
+        with timed(VECTOR_QUERY_SECONDS, "vector_query", store=store_label(store)):
+            return await store.asimilarity_search_by_vector_with_score(list(vector), k=k)
+    if hasattr(store, "asimilarity_search_with_score_by_vector"):
+        with timed(VECTOR_QUERY_SECONDS, "vector_query", store=store_label(store)):
+            return await store.asimilarity_search_with_score_by_vector(list(vector), k=k)
+    # Timed inside search_by_vector
+    return await asyncio.to_thread(search_by_vector, store, vector, k)
+
+
+def content_hash(text: str) -> str:
+    """Hash of whitespace-normalized document text, used to spot duplicates"""
+    return hashlib.sha1(" ".join(text.split()).encode("utf-8")).hexdigest()
+
+
+def merge_scored_results(results: Dict[str, List[Tuple[Document, float]]], k: int) -> List[Document]:
+    """Merge per-source results into one ranked list
+
+    results maps a data source label ("csv", "pdf") to (document, score) pairs
+    with higher scores being better. Each returned document is tagged with
+    metadata["data_source"] and metadata["score"]; exact duplicates (same text)
+    keep only their best-scoring copy.
+    """
+    scored = []
+    for data_source, pairs in results.items():
+        for doc, score in pairs:
+            metadata = dict(doc.metadata, data_source=data_source, score=float(score))
+            scored.append((float(score), Document(id=doc.id, page_content=doc.page_content, metadata=metadata)))
+    scored.sort(key=lambda pair: pair[0], reverse=True)
+
+    merged, seen = [], set()
+    for _, doc in scored:
+        digest = content_hash(doc.page_content)
+        if digest in seen:
+            continue
+        seen.add(digest)
+        merged.append(doc)
+        if len(merged) >= k:
+            break
+    return merged
+
+
+Rerank = Callable[[List[Tuple[Document, float]]], List[Tuple[Document, float]]]
+
+
+def _apply_rerank(results: Dict[str, List[Tuple[Document, float]]],
+                  rerank: Optional[Dict[str, Rerank]]) -> Dict[str, List[Tuple[Document, float]]]:
+    if not rerank:
+        return results
+    return {name: rerank[name](pairs) if name in rerank else pairs for name, pairs in results.items()}
+
+
+def rank_scores(results: Dict[str, List[Tuple[Document, float]]]) -> Dict[str, List[Tuple[Document, float]]]:
+    """Replace each source's scores with 1 / (RRF_K + rank), comparable across sources"""
+    return {
+        name: [(doc, 1.0 / (RRF_K + rank)) for rank, (doc, _) in
+               enumerate(sorted(pairs, key=lambda pair: pair[1], reverse=True), start=1)]
+        for name, pairs in results.items()
+    }
+
+
+def merge_results(results: Dict[str, List[Tuple[Document, float]]], k: int,
+                  rerank: Optional[Dict[str, Rerank]] = None) -> List[Document]:
+    """Rerank each source's pairs (if given), then merge them into one ranked list
+
+    Reranked scores (RRF) are not on the raw cosine scale of a source without
+    a reranker, so with rerank the sources are fused by rank instead.
+    """
+    if not rerank:
+        return merge_scored_results(results, k)
+    return merge_scored_results(rank_scores(_apply_rerank(results, rerank)), k)
+
+
+def search_all_by_vector(stores: Dict[str, object], vector: Sequence[float],
+                         k_per_source: int) -> Dict[str, List[Tuple[Document, float]]]:
+    """Raw (document, score) pairs from every store, queried concurrently"""
+    available = {name: store for name, store in stores.items() if store is not None}
+    futures = {
+        name: _fan_out_executor.submit(search_by_vector, store, vector, k_per_source)
+        for name, store in available.items()
+    }
+    return {name: future.result() for name, future in futures.items()}
+
+
+async def asearch_all_by_vector(stores: Dict[str, object], vector: Sequence[float],
+                                k_per_source: int) -> Dict[str, List[Tuple[Document, float]]]:
+    """Async variant of search_all_by_vector"""
+    available = {name: store for name, store in stores.items() if store is not None}
+    pairs = await asyncio.gather(*(asearch_by_vector(store, vector, k_per_source) for store in available.values()))
+    return dict(zip(available.keys(), pairs))
+
+
+def fan_out_search(stores: Dict[str, object], vector: Sequence[float], k_per_source: int, k: int,
+                   rerank: Optional[Dict[str, Rerank]] = None) -> List[Document]:
+    """Query every store concurrently with one shared query vector
+
+    rerank optionally maps a source name to a function applied to that
+    source's (document, score) pairs before merging (e.g. hybrid fusion).
+    """
+    return merge_results(search_all_by_vector(stores, vector, k_per_source), k, rerank)
+
+
+async def afan_out_search(stores: Dict[str, object], vector: Sequence[float], k_per_source: int, k: int,
+                          rerank: Optional[Dict[str, Rerank]] = None) -> List[Document]:
+    """Async variant of fan_out_search"""
+    return merge_results(await asearch_all_by_vector(stores, vector, k_per_source), k, rerank)
@@ -0,0 +1,167 @@
+"""
+Speculative retrieval overlapping the tool-selection LLM call
+
+For this catalog bot process_query almost always answers with a retrieval
+tool call whose query is close to the user's own words. SpeculativeRetrieval
+starts the vector half of retrieval on the raw message (one embedding, both
+indexes) as soon as the turn begins, while the LLM is still deciding. When the
+tool call arrives its query is compared with the speculated one: if they
+match, or overlap closely enough, the tool reuses the vector results (lexical
+fusion is cheap and is redone with the tool's own query); otherwise the
+speculation is discarded and the tool searches normally.
+
+Speculations are kept per conversation thread and dropped at the end of the
+tool step. start/astart take an optional query vector, so a caller that has
+already embedded the message (the answer cache, fingerprinting a first turn)
+does not pay for a second embedding. With on_message off, process_query does
+not speculate and only explicit start calls do.
+"""
+
+import asyncio
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from dataclasses import dataclass, field
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Sequence, Tuple, Union
+
+from langchain_core.documents import Document
+
+from embedding_cache import normalize_text
+from hybrid_search import tokenize
+
+# source -> (document, score) pairs from the vector index
+SourceResults = Dict[str, List[Tuple[Document, float]]]
+# (query, precomputed query vector or None) -> results
+Search = Callable[[str, Optional[Sequence[float]]], SourceResults]
+ASearch = Callable[[str, Optional[Sequence[float]]], Awaitable[SourceResults]]
+
+_speculation_executor = ThreadPoolExecutor(max_workers=8, thread_name_prefix="speculative")
+
+
+def query_overlap(a: str, b: str) -> float:
+    """Jaccard overlap of the two queries' terms (1.0 for identical normalized text)"""
+    if normalize_text(a) == normalize_text(b):
+        return 1.0
+    terms_a, terms_b = set(tokenize(a)), set(tokenize(b))
+    if not terms_a or not terms_b:
+        return 0.0
+    return len(terms_a & terms_b) / len(terms_a | terms_b)
+
+
+@dataclass
+class Speculation:
+    query: str
+    pending: Union[Future, "asyncio.Task[SourceResults]"]
+    started: float = field(default_factory=time.perf_counter)
+    used: bool = False
+
+
+class SpeculativeRetrieval:
+    """Per-thread speculative vector retrieval with hit-rate accounting"""
+
+    def __init__(self, search: Search, asearch: ASearch, min_overlap: float = 0.6,
+                 on_message: bool = True):
+        self.search = search
+        self.asearch = asearch
+        self.min_overlap = min_overlap
+        self.on_message = on_message
+        self._pending: Dict[str, Speculation] = {}
+        self._lock = threading.Lock()
+        self.counts: Dict[str, float] = {
+            "started": 0, "hits": 0, "exact_hits": 0, "misses": 0, "unused": 0, "errors": 0, "seconds_saved": 0.0,
+        }
+
+    def _register(self, thread_id: str, speculation: Speculation) -> None:
+        # Retrieve the outcome of discarded speculations so failures are not logged as unhandled
+        speculation.pending.add_done_callback(lambda done: done.cancelled() or done.exception())
+        with self._lock:
+            previous = self._pending.pop(thread_id, None)
+            self._pending[thread_id] = speculation
+            self.counts["started"] += 1
+        if previous is not None:
+            self._drop(previous)
+
+    def start(self, thread_id: str, query: str, vector: Optional[Sequence[float]] = None) -> Speculation:
+        """Begin retrieval for query on a worker thread"""
+        speculation = Speculation(query, _speculation_executor.submit(self.search, query, vector))
+        self._register(thread_id, speculation)
+        return speculation
+
+    def astart(self, thread_id: str, query: str, vector: Optional[Sequence[float]] = None) -> Speculation:
+        """Begin retrieval for query as a task on the running event loop"""
+        speculation = Speculation(query, asyncio.ensure_future(self.asearch(query, vector)))
+        self._register(thread_id, speculation)
+        return speculation
+
+    def pending_query(self, thread_id: str) -> Optional[str]:
+        """Query of the thread's current speculation, if any"""
+        with self._lock:
+            speculation = self._pending.get(thread_id)
+        return speculation.query if speculation is not None else None
+
+    def _claim(self, thread_id: str, query: str) -> Optional[Speculation]:
+        with self._lock:
+            speculation = self._pending.get(thread_id)
+        if speculation is None:
+            return None
+        overlap = query_overlap(speculation.query, query)
+        if overlap < self.min_overlap:
+            self.counts["misses"] += 1
+            return None
+        if not speculation.used:
+            # Counted once per speculation, however many tools share it
+            self.counts["hits"] += 1
+            self.counts["exact_hits"] += overlap == 1.0
+            # Retrieval time already spent in the background is time the tool does not wait
+            self.counts["seconds_saved"] += time.perf_counter() - speculation.started
+            speculation.used = True
+        return speculation
+
+    def take(self, thread_id: str, query: str) -> Optional[SourceResults]:
+        """Speculated results for a tool query, or None when they do not apply"""
+        speculation = self._claim(thread_id, query)
+        if speculation is None:
+            return None
+        try:
+            if isinstance(speculation.pending, Future):
+                return speculation.pending.result()
+            # An async speculation cannot be awaited from sync code unless already finished
+            return speculation.pending.result() if speculation.pending.done() else None
+        except Exception:
+            self.counts["errors"] += 1
+            return None
+
+    async def atake(self, thread_id: str, query: str) -> Optional[SourceResults]:
+        """Async variant of take"""
+        speculation = self._claim(thread_id, query)
+        if speculation is None:
+            return None
+        try:
+            if isinstance(speculation.pending, Future):
+                return await asyncio.wrap_future(speculation.pending)
+            # Shield: a cancelled tool must not cancel results another tool may share
+            return await asyncio.shield(speculation.pending)
+        except Exception:
+            self.counts["errors"] += 1
+            return None
+
+    def _drop(self, speculation: Speculation) -> None:
+        if not speculation.used:
+            self.counts["unused"] += 1
+        if not speculation.pending.done():
+            speculation.pending.cancel()
+
+    def discard(self, thread_id: str) -> None:
+        """Forget the thread's speculation, cancelling it if still running"""
+        with self._lock:
+            speculation = self._pending.pop(thread_id, None)
+        if speculation is not None:
+            self._drop(speculation)
+
+    def stats(self) -> Dict[str, Any]:
+        started = self.counts["started"]
+        return {
+            **self.counts,
+            "pending": len(self._pending),
+            "hit_rate": self.counts["hits"] / started if started else 0.0,
+        }
@@ -0,0 +1,130 @@
+import pytest
+
+from catalog import (ADDON_GROUPS, ADDON_PRICE_RANGES, ADDON_PRICES, ProductIndex, _parse_product, addon_price_guide,
+                     normalize_addon, normalize_embroidery)
+
+
+@pytest.fixture
+def index():
+    item = {
+        "id": "i7041",
+        "title": "Lightweight Aerated Performance Cap",
+        "description": {"features": ["UV protection"], "sizing": "OSFM"},
+        "pricing": {"Flat Embroidery": {"24": 17.5, "48": "$15.75", "96": 14.0},
+                    "3D Embroidery": {"24": 20.5, "48": 18.75}},
+        "available_colors": ["Black (Out of Stock)", "Navy"],
+    }
+    return ProductIndex([_parse_product(item, "caps_catalog1.json")], version="test")
+
+
+@pytest.mark.parametrize("name, key", [
+    ("side_embroidery", "side_embroidery"),
+    ("Side Embroidery", "side_embroidery"),
+    ("side", "side_embroidery"),
+    ("3D side", "side_embroidery"),
+    ("rubber", "molded_rubber_patch"),
+    ("Molded rubber patches", "molded_rubber_patch"),
+    ("woven patch", "woven_patch"),
+    ("faux leather", "faux_leather_patch"),
+    ("custom labels", "custom_label"),
+    ("American flag", "american_flag_patch"),
+    ("pom", "pom"),
+    ("Pom poms", "pom"),
+])
+def test_normalize_addon(name, key):
+    assert normalize_addon(name) == key
+
+
+@pytest.mark.parametrize("name", ["patch", "leather patch", "Leather", "embroidery"])
+def test_normalize_addon_ambiguous(name):
+    with pytest.raises(ValueError, match="Ambiguous add-on"):
+        normalize_addon(name)
+
+
+@pytest.mark.parametrize("name", ["3d embroidery", "flat embroidery"])
+def test_normalize_addon_embroidery_type(name):
+    with pytest.raises(ValueError, match="embroidery type"):
+        normalize_addon(name)
+
+
+def test_normalize_addon_unknown_lists_options():
+    with pytest.raises(ValueError, match="Unknown add-on") as error:
+        normalize_addon("rhinestones")
+    for key in ADDON_PRICES:
+        assert key in str(error.value)
+    assert "pom" in str(error.value)
+
+
+@pytest.mark.parametrize("name, pricing_key", [
+    ("flat", "Flat Embroidery"),
+    ("Flat Embroidery", "Flat Embroidery"),
+    ("flat embroidery", "Flat Embroidery"),
+    ("3d", "3D Embroidery"),
+    ("3D Embroidery", "3D Embroidery"),
+    ("3-D embroidery", "3D Embroidery"),
+    ("puff", None),
+])
+def test_normalize_embroidery(name, pricing_key):
+    assert normalize_embroidery(name) == pricing_key
+
+
+@pytest.mark.parametrize("embroidery", ["flat", "flat embroidery", "Flat Embroidery"])
+def test_unit_price_flat(index, embroidery):
+    assert index.unit_price("i7041", 50, embroidery) == (48, 15.75)
+
+
+def test_unit_price_3d(index):
+    assert index.unit_price("I7041", 24, "3D embroidery") == (24, 20.5)
+    assert index.unit_price("i7041", 1000, "3d") == (48, 18.75)
+
+
+def test_unit_price_errors(index):
+    with pytest.raises(KeyError):
+        index.unit_price("i0000", 24)
+    with pytest.raises(ValueError, match="Minimum order"):
+        index.unit_price("i7041", 10)
+    with pytest.raises(ValueError, match="no puff pricing"):
+        index.unit_price("i7041", 24, "puff")
+
+
+def test_quote(index):
+    quote = index.quote("i7041", 100, "flat", addons=["side", "woven patch"], stitch_count=12500, color="navy")
+    assert quote["tier"] == 96
+    assert quote["embroidery"] == "Flat Embroidery"
+    assert [line["addon"] for line in quote["addons"]] == ["side_embroidery", "woven_patch"]
+    # 14.00 base + 3.00 + 5.00 + three started blocks of 1,000 extra stitches at 0.80
+    assert quote["extra_stitch_charge"] == 2.4
+    assert quote["unit_total"] == 24.4
+    assert quote["order_total"] == 2440.0
+    assert quote["color_available"] is True
+    assert "unit_total_max" not in quote
+
+
+def test_quote_pom_range(index):
+    quote = index.quote("i7041", 48, "flat", addons=["pom"])
+    assert quote["unit_total"] == 17.15
+    assert quote["unit_total_max"] == 20.75
+    assert quote["order_total_max"] == 996.0
+
+
+def test_quote_rejects_ambiguous_addon(index):
+    with pytest.raises(ValueError, match="genuine_leather_patch"):
+        index.quote("i7041", 48, addons=["leather patch"])
+
+
+def test_price_guide_covers_every_addon():
+    grouped = [key for names in ADDON_GROUPS.values() for key in names]
+    assert sorted(grouped) == sorted([*ADDON_PRICES, *ADDON_PRICE_RANGES])
+    guide = addon_price_guide()
+    assert "molded rubber ($6.00)" in guide
+    assert "poms ($1.40-5.00)" in guide
+    assert "$0.80 per 1,000 stitches beyond 10,000" in guide
+
+
+def test_find(index):
+    assert [p.product_id for p in index.find(color="navy")] == ["i7041"]
+    assert [p.product_id for p in index.find(color="blac")] == ["i7041"]
+    assert index.find(color="black", in_stock_only=True) == []
+    assert [p.product_id for p in index.find(color="navy", style="performance cap")] == ["i7041"]
+    assert index.find(style="trucker") == []
+    assert len(index.find()) == 1
@@ -0,0 +1,53 @@
+import asyncio
+
+import numpy as np
+import pytest
+from langchain_core.embeddings import FakeEmbeddings
+
+from faiss_store import ReadOnlyIndexError, build_compact_store
+
+pytestmark = pytest.mark.filterwarnings("ignore:Normalizing L2")
+
+
+@pytest.fixture(scope="module")
+def vectors():
+    return np.random.default_rng(0).normal(size=(500, 64)).astype(np.float32)
+
+
+def compact(vectors, quantization):
+    ids = [f"doc-{i}" for i in range(len(vectors))]
+    return build_compact_store(ids, vectors, [{"group": i % 3} for i in range(len(vectors))], ids,
+                               FakeEmbeddings(size=64), dimensions=32, quantization=quantization)
+
+
+@pytest.mark.parametrize("method, args", [
+    ("add_texts", (["text"],)),
+    ("add_embeddings", ([("text", [0.0] * 64)],)),
+    ("delete", (["doc-0"],)),
+])
+def test_compact_index_is_read_only(vectors, method, args):
+    with pytest.raises(ReadOnlyIndexError):
+        getattr(compact(vectors, "none"), method)(*args)
+
+
+def test_mmr_accepts_full_size_queries(vectors):
+    docs = compact(vectors, "none").max_marginal_relevance_search_by_vector(vectors[7].tolist(), k=4)
+    assert len(docs) == 4
+    assert docs[0].id == "doc-7"
+
+
+def test_mmr_rescores_quantized_candidates(vectors):
+    query = vectors[7].tolist()
+    exact = compact(vectors, "none").max_marginal_relevance_search_with_score_by_vector(query, k=4)
+    rescored = compact(vectors, "int8").max_marginal_relevance_search_with_score_by_vector(query, k=4)
+    assert [doc.id for doc, _ in rescored] == [doc.id for doc, _ in exact]
+    assert [score for _, score in rescored] == pytest.approx([score for _, score in exact], abs=1e-5)
+    assert rescored[0][1] == pytest.approx(1.0, abs=1e-5)
+
+
+def test_mmr_filter_and_async(vectors):
+    store = compact(vectors, "int8")
+    docs = store.max_marginal_relevance_search_by_vector(vectors[7].tolist(), k=4, filter={"group": 1})
+    assert {doc.metadata["group"] for doc in docs} == {1}
+    docs = asyncio.run(store.amax_marginal_relevance_search_by_vector(vectors[7].tolist(), k=4))
+    assert docs[0].id == "doc-7"
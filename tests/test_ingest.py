@@ -0,0 +1,104 @@
+import pytest
+from langchain_core.documents import Document
+from langchain_core.embeddings import FakeEmbeddings
+
+from ingest import get_manifest_path, ingest, load_manifest
+
+MODEL = "fake-embedding"
+
+
+class MemorySink:
+    writes_through = True
+
+    def __init__(self, ids=(), fail_after=None):
+        self.ids = set(ids)
+        self.upserts = 0
+        self.attempts = 0
+        self.fail_after = fail_after
+
+    def list_ids(self):
+        return list(self.ids)
+
+    def upsert(self, docs, vectors):
+        self.attempts += 1
+        if self.fail_after is not None and self.upserts >= self.fail_after:
+            raise ConnectionError("index went away")
+        self.upserts += 1
+        self.ids.update(doc.id for doc in docs)
+
+    def delete(self, ids):
+        self.ids.difference_update(ids)
+
+    def close(self):
+        pass
+
+
+def documents(count):
+    return [Document(id=f"catalog.json:{i}", page_content=f"product {i}") for i in range(count)]
+
+
+@pytest.fixture
+def manifest_path(tmp_path):
+    return get_manifest_path("test-index", str(tmp_path))
+
+
+def test_first_run_deletes_ids_from_an_earlier_upload(manifest_path):
+    sink = MemorySink(ids=[f"uuid-{i}" for i in range(10)])
+    report = ingest(documents(10), sink, FakeEmbeddings(size=8), manifest_path, MODEL)
+    assert sink.ids == {doc.id for doc in documents(10)}
+    assert report["deleted"] == report["reconciled"] == 10
+
+
+def test_later_runs_trust_the_manifest(manifest_path):
+    sink = MemorySink()
+    ingest(documents(10), sink, FakeEmbeddings(size=8), manifest_path, MODEL)
+    sink.ids.add("written-by-hand")
+    ingest(documents(10), sink, FakeEmbeddings(size=8), manifest_path, MODEL)
+    assert "written-by-hand" in sink.ids
+    report = ingest(documents(10), sink, FakeEmbeddings(size=8), manifest_path, MODEL, reconcile=True)
+    assert "written-by-hand" not in sink.ids
+    assert report["upserted"] == 0
+
+
+def test_interrupted_run_keeps_finished_batches(manifest_path):
+    sink = MemorySink(fail_after=2)
+    with pytest.raises(ConnectionError):
+        ingest(documents(10), sink, FakeEmbeddings(size=8), manifest_path, MODEL, batch_size=3, concurrency=1)
+    assert len(load_manifest(manifest_path)["documents"]) == 6
+    sink.fail_after = None
+    report = ingest(documents(10), sink, FakeEmbeddings(size=8), manifest_path, MODEL, batch_size=3)
+    assert report["upserted"] == 4
+    assert report["unchanged"] == 6
+
+
+def test_dry_run_reports_stale_ids_without_deleting(manifest_path):
+    sink = MemorySink(ids=["uuid-0"])
+    report = ingest(documents(3), sink, FakeEmbeddings(size=8), manifest_path, MODEL, dry_run=True)
+    assert report["deleted"] == 1
+    assert sink.ids == {"uuid-0"}
+
+
+def test_first_failure_cancels_remaining_batches(manifest_path):
+    sink = MemorySink(fail_after=1)
+    with pytest.raises(ConnectionError):
+        ingest(documents(30), sink, FakeEmbeddings(size=8), manifest_path, MODEL, batch_size=3, concurrency=1)
+    # The failed batch, and at most the one the worker picked up before the cancel
+    assert sink.attempts <= 3
+    assert len(load_manifest(manifest_path)["documents"]) == 3 * sink.upserts
+
+
+def test_full_dry_run_plans_everything_and_keeps_the_manifest(manifest_path):
+    sink = MemorySink()
+    ingest(documents(10), sink, FakeEmbeddings(size=8), manifest_path, MODEL)
+    before = load_manifest(manifest_path)
+    report = ingest(documents(8), sink, FakeEmbeddings(size=8), manifest_path, MODEL, dry_run=True, full=True)
+    assert (report["upserted"], report["unchanged"], report["deleted"]) == (8, 0, 2)
+    assert load_manifest(manifest_path) == before
+
+
+def test_full_run_rewrites_the_manifest(manifest_path):
+    sink = MemorySink()
+    ingest(documents(10), sink, FakeEmbeddings(size=8), manifest_path, MODEL)
+    report = ingest(documents(8), sink, FakeEmbeddings(size=8), manifest_path, MODEL, reconcile=False, full=True)
+    assert (report["upserted"], report["deleted"]) == (8, 2)
+    assert sorted(load_manifest(manifest_path)["documents"]) == sorted(doc.id for doc in documents(8))
@@ -0,0 +1,24 @@
+import pytest
+
+from intent_router import CHITCHAT, LLM, RETRIEVE, IntentRouter
+
+TOOLS = ["retrieve_product_catalog", "retrieve_csv_data", "retrieve_all_sources", "calculate_price"]
+
+
+@pytest.mark.parametrize("text, has_history, intent", [
+    ("How much are trucker caps?", False, RETRIEVE),
+    ("What is the price per unit of your foam truckers", False, RETRIEVE),
+    ("What does a woven patch cost in total", False, RETRIEVE),
+    ("How much for 144 embroidered caps?", False, LLM),
+    ("Quote i7041 x 48 with flat embroidery", False, LLM),
+    ("What would 96 of them cost", True, LLM),
+    ("Tell me about i7041", False, RETRIEVE),
+    ("Thanks, that helps!", False, CHITCHAT),
+])
+def test_only_quote_requests_go_to_the_llm(text, has_history, intent):
+    assert IntentRouter(TOOLS).route(text, has_history).intent == intent
+
+
+def test_pricing_retrieves_without_calculate_price():
+    route = IntentRouter(TOOLS[:3]).route("How much for 144 embroidered caps?")
+    assert (route.intent, route.tool) == (RETRIEVE, "retrieve_product_catalog")
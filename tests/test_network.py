@@ -0,0 +1,143 @@
+import asyncio
+import logging
+import time
+
+import pytest
+
+from benchmarks.fake_http_server import FakeHTTPServer
+from network import ResilientVectorStore, pinecone_query_index
+
+
+@pytest.fixture
+def server():
+    with FakeHTTPServer(latency=0.01) as server:
+        yield server
+
+
+@pytest.fixture
+def store(server):
+    logging.getLogger("httpx").setLevel(logging.WARNING)
+    from langchain_openai import OpenAIEmbeddings
+    from langchain_pinecone import PineconeVectorStore
+
+    embeddings = OpenAIEmbeddings(api_key="fake", base_url=server.url + "/v1", check_embedding_ctx_length=False)
+    index = pinecone_query_index("fake", host=server.url)
+    return PineconeVectorStore(embedding=embeddings, index=index)
+
+
+@pytest.fixture
+def vector(server):
+    return [1.0] + [0.0] * (server.dimensions - 1)
+
+
+def test_retries_failed_queries(server, store, vector):
+    resilient = ResilientVectorStore(store, timeout=5.0, retries=4)
+    server.error_rate = 0.3
+    for _ in range(20):
+        assert len(resilient.similarity_search_by_vector_with_score(vector, k=4)) == 4
+    stats = resilient.stats()
+    assert stats["queries"] == 20
+    assert stats["retries"] > 0
+    assert stats["failures"] == 0
+    assert server.requests["/query"] == 20 + stats["retries"]
+
+
+def test_gives_up_after_the_last_retry(server, store, vector):
+    resilient = ResilientVectorStore(store, timeout=5.0, retries=2)
+    server.outages.add("/query")
+    with pytest.raises(Exception):
+        resilient.similarity_search_by_vector_with_score(vector, k=4)
+    assert resilient.stats()["retries"] == 2
+    assert resilient.stats()["failures"] == 1
+    assert server.requests["/query"] == 3
+
+
+def test_deadline_bounds_a_slow_query(server, store, vector):
+    resilient = ResilientVectorStore(store, timeout=0.2, retries=2)
+    server.latency = 1.0
+    start = time.perf_counter()
+    with pytest.raises(TimeoutError):
+        resilient.similarity_search_by_vector_with_score(vector, k=4)
+    assert time.perf_counter() - start < 0.6
+    assert resilient.stats()["timeouts"] >= 1
+    assert resilient.stats()["failures"] == 1
+
+
+def test_async_deadline_bounds_a_slow_query(server, store, vector):
+    resilient = ResilientVectorStore(store, timeout=0.2, retries=0, async_via_threads=True)
+    server.latency = 1.0
+    start = time.perf_counter()
+    with pytest.raises(TimeoutError):
+        asyncio.run(resilient.asimilarity_search_by_vector_with_score(vector, k=4))
+    assert time.perf_counter() - start < 0.6
+    assert resilient.stats()["timeouts"] == 1
+
+
+def _warm_up(resilient, vector):
+    # Fills the latency window that sets the hedging threshold
+    for _ in range(resilient.latency.min_samples):
+        resilient.similarity_search_by_vector_with_score(vector, k=4)
+
+
+def test_hedges_slow_queries(server, store, vector):
+    resilient = ResilientVectorStore(store, timeout=5.0, retries=0, hedge=True)
+    _warm_up(resilient, vector)
+    server.requests.clear()
+    server.slow_fraction, server.slow_latency = 0.3, 1.0
+    latencies = []
+    for _ in range(20):
+        start = time.perf_counter()
+        resilient.similarity_search_by_vector_with_score(vector, k=4)
+        latencies.append(time.perf_counter() - start)
+    stats = resilient.stats()
+    assert stats["hedges"] > 0
+    assert stats["hedge_wins"] > 0
+    # A hedge still queued when the first query answers is cancelled before it is sent
+    assert 20 < server.requests["/query"] <= 20 + stats["hedges"]
+    # Without hedging a third of the queries would take a second
+    assert sorted(latencies)[len(latencies) // 2] < 0.5
+
+
+def test_no_hedges_without_hedging(server, store, vector):
+    resilient = ResilientVectorStore(store, timeout=5.0, retries=0)
+    _warm_up(resilient, vector)
+    server.slow_fraction, server.slow_latency = 1.0, 0.05
+    resilient.similarity_search_by_vector_with_score(vector, k=4)
+    assert resilient.stats()["hedges"] == 0
+
+
+def test_async_hedges_slow_queries(server, store, vector):
+    resilient = ResilientVectorStore(store, timeout=5.0, retries=0, hedge=True, async_via_threads=True)
+    _warm_up(resilient, vector)
+    server.slow_fraction, server.slow_latency = 0.3, 1.0
+
+    async def queries():
+        for _ in range(20):
+            await resilient.asimilarity_search_by_vector_with_score(vector, k=4)
+
+    asyncio.run(queries())
+    assert resilient.stats()["hedge_wins"] > 0
+
+
+def test_counts_are_exact_under_concurrency(server, store, vector):
+    from concurrent.futures import ThreadPoolExecutor
+
+    resilient = ResilientVectorStore(store, timeout=5.0, retries=0)
+    with ThreadPoolExecutor(max_workers=16) as pool:
+        list(pool.map(lambda _: resilient.similarity_search_by_vector_with_score(vector, k=4), range(200)))
+    assert resilient.stats()["queries"] == 200
+
+
+def test_client_does_not_retry_on_its_own(server, store, vector):
+    server.outages.add("/query")
+    with pytest.raises(Exception):
+        store.similarity_search_by_vector_with_score(vector, k=4)
+    assert server.requests["/query"] == 1
+
+
+def test_losing_hedges_are_counted_as_abandoned(server, store, vector):
+    resilient = ResilientVectorStore(store, timeout=0.2, retries=0)
+    server.latency = 1.0
+    with pytest.raises(TimeoutError):
+        resilient.similarity_search_by_vector_with_score(vector, k=4)
+    assert resilient.stats()["abandoned"] == 1
@@ -0,0 +1,80 @@
+import asyncio
+import os
+import threading
+
+from checkpoint_store import SQLiteCheckpointSaver
+from thread_locks import ThreadLocks
+
+
+def test_async_waiters_run_in_arrival_order(tmp_path):
+    locks = ThreadLocks(str(tmp_path / "locks"))
+    order = []
+
+    async def turn(i):
+        async with locks.ahold("user-1"):
+            order.append(i)
+            await asyncio.sleep(0.001)
+
+    async def main():
+        async with locks.ahold("user-1"):
+            tasks = []
+            for i in range(20):
+                tasks.append(asyncio.create_task(turn(i)))
+                await asyncio.sleep(0)
+        await asyncio.gather(*tasks)
+
+    asyncio.run(main())
+    assert order == list(range(20))
+    assert locks.contended == 20
+
+
+def test_sync_and_async_callers_share_the_lock(tmp_path):
+    locks = ThreadLocks(str(tmp_path / "locks"))
+    inside = []
+
+    def sync_turn():
+        with locks.hold("user-1"):
+            inside.append("sync")
+
+    async def main():
+        async with locks.ahold("user-1"):
+            thread = threading.Thread(target=sync_turn)
+            thread.start()
+            await asyncio.sleep(0.05)
+            assert inside == []
+        await asyncio.to_thread(thread.join)
+
+    asyncio.run(main())
+    assert inside == ["sync"]
+
+
+def test_cancelled_waiter_gives_up_its_place(tmp_path):
+    locks = ThreadLocks()
+
+    async def main():
+        async with locks.ahold("user-1"):
+            waiter = asyncio.create_task(locks.ahold("user-1").__aenter__())
+            await asyncio.sleep(0)
+            waiter.cancel()
+        async with locks.ahold("user-1"):
+            pass
+
+    asyncio.run(asyncio.wait_for(main(), 1.0))
+
+
+def test_deleted_threads_drop_their_lock_files(tmp_path):
+    locks = ThreadLocks(str(tmp_path / "locks"))
+    saver = SQLiteCheckpointSaver(str(tmp_path / "checkpoints.db"))
+    saver.on_delete = locks.discard
+    for user in ("user-1", "user-2"):
+        with locks.hold(user):
+            pass
+    with locks.hold("user-2"):
+        saver.delete_thread("user-1")
+        saver.delete_thread("user-2")
+        # A lock file in use stays until a later deletion
+        assert os.path.exists(locks._lock_path("user-2"))
+    assert not os.path.exists(locks._lock_path("user-1", create=False))
+    assert locks.discarded == 1
+    with locks.hold("user-1"):
+        assert os.path.exists(locks._lock_path("user-1"))
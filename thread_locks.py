@@ -0,0 +1,233 @@
+"""
+Per-conversation locks that hold across threads, tasks and worker processes
+
+Two turns for the same user_id must not run concurrently: both would load the
+same checkpoint and the second write would silently drop the first turn.
+ThreadLocks serializes turns per thread ID:
+
+- within a process, with one FIFO lock per thread ID shared by sync callers
+  (hold) and async callers (ahold), so mixing both paths on one thread is
+  safe and turns run in arrival order (the request coalescer relies on it);
+  release hands the lock straight to the oldest waiter, no polling
+- across worker processes sharing one checkpoint database, with flock() on
+  a lock file of its own per thread ID in lock_dir (named by a hash of the ID,
+  spread over 256 subdirectories), so unrelated users never wait on each other
+
+flock locks belong to the open file, so every acquisition opens its own
+descriptor and the lock is released by the kernel if a worker dies. ahold
+polls the flock with backoff, as there is no async flock. discard() removes
+the lock files of threads the checkpointer deleted; it unlinks a file only
+while holding its flock, and acquirers re-open the path if the file they
+locked was unlinked meanwhile.
+Without fcntl (Windows) or without a lock_dir only in-process locking applies.
+"""
+
+import asyncio
+import hashlib
+import os
+import threading
+import weakref
+from collections import deque
+from contextlib import asynccontextmanager, contextmanager
+from typing import AsyncIterator, Iterable, Iterator, Optional
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover - Windows
+    fcntl = None
+
+
+def _wake(future: asyncio.Future) -> None:
+    if not future.done():
+        future.set_result(None)
+
+
+class FairLock:
+    """FIFO lock for threads and event loops; release hands over to the oldest waiter"""
+
+    def __init__(self):
+        self._mutex = threading.Lock()
+        self._held = False
+        self._waiters = deque()  # threading.Event (sync) or asyncio.Future (async)
+
+    def _enter_or_wait(self, waiter) -> bool:
+        with self._mutex:
+            if not self._held and not self._waiters:
+                self._held = True
+                return True
+            self._waiters.append(waiter)
+            return False
+
+    def acquire(self) -> bool:
+        """Block until the lock is ours; False if we had to wait"""
+        event = threading.Event()
+        if self._enter_or_wait(event):
+            return True
+        event.wait()
+        return False
+
+    async def aacquire(self) -> bool:
+        """Wait for the lock without blocking the event loop; False if we had to wait"""
+        future = asyncio.get_running_loop().create_future()
+        if self._enter_or_wait(future):
+            return True
+        try:
+            await future
+        except asyncio.CancelledError:
+            with self._mutex:
+                if future in self._waiters:
+                    self._waiters.remove(future)
+                    raise
+            # The lock was handed to us before the cancellation landed
+            self.release()
+            raise
+        return False
+
+    def release(self) -> None:
+        with self._mutex:
+            if not self._waiters:
+                self._held = False
+                return
+            waiter = self._waiters.popleft()
+        if isinstance(waiter, threading.Event):
+            waiter.set()
+            return
+        try:
+            waiter.get_loop().call_soon_threadsafe(_wake, waiter)
+        except RuntimeError:  # the waiter's loop is closed; pass the lock on
+            self.release()
+
+
+class ThreadLocks:
+    """Serialize work per conversation thread ID"""
+
+    def __init__(self, lock_dir: Optional[str] = None, max_poll_interval: float = 0.05):
+        self.max_poll_interval = max_poll_interval
+        self.lock_dir = lock_dir if fcntl is not None else None
+        if lock_dir and fcntl is None:
+            print("⚠️ fcntl unavailable; conversation locks are per process only")
+        if self.lock_dir:
+            os.makedirs(self.lock_dir, exist_ok=True)
+        self._guard = threading.Lock()
+        self._locks: "weakref.WeakValueDictionary[str, FairLock]" = weakref.WeakValueDictionary()
+        self.contended = 0
+        self.discarded = 0
+
+    def _lock_path(self, thread_id: str, create: bool = True) -> str:
+        digest = hashlib.blake2b(thread_id.encode("utf-8"), digest_size=16).hexdigest()
+        directory = os.path.join(self.lock_dir, digest[:2])
+        if create:
+            os.makedirs(directory, exist_ok=True)
+        return os.path.join(directory, f"{digest}.lock")
+
+    def _local_lock(self, thread_id: str) -> FairLock:
+        with self._guard:
+            lock = self._locks.get(thread_id)
+            if lock is None:
+                lock = FairLock()
+                self._locks[thread_id] = lock
+            return lock
+
+    def _try_flock(self, fd: int) -> bool:
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            return True
+        except BlockingIOError:
+            return False
+
+    @staticmethod
+    def _still_linked(fd: int, path: str) -> bool:
+        """Whether the locked descriptor is still the file at path (discard may have unlinked it)"""
+        try:
+            held, current = os.fstat(fd), os.stat(path)
+        except FileNotFoundError:
+            return False
+        return (held.st_dev, held.st_ino) == (current.st_dev, current.st_ino)
+
+    def _acquire_file_lock(self, thread_id: str) -> Optional[int]:
+        if not self.lock_dir:
+            return None
+        while True:
+            path = self._lock_path(thread_id)
+            fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o644)
+            fcntl.flock(fd, fcntl.LOCK_EX)
+            if self._still_linked(fd, path):
+                return fd
+            os.close(fd)
+
+    async def _aacquire_file_lock(self, thread_id: str) -> Optional[int]:
+        if not self.lock_dir:
+            return None
+        while True:
+            path = self._lock_path(thread_id)
+            fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o644)
+            try:
+                # Another process holds the thread's lock file
+                if not self._try_flock(fd):
+                    self.contended += 1
+                    await self._poll(lambda: self._try_flock(fd))
+            except BaseException:
+                os.close(fd)
+                raise
+            if self._still_linked(fd, path):
+                return fd
+            os.close(fd)
+
+    @staticmethod
+    def _release_file_lock(fd: Optional[int]) -> None:
+        if fd is not None:
+            # Closing the descriptor drops the flock
+            os.close(fd)
+
+    async def _poll(self, try_acquire) -> None:
+        """Retry a non-blocking acquire with backoff without blocking the event loop"""
+        delay = 0.002
+        while not try_acquire():
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, self.max_poll_interval)
+
+    @contextmanager
+    def hold(self, thread_id: str) -> Iterator[None]:
+        """Hold the lock for thread_id (blocking)"""
+        lock = self._local_lock(thread_id)
+        if not lock.acquire():
+            self.contended += 1
+        fd = None
+        try:
+            fd = self._acquire_file_lock(thread_id)
+            yield
+        finally:
+            self._release_file_lock(fd)
+            lock.release()
+
+    @asynccontextmanager
+    async def ahold(self, thread_id: str) -> AsyncIterator[None]:
+        """Hold the lock for thread_id without blocking the event loop"""
+        lock = self._local_lock(thread_id)
+        # Queued behind other tasks or sync callers' threads in arrival order
+        if not await lock.aacquire():
+            self.contended += 1
+        fd = None
+        try:
+            fd = await self._aacquire_file_lock(thread_id)
+            yield
+        finally:
+            self._release_file_lock(fd)
+            lock.release()
+
+    def discard(self, thread_ids: Iterable[str]) -> None:
+        """Remove the lock files of deleted threads; files in use are left alone"""
+        if not self.lock_dir:
+            return
+        for thread_id in thread_ids:
+            path = self._lock_path(thread_id, create=False)
+            try:
+                fd = os.open(path, os.O_RDWR)
+            except FileNotFoundError:
+                continue
+            try:
+                if self._try_flock(fd) and self._still_linked(fd, path):
+                    os.unlink(path)
+                    self.discarded += 1
+            finally:
+                os.close(fd)